@@ -0,0 +1,45 @@
+"""Add collection checkpoints
+
+Revision ID: 3c1f2a9d7b41
+Revises: eb8c6722d954
+Create Date: 2025-05-06 12:14:31.507218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f2a9d7b41'
+down_revision: Union[str, None] = 'eb8c6722d954'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('collection_checkpoints',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('mode', sa.Text(), nullable=False),
+    sa.Column('status', sa.Text(), nullable=False),
+    sa.Column('position', sa.BigInteger(), nullable=True),
+    sa.Column('state', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('pages_done', sa.Integer(), nullable=False),
+    sa.Column('rows_done', sa.BigInteger(), nullable=False),
+    sa.Column('session_file', sa.Text(), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['target_chats.chat_id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('chat_id', 'mode', name='uq_collection_checkpoint_chat_mode')
+    )
+    op.create_index(op.f('ix_collection_checkpoints_status'), 'collection_checkpoints', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_collection_checkpoints_status'), table_name='collection_checkpoints')
+    op.drop_table('collection_checkpoints')
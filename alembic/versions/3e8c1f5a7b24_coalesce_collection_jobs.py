@@ -0,0 +1,38 @@
+"""Coalesce collection jobs by target key
+
+Revision ID: 3e8c1f5a7b24
+Revises: 9d2f6b1e8a53
+Create Date: 2025-05-22 16:08:31.204719
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8c1f5a7b24'
+down_revision: Union[str, None] = '9d2f6b1e8a53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('collection_jobs', sa.Column('target_key', sa.Text(), nullable=True))
+    op.add_column('collection_jobs', sa.Column('attached_requests', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('collection_jobs', sa.Column('attached_user_ids', postgresql.ARRAY(postgresql.UUID(as_uuid=True)), nullable=True))
+    op.create_index(
+        'uq_collection_jobs_active_target_key', 'collection_jobs', ['target_key'], unique=True,
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_collection_jobs_active_target_key', table_name='collection_jobs', postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.drop_column('collection_jobs', 'attached_user_ids')
+    op.drop_column('collection_jobs', 'attached_requests')
+    op.drop_column('collection_jobs', 'target_key')
@@ -0,0 +1,70 @@
+"""Add membership snapshots
+
+Revision ID: 5b9e3c7a1d24
+Revises: 8e4d0b6a2f17
+Create Date: 2025-05-12 09:26:47.381052
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b9e3c7a1d24'
+down_revision: Union[str, None] = '8e4d0b6a2f17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_participants', sa.Column('left_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_table('membership_snapshots',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('previous_snapshot_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.Text(), nullable=False),
+    sa.Column('is_baseline', sa.Boolean(), nullable=False),
+    sa.Column('member_count', sa.Integer(), nullable=True),
+    sa.Column('joined_count', sa.Integer(), nullable=True),
+    sa.Column('left_count', sa.Integer(), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['chat_id'], ['target_chats.chat_id'], ),
+    sa.ForeignKeyConstraint(['previous_snapshot_id'], ['membership_snapshots.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_membership_snapshots_chat_id_status', 'membership_snapshots', ['chat_id', 'status'], unique=False)
+    op.create_table('membership_snapshot_members',
+    sa.Column('snapshot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['snapshot_id'], ['membership_snapshots.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('snapshot_id', 'user_id')
+    )
+    op.create_table('membership_events',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('snapshot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('event', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.CheckConstraint("event IN ('joined', 'left')", name='ck_membership_event_type'),
+    sa.ForeignKeyConstraint(['chat_id'], ['target_chats.chat_id'], ),
+    sa.ForeignKeyConstraint(['snapshot_id'], ['membership_snapshots.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_membership_events_chat_id_snapshot_id', 'membership_events', ['chat_id', 'snapshot_id'], unique=False)
+    op.create_index('ix_membership_events_chat_id_user_id', 'membership_events', ['chat_id', 'user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_membership_events_chat_id_user_id', table_name='membership_events')
+    op.drop_index('ix_membership_events_chat_id_snapshot_id', table_name='membership_events')
+    op.drop_table('membership_events')
+    op.drop_table('membership_snapshot_members')
+    op.drop_index('ix_membership_snapshots_chat_id_status', table_name='membership_snapshots')
+    op.drop_table('membership_snapshots')
+    op.drop_column('chat_participants', 'left_at')
@@ -0,0 +1,40 @@
+"""Add participant page hashes
+
+Revision ID: 8e4d0b6a2f17
+Revises: 3c1f2a9d7b41
+Create Date: 2025-05-08 10:41:02.113594
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4d0b6a2f17'
+down_revision: Union[str, None] = '3c1f2a9d7b41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('participant_page_hashes',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('filter_query', sa.Text(), nullable=False),
+    sa.Column('offset', sa.Integer(), nullable=False),
+    sa.Column('hash', sa.BigInteger(), nullable=False),
+    sa.Column('total_count', sa.Integer(), nullable=False),
+    sa.Column('user_ids', postgresql.ARRAY(sa.BigInteger()), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['target_chats.chat_id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('chat_id', 'filter_query', 'offset', name='uq_participant_page_hash')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('participant_page_hashes')
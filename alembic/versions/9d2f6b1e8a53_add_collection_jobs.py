@@ -0,0 +1,52 @@
+"""Add collection jobs
+
+Revision ID: 9d2f6b1e8a53
+Revises: c4a7e2d9f310
+Create Date: 2025-05-20 11:42:08.517364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2f6b1e8a53'
+down_revision: Union[str, None] = 'c4a7e2d9f310'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('collection_jobs',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('app_user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('chat_target', sa.Text(), nullable=False),
+    sa.Column('options', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('status', sa.Text(), nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=True),
+    sa.Column('progress', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('worker', sa.Text(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.CheckConstraint("status IN ('queued', 'running', 'completed', 'failed')", name='ck_collection_job_status'),
+    sa.ForeignKeyConstraint(['app_user_id'], ['app_users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_collection_jobs_status_created_at', 'collection_jobs', ['status', 'created_at'], unique=False)
+    op.create_index('ix_collection_jobs_app_user_id', 'collection_jobs', ['app_user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_collection_jobs_app_user_id', table_name='collection_jobs')
+    op.drop_index('ix_collection_jobs_status_created_at', table_name='collection_jobs')
+    op.drop_table('collection_jobs')
@@ -0,0 +1,28 @@
+"""Add dc_id to collection jobs
+
+Revision ID: b71d4c09e2f6
+Revises: 3e8c1f5a7b24
+Create Date: 2025-05-24 10:31:54.662180
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71d4c09e2f6'
+down_revision: Union[str, None] = '3e8c1f5a7b24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('collection_jobs', sa.Column('dc_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('collection_jobs', 'dc_id')
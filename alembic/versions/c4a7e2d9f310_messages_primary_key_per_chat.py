@@ -0,0 +1,43 @@
+"""Messages primary key per chat
+
+Revision ID: c4a7e2d9f310
+Revises: 5b9e3c7a1d24
+Create Date: 2025-05-19 14:03:12.518264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a7e2d9f310'
+down_revision: Union[str, None] = '5b9e3c7a1d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ID сообщений уникальны только внутри чата (у каждого канала нумерация с 1).
+    # Первичный ключ (id, chat_id) заменяет uq_message_id_chat_id: второй такой же индекс
+    # только замедлял бы запись. Внешние ключи сущностей и файлов пересоздаются на первичный ключ.
+    op.drop_constraint('fk_message_entity_message', 'message_entities', type_='foreignkey')
+    op.drop_constraint('fk_message_file_message', 'message_files', type_='foreignkey')
+    op.drop_constraint('messages_pkey', 'messages', type_='primary')
+    op.create_primary_key('messages_pkey', 'messages', ['id', 'chat_id'])
+    op.drop_constraint('uq_message_id_chat_id', 'messages', type_='unique')
+    op.create_foreign_key('fk_message_entity_message', 'message_entities', 'messages', ['message_id', 'chat_id'], ['id', 'chat_id'])
+    op.create_foreign_key('fk_message_file_message', 'message_files', 'messages', ['message_id', 'chat_id'], ['id', 'chat_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Не выполнится, если в разных чатах уже есть сообщения с одинаковыми ID
+    op.drop_constraint('fk_message_entity_message', 'message_entities', type_='foreignkey')
+    op.drop_constraint('fk_message_file_message', 'message_files', type_='foreignkey')
+    op.create_unique_constraint('uq_message_id_chat_id', 'messages', ['id', 'chat_id'])
+    op.drop_constraint('messages_pkey', 'messages', type_='primary')
+    op.create_primary_key('messages_pkey', 'messages', ['id'])
+    op.create_foreign_key('fk_message_entity_message', 'message_entities', 'messages', ['message_id', 'chat_id'], ['id', 'chat_id'])
+    op.create_foreign_key('fk_message_file_message', 'message_files', 'messages', ['message_id', 'chat_id'], ['id', 'chat_id'])
@@ -0,0 +1,49 @@
+"""Fair collection job scheduling: priorities, preemption and user quotas
+
+Revision ID: d5e9a3c61f08
+Revises: b71d4c09e2f6
+Create Date: 2025-05-26 12:17:40.318825
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5e9a3c61f08'
+down_revision: Union[str, None] = 'b71d4c09e2f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('collection_jobs', sa.Column('priority', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('collection_jobs', sa.Column('preempt_requested', sa.Boolean(), server_default='false', nullable=False))
+    op.add_column('collection_jobs', sa.Column('preemptions', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('collection_jobs', sa.Column('queued_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.execute("UPDATE collection_jobs SET queued_at = created_at")
+    op.create_index('ix_collection_jobs_status_priority_created_at', 'collection_jobs', ['status', 'priority', 'created_at'], unique=False)
+    op.create_table('collection_quotas',
+    sa.Column('app_user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('weight', sa.Integer(), server_default='1', nullable=False),
+    sa.Column('max_running', sa.Integer(), nullable=True),
+    sa.Column('max_queued', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.CheckConstraint('weight > 0', name='ck_collection_quota_weight'),
+    sa.ForeignKeyConstraint(['app_user_id'], ['app_users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('app_user_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('collection_quotas')
+    op.drop_index('ix_collection_jobs_status_priority_created_at', table_name='collection_jobs')
+    op.drop_column('collection_jobs', 'queued_at')
+    op.drop_column('collection_jobs', 'preemptions')
+    op.drop_column('collection_jobs', 'preempt_requested')
+    op.drop_column('collection_jobs', 'priority')
@@ -0,0 +1,3 @@
+# telegram-intel/benchmarks/__init__.py
+
+# Бенчмарки сервиса сбора. Запуск из корня репозитория: python -m benchmarks.<модуль>
@@ -0,0 +1,67 @@
+# telegram-intel/benchmarks/backfill.py
+
+import asyncio
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Sequence
+
+from telethon.tl.types import Channel, ChatPhotoEmpty, PeerChannel, Message as TLMessage
+from telethon.tl.types.messages import ChannelMessages
+
+from data_collector_service.telegram.backfill import BackfillReport, iter_history_ranges, split_history_ranges
+from data_collector_service.telegram.rate_limiter import rate_limiter
+from data_collector_service.telegram.sharding import CrawlLane
+
+# --- Бенчмарк параллельной загрузки истории (telegram.backfill) ---
+# Запуск: python -m benchmarks.backfill
+# Время полной загрузки истории в зависимости от числа клиентов. Клиенты-заглушки отвечают на
+# GetHistoryRequest с задержкой сети; история неравномерная (старые ID плотные, новые - с
+# пропусками удаленных сообщений), один из клиентов в последнем прогоне втрое медленнее остальных.
+# Ограничитель запросов отключается: измеряется распределение работы, а не лимиты Telegram. БД не нужна.
+
+LATENCY = 0.02
+DATE = datetime.now(timezone.utc)
+IDS = list(range(1, 40_001)) + list(range(40_008, 200_001, 8))
+MESSAGES = [TLMessage(id=i, peer_id=PeerChannel(1), date=DATE, message=f"Message {i}") for i in IDS]
+ENTITY = Channel(id=1, title="backfill benchmark", photo=ChatPhotoEmpty(), date=DATE, access_hash=1)
+
+
+class LatencyHistoryClient:
+    """Заглушка TelegramClient: история из памяти с задержкой на каждый запрос."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def __call__(self, request):
+        await asyncio.sleep(self.latency)
+        # Сообщения с ID в (min_id, offset_id) от новых к старым, как у сервера
+        end = bisect_left(IDS, request.offset_id) if request.offset_id else len(IDS)
+        start = max(bisect_right(IDS, request.min_id), end - request.limit)
+        return ChannelMessages(pts=1, count=len(IDS), messages=MESSAGES[start:end][::-1], topics=[], chats=[], users=[])
+
+
+async def run(latencies: Sequence[float]) -> None:
+    lanes = [CrawlLane(client=LatencyHistoryClient(latency), entity=ENTITY, name=f"session{i}", primary=i == 0)
+             for i, latency in enumerate(latencies)]
+    ranges = split_history_ranges(0, IDS[-1], len(lanes))
+    report, seen = BackfillReport(), set()
+    started = time.perf_counter()
+    async for page in iter_history_ranges(lanes, ranges, report=report, min_split=500):
+        seen.update(row[0] for row in page.batch.messages)
+    elapsed = time.perf_counter() - started
+    if seen != set(IDS):
+        print(f"Error: history is incomplete ({len(seen)} of {len(IDS)} messages)")
+    print(f"{len(lanes)} client(s){' (one slow)' if len(set(latencies)) > 1 else '':<11}: {elapsed:6.2f}s, "
+          f"{report.pages_fetched} pages, {report.ranges_stolen} stolen, {len(seen) / elapsed:,.0f} messages/s")
+
+
+async def main() -> None:
+    rate_limiter.initial_rate = rate_limiter.max_rate = rate_limiter.burst = 1e9
+    for sessions in (1, 2, 4, 8):
+        await run([LATENCY] * sessions)
+    await run([LATENCY] * 3 + [LATENCY * 3])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
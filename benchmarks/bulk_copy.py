@@ -0,0 +1,127 @@
+# telegram-intel/benchmarks/bulk_copy.py
+
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Table, select, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from data_collector_service.crud import USER_COLUMNS
+from data_collector_service.crud.bulk_copy import bulk_copy_upsert
+from data_collector_service.db.session import AsyncSessionFactory, async_engine
+from shared.models import User, ChatParticipant, TargetChat, AppUser
+from .common import BENCH_CHAT_ID, BenchmarkDatabaseError, require_benchmark_database
+
+# --- Бенчмарк массовой записи (crud.bulk_copy) ---
+# Запуск: python -m benchmarks.bulk_copy
+# Сравнивает скорость (строк/сек) записи пользователей и участников через прежний единый
+# INSERT ... VALUES, executemany и COPY на 1k/50k/500k строк. Нужен локальный пустой Postgres
+# с примененными миграциями (DATABASE_URL, см. common.require_benchmark_database) и хотя бы
+# один AppUser для тестового чата. Все тестовые строки пишутся с отрицательными ID и удаляются в конце.
+
+MAX_BIND_PARAMS = 32767
+
+
+def make_users(count: int, added_by: uuid.UUID) -> Tuple[List[str], List[Tuple]]:
+    # Те же колонки, что пишет сбор (crud.bulk_upsert_user_rows)
+    columns = [*USER_COLUMNS, "added_by_user_id"]
+    rows = [
+        (-i, i * 7919, f"bench_user_{i}", f"Bench{i}", "User", None, False, False, False, False, False, False, "en", added_by)
+        for i in range(1, count + 1)
+    ]
+    return columns, rows
+
+
+def make_participants(count: int) -> Tuple[List[str], List[Tuple]]:
+    columns = ["chat_id", "user_id", "participant_type", "inviter_user_id", "joined_date"]
+    joined = datetime.now(timezone.utc)
+    rows = [(BENCH_CHAT_ID, -i, "member", None, joined) for i in range(1, count + 1)]
+    return columns, rows
+
+
+async def run_values(db: AsyncSession, table: Table, columns, rows, conflict_columns, update_columns, constraint) -> Optional[int]:
+    if len(rows) * len(columns) > MAX_BIND_PARAMS:
+        return None # Прежний путь на таком объеме падает с ошибкой лимита параметров
+    stmt = insert(table).values([dict(zip(columns, row)) for row in rows])
+    target = {"constraint": constraint} if constraint else {"index_elements": list(conflict_columns)}
+    stmt = stmt.on_conflict_do_update(**target, set_={name: getattr(stmt.excluded, name) for name in update_columns})
+    result = await db.execute(stmt)
+    return result.rowcount
+
+
+async def timed(table: Table, columns, rows, conflict_columns, update_columns, method: str, constraint=None) -> str:
+    async with AsyncSessionFactory() as db:
+        started = time.perf_counter()
+        if method == "values":
+            written = await run_values(db, table, columns, rows, conflict_columns, update_columns, constraint)
+            skipped = None if written is None else len(rows) - written
+        else:
+            result = await bulk_copy_upsert(
+                db, table=table, columns=columns, rows=rows, conflict_columns=conflict_columns,
+                update_columns=update_columns, constraint=constraint, method=method,
+            )
+            written, skipped = result.count, result.skipped
+        if written is None:
+            return "n/a"
+        await db.commit()
+        return f"{len(rows) / (time.perf_counter() - started):,.0f} rows/s ({skipped} skipped)"
+
+
+async def cleanup() -> None:
+    async with AsyncSessionFactory() as db:
+        await db.execute(delete(ChatParticipant).where(ChatParticipant.chat_id == BENCH_CHAT_ID))
+        await db.execute(delete(User).where(User.id < 0))
+        await db.commit()
+
+
+async def main() -> None:
+    try:
+        await require_benchmark_database()
+    except BenchmarkDatabaseError as e:
+        print(f"Error: {e}")
+        await async_engine.dispose()
+        return
+    async with AsyncSessionFactory() as db:
+        app_user_id = (await db.execute(select(AppUser.id).limit(1))).scalar_one_or_none()
+        if app_user_id is None:
+            print("Benchmark needs at least one AppUser in the database.")
+            await async_engine.dispose()
+            return
+        # Чат мог остаться от прерванного запуска
+        await db.execute(
+            insert(TargetChat).values(chat_id=BENCH_CHAT_ID, title="bulk_copy benchmark", added_by=app_user_id)
+            .on_conflict_do_nothing()
+        )
+        await db.commit()
+    try:
+        user_updates = [name for name in USER_COLUMNS if name != "id"] # Как в crud.bulk_upsert_user_rows
+        participant_updates = ["participant_type", "inviter_user_id", "joined_date"]
+        for count in (1_000, 50_000, 500_000):
+            user_columns, user_rows = make_users(count, app_user_id)
+            participant_columns, participant_rows = make_participants(count)
+            results = {"users": [], "participants": []}
+            for method in ("values", "executemany", "copy"):
+                # Каждый способ пишет в пустые таблицы (вставка), затем повторно те же строки (без изменений - пропускаются)
+                await cleanup()
+                for phase in ("insert", "update"):
+                    results["users"].append(f"{method}/{phase}=" + await timed(
+                        User.__table__, user_columns, user_rows, ["id"], user_updates, method))
+                    results["participants"].append(f"{method}/{phase}=" + await timed(
+                        ChatParticipant.__table__, participant_columns, participant_rows, ["chat_id", "user_id"],
+                        participant_updates, method, constraint="uq_chat_participant"))
+            for label, line in results.items():
+                print(f"{label:>12} {count:>7} rows: " + "  ".join(line))
+    finally:
+        await cleanup()
+        async with AsyncSessionFactory() as db:
+            await db.execute(delete(TargetChat).where(TargetChat.chat_id == BENCH_CHAT_ID))
+            await db.commit()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
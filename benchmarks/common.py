@@ -0,0 +1,61 @@
+# telegram-intel/benchmarks/common.py
+
+from sqlalchemy import select, func
+from sqlalchemy.engine import make_url
+
+from data_collector_service.core.config import settings
+from data_collector_service.db.session import AsyncSessionFactory
+from shared.models import User, TargetChat, ChatParticipant, Message
+
+# --- Общее для бенчмарков ---
+# Бенчмарки с БД пишут тестовые строки с отрицательными ID (настоящие ID Telegram положительные)
+# и удаляют их в конце. Чтобы очистка не задела настоящие данные, они запускаются только на
+# локальном Postgres без собранных данных (require_benchmark_database).
+
+# ID тестового чата бенчмарков
+BENCH_CHAT_ID = -1
+
+# Хосты, которые считаются локальными
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+class BenchmarkDatabaseError(Exception):
+    """БД не подходит для бенчмарка (не локальная или в ней есть собранные данные)."""
+
+
+async def require_benchmark_database() -> None:
+    """
+    Проверяет, что DATABASE_URL указывает на локальный Postgres, в котором нет собранных данных
+    (строк с неотрицательными ID в users, target_chats, chat_participants и messages).
+    Остатки прошлого запуска бенчмарка (отрицательные ID) допускаются.
+
+    Raises:
+        BenchmarkDatabaseError: БД не локальная или не пустая.
+    """
+    host = make_url(settings.DATABASE_URL).host or "localhost" # Без хоста - unix-сокет
+    if host not in LOCAL_HOSTS:
+        raise BenchmarkDatabaseError(f"Benchmarks run only against a local database, DATABASE_URL points to '{host}'.")
+    checks = {
+        "users": select(func.count()).select_from(User).filter(User.id >= 0),
+        "target_chats": select(func.count()).select_from(TargetChat).filter(TargetChat.chat_id >= 0),
+        "chat_participants": select(func.count()).select_from(ChatParticipant).filter(ChatParticipant.chat_id >= 0),
+        "messages": select(func.count()).select_from(Message).filter(Message.chat_id >= 0),
+    }
+    async with AsyncSessionFactory() as db:
+        for table, query in checks.items():
+            rows = (await db.execute(query)).scalar_one()
+            if rows:
+                raise BenchmarkDatabaseError(f"Benchmarks run only against an empty database, '{table}' has {rows} row(s).")
+
+
+class FakeClock:
+    """Поддельные часы: sleep сдвигает время мгновенно (для ограничителя запросов и поддельных серверов)."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.now += max(seconds, 0.0)
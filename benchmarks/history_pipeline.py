@@ -0,0 +1,157 @@
+# telegram-intel/benchmarks/history_pipeline.py
+
+import asyncio
+import sys
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import List
+
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+from telethon.extensions import BinaryReader
+from telethon.tl.types import (
+    Channel, ChatPhotoEmpty, PeerChannel, PeerUser, User as TLUser, Message as TLMessage,
+    MessageEntityBold, MessageEntityUrl, MessageReplyHeader, MessageMediaDocument, Document,
+    DocumentAttributeFilename, MessageReactions, ReactionCount, ReactionEmoji,
+)
+from telethon.tl.types.messages import ChannelMessages
+
+from data_collector_service.db.session import AsyncSessionFactory, async_engine
+from data_collector_service.pipeline.fingerprints import ProfileFingerprintCache
+from data_collector_service.pipeline.history import run_history_pipeline
+from data_collector_service.telegram.rate_limiter import rate_limiter
+from shared.models import AppUser, TargetChat, User, Message, MessageEntity, MessageFile, CollectionCheckpoint
+from .common import BENCH_CHAT_ID, BenchmarkDatabaseError, require_benchmark_database
+
+# --- Бенчмарк загрузки истории (pipeline.history) ---
+# Запуск: python -m benchmarks.history_pipeline [fixture.bin]
+# Загружает историю через run_history_pipeline из записанной истории вместо Telegram: клиент-заглушка
+# отвечает на GetHistoryRequest страницами из фикстуры. Фикстура - подряд записанные ответы
+# GetHistoryRequest (bytes(result) объектов messages.ChannelMessages); без файла история
+# генерируется и проходит ту же сериализацию TL, что и ответы сервера. Нужен локальный пустой
+# Postgres с примененными миграциями (DATABASE_URL, см. common.require_benchmark_database) и хотя
+# бы один AppUser. Тестовый чат и пользователи получают отрицательные ID и удаляются в конце;
+# ограничитель запросов отключается.
+
+MESSAGES = 200_000
+SENDERS = 2_000
+
+
+class FixtureHistoryClient:
+    """Заглушка TelegramClient: история чата из записанных ответов GetHistoryRequest."""
+
+    def __init__(self, entity, messages, users):
+        self.entity = entity
+        self.messages = sorted(messages, key=lambda m: m.id)
+        self.ids = [m.id for m in self.messages]
+        self.users = {u.id: u for u in users}
+
+    async def get_entity(self, target):
+        return self.entity
+
+    async def __call__(self, request):
+        # add_offset=-limit: limit сообщений начиная с offset_id (от новых к старым, как у сервера)
+        start = bisect_left(self.ids, request.offset_id)
+        page = self.messages[start:start + request.limit]
+        senders = {m.from_id.user_id for m in page if isinstance(m.from_id, PeerUser)}
+        return ChannelMessages(
+            pts=1, count=len(self.messages), messages=page[::-1], topics=[], chats=[self.entity],
+            users=[self.users[user_id] for user_id in senders if user_id in self.users],
+        )
+
+
+def generate_fixture() -> List[bytes]:
+    date = datetime.now(timezone.utc)
+    users = [TLUser(id=-i, access_hash=i * 7919, first_name=f"Sender{i}", username=f"bench_sender_{i}") for i in range(1, SENDERS + 1)]
+    records = []
+    for start in range(1, MESSAGES + 1, 100):
+        page = []
+        for i in range(start, min(start + 100, MESSAGES + 1)):
+            text = f"Message {i}: see https://example.com/{i} for details"
+            media = None
+            if i % 10 == 0:
+                media = MessageMediaDocument(document=Document(
+                    id=i, access_hash=i, file_reference=b"", date=date, mime_type="application/pdf", size=i * 100,
+                    dc_id=2, attributes=[DocumentAttributeFilename(file_name=f"file{i}.pdf")],
+                ))
+            page.append(TLMessage(
+                id=i, peer_id=PeerChannel(-BENCH_CHAT_ID), date=date, message=text, from_id=PeerUser(-(i % SENDERS + 1)),
+                entities=[MessageEntityBold(offset=0, length=7), MessageEntityUrl(offset=len(f"Message {i}: see "), length=len(f"https://example.com/{i}"))],
+                reply_to=MessageReplyHeader(reply_to_msg_id=i - 1) if i % 7 == 0 else None, media=media,
+                views=i, forwards=i % 3,
+                reactions=MessageReactions(results=[ReactionCount(reaction=ReactionEmoji(emoticon="👍"), count=i % 5 + 1)]) if i % 4 == 0 else None,
+            ))
+        records.append(bytes(ChannelMessages(pts=1, count=MESSAGES, messages=page[::-1], topics=[], chats=[], users=users)))
+    return records
+
+
+def load_fixture(records: List[bytes]):
+    messages, users = [], {}
+    for record in records:
+        result = BinaryReader(record).tgread_object()
+        messages.extend(result.messages)
+        users.update((u.id, u) for u in result.users)
+    return messages, list(users.values())
+
+
+def read_records(path: str) -> List[bytes]:
+    # Ответы записаны подряд: BinaryReader читает их по одному
+    with open(path, "rb") as f:
+        data = f.read()
+    reader, records = BinaryReader(data), []
+    while reader.tell_position() < len(data):
+        start = reader.tell_position()
+        reader.tgread_object()
+        records.append(data[start:reader.tell_position()])
+    return records
+
+
+async def cleanup() -> None:
+    async with AsyncSessionFactory() as db:
+        await db.execute(delete(MessageEntity).where(MessageEntity.chat_id == BENCH_CHAT_ID))
+        await db.execute(delete(MessageFile).where(MessageFile.chat_id == BENCH_CHAT_ID))
+        await db.execute(delete(Message).where(Message.chat_id == BENCH_CHAT_ID))
+        await db.execute(delete(CollectionCheckpoint).where(CollectionCheckpoint.chat_id == BENCH_CHAT_ID))
+        await db.execute(delete(User).where(User.id < 0))
+        await db.commit()
+
+
+async def main() -> None:
+    try:
+        await require_benchmark_database()
+    except BenchmarkDatabaseError as e:
+        print(f"Error: {e}")
+        await async_engine.dispose()
+        return
+    rate_limiter.initial_rate = rate_limiter.max_rate = rate_limiter.burst = 1e9
+    records = read_records(sys.argv[1]) if len(sys.argv) > 1 else generate_fixture()
+    messages, users = load_fixture(records)
+    entity = Channel(id=-BENCH_CHAT_ID, title="history benchmark", photo=ChatPhotoEmpty(), date=datetime.now(timezone.utc), access_hash=1)
+    async with AsyncSessionFactory() as db:
+        app_user = (await db.execute(select(AppUser).limit(1))).scalar_one_or_none()
+        if app_user is None:
+            print("Benchmark needs at least one AppUser in the database.")
+            await async_engine.dispose()
+            return
+        await db.execute(insert(TargetChat).values(chat_id=BENCH_CHAT_ID, title="history benchmark", added_by=app_user.id).on_conflict_do_nothing())
+        await db.commit()
+    try:
+        await cleanup()
+        client = FixtureHistoryClient(entity, messages, users)
+        for label in ("initial load", "re-run (watermark)"):
+            stats = await run_history_pipeline(
+                client, BENCH_CHAT_ID, chat_id=BENCH_CHAT_ID, app_user=app_user, fingerprints=ProfileFingerprintCache(),
+            )
+            rate = stats.messages_per_second
+            print(f"{label:>20}: {stats.messages_fetched} fetched, {stats.messages_written} written, "
+                  f"{f'{rate:,.0f} messages/s' if rate else 'nothing to load'}")
+    finally:
+        await cleanup()
+        async with AsyncSessionFactory() as db:
+            await db.execute(delete(TargetChat).where(TargetChat.chat_id == BENCH_CHAT_ID))
+            await db.commit()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
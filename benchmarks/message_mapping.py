@@ -0,0 +1,48 @@
+# telegram-intel/benchmarks/message_mapping.py
+
+import time
+from datetime import datetime, timezone
+from typing import List, Tuple, Any
+
+from telethon.tl.types import (
+    User as TLUser, Message as TLMessage, PeerUser, PeerChannel, MessageReplyHeader,
+    MessageEntityBold, MessageEntityUrl, ReactionCount, ReactionEmoji, MessageReactions,
+)
+
+from data_collector_service.telegram.messages import MessageBatch
+
+# --- Микро-бенчмарк разбора страниц истории (telegram.messages) ---
+# Запуск: python -m benchmarks.message_mapping
+# Раскладывает сгенерированные страницы истории в строки MessageBatch; БД не нужна.
+
+PAGES = 500
+
+
+def make_page(start: int, size: int = 100) -> Tuple[List[Any], List[Any]]:
+    date = datetime.now(timezone.utc)
+    users = [TLUser(id=i, access_hash=i * 7919, first_name=f"User{i}") for i in range(1, 51)]
+    messages = []
+    for i in range(start, start + size):
+        text = f"Message {i} with a link https://example.com/{i} and some bold text"
+        messages.append(TLMessage(
+            id=i, peer_id=PeerChannel(1), date=date, message=text, from_id=PeerUser(i % 50 + 1),
+            entities=[MessageEntityBold(offset=0, length=7), MessageEntityUrl(offset=23, length=24)],
+            reply_to=MessageReplyHeader(reply_to_msg_id=i - 1) if i % 5 == 0 else None,
+            views=i, forwards=0,
+            reactions=MessageReactions(results=[ReactionCount(reaction=ReactionEmoji(emoticon="👍"), count=3)]) if i % 3 == 0 else None,
+        ))
+    return messages, users
+
+
+def main() -> None:
+    pages = [make_page(1 + n * 100) for n in range(PAGES)]
+    started = time.perf_counter()
+    batch = MessageBatch()
+    for page_messages, page_users in pages:
+        batch.merge(MessageBatch.from_page(page_messages, page_users))
+    elapsed = time.perf_counter() - started
+    print(f"Mapped {len(batch)} messages ({len(batch.entities)} entities) in {elapsed:.2f}s: {len(batch) / elapsed:,.0f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
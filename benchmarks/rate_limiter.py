@@ -0,0 +1,75 @@
+# telegram-intel/benchmarks/rate_limiter.py
+
+import asyncio
+
+from telethon.errors import FloodWaitError
+
+from data_collector_service.telegram.rate_limiter import RateLimiter, session_key
+from .common import FakeClock
+
+# --- Бенчмарк: адаптивный ограничитель против фиксированной паузы (telegram.rate_limiter) ---
+# Запуск: python -m benchmarks.rate_limiter
+# Поддельный клиент моделирует серверный лимит (скользящее окно) и возвращает FloodWaitError
+# при превышении; время поддельное, поэтому бенчмарк выполняется мгновенно.
+
+
+class FloodingClient:
+    """Сервер разрешает не более `limit` запросов за `window` секунд, иначе flood wait."""
+
+    def __init__(self, clock: FakeClock, limit: int = 30, window: float = 10.0, penalty: int = 5):
+        self.clock, self.limit, self.window, self.penalty = clock, limit, window, penalty
+        self.sent = []
+        self.blocked_until = 0.0
+        self.session = None
+
+    async def __call__(self, request):
+        now = self.clock()
+        self.clock.now += 0.15 # Время выполнения запроса
+        if now < self.blocked_until:
+            raise FloodWaitError(request=None, capture=int(self.blocked_until - now) + 1)
+        self.sent = [t for t in self.sent if t > now - self.window]
+        if len(self.sent) >= self.limit:
+            self.blocked_until = now + self.penalty
+            raise FloodWaitError(request=None, capture=self.penalty)
+        self.sent.append(now)
+        return "page"
+
+
+class GetParticipantsRequest:
+    pass
+
+
+async def fixed_sleep_policy(clock, client, duration):
+    pages = 0
+    while clock() < duration:
+        try:
+            await client(GetParticipantsRequest())
+            pages += 1
+            await clock.sleep(1) # Прежняя фиксированная пауза
+        except FloodWaitError as e:
+            await clock.sleep(e.seconds + 1)
+    return pages
+
+
+async def limiter_policy(clock, client, duration):
+    limiter = RateLimiter(initial_rate=1.0, clock=clock, sleep=clock.sleep)
+    pages = 0
+    while clock() < duration:
+        await limiter.call(client, GetParticipantsRequest())
+        pages += 1
+    return pages, limiter, client
+
+
+async def main():
+    duration = 600.0
+    clock = FakeClock()
+    fixed = await fixed_sleep_policy(clock, FloodingClient(clock), duration)
+    clock = FakeClock()
+    adaptive, limiter, client = await limiter_policy(clock, FloodingClient(clock), duration)
+    print(f"fixed sleep(1): {fixed / duration * 60:6.1f} pages/min")
+    print(f"adaptive:       {adaptive / duration * 60:6.1f} pages/min "
+          f"(flood waits: {limiter.stats.flood_waits}, final rate {limiter.rate((session_key(client), 'GetParticipantsRequest')):.2f} req/s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
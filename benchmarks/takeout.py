@@ -0,0 +1,130 @@
+# telegram-intel/benchmarks/takeout.py
+
+import asyncio
+import contextlib
+import io
+import math
+from datetime import datetime, timezone
+
+from telethon.errors import FloodWaitError, RPCError
+from telethon.tl.functions import InvokeWithTakeoutRequest
+from telethon.tl.functions.account import InitTakeoutSessionRequest, FinishTakeoutSessionRequest
+from telethon.tl.functions.channels import GetParticipantsRequest
+from telethon.tl.functions.messages import GetHistoryRequest
+from telethon.tl.types import (
+    Channel, ChatPhotoEmpty, PeerChannel, InputPeerChannel, Message as TLMessage,
+    User as TLUser, ChannelParticipant, account,
+)
+from telethon.tl.types.channels import ChannelParticipants
+from telethon.tl.types.messages import ChannelMessages
+
+from data_collector_service.telegram.collector import iter_chat_history, iter_chat_participants
+from data_collector_service.telegram.rate_limiter import rate_limiter
+from data_collector_service.telegram.takeout import takeout_session
+from .common import FakeClock
+
+# --- Бенчмарк: экспорт через takeout-сессию против обычного сбора (telegram.takeout) ---
+# Запуск: python -m benchmarks.takeout
+# Поддельный клиент моделирует серверные лимиты (скользящее окно) отдельно для обычных запросов
+# и для запросов внутри takeout-сессии и возвращает FloodWaitError при превышении. Выгружаются
+# история (iter_chat_history) и участники (iter_chat_participants) одного канала; время
+# поддельное (ограничитель ждет по тем же часам), поэтому бенчмарк выполняется мгновенно. БД не нужна.
+
+MESSAGES = 50_000
+PARTICIPANTS = 9_000
+WINDOW = 30.0
+BUDGETS = {"normal": 30, "takeout": 300} # Запросов за WINDOW секунд
+DATE = datetime.now(timezone.utc)
+ENTITY = Channel(id=1, title="takeout benchmark", photo=ChatPhotoEmpty(), date=DATE, access_hash=1, megagroup=True)
+
+
+class FakeSession:
+    filename = "benchmark.session"
+    takeout_id = None
+
+
+class ExportServer:
+    """Канал на сервере: лимит запросов за WINDOW секунд свой для обычных и takeout-запросов."""
+
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.session = FakeSession()
+        self.sent = {budget: [] for budget in BUDGETS}
+        self.requests = {budget: 0 for budget in BUDGETS}
+        self.flood_waits = 0
+
+    async def get_entity(self, target):
+        return ENTITY
+
+    async def get_input_entity(self, peer):
+        return InputPeerChannel(channel_id=ENTITY.id, access_hash=ENTITY.access_hash)
+
+    def check_budget(self, budget: str) -> None:
+        now = self.clock()
+        self.clock.now += 0.1 # Время выполнения запроса
+        sent = self.sent[budget] = [t for t in self.sent[budget] if t > now - WINDOW]
+        if len(sent) >= BUDGETS[budget]:
+            self.flood_waits += 1
+            raise FloodWaitError(request=None, capture=math.ceil(sent[0] + WINDOW - now))
+        sent.append(now)
+        self.requests[budget] += 1
+
+    async def __call__(self, request, ordered=False):
+        budget = "normal"
+        if isinstance(request, InvokeWithTakeoutRequest):
+            budget, request = "takeout", request.query
+        if isinstance(request, InitTakeoutSessionRequest):
+            return account.Takeout(id=42)
+        if isinstance(request, FinishTakeoutSessionRequest):
+            return True
+        self.check_budget(budget)
+        if isinstance(request, GetHistoryRequest):
+            # add_offset=-limit: limit сообщений начиная с offset_id, от новых к старым
+            first = max(request.offset_id, 1)
+            ids = range(min(first + request.limit, MESSAGES + 1) - 1, first - 1, -1)
+            return ChannelMessages(pts=1, count=MESSAGES, topics=[], chats=[], users=[], messages=[
+                TLMessage(id=i, peer_id=PeerChannel(ENTITY.id), date=DATE, message=f"Message {i}") for i in ids
+            ])
+        if isinstance(request, GetParticipantsRequest):
+            ids = range(request.offset + 1, min(request.offset + request.limit, PARTICIPANTS) + 1)
+            return ChannelParticipants(
+                count=PARTICIPANTS, chats=[],
+                participants=[ChannelParticipant(user_id=i, date=DATE) for i in ids],
+                users=[TLUser(id=i, access_hash=i, first_name=f"User{i}") for i in ids],
+            )
+        # Остальные методы поддельный сервер не знает - отвечает как сервер на неизвестный метод
+        raise RPCError(request, f"METHOD_INVALID ({type(request).__name__})", 400)
+
+
+async def export(client) -> int:
+    rows = 0
+    with contextlib.redirect_stdout(io.StringIO()): # Сборщики пишут строку на каждую страницу
+        async for page in iter_chat_history(client, ENTITY.id):
+            rows += len(page)
+        async for page in iter_chat_participants(client, ENTITY.id):
+            rows += len(page.batch)
+    return rows
+
+
+async def run(label: str, use_takeout: bool) -> None:
+    clock = FakeClock()
+    rate_limiter.clock, rate_limiter.sleep = clock, clock.sleep
+    rate_limiter._buckets.clear()
+    server = ExportServer(clock)
+    if use_takeout:
+        async with takeout_session(server) as takeout_client:
+            rows = await export(takeout_client)
+    else:
+        rows = await export(server)
+    requests = sum(server.requests.values())
+    print(f"{label:>8}: {rows} rows ({MESSAGES} messages + {PARTICIPANTS} participants) in {requests} requests, "
+          f"{clock.now / 60:5.1f} min, {rows / clock.now:6.1f} rows/s, flood waits {server.flood_waits}")
+
+
+async def main() -> None:
+    await run("normal", use_takeout=False)
+    await run("takeout", use_takeout=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
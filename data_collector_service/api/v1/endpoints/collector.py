@@ -1,11 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional, Union
+from contextlib import AsyncExitStack
+import asyncio
+import json
+import time
+import uuid
+from typing import Optional, Union, List, Dict, Any, Callable, Awaitable, AsyncIterator
 
 # Импортируем зависимости, CRUD, схемы, модели, Telethon-логику
-from data_collector_service.db.session import get_db # Локальная get_db
+from data_collector_service.db.session import get_db, AsyncSessionFactory # Локальная get_db
 from data_collector_service import schemas, crud
-from data_collector_service.telegram.collector import collect_chat_data, ChatDataType, ParticipantsDataType
+from data_collector_service.core.config import settings
+from data_collector_service.telegram.client import telegram_client_session, session_dc_id
+from data_collector_service.telegram.session_pool import session_pool
+from data_collector_service.telegram.collector import get_chat_info, get_channels_info
+from telethon import utils
+from telethon.tl.types import PeerChannel
+from data_collector_service.telegram.takeout import TakeoutClient, takeout_session, TakeoutUnavailableError
+from data_collector_service.pipeline import (
+    run_participant_pipeline, fingerprint_cache, refresh_from_admin_log, save_admin_log_watermark, run_history_pipeline,
+    run_history_backfill, progress_hub, ProgressEvent, JobPreempted,
+)
+from data_collector_service.jobs import (
+    job_runner, resolve_target_key, resolve_target_keys, collection_flight, job_priority, effective_quota, queue_slots_left,
+)
 from shared.models import AppUser as CurrentUserModel # Модель AppUser из shared
 # Импортируем общую зависимость аутентификации из shared
 from shared.dependencies.auth import get_current_user
@@ -22,84 +41,172 @@ async def get_current_user_dependency(db: AsyncSession = Depends(get_db)):
 async def process_and_save_collection(
     db: AsyncSession,
     app_user: CurrentUserModel,
-    chat_target: Union[int, str]
+    chat_target: Union[int, str],
+    takeout: Optional[bool] = None,
+    progress: Optional[Callable[[str, Optional[int]], Awaitable[None]]] = None,
+    participants: bool = True,
+    history: Optional[bool] = None,
 ) -> schemas.CollectChatResponse:
     """
     Выполняет сбор данных из Telegram и сохраняет их в БД.
-    Вызывается либо напрямую, либо через BackgroundTasks.
+    Участники сохраняются потоково, страница за страницей (см. pipeline.participants).
+    Вызывается обработчиком очереди задач (jobs.runner) либо напрямую (JOB_QUEUE_ENABLED=false).
+    takeout - собирать участников и историю через takeout-сессию (None - settings.TAKEOUT_EXPORT_ENABLED).
+    progress - колбэк этапа сбора (stage, chat_id), задача очереди сохраняет его в collection_jobs.
+    participants, history - что собирать (history=None - settings.HISTORY_COLLECTION_ENABLED).
     """
+    async def report(stage: str) -> None:
+        if progress is not None:
+            await progress(stage, response_chat_id)
+
     print(f"Starting data collection for target '{chat_target}' by user {app_user.email}")
     response_msg = f"Сбор данных для '{chat_target}' инициирован."
     response_chat_id = None
     response_status = None
     target_chat_db = None # Переменная для хранения объекта TargetChat из БД
+    chat_data = None
+    pipeline_stats = None
+    history_stats = None
 
-    # 1. Выполнить сбор данных из Telegram
-    chat_data, participants_list = await collect_chat_data(app_user, chat_target)
+    # export_stack закрывается раньше клиента: takeout-сессия завершается, пока клиент подключен
+    async with telegram_client_session(app_user) as client, AsyncExitStack() as export_stack:
+        if not client:
+            print(f"Failed to get Telegram client for user {app_user.email}")
+            return schemas.CollectChatResponse(message=f"Не удалось подключиться к Telegram для сбора '{chat_target}'.")
 
-    if chat_data:
-        response_chat_id = chat_data.get("id")
-        print(f"Collected chat info for ID: {response_chat_id}")
-        # 2. Создать или обновить TargetChat в БД
-        try:
-            target_chat_db = await crud.create_or_update_target_chat(
-                db=db,
-                chat_data=chat_data,
-                added_by_user=app_user,
-                initial_status="collecting" # Начинаем со статуса сбора
-            )
-            response_status = target_chat_db.status
-            response_msg = f"Информация о чате '{chat_data.get('title', chat_target)}' (ID: {response_chat_id}) сохранена/обновлена."
-        except Exception as e:
-            print(f"Error saving target chat data for {response_chat_id}: {e}")
-            response_msg = f"Ошибка сохранения информации о чате '{chat_target}'."
-            # Не прерываем, попробуем сохранить участников, если они есть
-    else:
-        # Попробовать найти чат в БД по имени/id, если он был добавлен ранее
-        if isinstance(chat_target, int):
-             target_chat_db = await crud.get_target_chat_by_chat_id(db, chat_id=chat_target)
-             if target_chat_db: response_chat_id = target_chat_db.chat_id
-        # TODO: Добавить поиск по username, если chat_target - строка
-        response_msg = f"Не удалось получить информацию о чате '{chat_target}' из Telegram."
-        print(response_msg)
-
-    if participants_list:
-        print(f"Collected {len(participants_list)} participants for chat ID: {response_chat_id}")
-        if response_chat_id is None:
-             print("Warning: Cannot save participants without a valid chat ID.")
-             response_msg += " Не удалось сохранить участников, т.к. ID чата неизвестен."
-        else:
-            # 3. Преобразовать участников в схему для валидации/обработки
-            valid_participants_data = []
-            for p_dict in participants_list:
-                try:
-                    # Пропускаем валидацию через Pydantic для скорости или добавляем обработку ошибок
-                    valid_participants_data.append(schemas.CollectedUserSchema.model_validate(p_dict)) # Pydantic V2
-                    # valid_participants_data.append(schemas.CollectedUserSchema.parse_obj(p_dict)) # Pydantic V1
-                except Exception as p_error:
-                    print(f"Warning: Skipping participant data due to validation error: {p_error}. Data: {p_dict}")
+        # 1. Получить информацию о чате из Telegram
+        await report("chat_info")
+        chat_data = await get_chat_info(client, chat_target)
 
-            # 4. Выполнить bulk upsert пользователей (User)
+        if chat_data:
+            response_chat_id = chat_data.get("id")
+            print(f"Collected chat info for ID: {response_chat_id}")
+            # 2. Создать или обновить TargetChat в БД
             try:
-                await crud.bulk_upsert_users(db=db, users_data=valid_participants_data, collected_by=app_user)
+                target_chat_db = await crud.create_or_update_target_chat(
+                    db=db,
+                    chat_data=chat_data,
+                    added_by_user=app_user,
+                    initial_status="collecting" # Начинаем со статуса сбора
+                )
+                response_status = target_chat_db.status
+                response_msg = f"Информация о чате '{chat_data.get('title', chat_target)}' (ID: {response_chat_id}) сохранена/обновлена."
             except Exception as e:
-                 print(f"Error during bulk user upsert for chat {response_chat_id}: {e}")
-                 response_msg += " Ошибка при сохранении данных пользователей."
+                print(f"Error saving target chat data for {response_chat_id}: {e}")
+                response_msg = f"Ошибка сохранения информации о чате '{chat_target}'."
+        else:
+            # Попробовать найти чат в БД по имени/id, если он был добавлен ранее
+            if isinstance(chat_target, int):
+                 target_chat_db = await crud.get_target_chat_by_chat_id(db, chat_id=chat_target)
+                 if target_chat_db: response_chat_id = target_chat_db.chat_id
+            # TODO: Добавить поиск по username, если chat_target - строка
+            response_msg = f"Не удалось получить информацию о чате '{chat_target}' из Telegram."
+            print(response_msg)
 
-            # 5. Выполнить bulk upsert участников (ChatParticipant)
+        # Режим экспорта: участники и история собираются через takeout-сессию (у нее мягче лимиты)
+        export_client = client
+        if target_chat_db is not None and (takeout if takeout is not None else settings.TAKEOUT_EXPORT_ENABLED):
             try:
-                await crud.bulk_upsert_participants(db=db, chat_id=response_chat_id, participants_data=valid_participants_data)
-                response_msg += f" Сохранено/обновлено {len(valid_participants_data)} участников."
-            except Exception as e:
-                 print(f"Error during bulk participant upsert for chat {response_chat_id}: {e}")
-                 response_msg += " Ошибка при сохранении связей участников с чатом."
-    else:
-        print(f"No participants collected or failed to collect for chat ID: {response_chat_id}")
-        # response_msg += " Участники не были собраны." # Можно не добавлять, если это ожидаемо
+                export_client = await export_stack.enter_async_context(takeout_session(client))
+            except TakeoutUnavailableError as e:
+                print(f"Warning: {e}. Collecting without takeout.")
+                response_msg += " Режим экспорта (takeout) недоступен, сбор выполнен обычным способом."
+
+        # 3. Потоково собрать и сохранить участников (страницы пишутся в БД по мере получения)
+        if target_chat_db is None:
+            print("Warning: Cannot save participants without a saved target chat.")
+            response_msg += " Не удалось сохранить участников, т.к. чат не сохранен в БД."
+        else:
+            if participants:
+                await report("participants")
+            # Каналы, где аккаунт - администратор: состав обновляется по журналу администратора
+            admin_log_stats = None
+            if participants and settings.ADMIN_LOG_INCREMENTAL_ENABLED and chat_data and chat_data.get("is_admin"):
+                try:
+                    admin_log_stats = await refresh_from_admin_log(client, chat_target, chat_id=response_chat_id, app_user=app_user)
+                except Exception as e:
+                    print(f"Error: Admin log refresh for chat {response_chat_id} failed: {e}")
+            if admin_log_stats is not None and admin_log_stats.applied:
+                response_msg += (f" Состав обновлен по журналу администратора: событий {admin_log_stats.events},"
+                                 f" состоят {admin_log_stats.members_present}, вышли {admin_log_stats.members_left}.")
+            elif participants:
+                # Дополнительные аккаунты из пула сессий: страницы участников распределяются между ними
+                async with session_pool.lease(
+                    settings.SESSION_POOL_SESSIONS_PER_JOB - 1, exclude=[app_user.session_file]
+                ) as lease:
+                    pipeline_stats = await run_participant_pipeline(
+                        export_client,
+                        chat_target,
+                        chat_id=response_chat_id,
+                        app_user=app_user,
+                        limit=0, # TODO: брать лимит из запроса API
+                        participants_count=chat_data.get("participants_count") if chat_data else None,
+                        extra_clients=lease.clients,
+                    )
+                if pipeline_stats.rows_written:
+                    response_msg += f" Сохранено/обновлено {pipeline_stats.rows_written} участников."
+                if pipeline_stats.users_unchanged or pipeline_stats.participations_unchanged:
+                    response_msg += (f" Изменилось пользователей: {pipeline_stats.users_changed}, без изменений: {pipeline_stats.users_unchanged};"
+                                     f" записей об участии: {pipeline_stats.participations_changed}, без изменений: {pipeline_stats.participations_unchanged}.")
+                if pipeline_stats.users_cached:
+                    response_msg += f" Профили {pipeline_stats.users_cached} пользователей не изменились (кеш), в БД не отправлялись."
+                if pipeline_stats.coverage is not None:
+                    response_msg += f" Покрытие: {pipeline_stats.coverage:.1%} от {pipeline_stats.participants_count}."
+                if pipeline_stats.pages_not_modified:
+                    response_msg += f" Без изменений с прошлого сбора: {pipeline_stats.rows_not_modified} участников ({pipeline_stats.pages_not_modified} страниц)."
+                if pipeline_stats.resumed:
+                    response_msg += " Сбор участников продолжен с чекпоинта."
+                if pipeline_stats.write_errors:
+                    response_msg += " Часть страниц участников не удалось сохранить."
+                if pipeline_stats.snapshot_status == "completed" and not pipeline_stats.snapshot_baseline:
+                    response_msg += f" Состав с прошлого сбора: вошли {pipeline_stats.members_joined}, вышли {pipeline_stats.members_left}."
+                if pipeline_stats.checkpoint_status == "interrupted":
+                    response_msg += " Сбор участников прерван, повторный запуск продолжит его с места остановки."
+                if admin_log_stats is not None and admin_log_stats.watermark is not None and pipeline_stats.checkpoint_status == "completed":
+                    # Следующее обновление пойдет по журналу с событий, начиная с начала этого перебора
+                    await save_admin_log_watermark(response_chat_id, admin_log_stats.watermark, app_user.session_file)
+                if not pipeline_stats.rows_fetched:
+                    print(f"No participants collected or failed to collect for chat ID: {response_chat_id}")
 
-    # 6. Обновить статус TargetChat на 'collected' или 'error'
+            # 4. Загрузить новые сообщения истории (после водяного знака прошлой загрузки)
+            if history if history is not None else settings.HISTORY_COLLECTION_ENABLED:
+                await report("history")
+                try:
+                    if settings.HISTORY_BACKFILL_ENABLED:
+                        # Первая загрузка всей истории - по диапазонам ID всеми аккаунтами из пула
+                        async with session_pool.lease(
+                            settings.SESSION_POOL_SESSIONS_PER_JOB - 1, exclude=[app_user.session_file]
+                        ) as lease:
+                            backfill_stats = await run_history_backfill(
+                                export_client, chat_target, chat_id=response_chat_id, app_user=app_user, extra_clients=lease.clients,
+                            )
+                        if not backfill_stats.skipped:
+                            response_msg += (f" История загружена по диапазонам ({backfill_stats.sessions} аккаунт(ов)):"
+                                             f" сохранено сообщений {backfill_stats.messages_written}.")
+                            if backfill_stats.checkpoint_status == "interrupted":
+                                response_msg += " Загрузка истории прервана, повторный запуск продолжит незагруженные диапазоны."
+                    history_stats = await run_history_pipeline(export_client, chat_target, chat_id=response_chat_id, app_user=app_user)
+                    response_msg += f" Сохранено новых сообщений: {history_stats.messages_written}."
+                    if history_stats.checkpoint_status == "interrupted":
+                        response_msg += " Загрузка истории прервана, повторный запуск продолжит ее с последнего сохраненного сообщения."
+                except JobPreempted:
+                    raise # Задача вернется в очередь: статус чата и итог экспорта не обновляются
+                except Exception as e:
+                    print(f"Error: History collection for chat {response_chat_id} failed: {e}")
+                    response_msg += " Не удалось загрузить историю сообщений."
+                    if isinstance(export_client, TakeoutClient):
+                        export_client.success = False
+
+        if isinstance(export_client, TakeoutClient) and export_client.success is None:
+            # Прерванный экспорт сообщается Telegram как неуспешный
+            export_client.success = not (
+                (pipeline_stats is not None and pipeline_stats.checkpoint_status == "interrupted")
+                or (history_stats is not None and history_stats.checkpoint_status == "interrupted")
+            )
+
+    # 5. Обновить статус TargetChat на 'collected' или 'error'
     final_status = "collected"
-    if chat_data is None and participants_list is None:
+    if chat_data is None and (pipeline_stats is None or pipeline_stats.rows_fetched == 0):
         final_status = "error" # Ошибка, если не удалось собрать ни чат, ни участников
     elif target_chat_db: # Если объект чата был создан/найден
         try:
@@ -122,55 +229,459 @@ async def process_and_save_collection(
 
 
 # --- API Эндпоинт ---
-# Используем BackgroundTasks для неблокирующего выполнения (простой вариант без Celery)
-# Внимание: BackgroundTasks имеют ограничения по ресурсам и надежности для долгих задач!
+# Сбор ставится в очередь задач в Postgres (см. jobs.runner) и выполняется обработчиком очереди:
+# запрос отвечает сразу, статус и прогресс - GET /collect/{task_id}. Повторный запрос того же
+# чата (в любой форме: ID, @username, ссылка) присоединяется к активной задаче (см. jobs.coalescing).
 @router.post("/collect", response_model=schemas.CollectChatResponse, status_code=status.HTTP_202_ACCEPTED)
 async def trigger_chat_collection(
     request_data: schemas.CollectChatRequest, # Данные из тела запроса (chat_target)
-    background_tasks: BackgroundTasks, # Механизм фоновых задач FastAPI
     db: AsyncSession = Depends(get_db), # Локальная сессия БД
     current_user: CurrentUserModel = Depends(get_current_user_dependency) # Текущий пользователь
 ):
     """
-    Запускает сбор данных для указанного чата/канала в фоновом режиме.
+    Ставит сбор данных для указанного чата/канала в очередь и возвращает ID задачи.
     """
     print(f"Received collection request for '{request_data.chat_target}' from user {current_user.email}")
 
-    # Добавляем основную логику сбора и сохранения в фоновую задачу
-    # Передаем КОПИИ необходимых данных, а не объекты сессии или пользователя напрямую,
-    # если бы это были сложные объекты (для простых ID/строк это не так критично).
-    # В нашем случае передаем chat_target и объект current_user (он будет доступен).
-    # Сессия db будет создана заново внутри фоновой задачи при вызове Depends(get_db).
-    # НЕ передавайте db из этого эндпоинта в фоновую задачу!
-
-    # Мы НЕ МОЖЕМ напрямую передать Depends(get_db) в фоновую задачу.
-    # Поэтому process_and_save_collection должна уметь работать с сессией,
-    # которую она получит через Depends(), когда будет вызвана фоново.
-    # Переделываем process_and_save_collection, чтобы она принимала Depends()
-
-    # *** Альтернативный (СИНХРОННЫЙ) вариант для простоты отладки ***
-    # Уберите background_tasks и вызовите напрямую:
-    # response = await process_and_save_collection(db=db, app_user=current_user, chat_target=request_data.chat_target)
-    # return response
-    # *****************************************************************
-
-    # *** Вариант с BackgroundTasks ***
-    # Функция process_and_save_collection ДОЛЖНА быть изменена, чтобы принимать user_id, а не объект user,
-    # и получать db сессию через Depends() внутри себя. Либо использовать contextvars.
-    # Это усложнение. Пока оставим СИНХРОННЫЙ вариант для простоты и выполнения ТЗ
-    # (там указан Celery, а не BackgroundTasks).
-
-    # ВЫПОЛНЯЕМ СИНХРОННО (для простоты, пока нет Celery)
-    response = await process_and_save_collection(
-        db=db, # Используем сессию из эндпоинта
+    target_key, known_chat_id = await resolve_target_key(db, request_data.chat_target)
+
+    if not settings.JOB_QUEUE_ENABLED:
+        # Сбор прямо в запросе (для отладки, без очереди); одновременные запросы чата ждут один сбор
+        async def collect() -> schemas.CollectChatResponse:
+            # Своя сессия: общий сбор не должен зависеть от запроса, который его начал
+            async with AsyncSessionFactory() as collection_db:
+                return await process_and_save_collection(
+                    db=collection_db,
+                    app_user=current_user,
+                    chat_target=request_data.chat_target,
+                    takeout=request_data.takeout,
+                )
+
+        response, attached = await collection_flight.run(target_key, collect)
+        return response.model_copy(update={"attached": True}) if attached else response
+
+    # Квота очереди пользователя: присоединение к активной задаче ее не расходует
+    if await queue_slots_left(db, current_user) == 0 and await crud.get_active_collection_job(
+        db, target_key=target_key, chat_id=known_chat_id,
+    ) is None:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Очередь задач сбора пользователя заполнена")
+
+    options = {"takeout": request_data.takeout}
+    job, attached = await crud.enqueue_collection_job(
+        db,
         app_user=current_user,
-        chat_target=request_data.chat_target
+        chat_target=str(request_data.chat_target),
+        target_key=target_key,
+        chat_id=known_chat_id,
+        dc_id=session_dc_id(current_user.session_file) if current_user.session_file else None,
+        options=options,
+        priority=job_priority(options),
+    )
+    if attached:
+        print(f"Attached request for '{request_data.chat_target}' to active collection job {job.id} ({target_key})")
+        message = f"Сбор '{job.chat_target}' уже выполняется, запрос присоединен к задаче."
+    else:
+        job_runner.notify()
+        print(f"Queued collection job {job.id} for '{job.chat_target}' ({target_key})")
+        message = f"Сбор данных для '{request_data.chat_target}' поставлен в очередь."
+    return schemas.CollectChatResponse(
+        message=message,
+        chat_id=job.chat_id,
+        status=job.status,
+        task_id=str(job.id),
+        attached=attached,
+    )
+
+
+# --- Пакетный сбор ---
+# Цели пакета объединяются по каноническому ключу и ставятся в общую очередь задач: сколько
+# сборов выполняется одновременно (всего, на сессию, на DC), решают лимиты обработчиков очереди
+# (JOB_GLOBAL_CONCURRENCY, JOB_MAX_PER_SESSION, JOB_MAX_PER_DC). Каналы, уже сохраненные с
+# access_hash, запрашиваются пачками channels.getChannels: недоступные отсекаются сразу, а
+# остальные ставятся в очередь по ID (без ResolveUsername в каждой задаче). Ответ - поток NDJSON.
+# Пакет только с информацией о чатах (participants=false, history=false) - интерактивный класс
+# приоритета; цели сверх квоты очереди пользователя (collection_quotas.max_queued) не ставятся.
+@router.post("/collect/batch", status_code=status.HTTP_200_OK)
+async def trigger_batch_collection(
+    request_data: schemas.CollectBatchRequest,
+    current_user: CurrentUserModel = Depends(get_current_user_dependency)
+):
+    """
+    Ставит сбор списка чатов в очередь и построчно (NDJSON) отдает результат по каждой цели.
+    """
+    if not settings.JOB_QUEUE_ENABLED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Пакетный сбор требует очереди задач (JOB_QUEUE_ENABLED)")
+    if len(request_data.targets) > settings.COLLECT_BATCH_MAX_TARGETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Не больше {settings.COLLECT_BATCH_MAX_TARGETS} целей в одном запросе",
+        )
+    print(f"Received batch collection request for {len(request_data.targets)} targets from user {current_user.email}")
+    return StreamingResponse(stream_batch_collection(request_data, current_user), media_type="application/x-ndjson")
+
+
+def _batch_line(item: Union[schemas.CollectBatchItem, schemas.CollectBatchSummary]) -> str:
+    if isinstance(item, schemas.CollectBatchSummary):
+        return json.dumps({"summary": item.model_dump()}, ensure_ascii=False) + "\n"
+    return item.model_dump_json(exclude_none=True) + "\n"
+
+
+async def stream_batch_collection(
+    request_data: schemas.CollectBatchRequest, app_user: CurrentUserModel,
+) -> AsyncIterator[str]:
+    """
+    Генератор потока /collect/batch. Работает со своей сессией БД: поток живет дольше запроса.
+    Отключение клиента или истечение COLLECT_BATCH_STREAM_TIMEOUT останавливает только поток -
+    поставленные задачи выполняются дальше.
+    """
+    targets = request_data.targets
+    options = {"takeout": request_data.takeout, "participants": request_data.participants, "history": request_data.history}
+    priority = job_priority(options)
+    summary = schemas.CollectBatchSummary(
+        targets=len(targets), unique=0, duplicates=0, attached=0, resolved_in_bulk=0, completed=0, failed=0,
+    )
+    pending: Dict[uuid.UUID, List[schemas.CollectBatchItem]] = {} # Задача -> ждущие ее цели пакета
+
+    async with AsyncSessionFactory() as db:
+        resolved = await resolve_target_keys(db, targets)
+
+        # 1. Повторы (в любой форме записи) объединяются с первой целью того же ключа
+        first_index: Dict[str, int] = {}
+        for index, (target, (target_key, _)) in enumerate(zip(targets, resolved)):
+            if target_key in first_index:
+                summary.duplicates += 1
+                yield _batch_line(schemas.CollectBatchItem(
+                    index=index, target=target, target_key=target_key, status="duplicate", duplicate_of=first_index[target_key],
+                ))
+            else:
+                first_index[target_key] = index
+        summary.unique = len(first_index)
+
+        # 2. Сохраненные каналы с access_hash - пачками channels.getChannels
+        known_ids = [resolved[index][1] for index in first_index.values() if resolved[index][1] is not None]
+        channels = [
+            (target_chat.chat_id, target_chat.access_hash)
+            for target_chat in await crud.get_target_chats_by_chat_ids(db, known_ids)
+            if target_chat.access_hash is not None
+        ]
+        channels_info = {}
+        if channels:
+            async with telegram_client_session(app_user) as client:
+                if client:
+                    channels_info = await get_channels_info(client, channels)
+        summary.resolved_in_bulk = sum(1 for info in channels_info.values() if info is not None)
+
+        # 3. Постановка в очередь (или присоединение к уже выполняемым сборам)
+        dc_id = session_dc_id(app_user.session_file) if app_user.session_file else None
+        slots_left = await queue_slots_left(db, app_user)
+        for target_key, index in first_index.items():
+            target, chat_id = targets[index], resolved[index][1]
+            item = schemas.CollectBatchItem(index=index, target=target, target_key=target_key, status="queued", chat_id=chat_id)
+            chat_target = str(target)
+            if chat_id is not None and chat_id in channels_info:
+                info = channels_info[chat_id]
+                if info is None:
+                    item.status, item.error = "failed", "Нет доступа к каналу (channels.getChannels: ChannelForbidden)."
+                    summary.failed += 1
+                    yield _batch_line(item)
+                    continue
+                item.title = info.get("title")
+                # Сущность уже в кеше сессии: задача разрешит канал по ID, без ResolveUsername
+                chat_target = str(utils.get_peer_id(PeerChannel(chat_id)))
+            if slots_left == 0 and await crud.get_active_collection_job(db, target_key=target_key, chat_id=chat_id) is None:
+                item.status, item.error = "failed", "Очередь задач сбора пользователя заполнена."
+                summary.failed += 1
+                yield _batch_line(item)
+                continue
+            job, attached = await crud.enqueue_collection_job(
+                db, app_user=app_user, chat_target=chat_target, target_key=target_key, chat_id=chat_id, dc_id=dc_id,
+                options=options, priority=priority,
+            )
+            if slots_left is not None and not attached:
+                slots_left -= 1
+            item.task_id, item.status, item.attached = str(job.id), job.status, attached
+            item.chat_id = job.chat_id or chat_id
+            summary.attached += attached
+            pending.setdefault(job.id, []).append(item)
+            yield _batch_line(item)
+        job_runner.notify()
+
+    # 4. Результаты - по мере завершения задач, но не дольше COLLECT_BATCH_STREAM_TIMEOUT
+    deadline = time.monotonic() + settings.COLLECT_BATCH_STREAM_TIMEOUT
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(settings.COLLECT_BATCH_POLL_INTERVAL, remaining))
+        async with AsyncSessionFactory() as db:
+            jobs = await crud.get_collection_jobs(db, job_ids=list(pending))
+        for job in jobs:
+            if job.status not in crud.FINISHED_JOB_STATUSES:
+                continue
+            for item in pending.pop(job.id):
+                item.status, item.chat_id, item.error = job.status, job.chat_id or item.chat_id, job.error
+                item.result = schemas.CollectChatResponse.model_validate(job.result) if job.result else None
+                if job.status == 'completed':
+                    summary.completed += 1
+                else:
+                    summary.failed += 1
+                yield _batch_line(item)
+
+    # Незавершенные к сроку задачи выполняются дальше: клиент получает их task_id для /collect/{task_id}
+    for items in pending.values():
+        for item in items:
+            item.status = "queued"
+            summary.pending += 1
+            yield _batch_line(item)
+
+    yield _batch_line(summary)
+
+
+# --- Метрики очереди задач ---
+# Объявлен до /collect/{task_id}, иначе 'queue' разбирался бы как task_id
+@router.get("/collect/queue", response_model=schemas.CollectQueueStats)
+async def get_collection_queue_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUserModel = Depends(get_current_user_dependency)
+):
+    """
+    Возвращает общую глубину очереди и число выполняемых задач, а также время ожидания,
+    вытеснения и квоты текущего пользователя (метрики других пользователей не раскрываются).
+    """
+    rows = await crud.get_collection_queue_stats(db, window_seconds=settings.JOB_QUEUE_STATS_WINDOW)
+    own = next((row for row in rows if row["app_user_id"] == current_user.id), None)
+    tenant = None
+    if own is not None:
+        quotas = await crud.get_collection_quotas(db, app_user_ids=[current_user.id])
+        weight, max_running, max_queued = effective_quota(quotas.get(current_user.id))
+        tenant = schemas.CollectTenantQueueStats(
+            weight=weight, max_running=max_running, max_queued=max_queued,
+            **{key: float(value) if key.endswith("_seconds") and value is not None else value for key, value in own.items()},
+        )
+    return schemas.CollectQueueStats(
+        window_seconds=settings.JOB_QUEUE_STATS_WINDOW,
+        global_limit=settings.JOB_GLOBAL_CONCURRENCY,
+        queued=sum(row["queued"] for row in rows),
+        running=sum(row["running"] for row in rows),
+        tenant=tenant,
+    )
+
+
+# --- Статус задачи сбора ---
+@router.get("/collect/{task_id}", response_model=schemas.CollectJobStatus)
+async def get_collection_job_status(
+    task_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUserModel = Depends(get_current_user_dependency)
+):
+    """
+    Возвращает статус, этап и результат задачи сбора (и прогресс чекпоинтов чата).
+    """
+    job = await crud.get_collection_job(db, job_id=task_id, app_user_id=current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача сбора не найдена")
+    checkpoints = await crud.get_checkpoints(db, chat_id=job.chat_id) if job.chat_id is not None else []
+    return schemas.CollectJobStatus(
+        task_id=job.id,
+        status=job.status,
+        chat_target=job.chat_target,
+        chat_id=job.chat_id,
+        attempts=job.attempts,
+        attached_requests=job.attached_requests,
+        priority="interactive" if job.priority == crud.PRIORITY_INTERACTIVE else "bulk",
+        preemptions=job.preemptions,
+        progress=job.progress,
+        checkpoints=[schemas.CollectJobCheckpoint.model_validate(c) for c in checkpoints],
+        result=job.result,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+# --- Живой прогресс задачи сбора ---
+# События публикуются процессом, выполняющим задачу (pipeline.progress_hub), и раздаются из памяти:
+# WebSocket /collect/{task_id}/ws?token=... (браузер не может передать заголовок Authorization)
+# или SSE /collect/{task_id}/events. Поток закрывается после события 'finished'.
+def _final_event(job) -> Dict[str, Any]:
+    """Итоговое событие по записи задачи в БД (задача уже завершена)."""
+    event = ProgressEvent(
+        task_id=str(job.id), event="finished", stage="finished", chat_id=job.chat_id,
+        status=job.status, error=job.error, ts=time.time(),
+    ).to_dict()
+    event["result"] = job.result
+    return event
+
+
+async def watch_job_progress(job) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    События прогресса задачи до ее завершения. БД проверяется только если событий нет дольше
+    JOB_PROGRESS_STATUS_CHECK_INTERVAL (задача ждет в очереди или выполняется другим процессом):
+    изменившиеся статус или этап задачи отдаются событием 'status', иначе отдается None (для keep-alive).
+
+    Ограничение: события страниц, записей и flood wait'ов публикуются в progress_hub процесса,
+    который выполняет задачу. Если задачу выполняет другой процесс (отдельный обработчик
+    jobs.runner или другой экземпляр API), подписчик получает только события 'status' из
+    collection_jobs (этап сбора, обновляется на границах этапов) и итоговое событие.
+    """
+    if job.status in crud.FINISHED_JOB_STATUSES:
+        yield _final_event(job)
+        return
+    task_id = str(job.id)
+
+    def status_event(job) -> Dict[str, Any]:
+        return {"task_id": task_id, "event": "status", "status": job.status, "chat_id": job.chat_id, "progress": job.progress}
+
+    async with progress_hub.subscribe(task_id) as queue:
+        last_status = (job.status, job.progress)
+        if progress_hub.latest(task_id) is None:
+            # Задача еще в очереди или выполняется другим процессом: начальное состояние - из БД
+            yield status_event(job)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.JOB_PROGRESS_STATUS_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                async with AsyncSessionFactory() as db:
+                    job = await crud.get_collection_job(db, job_id=job.id)
+                if job is None or job.status in crud.FINISHED_JOB_STATUSES:
+                    if job is not None:
+                        yield _final_event(job)
+                    return
+                if (job.status, job.progress) != last_status:
+                    last_status = (job.status, job.progress)
+                    yield status_event(job) # Изменения задачи, выполняемой другим процессом
+                else:
+                    yield None
+                continue
+            if event.final and event.status in crud.FINISHED_JOB_STATUSES:
+                async with AsyncSessionFactory() as db: # Результат сбора - из записи задачи
+                    finished_job = await crud.get_collection_job(db, job_id=job.id)
+                payload = event.to_dict()
+                payload["result"] = finished_job.result if finished_job is not None else None
+                yield payload
+                return
+            yield event.to_dict() # 'finished' со статусом 'queued' - задача вернулась в очередь, ждем дальше
+
+
+@router.websocket("/collect/{task_id}/ws")
+async def collection_progress_ws(
+    websocket: WebSocket,
+    task_id: uuid.UUID,
+    token: str = Query(..., description="JWT токен доступа"),
+):
+    """
+    Поток событий прогресса задачи сбора (JSON-сообщения) по WebSocket.
+    """
+    async with AsyncSessionFactory() as db:
+        try:
+            current_user = await get_current_user(token=token, db=db)
+        except HTTPException:
+            current_user = None
+        if current_user is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        job = await crud.get_collection_job(db, job_id=task_id, app_user_id=current_user.id)
+    if job is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Задача сбора не найдена")
+        return
+    await websocket.accept()
+    try:
+        async for event in watch_job_progress(job):
+            if event is not None:
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
+
+
+@router.get("/collect/{task_id}/events")
+async def collection_progress_sse(
+    task_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUserModel = Depends(get_current_user_dependency)
+):
+    """
+    Поток событий прогресса задачи сбора (Server-Sent Events) - для клиентов без WebSocket.
+    """
+    job = await crud.get_collection_job(db, job_id=task_id, app_user_id=current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача сбора не найдена")
+
+    async def events() -> AsyncIterator[str]:
+        async for event in watch_job_progress(job):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# --- Статистика кеша отпечатков профилей ---
+@router.get("/fingerprint-cache", status_code=status.HTTP_200_OK)
+async def get_fingerprint_cache_stats(
+    current_user: CurrentUserModel = Depends(get_current_user_dependency)
+):
+    """
+    Возвращает счетчики кеша отпечатков профилей (попадания, промахи, доля попаданий).
+    """
+    return fingerprint_cache.metrics()
+
+
+# --- Снимки состава чата ---
+@router.get("/chats/{chat_id}/membership/snapshots", response_model=List[schemas.MembershipSnapshotPublic])
+async def list_membership_snapshots(
+    chat_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUserModel = Depends(get_current_user_dependency)
+):
+    """
+    Возвращает последние завершенные снимки состава чата (новые первыми).
+    """
+    return await crud.get_membership_snapshots(db, chat_id=chat_id, limit=limit)
+
+
+@router.get("/chats/{chat_id}/membership/diff", response_model=schemas.MembershipDiffResponse)
+async def get_membership_diff(
+    chat_id: int,
+    from_snapshot_id: Optional[int] = Query(None, description="Более ранний снимок (по умолчанию - предыдущий для to_snapshot_id)"),
+    to_snapshot_id: Optional[int] = Query(None, description="Более поздний снимок (по умолчанию - последний)"),
+    limit: int = Query(10000, ge=0, le=1000000, description="Максимум ID в каждом списке"),
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUserModel = Depends(get_current_user_dependency)
+):
+    """
+    Возвращает вошедших и вышедших участников чата между двумя завершенными снимками состава.
+    """
+    if to_snapshot_id is None:
+        latest = await crud.get_membership_snapshots(db, chat_id=chat_id, limit=1)
+        to_snapshot = latest[0] if latest else None
+    else:
+        to_snapshot = await crud.get_membership_snapshot(db, chat_id=chat_id, snapshot_id=to_snapshot_id)
+    if to_snapshot is None or to_snapshot.status != "completed":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Завершенный снимок состава чата не найден")
+
+    if from_snapshot_id is None:
+        from_snapshot_id = to_snapshot.previous_snapshot_id
+        if from_snapshot_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="У снимка нет предыдущего снимка для сравнения")
+    else:
+        from_snapshot = await crud.get_membership_snapshot(db, chat_id=chat_id, snapshot_id=from_snapshot_id)
+        if from_snapshot is None or from_snapshot.status != "completed":
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Завершенный снимок {from_snapshot_id} не найден")
+    if from_snapshot_id >= to_snapshot.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="from_snapshot_id должен быть раньше to_snapshot_id")
+
+    diff = await crud.get_membership_diff(db, chat_id=chat_id, from_snapshot_id=from_snapshot_id, to_snapshot_id=to_snapshot.id)
+    return schemas.MembershipDiffResponse(
+        chat_id=chat_id,
+        from_snapshot_id=from_snapshot_id,
+        to_snapshot_id=to_snapshot.id,
+        joined_count=len(diff.joined),
+        left_count=len(diff.left),
+        joined=diff.joined[:limit],
+        left=diff.left[:limit],
+        truncated=len(diff.joined) > limit or len(diff.left) > limit,
     )
-    # Статус 202 здесь не совсем корректен для синхронного выполнения,
-    # но оставим его как задел на будущее с Celery.
-    # Для синхронного можно вернуть 200 OK.
-    # Поменяем статус ответа в декораторе на 200 OK для синхронной версии.
-    # router = APIRouter()
-    # @router.post("/collect", response_model=schemas.CollectChatResponse, status_code=status.HTTP_200_OK)
-
-    return response # Возвращаем результат выполнения
\ No newline at end of file
@@ -31,6 +31,15 @@ class Settings(BaseSettings):
     def DATABASE_URL(self) -> str:
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    # --- Redis Settings ---
+    REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
+    REDIS_PORT: int = int(os.getenv("REDIS_PORT", "6379"))
+    REDIS_DB: int = int(os.getenv("REDIS_DB", "0"))
+
+    @property
+    def REDIS_URL(self) -> str:
+        return f"redis://{self.REDIS_HOST}:{self.REDIS_PORT}/{self.REDIS_DB}"
+
     # --- Telegram API Settings ---
     # Загружаем API_ID и API_HASH из .env
     # Преобразуем API_ID в int, так как Telethon ожидает число
@@ -52,6 +61,160 @@ class Settings(BaseSettings):
     # BASE_DIR уже определен выше как корень проекта
     SESSION_FILES_DIR: Path = BASE_DIR / "sessions"
 
+    # --- Collection Pipeline Settings ---
+    # Размер страницы GetParticipantsRequest (Telegram отдает не более 200 за запрос)
+    PARTICIPANTS_PAGE_SIZE: int = int(os.getenv("PARTICIPANTS_PAGE_SIZE", "200"))
+    # Максимум страниц в очереди между сборщиком и писателями в БД (backpressure)
+    PIPELINE_QUEUE_MAXSIZE: int = int(os.getenv("PIPELINE_QUEUE_MAXSIZE", "4"))
+    # Количество параллельных писателей в БД (у каждого своя сессия)
+    PIPELINE_WRITERS: int = int(os.getenv("PIPELINE_WRITERS", "2"))
+    # Сколько страниц писатель записывает в одной транзакции (каждая страница - в своем SAVEPOINT)
+    PIPELINE_PAGES_PER_COMMIT: int = int(os.getenv("PIPELINE_PAGES_PER_COMMIT", "10"))
+    # Хеши страниц прошлого сбора в GetParticipantsRequest: неизменившиеся страницы не загружаются и не пишутся
+    PARTICIPANTS_PAGE_HASHES_ENABLED: bool = os.getenv("PARTICIPANTS_PAGE_HASHES_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Пачки от этого размера пишутся в БД через COPY во временную таблицу, меньшие - executemany
+    BULK_COPY_MIN_ROWS: int = int(os.getenv("BULK_COPY_MIN_ROWS", "1000"))
+    # Размер порции executemany при массовом Upsert
+    BULK_EXECUTEMANY_CHUNK_SIZE: int = int(os.getenv("BULK_EXECUTEMANY_CHUNK_SIZE", "1000"))
+    # Кеш отпечатков профилей: пользователи с неизменившимся профилем не отправляются в БД
+    PROFILE_FINGERPRINT_CACHE_ENABLED: bool = os.getenv("PROFILE_FINGERPRINT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Максимум отпечатков в памяти процесса (LRU)
+    PROFILE_FINGERPRINT_CACHE_SIZE: int = int(os.getenv("PROFILE_FINGERPRINT_CACHE_SIZE", "500000"))
+    # Хранить отпечатки также в Redis (общий кеш для всех процессов сервиса)
+    PROFILE_FINGERPRINT_REDIS_ENABLED: bool = os.getenv("PROFILE_FINGERPRINT_REDIS_ENABLED", "false").lower() in ("1", "true", "yes")
+    # Время жизни отпечатка в Redis (сек)
+    PROFILE_FINGERPRINT_TTL: int = int(os.getenv("PROFILE_FINGERPRINT_TTL", "604800"))
+    # Снимки состава чата: каждый полный сбор участников сравнивается с предыдущим (входы/выходы)
+    MEMBERSHIP_SNAPSHOTS_ENABLED: bool = os.getenv("MEMBERSHIP_SNAPSHOTS_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Минимальное покрытие (доля от participants_count), при котором снимок считается полным.
+    # Неполный снимок не сравнивается: недостающие участники выглядели бы вышедшими
+    MEMBERSHIP_SNAPSHOT_MIN_COVERAGE: float = float(os.getenv("MEMBERSHIP_SNAPSHOT_MIN_COVERAGE", "1.0"))
+    # Обновлять состав каналов, где аккаунт - администратор, по журналу администратора (без полного перебора)
+    ADMIN_LOG_INCREMENTAL_ENABLED: bool = os.getenv("ADMIN_LOG_INCREMENTAL_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Событий журнала на запрос GetAdminLogRequest (Telegram отдает не более 100)
+    ADMIN_LOG_PAGE_SIZE: int = int(os.getenv("ADMIN_LOG_PAGE_SIZE", "100"))
+    # Больше событий с прошлого обновления - выполняется полный перебор участников
+    ADMIN_LOG_MAX_EVENTS: int = int(os.getenv("ADMIN_LOG_MAX_EVENTS", "20000"))
+    # Водяной знак старше этого (сек) не используется: Telegram хранит журнал 48 часов, события могли пропасть
+    ADMIN_LOG_MAX_WATERMARK_AGE: int = int(os.getenv("ADMIN_LOG_MAX_WATERMARK_AGE", "165600"))
+    # Чекпоинт сбора сохраняется после каждых N записанных страниц
+    CHECKPOINT_EVERY_PAGES: int = int(os.getenv("CHECKPOINT_EVERY_PAGES", "10"))
+    # Шардированный перебор участников (поиск по префиксам) для каналов больше порога
+    PARTICIPANTS_SHARDING_THRESHOLD: int = int(os.getenv("PARTICIPANTS_SHARDING_THRESHOLD", "10000"))
+    # Количество одновременных префиксных запросов
+    PARTICIPANTS_SHARD_CONCURRENCY: int = int(os.getenv("PARTICIPANTS_SHARD_CONCURRENCY", "4"))
+    # Максимальная длина префикса при рекурсивном делении
+    PARTICIPANTS_SHARD_MAX_DEPTH: int = int(os.getenv("PARTICIPANTS_SHARD_MAX_DEPTH", "3"))
+    # Запрос считается насыщенным (делится дальше), если count >= этого значения
+    PARTICIPANTS_SHARD_SATURATION: int = int(os.getenv("PARTICIPANTS_SHARD_SATURATION", "9000"))
+    # Письменности для алфавита префиксов (см. telegram/sharding.py SHARD_SCRIPTS)
+    PARTICIPANTS_SHARD_SCRIPTS: str = os.getenv("PARTICIPANTS_SHARD_SCRIPTS", "latin,digits,cyrillic,ukrainian")
+
+    # --- Message History Settings ---
+    # Загружать историю сообщений чата при сборе (/collect) после участников
+    HISTORY_COLLECTION_ENABLED: bool = os.getenv("HISTORY_COLLECTION_ENABLED", "false").lower() in ("1", "true", "yes")
+    # Размер страницы GetHistoryRequest (Telegram отдает не более 100 сообщений за запрос)
+    HISTORY_PAGE_SIZE: int = int(os.getenv("HISTORY_PAGE_SIZE", "100"))
+    # Сколько сообщений писатель истории отправляет в БД одной пачкой (COPY) и одной транзакцией
+    HISTORY_WRITE_BATCH_SIZE: int = int(os.getenv("HISTORY_WRITE_BATCH_SIZE", "5000"))
+    # Максимум пачек в очереди между сборщиком истории и писателем (backpressure)
+    HISTORY_QUEUE_MAXSIZE: int = int(os.getenv("HISTORY_QUEUE_MAXSIZE", "2"))
+    # Первая загрузка истории - параллельно по диапазонам ID всеми аккаунтами из пула сессий
+    HISTORY_BACKFILL_ENABLED: bool = os.getenv("HISTORY_BACKFILL_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Начальных диапазонов на один аккаунт (дальше работа перераспределяется делением диапазонов)
+    HISTORY_BACKFILL_RANGES_PER_SESSION: int = int(os.getenv("HISTORY_BACKFILL_RANGES_PER_SESSION", "1"))
+    # Диапазон делится между аккаунтами, только если в нем не меньше 2 * N непрочитанных ID
+    HISTORY_BACKFILL_MIN_SPLIT: int = int(os.getenv("HISTORY_BACKFILL_MIN_SPLIT", "2000"))
+
+    # --- Telegram Rate Limiter Settings ---
+    # Начальная/минимальная/максимальная скорость запросов на (сессию, метод), запросов/сек
+    RATE_LIMIT_INITIAL_RPS: float = float(os.getenv("RATE_LIMIT_INITIAL_RPS", "1.0"))
+    RATE_LIMIT_MIN_RPS: float = float(os.getenv("RATE_LIMIT_MIN_RPS", "0.05"))
+    RATE_LIMIT_MAX_RPS: float = float(os.getenv("RATE_LIMIT_MAX_RPS", "5.0"))
+    # Сколько запросов можно отправить подряд без ожидания
+    RATE_LIMIT_BURST: float = float(os.getenv("RATE_LIMIT_BURST", "3"))
+    # Повторы после FloodWaitError и максимальное ожидание, которое ограничитель готов выдержать (сек)
+    RATE_LIMIT_MAX_RETRIES: int = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+    RATE_LIMIT_MAX_FLOOD_WAIT: float = float(os.getenv("RATE_LIMIT_MAX_FLOOD_WAIT", "900"))
+
+    # --- Takeout Export Settings ---
+    # Собирать участников и историю через takeout-сессию (account.initTakeoutSession) - режим экспорта
+    TAKEOUT_EXPORT_ENABLED: bool = os.getenv("TAKEOUT_EXPORT_ENABLED", "false").lower() in ("1", "true", "yes")
+    # Начальная/максимальная скорость запросов внутри takeout-сессии (лимиты Telegram для экспорта мягче), запросов/сек
+    TAKEOUT_RATE_LIMIT_INITIAL_RPS: float = float(os.getenv("TAKEOUT_RATE_LIMIT_INITIAL_RPS", "3.0"))
+    TAKEOUT_RATE_LIMIT_MAX_RPS: float = float(os.getenv("TAKEOUT_RATE_LIMIT_MAX_RPS", "20.0"))
+
+    # --- Telegram Client Pool Settings ---
+    # Переиспользовать подключенные клиенты между сборами (false - подключение на каждый сбор, как раньше)
+    TELEGRAM_CLIENT_POOL_ENABLED: bool = os.getenv("TELEGRAM_CLIENT_POOL_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Максимальное количество одновременно подключенных клиентов
+    TELEGRAM_CLIENT_POOL_MAX_CLIENTS: int = int(os.getenv("TELEGRAM_CLIENT_POOL_MAX_CLIENTS", "20"))
+    # Простаивающий клиент отключается через это время (сек)
+    TELEGRAM_CLIENT_POOL_IDLE_TIMEOUT: float = float(os.getenv("TELEGRAM_CLIENT_POOL_IDLE_TIMEOUT", "900"))
+    # Интервал проверки простаивающего клиента пингом перед выдачей (сек)
+    TELEGRAM_CLIENT_POOL_HEALTH_CHECK_INTERVAL: float = float(os.getenv("TELEGRAM_CLIENT_POOL_HEALTH_CHECK_INTERVAL", "60"))
+    # Сколько клиентов подключить заранее при старте сервиса (0 - не прогревать)
+    TELEGRAM_CLIENT_POOL_PREWARM: int = int(os.getenv("TELEGRAM_CLIENT_POOL_PREWARM", "10"))
+
+    # --- Session Pool Settings ---
+    # Сколько аккаунтов (включая сессию пользователя) выдавать одному сбору (1 - только сессия пользователя)
+    SESSION_POOL_SESSIONS_PER_JOB: int = int(os.getenv("SESSION_POOL_SESSIONS_PER_JOB", "4"))
+    # Сколько сборов одновременно могут использовать один аккаунт пула
+    SESSION_POOL_MAX_JOBS_PER_SESSION: int = int(os.getenv("SESSION_POOL_MAX_JOBS_PER_SESSION", "1"))
+    # Flood wait не короче этого значения (сек) отправляет аккаунт на охлаждение
+    SESSION_POOL_COOLDOWN_THRESHOLD: float = float(os.getenv("SESSION_POOL_COOLDOWN_THRESHOLD", "60"))
+    # Охлаждение аккаунта после неудачного подключения (сек)
+    SESSION_POOL_FAILURE_COOLDOWN: float = float(os.getenv("SESSION_POOL_FAILURE_COOLDOWN", "600"))
+
+    # --- Collection Job Queue Settings ---
+    # Ставить /collect в очередь задач в Postgres (false - сбор выполняется прямо в запросе, как раньше)
+    JOB_QUEUE_ENABLED: bool = os.getenv("JOB_QUEUE_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Выполнять задачи очереди в процессе API (false - только отдельным обработчиком: python -m data_collector_service.jobs.runner)
+    JOB_WORKER_ENABLED: bool = os.getenv("JOB_WORKER_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Сколько задач сбора один процесс выполняет одновременно
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+    # Как часто проверять очередь, если новых задач нет (сек)
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "2.0"))
+    # Как часто выполняемая задача обновляет heartbeat (сек)
+    JOB_HEARTBEAT_INTERVAL: float = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))
+    # Задача без heartbeat дольше этого времени (сек) возвращается в очередь
+    JOB_STALE_AFTER: float = float(os.getenv("JOB_STALE_AFTER", "120"))
+    # Сколько раз задача может быть начата (после этого она завершается с ошибкой)
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    # Сколько задач сбора выполняется одновременно во всех процессах (0 - без ограничения)
+    JOB_GLOBAL_CONCURRENCY: int = int(os.getenv("JOB_GLOBAL_CONCURRENCY", "8"))
+    # Сколько задач одновременно выполняется через сессию одного пользователя (0 - без ограничения)
+    JOB_MAX_PER_SESSION: int = int(os.getenv("JOB_MAX_PER_SESSION", "1"))
+    # Сколько задач одновременно выполняется через аккаунты одного DC Telegram (0 - без ограничения)
+    JOB_MAX_PER_DC: int = int(os.getenv("JOB_MAX_PER_DC", "4"))
+    # Поток прогресса (WebSocket/SSE): если событий нет столько секунд, статус задачи проверяется в БД
+    # (задача могла выполняться другим процессом), а SSE-клиенту отправляется keep-alive
+    JOB_PROGRESS_STATUS_CHECK_INTERVAL: float = float(os.getenv("JOB_PROGRESS_STATUS_CHECK_INTERVAL", "15"))
+
+    # --- Fair Scheduling Settings ---
+    # Вес пользователя в справедливом распределении слотов очереди, если у него нет строки в collection_quotas
+    JOB_DEFAULT_WEIGHT: int = int(os.getenv("JOB_DEFAULT_WEIGHT", "1"))
+    # Сколько задач пользователя может ждать в очереди (0 - без ограничения; квота - collection_quotas.max_queued)
+    JOB_MAX_QUEUED_PER_USER: int = int(os.getenv("JOB_MAX_QUEUED_PER_USER", "0"))
+    # Вытеснять выполняемые задачи (на границе страницы) ради ждущих задач с более высоким приоритетом или недополучивших пользователей
+    JOB_PREEMPTION_ENABLED: bool = os.getenv("JOB_PREEMPTION_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Сколько секунд задача должна прождать в очереди, чтобы ради нее вытеснялась другая
+    JOB_PREEMPT_AFTER: float = float(os.getenv("JOB_PREEMPT_AFTER", "10"))
+    # Как часто обработчик ищет задачи для вытеснения (сек)
+    JOB_PREEMPTION_CHECK_INTERVAL: float = float(os.getenv("JOB_PREEMPTION_CHECK_INTERVAL", "5"))
+    # Сколько раз одну задачу можно вытеснить (дальше она выполняется до конца, чтобы не голодать)
+    JOB_MAX_PREEMPTIONS: int = int(os.getenv("JOB_MAX_PREEMPTIONS", "3"))
+    # Окно (сек), за которое считается время ожидания задач в метриках очереди
+    JOB_QUEUE_STATS_WINDOW: float = float(os.getenv("JOB_QUEUE_STATS_WINDOW", "3600"))
+
+    # --- Batch Collection Settings ---
+    # Максимум целей в одном запросе /collect/batch
+    COLLECT_BATCH_MAX_TARGETS: int = int(os.getenv("COLLECT_BATCH_MAX_TARGETS", "1000"))
+    # Как часто поток /collect/batch проверяет завершение задач (сек)
+    COLLECT_BATCH_POLL_INTERVAL: float = float(os.getenv("COLLECT_BATCH_POLL_INTERVAL", "2.0"))
+    # Сколько поток /collect/batch ждет завершения задач (сек); незавершенные отдаются со статусом queued и task_id
+    COLLECT_BATCH_STREAM_TIMEOUT: float = float(os.getenv("COLLECT_BATCH_STREAM_TIMEOUT", "3600"))
+
     class Config:
         env_file_encoding = 'utf-8'
         extra = 'ignore'
@@ -1,18 +1,102 @@
 # telegram-intel/data_collector_service/crud/__init__.py
 
-from .crud_target_chat import get_target_chat_by_chat_id, create_or_update_target_chat, update_target_chat_status
-from .crud_user import get_user_by_id, upsert_user, bulk_upsert_users
-from .crud_chat_participant import bulk_upsert_participants
+from .bulk_copy import UpsertResult, RETURN_COUNT, RETURN_SPLIT, RETURN_IDS
+from .crud_target_chat import (
+    get_target_chat_by_chat_id, get_target_chat_by_username, get_target_chats_by_chat_ids, get_target_chats_by_usernames,
+    create_or_update_target_chat, update_target_chat_status,
+)
+from .crud_user import get_user_by_id, upsert_user, bulk_upsert_users, bulk_upsert_user_rows, USER_COLUMNS
+from .crud_chat_participant import (
+    bulk_upsert_participants, bulk_upsert_participant_rows, PARTICIPANT_COLUMNS, apply_participant_membership,
+)
+from .crud_app_user import get_app_users_with_sessions
+from .crud_collection_checkpoint import get_checkpoint, get_checkpoints, save_checkpoint
+from .crud_participant_page_hash import get_participant_page_hashes, save_participant_page_hash
+from .unit_of_work import CollectionUnitOfWork, CollectionCommitError
+from .crud_membership import (
+    MembershipDiff, start_membership_snapshot, stage_membership_members, set_membership_snapshot_status,
+    discard_membership_snapshot, complete_membership_snapshot, get_membership_snapshot, get_membership_snapshots,
+    get_membership_diff,
+)
+from .crud_message import MessageInsertResult, bulk_insert_message_rows
+from .crud_collection_job import (
+    FINISHED_JOB_STATUSES, ACTIVE_JOB_STATUSES, create_collection_job, get_active_collection_job, enqueue_collection_job,
+    get_collection_job, get_collection_jobs, claim_collection_job, update_collection_job,
+    finish_collection_job, release_collection_jobs, requeue_stale_collection_jobs,
+    PRIORITY_INTERACTIVE, PRIORITY_BULK, preempt_collection_job, request_collection_job_preemptions,
+    get_collection_queue_stats,
+)
+from .crud_collection_quota import get_collection_quota, get_collection_quotas, count_queued_collection_jobs
 
 __all__ = [
+    # Upsert
+    "UpsertResult",
+    "RETURN_COUNT",
+    "RETURN_SPLIT",
+    "RETURN_IDS",
     # TargetChat
     "get_target_chat_by_chat_id",
+    "get_target_chat_by_username",
+    "get_target_chats_by_chat_ids",
+    "get_target_chats_by_usernames",
     "create_or_update_target_chat",
     "update_target_chat_status",
     # User
     "get_user_by_id",
     "upsert_user",
     "bulk_upsert_users",
+    "bulk_upsert_user_rows",
+    "USER_COLUMNS",
     # ChatParticipant
     "bulk_upsert_participants",
+    "bulk_upsert_participant_rows",
+    "PARTICIPANT_COLUMNS",
+    "apply_participant_membership",
+    # AppUser
+    "get_app_users_with_sessions",
+    # CollectionCheckpoint
+    "get_checkpoint",
+    "get_checkpoints",
+    "save_checkpoint",
+    # ParticipantPageHash
+    "get_participant_page_hashes",
+    "save_participant_page_hash",
+    # Unit of work
+    "CollectionUnitOfWork",
+    "CollectionCommitError",
+    # Membership snapshots
+    "MembershipDiff",
+    "start_membership_snapshot",
+    "stage_membership_members",
+    "set_membership_snapshot_status",
+    "discard_membership_snapshot",
+    "complete_membership_snapshot",
+    "get_membership_snapshot",
+    "get_membership_snapshots",
+    "get_membership_diff",
+    # Message
+    "MessageInsertResult",
+    "bulk_insert_message_rows",
+    # CollectionJob
+    "FINISHED_JOB_STATUSES",
+    "ACTIVE_JOB_STATUSES",
+    "create_collection_job",
+    "get_active_collection_job",
+    "enqueue_collection_job",
+    "get_collection_job",
+    "get_collection_jobs",
+    "claim_collection_job",
+    "update_collection_job",
+    "finish_collection_job",
+    "release_collection_jobs",
+    "requeue_stale_collection_jobs",
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_BULK",
+    "preempt_collection_job",
+    "request_collection_job_preemptions",
+    "get_collection_queue_stats",
+    # CollectionQuota
+    "get_collection_quota",
+    "get_collection_quotas",
+    "count_queued_collection_jobs",
 ]
\ No newline at end of file
@@ -0,0 +1,276 @@
+# telegram-intel/data_collector_service/crud/bulk_copy.py
+
+import json
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Dict, Any, Tuple
+
+from sqlalchemy import Table, Boolean, JSON, text, select, literal, literal_column, func, or_, table as sql_table, column as sql_column
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+
+from data_collector_service.core.config import settings
+
+# --- Массовый Upsert через COPY ---
+# Один INSERT ... VALUES со всеми строками долго компилируется и упирается в лимит 32767
+# параметров на запрос (у users ~16 колонок - это ~2000 строк). Поэтому большие пачки
+# загружаются через COPY (asyncpg copy_records_to_table) во временную таблицу соединения и
+# сливаются в целевую одним INSERT ... SELECT ... ON CONFLICT DO UPDATE. Небольшие пачки
+# (страница участников - 200 строк) пишутся executemany порциями: на них COPY не окупается.
+# Запись идет через Core (Model.__table__), без RETURNING ORM-объектов: строки не попадают
+# в identity map сессии, и память писателя не растет на длинных сборах.
+# ON CONFLICT DO UPDATE срабатывает только для строк, у которых отслеживаемые колонки
+# действительно изменились (IS DISTINCT FROM): повторный сбор стабильного чата не создает
+# мертвых версий строк и WAL для каждой строки. updated_at при этом выставляется в now().
+# Без update_columns конфликт означает ON CONFLICT DO NOTHING (неизменяемые строки - сообщения).
+# Таблицы без ключа конфликта (сущности и файлы сообщений) пишутся bulk_copy_insert: COPY сразу
+# в целевую таблицу, без временной.
+
+# Что возвращает Upsert (параметр returning)
+RETURN_COUNT = "count" # Только количество строк
+RETURN_SPLIT = "split" # Сколько строк вставлено и сколько обновлено
+RETURN_IDS = "ids" # Массив ID записанных строк
+RETURNING_MODES = (RETURN_COUNT, RETURN_SPLIT, RETURN_IDS)
+
+
+@dataclass
+class UpsertResult:
+    """Итог массового Upsert. inserted/updated заполняются в режиме 'split', ids - в режиме 'ids'."""
+    count: int = 0 # Вставлено + изменено
+    skipped: int = 0 # Строки уже были в таблице без изменений - не записывались
+    inserted: Optional[int] = None
+    updated: Optional[int] = None
+    ids: Optional[List[Any]] = None
+
+
+def _stage_name(table: Table, columns: Sequence[str]) -> str:
+    # Набор колонок входит в имя: временная таблица создается один раз на соединение
+    return f"_stage_{table.name}_{zlib.crc32(','.join(columns).encode()):08x}"
+
+
+def _dedupe(rows: Sequence[Tuple], key_positions: Sequence[int]) -> List[Tuple]:
+    """Убирает повторы ключа конфликта (остается последняя строка): один INSERT не может обновить строку дважды."""
+    unique: Dict[Tuple, Tuple] = {}
+    for row in rows:
+        unique[tuple(row[i] for i in key_positions)] = row
+    return list(unique.values())
+
+
+def _scalar_defaults(table: Table, columns: Sequence[str]) -> Dict[str, Any]:
+    """
+    Python-значения по умолчанию (Column.default) для колонок, которых нет в columns.
+    INSERT ... SELECT их не подставляет, в отличие от INSERT ... VALUES через ORM/Core.
+    """
+    return {
+        col.name: col.default.arg
+        for col in table.columns
+        if col.name not in columns and col.default is not None and col.default.is_scalar
+    }
+
+
+def _encode_json(table: Table, columns: Sequence[str], rows: Sequence[Tuple]) -> Sequence[Tuple]:
+    """
+    Сериализует значения JSON/JSONB-колонок для COPY: кодек asyncpg (его настраивает SQLAlchemy)
+    ждет строку, а в executemany значения сериализует сама SQLAlchemy. Вызывающий код передает dict.
+    """
+    positions = [i for i, name in enumerate(columns) if isinstance(table.c[name].type, JSON)]
+    if not positions:
+        return rows
+    encoded = []
+    for row in rows:
+        row = list(row)
+        for i in positions:
+            if row[i] is not None:
+                row[i] = json.dumps(row[i])
+        encoded.append(tuple(row))
+    return encoded
+
+
+def _returning(stmt, table: Table, returning: str, id_column: str):
+    """Добавляет к Upsert нужный RETURNING: xmax = 0 только у вставленных (а не обновленных) строк."""
+    if returning == RETURN_SPLIT:
+        return stmt.returning(literal_column("(xmax = 0)", Boolean).label("inserted"))
+    if returning == RETURN_IDS:
+        return stmt.returning(table.c[id_column])
+    return stmt
+
+
+def _collect(result: UpsertResult, rows, returning: str) -> None:
+    """Добавляет строки RETURNING к итогу."""
+    if returning == RETURN_SPLIT:
+        inserted = sum(1 for (is_inserted,) in rows if is_inserted)
+        result.inserted += inserted
+        result.updated += len(rows) - inserted
+    elif returning == RETURN_IDS:
+        result.ids.extend(row_id for (row_id,) in rows)
+
+
+async def _executemany_upsert(
+    db: AsyncSession, upsert_stmt, columns: Sequence[str], rows: Sequence[Tuple], chunk_size: int, result: UpsertResult, returning: str
+) -> None:
+    # executemany не сообщает rowcount, поэтому RETURNING нужен и в режиме 'count':
+    # строки, пропущенные условием ON CONFLICT, не возвращаются
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        # С RETURNING SQLAlchemy отправляет порцию пакетами insertmanyvalues и возвращает строки всех пакетов
+        chunk_rows = (await db.execute(upsert_stmt, [dict(zip(columns, row)) for row in chunk])).all()
+        result.count += len(chunk_rows)
+        _collect(result, chunk_rows, returning)
+
+
+async def _copy_upsert(
+    db: AsyncSession, table: Table, columns: Sequence[str], rows: Sequence[Tuple], on_conflict, result: UpsertResult, returning: str, id_column: str
+) -> None:
+    stage_name = _stage_name(table, columns)
+    # Временная таблица живет в соединении (у каждого писателя свое) и очищается при коммите.
+    # CREATE TABLE AS не копирует NOT NULL/умолчания: в ней только загружаемые колонки.
+    await db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {stage_name} ON COMMIT DELETE ROWS AS "
+        f"SELECT {', '.join(columns)} FROM {table.name} WITH NO DATA"
+    ))
+    # Несколько загрузок в одной транзакции не должны сливать строки предыдущей
+    await db.execute(text(f"TRUNCATE {stage_name}"))
+    # Тот же asyncpg connection и та же транзакция, что у сессии (ее открыл запрос выше)
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        stage_name, records=_encode_json(table, columns, rows), columns=list(columns)
+    )
+
+    stage = sql_table(stage_name, *(sql_column(name) for name in columns))
+    defaults = _scalar_defaults(table, columns)
+    source = select(
+        *(stage.c[name] for name in columns),
+        *(literal(value, table.c[name].type) for name, value in defaults.items()),
+    )
+    stmt = insert(table).from_select([*columns, *defaults], source)
+    merge_result = await db.execute(_returning(on_conflict(stmt), table, returning, id_column))
+    if returning == RETURN_COUNT:
+        result.count = merge_result.rowcount
+    else:
+        merged = merge_result.all()
+        result.count = len(merged)
+        _collect(result, merged, returning)
+
+
+async def bulk_copy_upsert(
+    db: AsyncSession,
+    *,
+    table: Table,
+    columns: Sequence[str],
+    rows: Sequence[Tuple],
+    conflict_columns: Sequence[str],
+    update_columns: Sequence[str],
+    constraint: Optional[str] = None,
+    method: Optional[str] = None,
+    returning: str = RETURN_COUNT,
+    id_column: Optional[str] = None,
+    skip_unchanged: bool = True,
+    touch_column: Optional[str] = "updated_at",
+) -> UpsertResult:
+    """
+    Массовый Upsert строк в таблицу: COPY во временную таблицу + INSERT ... SELECT ... ON CONFLICT
+    для больших пачек, executemany порциями для небольших. Не коммитит и не создает ORM-объектов.
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy (asyncpg).
+        table: Целевая таблица (Model.__table__).
+        columns: Загружаемые колонки в порядке значений в rows.
+        rows: Строки (кортежи значений в порядке columns).
+        conflict_columns: Колонки ключа конфликта (по ним же убираются повторы в пачке).
+        update_columns: Колонки, обновляемые при конфликте (и сравниваемые при skip_unchanged);
+            пустой список - ON CONFLICT DO NOTHING (count - только вставленные строки).
+        constraint: Имя уникального ограничения для ON CONFLICT (иначе используется conflict_columns).
+        method: 'copy' или 'executemany' принудительно; по умолчанию выбирается по
+            settings.BULK_COPY_MIN_ROWS.
+        returning: 'count' (по умолчанию), 'split' (вставлено/обновлено) или 'ids' (ID строк).
+        id_column: Колонка для режима 'ids' (по умолчанию - первичный ключ таблицы).
+        skip_unchanged: Обновлять только строки, у которых update_columns отличаются от новых значений.
+        touch_column: Колонка, которой при обновлении присваивается now() (если она есть в таблице).
+
+    Returns:
+        UpsertResult с количеством вставленных/обновленных и пропущенных (неизменившихся) строк.
+    """
+    if returning not in RETURNING_MODES:
+        raise ValueError(f"Unknown upsert returning mode: {returning}")
+    result = UpsertResult(
+        inserted=0 if returning == RETURN_SPLIT else None,
+        updated=0 if returning == RETURN_SPLIT else None,
+        ids=[] if returning == RETURN_IDS else None,
+    )
+    if not rows:
+        return result
+    id_column = id_column or table.primary_key.columns.values()[0].name
+    rows = _dedupe(rows, [columns.index(name) for name in conflict_columns])
+    if method is None:
+        method = "copy" if len(rows) >= settings.BULK_COPY_MIN_ROWS else "executemany"
+
+    def on_conflict(stmt):
+        target = {"constraint": constraint} if constraint else {"index_elements": list(conflict_columns)}
+        if not update_columns:
+            return stmt.on_conflict_do_nothing(**target)
+        set_ = {name: getattr(stmt.excluded, name) for name in update_columns}
+        if touch_column is not None and touch_column in table.c and touch_column not in set_:
+            set_[touch_column] = func.now() # onupdate модели не применяется к ON CONFLICT DO UPDATE
+        where = None
+        if skip_unchanged:
+            where = or_(*(table.c[name].is_distinct_from(getattr(stmt.excluded, name)) for name in update_columns))
+        return stmt.on_conflict_do_update(**target, set_=set_, where=where)
+
+    if method == "copy":
+        await _copy_upsert(db, table, columns, rows, on_conflict, result, returning, id_column)
+    else:
+        await _executemany_upsert(
+            db, _returning(on_conflict(insert(table)), table, returning if returning != RETURN_COUNT else RETURN_SPLIT, id_column),
+            columns, rows, settings.BULK_EXECUTEMANY_CHUNK_SIZE, result, returning,
+        )
+    result.skipped = len(rows) - result.count
+    return result
+
+
+
+async def bulk_copy_insert(
+    db: AsyncSession,
+    *,
+    table: Table,
+    columns: Sequence[str],
+    rows: Sequence[Tuple],
+    method: Optional[str] = None,
+) -> int:
+    """
+    Массовая вставка строк в таблицу без ключа конфликта: COPY прямо в целевую таблицу для
+    больших пачек, executemany порциями для небольших. Не коммитит.
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy (asyncpg).
+        table: Целевая таблица (Model.__table__).
+        columns: Загружаемые колонки в порядке значений в rows.
+        rows: Строки (кортежи значений в порядке columns).
+        method: 'copy' или 'executemany' принудительно (по умолчанию - по settings.BULK_COPY_MIN_ROWS).
+
+    Returns:
+        Количество вставленных строк.
+    """
+    if not rows:
+        return 0
+    if method is None:
+        method = "copy" if len(rows) >= settings.BULK_COPY_MIN_ROWS else "executemany"
+    if method == "copy":
+        # COPY не подставляет Python-умолчания колонок (Column.default) - они дописываются в строки
+        defaults = _scalar_defaults(table, columns)
+        if defaults:
+            columns = [*columns, *defaults]
+            rows = [row + tuple(defaults.values()) for row in rows]
+        # Драйвер открывает транзакцию на первом запросе: без него COPY выполнился бы вне транзакции сессии
+        await db.execute(text("SELECT 1"))
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            table.name, records=_encode_json(table, columns, rows), columns=list(columns)
+        )
+    else:
+        chunk_size = settings.BULK_EXECUTEMANY_CHUNK_SIZE
+        for start in range(0, len(rows), chunk_size):
+            await db.execute(insert(table), [dict(zip(columns, row)) for row in rows[start:start + chunk_size]])
+    return len(rows)
+
@@ -0,0 +1,21 @@
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared.models import AppUser
+
+async def get_app_users_with_sessions(db: AsyncSession, *, limit: int = 0) -> List[AppUser]:
+    """
+    Возвращает пользователей приложения с настроенным файлом сессии Telegram
+    (последние обновленные - первыми). Используется для прогрева пула клиентов.
+
+    Args:
+        db: Асинхронная сессия БД.
+        limit: Максимальное количество пользователей (0 = все).
+    """
+    stmt = select(AppUser).filter(AppUser.session_file.is_not(None)).order_by(AppUser.updated_at.desc())
+    if limit > 0:
+        stmt = stmt.limit(limit)
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
@@ -1,18 +1,26 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple, Dict
 
+from sqlalchemy import update, select, func, literal, BigInteger, DateTime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import ARRAY
 
 # Импортируем модели SQLAlchemy и схемы Pydantic
 from shared.models import ChatParticipant, User, TargetChat
 from data_collector_service.schemas.collection import CollectedUserSchema # Данные из Telethon содержат инфо об участнике
+from .bulk_copy import bulk_copy_upsert, UpsertResult, RETURN_COUNT
+
+# Колонки строки участника для bulk_upsert_participant_rows (chat_id добавляется при записи)
+PARTICIPANT_COLUMNS = ("user_id", "participant_type", "inviter_user_id", "joined_date")
 
 async def bulk_upsert_participants(
     db: AsyncSession,
     *,
     chat_id: int, # ID чата Telegram
-    participants_data: List[CollectedUserSchema] # Список данных, включающих инфо об участнике
-) -> int:
+    participants_data: List[CollectedUserSchema], # Список данных, включающих инфо об участнике
+    returning: str = RETURN_COUNT,
+    commit: bool = True,
+) -> UpsertResult:
     """
     Выполняет массовый Upsert информации об участниках чата.
     Связывает пользователей (User) с чатом (TargetChat).
@@ -21,51 +29,114 @@ async def bulk_upsert_participants(
         db: Асинхронная сессия SQLAlchemy.
         chat_id: ID чата Telegram, к которому относятся участники.
         participants_data: Список данных пользователей/участников.
+        returning: 'count', 'split' (вставлено/обновлено) или 'ids' (user_id участников).
+        commit: Закоммитить транзакцию (False - запись войдет в транзакцию вызывающего кода).
+
+    Returns:
+        UpsertResult (количество успешно добавленных/обновленных записей об участии).
+    """
+    rows = [
+        (p_data.id, p_data.participant_type, p_data.inviter_user_id, p_data.joined_date)
+        for p_data in participants_data
+    ]
+    return await bulk_upsert_participant_rows(db, chat_id=chat_id, rows=rows, returning=returning, commit=commit)
+
+async def bulk_upsert_participant_rows(
+    db: AsyncSession,
+    *,
+    chat_id: int,
+    rows: Sequence[Tuple],
+    returning: str = RETURN_COUNT,
+    commit: bool = True,
+) -> UpsertResult:
+    """
+    Массовый Upsert участников чата из готовых строк (кортежи в порядке PARTICIPANT_COLUMNS).
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        chat_id: ID чата Telegram, к которому относятся участники.
+        rows: Строки участников в порядке PARTICIPANT_COLUMNS.
+        returning: 'count', 'split' (вставлено/обновлено) или 'ids' (user_id участников).
+        commit: Закоммитить транзакцию.
+
+    Returns:
+        UpsertResult (количество успешно добавленных/обновленных записей об участии).
+    """
+    if not rows:
+        return UpsertResult(count=0)
+
+    columns = ["chat_id", *PARTICIPANT_COLUMNS] # added_at - по умолчанию в модели
+    chat = (chat_id,)
+    rows = [chat + row for row in rows]
+
+    # Конфликт определяется уникальным ограничением ('chat_id', 'user_id').
+    # Обновляем тип участника, пригласившего и дату входа, только если они изменились; added_at не обновляем
+    result = await bulk_copy_upsert(
+        db, table=ChatParticipant.__table__, columns=columns, rows=rows,
+        conflict_columns=["chat_id", "user_id"],
+        update_columns=["participant_type", "inviter_user_id", "joined_date"],
+        constraint='uq_chat_participant',
+        returning=returning,
+        id_column="user_id",
+    )
+    if commit:
+        await db.commit() # Коммитим транзакцию
+
+    print(f"Bulk upserted {result.count} chat participants for chat ID {chat_id} ({result.skipped} unchanged).")
+
+    return result
+
+async def apply_participant_membership(
+    db: AsyncSession,
+    *,
+    chat_id: int,
+    present_user_ids: Sequence[int],
+    left: Dict[int, datetime],
+    commit: bool = True,
+) -> int:
+    """
+    Точечно обновляет состояние участия по известным изменениям состава (например, журнал администратора):
+    вернувшимся участникам сбрасывает left_at, вышедшим выставляет left_at = дата выхода.
+    Строки участников не удаляются (см. снимки состава, crud_membership).
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        chat_id: ID чата Telegram.
+        present_user_ids: Пользователи, которые состоят в чате (их строки уже записаны Upsert).
+        left: Вышедшие пользователи: user_id -> дата выхода.
+        commit: Закоммитить транзакцию.
 
     Returns:
-        Количество успешно добавленных/обновленных записей об участии.
+        Сколько участников отмечено вышедшими.
     """
-    if not participants_data:
-        return 0
-
-    participants_values = []
-    for p_data in participants_data:
-        # Собираем данные для таблицы chat_participants
-        values = {
-            "chat_id": chat_id,
-            "user_id": p_data.id, # ID пользователя TG
-            "participant_type": p_data.participant_type,
-            "inviter_user_id": p_data.inviter_user_id,
-            "joined_date": p_data.joined_date,
-            # added_at - устанавливается по умолчанию в модели
-        }
-        participants_values.append(values)
-
-    # Создаем оператор insert
-    stmt = insert(ChatParticipant).values(participants_values)
-
-    # Определяем поля для обновления при конфликте
-    # Конфликт определяется уникальным индексом ('chat_id', 'user_id')
-    update_dict = {
-        # Обновляем тип участника, пригласившего и дату входа, если они изменились
-        "participant_type": getattr(stmt.excluded, 'participant_type'),
-        "inviter_user_id": getattr(stmt.excluded, 'inviter_user_id'),
-        "joined_date": getattr(stmt.excluded, 'joined_date'),
-        # added_at не обновляем
-    }
-
-    # Создаем ON CONFLICT DO UPDATE
-    # Указываем индекс, по которому проверяется конфликт
-    upsert_stmt = stmt.on_conflict_do_update(
-        constraint='uq_chat_participant', # Имя уникального ограничения
-        set_=update_dict
-    ) # Не используем returning(), т.к. нам нужно только количество
-
-    # Выполняем запрос
-    result = await db.execute(upsert_stmt)
-    await db.commit() # Коммитим транзакцию
-
-    count = result.rowcount # Количество обработанных строк
-    print(f"Bulk upserted {count} chat participants for chat ID {chat_id}.")
-
-    return count
\ No newline at end of file
+    if present_user_ids:
+        await db.execute(
+            update(ChatParticipant)
+            .filter(
+                ChatParticipant.chat_id == chat_id,
+                ChatParticipant.user_id == func.any(literal(list(present_user_ids), ARRAY(BigInteger))),
+                ChatParticipant.left_at.is_not(None),
+            )
+            .values(left_at=None)
+            .execution_options(synchronize_session=False)
+        )
+    left_count = 0
+    if left:
+        departures = select(
+            func.unnest(literal(list(left), ARRAY(BigInteger))).label("user_id"),
+            func.unnest(literal(list(left.values()), ARRAY(DateTime(timezone=True)))).label("left_at"),
+        ).subquery()
+        result = await db.execute(
+            update(ChatParticipant)
+            .filter(
+                ChatParticipant.chat_id == chat_id,
+                ChatParticipant.user_id == departures.c.user_id,
+                ChatParticipant.left_at.is_(None),
+            )
+            .values(left_at=departures.c.left_at)
+            .execution_options(synchronize_session=False)
+        )
+        left_count = result.rowcount
+    if commit:
+        await db.commit()
+    return left_count
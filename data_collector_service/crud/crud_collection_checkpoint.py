@@ -0,0 +1,67 @@
+from typing import Optional, Dict, Any, List
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+
+from shared.models import CollectionCheckpoint
+
+async def get_checkpoint(db: AsyncSession, *, chat_id: int, mode: str) -> Optional[CollectionCheckpoint]:
+    """Получает чекпоинт сбора чата для указанного вида сбора ('participants', ...)."""
+    result = await db.execute(
+        select(CollectionCheckpoint).filter(CollectionCheckpoint.chat_id == chat_id, CollectionCheckpoint.mode == mode)
+    )
+    return result.scalar_one_or_none()
+
+async def get_checkpoints(db: AsyncSession, *, chat_id: int) -> List[CollectionCheckpoint]:
+    """Получает все чекпоинты сбора чата (по одному на вид сбора)."""
+    result = await db.execute(
+        select(CollectionCheckpoint).filter(CollectionCheckpoint.chat_id == chat_id).order_by(CollectionCheckpoint.mode)
+    )
+    return list(result.scalars().all())
+
+async def save_checkpoint(
+    db: AsyncSession,
+    *,
+    chat_id: int,
+    mode: str,
+    status: str,
+    state: Optional[Dict[str, Any]] = None,
+    position: Optional[int] = None,
+    pages_done: int = 0,
+    rows_done: int = 0,
+    session_file: Optional[str] = None,
+    restart: bool = False,
+) -> None:
+    """
+    Создает или обновляет чекпоинт сбора (один на пару chat_id + mode) и сразу коммитит его.
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        chat_id: ID чата Telegram.
+        mode: Вид сбора.
+        status: 'running', 'interrupted' или 'completed'.
+        state: Незавершенная работа (формат зависит от вида сбора).
+        position: Смещение/ID, до которого все собрано.
+        pages_done: Сколько страниц записано (нарастающим итогом, включая прерванные запуски).
+        rows_done: Сколько строк записано.
+        session_file: Сессия, которой идет сбор.
+        restart: Новый сбор с начала - обновить started_at.
+    """
+    values = {
+        "chat_id": chat_id,
+        "mode": mode,
+        "status": status,
+        "state": state,
+        "position": position,
+        "pages_done": pages_done,
+        "rows_done": rows_done,
+        "session_file": session_file,
+    }
+    stmt = insert(CollectionCheckpoint).values(**values)
+    update_dict = {key: getattr(stmt.excluded, key) for key in values if key not in ("chat_id", "mode")}
+    update_dict["updated_at"] = func.now()
+    if restart:
+        update_dict["started_at"] = func.now()
+    await db.execute(stmt.on_conflict_do_update(constraint='uq_collection_checkpoint_chat_mode', set_=update_dict))
+    await db.commit()
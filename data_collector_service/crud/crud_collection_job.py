@@ -0,0 +1,478 @@
+import uuid
+from collections import Counter
+from datetime import timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+from sqlalchemy import select, update, func, case, or_, Float
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from shared.models import AppUser, CollectionJob, CollectionQuota
+
+# --- Очередь задач сбора в Postgres ---
+# Задачи /collect записываются в collection_jobs со статусом 'queued'; обработчики забирают их
+# SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько обработчиков (в разных процессах)
+# не получат одну задачу и не ждут блокировок друг друга. Выполняемая задача периодически
+# обновляет heartbeat_at; задачу без heartbeat (обработчик упал) можно вернуть в очередь.
+# Обновления выполняемой задачи проверяют, что она все еще 'running' у того же обработчика (worker):
+# задачу, возвращенную в очередь после задержки heartbeat, прежний обработчик уже не перезапишет.
+
+# Статусы завершенной задачи
+FINISHED_JOB_STATUSES = ('completed', 'failed')
+# Статусы активной задачи (на цель - не больше одной, см. uq_collection_jobs_active_target_key)
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+# Ключ advisory-блокировки, под которой задачи забираются с учетом лимитов параллельности
+_CLAIM_LOCK_KEY = 0x636A6F62 # 'cjob'
+# Классы приоритета: интерактивные запросы (только информация о чате) идут раньше массовых сборов
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+async def create_collection_job(
+    db: AsyncSession,
+    *,
+    app_user: AppUser,
+    chat_target: str,
+    options: Optional[Dict[str, Any]] = None,
+    target_key: Optional[str] = None,
+    chat_id: Optional[int] = None,
+    dc_id: Optional[int] = None,
+    priority: int = PRIORITY_BULK,
+) -> CollectionJob:
+    """Ставит задачу сбора в очередь (status='queued') и коммитит ее."""
+    job = CollectionJob(
+        app_user_id=app_user.id, chat_target=chat_target, target_key=target_key, chat_id=chat_id, dc_id=dc_id,
+        options=options, status='queued', attempts=0, attached_requests=0, priority=priority,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def get_active_collection_job(
+    db: AsyncSession, *, target_key: str, chat_id: Optional[int] = None, for_update: bool = False,
+) -> Optional[CollectionJob]:
+    """Получает активную (queued/running) задачу цели: по ключу цели или по уже известному ID чата."""
+    condition = CollectionJob.target_key == target_key
+    if chat_id is not None:
+        condition = or_(condition, CollectionJob.chat_id == chat_id)
+    query = (
+        select(CollectionJob)
+        .filter(CollectionJob.status.in_(ACTIVE_JOB_STATUSES), condition)
+        .order_by(CollectionJob.created_at)
+        .limit(1)
+    )
+    if for_update:
+        query = query.with_for_update()
+    result = await db.execute(query)
+    return result.scalar_one_or_none()
+
+
+async def enqueue_collection_job(
+    db: AsyncSession,
+    *,
+    app_user: AppUser,
+    chat_target: str,
+    target_key: str,
+    chat_id: Optional[int] = None,
+    dc_id: Optional[int] = None,
+    options: Optional[Dict[str, Any]] = None,
+    priority: int = PRIORITY_BULK,
+) -> Tuple[CollectionJob, bool]:
+    """
+    Ставит задачу сбора в очередь или присоединяет запрос к активной задаче той же цели.
+    Проверка и вставка выполняются под транзакционной advisory-блокировкой ключа цели, поэтому
+    одновременные запросы из разных процессов API не создадут две задачи; уникальный частичный
+    индекс по target_key - страховка на случай вставки в обход этой функции. Коммитит.
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        app_user: Пользователь, запросивший сбор.
+        chat_target: Цель сбора, как в запросе.
+        target_key: Канонический ключ цели (jobs.targets.chat_target_key).
+        chat_id: ID чата, если он уже известен (цель - ID или username сохраненного чата).
+        dc_id: DC сессии пользователя (для лимита JOB_MAX_PER_DC).
+        options: Параметры сбора новой задачи (у присоединенного запроса не применяются).
+        priority: Класс приоритета новой задачи (PRIORITY_INTERACTIVE / PRIORITY_BULK).
+
+    Returns:
+        (задача, True - запрос присоединен к уже активной задаче).
+    """
+    retried = False
+    while True:
+        await db.execute(select(func.pg_advisory_xact_lock(func.hashtextextended(target_key, 0))))
+        job = await get_active_collection_job(db, target_key=target_key, chat_id=chat_id, for_update=True)
+        if job is not None:
+            values: Dict[str, Any] = {"attached_requests": CollectionJob.attached_requests + 1}
+            if app_user.id != job.app_user_id and app_user.id not in (job.attached_user_ids or []):
+                # Строка задачи заблокирована (FOR UPDATE) - список можно собрать здесь
+                values["attached_user_ids"] = [*(job.attached_user_ids or []), app_user.id]
+            result = await db.execute(
+                update(CollectionJob).where(CollectionJob.id == job.id).values(**values)
+                .returning(CollectionJob).execution_options(synchronize_session=False)
+            )
+            job = result.scalar_one()
+            await db.commit() # Снимает advisory-блокировку
+            return job, True
+        try:
+            return await create_collection_job(
+                db, app_user=app_user, chat_target=chat_target, options=options, target_key=target_key,
+                chat_id=chat_id, dc_id=dc_id, priority=priority,
+            ), False
+        except IntegrityError: # Активная задача появилась в обход блокировки - присоединяемся к ней
+            await db.rollback()
+            if retried:
+                raise
+            retried = True
+
+
+async def get_collection_job(
+    db: AsyncSession, *, job_id: uuid.UUID, app_user_id: Optional[uuid.UUID] = None,
+) -> Optional[CollectionJob]:
+    """
+    Получает задачу сбора по ID (если указан app_user_id - только задачу этого пользователя
+    или задачу, к которой присоединен его запрос).
+    """
+    query = select(CollectionJob).filter(CollectionJob.id == job_id)
+    if app_user_id is not None:
+        query = query.filter(or_(CollectionJob.app_user_id == app_user_id, CollectionJob.attached_user_ids.any(app_user_id)))
+    result = await db.execute(query)
+    return result.scalar_one_or_none()
+
+
+async def get_collection_jobs(db: AsyncSession, *, job_ids: List[uuid.UUID]) -> List[CollectionJob]:
+    """Получает задачи сбора по списку ID (порядок не гарантируется)."""
+    if not job_ids:
+        return []
+    result = await db.execute(select(CollectionJob).filter(CollectionJob.id.in_(job_ids)))
+    return list(result.scalars().all())
+
+
+async def claim_collection_job(
+    db: AsyncSession,
+    *,
+    worker: str,
+    global_limit: int = 0,
+    per_session_limit: int = 0,
+    per_dc_limit: int = 0,
+    default_weight: int = 1,
+) -> Optional[CollectionJob]:
+    """
+    Забирает следующую задачу из очереди и коммитит ее переход в 'running'.
+    Порядок - взвешенный справедливый: сначала класс приоритета, затем пользователь, занимающий
+    меньше всего выполняемых задач относительно своего веса (collection_quotas.weight), затем
+    время постановки. Поэтому большой пакет одного пользователя не задерживает задачи других.
+    Задача пропускается, если ее запуск превысит лимит выполняемых задач: всего, через сессию
+    того же пользователя (квота max_running или per_session_limit) или через аккаунты того же
+    DC (0 - без ограничения). Лимиты и порядок общие для всех обработчиков: выбор задачи
+    выполняется под advisory-блокировкой.
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        worker: Имя обработчика (записывается в задачу).
+        global_limit, per_session_limit, per_dc_limit: Лимиты выполняемых задач.
+        default_weight: Вес пользователя без строки в collection_quotas.
+
+    Returns:
+        Объект CollectionJob или None, если очередь пуста или все задачи упираются в лимиты.
+    """
+    running = aliased(CollectionJob)
+
+    def running_count(*conditions):
+        return select(func.count()).select_from(running).filter(running.status == 'running', *conditions).scalar_subquery()
+
+    def quota_value(column, default):
+        quota = select(column).filter(CollectionQuota.app_user_id == CollectionJob.app_user_id).scalar_subquery()
+        return func.coalesce(quota, default)
+
+    user_running = running_count(running.app_user_id == CollectionJob.app_user_id)
+    user_limit = quota_value(CollectionQuota.max_running, per_session_limit)
+    query = select(CollectionJob.id).filter(
+        CollectionJob.status == 'queued', or_(user_limit <= 0, user_running < user_limit),
+    )
+    if global_limit > 0:
+        query = query.filter(running_count() < global_limit)
+    if per_dc_limit > 0:
+        query = query.filter(or_(
+            CollectionJob.dc_id.is_(None), running_count(running.dc_id == CollectionJob.dc_id) < per_dc_limit,
+        ))
+    # Иначе два обработчика одновременно увидят свободный слот (или одну и ту же долю пользователя)
+    await db.execute(select(func.pg_advisory_xact_lock(_CLAIM_LOCK_KEY)))
+    subquery = (
+        query
+        .order_by(
+            CollectionJob.priority,
+            func.cast(user_running, Float) / quota_value(CollectionQuota.weight, default_weight),
+            CollectionJob.created_at,
+        )
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(CollectionJob)
+        .where(CollectionJob.id == subquery)
+        .values(
+            status='running', worker=worker, attempts=CollectionJob.attempts + 1,
+            started_at=func.now(), heartbeat_at=func.now(), error=None, preempt_requested=False,
+        )
+        .returning(CollectionJob)
+        .execution_options(synchronize_session=False)
+    )
+    job = result.scalar_one_or_none()
+    await db.commit()
+    return job
+
+
+def _owned_by(job_id: uuid.UUID, worker: str):
+    """Условие: задача выполняется указанным обработчиком (не возвращена в очередь и не забрана другим)."""
+    return (CollectionJob.id == job_id) & (CollectionJob.status == 'running') & (CollectionJob.worker == worker)
+
+
+async def update_collection_job(
+    db: AsyncSession,
+    *,
+    job_id: uuid.UUID,
+    worker: str,
+    progress: Optional[Dict[str, Any]] = None,
+    chat_id: Optional[int] = None,
+) -> Optional[bool]:
+    """
+    Сохраняет прогресс выполняемой задачи и обновляет heartbeat_at (коммитит).
+
+    Returns:
+        True, если планировщик просит вытеснить задачу (см. request_collection_job_preemptions);
+        None, если задача больше не выполняется этим обработчиком (возвращена в очередь или
+        завершена) - обработчик должен прекратить сбор.
+    """
+    values: Dict[str, Any] = {"heartbeat_at": func.now()}
+    if progress is not None:
+        values["progress"] = progress
+    if chat_id is not None:
+        values["chat_id"] = chat_id
+    result = await db.execute(
+        update(CollectionJob).where(_owned_by(job_id, worker)).values(**values).returning(CollectionJob.preempt_requested)
+    )
+    preempt_requested = result.scalar_one_or_none()
+    await db.commit()
+    return preempt_requested
+
+
+async def finish_collection_job(
+    db: AsyncSession,
+    *,
+    job_id: uuid.UUID,
+    worker: str,
+    status: str,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+    chat_id: Optional[int] = None,
+) -> bool:
+    """
+    Завершает задачу ('completed' / 'failed') с результатом или ошибкой (коммитит).
+
+    Returns:
+        False, если задача больше не выполняется этим обработчиком (результат не сохранен).
+    """
+    values: Dict[str, Any] = {
+        "status": status, "result": result, "error": error, "finished_at": func.now(), "heartbeat_at": func.now(),
+        "preempt_requested": False,
+    }
+    if chat_id is not None:
+        values["chat_id"] = chat_id
+    updated = await db.execute(
+        update(CollectionJob).where(_owned_by(job_id, worker)).values(**values).returning(CollectionJob.id)
+    )
+    finished = updated.scalar_one_or_none() is not None
+    await db.commit()
+    return finished
+
+
+async def release_collection_jobs(db: AsyncSession, *, job_ids: List[uuid.UUID], workers: List[str]) -> None:
+    """
+    Возвращает в очередь без учета попытки задачи, которые все еще выполняют указанные
+    обработчики (обработчики останавливаются штатно). Коммитит.
+    """
+    if not job_ids:
+        return
+    await db.execute(
+        update(CollectionJob)
+        .where(CollectionJob.id.in_(job_ids), CollectionJob.status == 'running', CollectionJob.worker.in_(workers))
+        .values(status='queued', worker=None, attempts=CollectionJob.attempts - 1, queued_at=func.now(), preempt_requested=False)
+    )
+    await db.commit()
+
+
+async def preempt_collection_job(
+    db: AsyncSession, *, job_id: uuid.UUID, worker: str, progress: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Возвращает вытесненную задачу в очередь без учета попытки (она остановлена на границе
+    страницы, сбор продолжится с чекпоинтов, а этапы из progress['completed_stages'] будут
+    пропущены). Место в очереди пользователя сохраняется. Коммитит.
+    """
+    await db.execute(
+        update(CollectionJob)
+        .where(_owned_by(job_id, worker))
+        .values(
+            status='queued', worker=None, attempts=CollectionJob.attempts - 1, preemptions=CollectionJob.preemptions + 1,
+            preempt_requested=False, queued_at=func.now(), progress=progress,
+        )
+    )
+    await db.commit()
+
+
+async def requeue_stale_collection_jobs(db: AsyncSession, *, stale_after: float, max_attempts: int) -> List[uuid.UUID]:
+    """
+    Возвращает в очередь задачи, обработчик которых перестал обновлять heartbeat (упал или был
+    перезапущен). Задачи, исчерпавшие max_attempts попыток, завершаются с ошибкой. Повтор
+    безопасен: сбор продолжится с чекпоинтов. Коммитит.
+
+    Returns:
+        ID задач, возвращенных в очередь или завершенных.
+    """
+    exhausted = CollectionJob.attempts >= max_attempts
+    result = await db.execute(
+        update(CollectionJob)
+        .where(
+            CollectionJob.status == 'running',
+            CollectionJob.heartbeat_at < func.now() - timedelta(seconds=stale_after),
+        )
+        .values(
+            status=case((exhausted, 'failed'), else_='queued'),
+            error=case((exhausted, 'worker stopped responding'), else_=None),
+            finished_at=case((exhausted, func.now()), else_=None),
+            queued_at=case((exhausted, CollectionJob.queued_at), else_=func.now()),
+            worker=None, preempt_requested=False,
+        )
+        .returning(CollectionJob.id)
+        .execution_options(synchronize_session=False)
+    )
+    job_ids = list(result.scalars().all())
+    await db.commit()
+    return job_ids
+
+
+async def request_collection_job_preemptions(
+    db: AsyncSession,
+    *,
+    preempt_after: float,
+    per_session_limit: int = 0,
+    default_weight: int = 1,
+    max_preemptions: int = 0,
+) -> List[uuid.UUID]:
+    """
+    Помечает (preempt_requested) выполняемые задачи, которые нужно вытеснить ради задач, ждущих
+    в очереди дольше preempt_after секунд. Обработчик остановит помеченную задачу на границе
+    страницы и вернет ее в очередь (preempt_collection_job). Ради ждущей задачи вытесняется:
+    - задача более низкого класса приоритета (массовый сбор ради интерактивного запроса), в том
+      числе задача того же пользователя, если ждущая задача упирается в его лимит выполняемых;
+    - задача того же класса другого пользователя, чья доля (выполняемые задачи / вес) останется
+      больше доли ждущего пользователя и после запуска его задачи.
+    На ждущего пользователя - не больше одной вытесняемой задачи (с учетом уже помеченных);
+    задачи, вытесненные max_preemptions раз, дальше не вытесняются (0 - без ограничения).
+    Выполняется под той же advisory-блокировкой, что и claim_collection_job. Коммитит.
+
+    Returns:
+        ID задач, помеченных для вытеснения.
+    """
+    await db.execute(select(func.pg_advisory_xact_lock(_CLAIM_LOCK_KEY)))
+    running_jobs = (await db.execute(
+        select(
+            CollectionJob.id, CollectionJob.app_user_id, CollectionJob.priority, CollectionJob.preempt_requested,
+            CollectionJob.preemptions, CollectionJob.started_at,
+        ).filter(CollectionJob.status == 'running')
+    )).all()
+    waiting = (await db.execute(
+        select(CollectionJob.app_user_id, func.min(CollectionJob.priority))
+        .filter(CollectionJob.status == 'queued', CollectionJob.queued_at < func.now() - timedelta(seconds=preempt_after))
+        .group_by(CollectionJob.app_user_id)
+    )).all()
+    budget = len(waiting) - sum(1 for job in running_jobs if job.preempt_requested)
+    if not running_jobs or budget <= 0:
+        await db.commit()
+        return []
+
+    app_user_ids = {job.app_user_id for job in running_jobs} | {app_user_id for app_user_id, _ in waiting}
+    quotas = (await db.execute(select(CollectionQuota).filter(CollectionQuota.app_user_id.in_(app_user_ids)))).scalars().all()
+    weights = {quota.app_user_id: quota.weight for quota in quotas}
+    limits = {quota.app_user_id: quota.max_running for quota in quotas if quota.max_running is not None}
+    running = Counter(job.app_user_id for job in running_jobs)
+
+    def share(app_user_id: uuid.UUID, extra: int = 0) -> float:
+        return (running[app_user_id] + extra) / weights.get(app_user_id, default_weight)
+
+    candidates = [
+        job for job in running_jobs
+        if not job.preempt_requested and (max_preemptions <= 0 or job.preemptions < max_preemptions)
+    ]
+    victims: List[uuid.UUID] = []
+    # Сначала ждущие с более высоким приоритетом и меньшей долей
+    for app_user_id, priority in sorted(waiting, key=lambda row: (row[1], share(row[0]))):
+        if budget <= 0:
+            break
+        user_limit = limits.get(app_user_id, per_session_limit)
+        at_limit = user_limit > 0 and running[app_user_id] >= user_limit
+
+        def displaceable(job) -> bool:
+            if job.priority > priority:
+                return not at_limit or job.app_user_id == app_user_id # Иначе освобожденный слот ждущей задаче не поможет
+            return (
+                not at_limit and job.priority == priority and job.app_user_id != app_user_id
+                and share(job.app_user_id) > share(app_user_id, extra=1)
+            )
+
+        options = [job for job in candidates if displaceable(job)]
+        if not options:
+            continue
+        # Самый низкий приоритет, самая большая доля, позже всех начатая (меньше всего работы до чекпоинта)
+        victim = max(options, key=lambda job: (job.priority, share(job.app_user_id), job.started_at))
+        candidates.remove(victim)
+        victims.append(victim.id)
+        running[victim.app_user_id] -= 1
+        running[app_user_id] += 1
+        budget -= 1
+
+    if victims:
+        await db.execute(
+            update(CollectionJob)
+            .where(CollectionJob.id.in_(victims), CollectionJob.status == 'running')
+            .values(preempt_requested=True)
+        )
+    await db.commit()
+    return victims
+
+
+async def get_collection_queue_stats(db: AsyncSession, *, window_seconds: float) -> List[Dict[str, Any]]:
+    """
+    Метрики очереди по пользователям: задачи в очереди (всего и интерактивные), выполняемые,
+    текущее ожидание самой старой задачи, а за последние window_seconds - число запусков,
+    среднее и p95 время ожидания (от постановки в очередь до запуска) и вытеснения.
+
+    Returns:
+        Словари по пользователям, у которых есть активные задачи или задачи, завершенные в окне.
+    """
+    since = func.now() - timedelta(seconds=window_seconds)
+    queued = CollectionJob.status == 'queued'
+    started = CollectionJob.started_at >= since
+    wait = func.extract('epoch', CollectionJob.started_at - CollectionJob.queued_at)
+    result = await db.execute(
+        select(
+            CollectionJob.app_user_id,
+            func.count().filter(queued).label("queued"),
+            func.count().filter(queued, CollectionJob.priority == PRIORITY_INTERACTIVE).label("queued_interactive"),
+            func.count().filter(CollectionJob.status == 'running').label("running"),
+            func.extract('epoch', func.now() - func.min(CollectionJob.queued_at).filter(queued)).label("oldest_wait_seconds"),
+            func.count().filter(started).label("started"),
+            func.avg(wait).filter(started).label("avg_wait_seconds"),
+            # WITHIN GROUP не сочетается с FILTER в SQLAlchemy: NULL вне окна percentile_cont пропускает
+            func.percentile_cont(0.95).within_group(case((started, wait))).label("p95_wait_seconds"),
+            func.coalesce(func.sum(CollectionJob.preemptions), 0).label("preemptions"),
+        )
+        # Задача, начатая в окне, сейчас либо активна, либо завершена в окне
+        .filter(or_(CollectionJob.status.in_(ACTIVE_JOB_STATUSES), CollectionJob.finished_at >= since))
+        .group_by(CollectionJob.app_user_id)
+    )
+    return [dict(row._mapping) for row in result]
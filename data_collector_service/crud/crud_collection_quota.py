@@ -0,0 +1,26 @@
+import uuid
+from typing import Optional, Dict, List
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared.models import CollectionJob, CollectionQuota
+
+async def get_collection_quotas(db: AsyncSession, *, app_user_ids: List[uuid.UUID]) -> Dict[uuid.UUID, CollectionQuota]:
+    """Получает квоты очереди сбора пользователей (пользователей без строки квоты в словаре нет)."""
+    if not app_user_ids:
+        return {}
+    result = await db.execute(select(CollectionQuota).filter(CollectionQuota.app_user_id.in_(app_user_ids)))
+    return {quota.app_user_id: quota for quota in result.scalars().all()}
+
+async def get_collection_quota(db: AsyncSession, *, app_user_id: uuid.UUID) -> Optional[CollectionQuota]:
+    """Получает квоту очереди сбора пользователя (None - действуют настройки по умолчанию)."""
+    return await db.get(CollectionQuota, app_user_id)
+
+async def count_queued_collection_jobs(db: AsyncSession, *, app_user_id: uuid.UUID) -> int:
+    """Сколько задач пользователя ждет в очереди (без задач, к которым присоединены его запросы)."""
+    result = await db.execute(
+        select(func.count()).select_from(CollectionJob)
+        .filter(CollectionJob.app_user_id == app_user_id, CollectionJob.status == 'queued')
+    )
+    return result.scalar_one()
@@ -0,0 +1,225 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+from sqlalchemy import select, update, delete, insert as sql_insert, literal, func, exists, and_, BigInteger, Text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert, ARRAY, array_agg, aggregate_order_by
+
+from shared.models import ChatParticipant, MembershipSnapshot, MembershipSnapshotMember, MembershipEvent
+
+# --- Снимки состава чата ---
+# Каждый полный сбор участников складывает ID участников в membership_snapshot_members
+# (страница за страницей, в транзакции записи страницы). При завершении снимка входы и выходы
+# считаются в Postgres anti-join'ами с участниками предыдущего снимка и добавляются в
+# membership_events; участники предыдущего снимка после этого удаляются - для сравнения
+# всегда хранится только последний завершенный снимок.
+
+# Статусы снимка, который еще можно продолжить
+OPEN_SNAPSHOT_STATUSES = ('running', 'interrupted')
+
+
+@dataclass
+class MembershipDiff:
+    """Изменение состава чата между двумя снимками."""
+    joined: List[int] = field(default_factory=list)
+    left: List[int] = field(default_factory=list)
+
+
+async def start_membership_snapshot(db: AsyncSession, *, chat_id: int, resume: bool = True) -> MembershipSnapshot:
+    """
+    Начинает снимок состава чата и коммитит его.
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        chat_id: ID чата Telegram.
+        resume: Продолжить незавершенный снимок (сбор возобновлен с чекпоинта). Иначе незавершенные
+            снимки чата отбрасываются (status='abandoned', их участники удаляются).
+
+    Returns:
+        Объект MembershipSnapshot.
+    """
+    result = await db.execute(
+        select(MembershipSnapshot)
+        .filter(MembershipSnapshot.chat_id == chat_id, MembershipSnapshot.status.in_(OPEN_SNAPSHOT_STATUSES))
+        .order_by(MembershipSnapshot.id.desc())
+    )
+    open_snapshots = list(result.scalars())
+    if resume and open_snapshots:
+        snapshot, open_snapshots = open_snapshots[0], open_snapshots[1:]
+        snapshot.status = 'running'
+    else:
+        snapshot = MembershipSnapshot(chat_id=chat_id, status='running')
+        db.add(snapshot)
+    if open_snapshots:
+        abandoned = [s.id for s in open_snapshots]
+        await db.execute(delete(MembershipSnapshotMember).filter(MembershipSnapshotMember.snapshot_id.in_(abandoned)))
+        await db.execute(update(MembershipSnapshot).filter(MembershipSnapshot.id.in_(abandoned)).values(status='abandoned'))
+    await db.commit()
+    await db.refresh(snapshot)
+    return snapshot
+
+
+async def stage_membership_members(
+    db: AsyncSession,
+    *,
+    snapshot_id: int,
+    user_ids: Sequence[int],
+    commit: bool = True,
+) -> None:
+    """
+    Добавляет ID участников в снимок одним запросом (unnest массива; повторы игнорируются).
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        snapshot_id: ID снимка.
+        user_ids: ID участников (например, страницы участников).
+        commit: Закоммитить транзакцию (False - запись войдет в транзакцию вызывающего кода).
+    """
+    if not user_ids:
+        return
+    members = select(literal(snapshot_id), func.unnest(literal(list(user_ids), ARRAY(BigInteger))))
+    await db.execute(
+        insert(MembershipSnapshotMember)
+        .from_select(["snapshot_id", "user_id"], members)
+        .on_conflict_do_nothing()
+    )
+    if commit:
+        await db.commit()
+
+
+async def set_membership_snapshot_status(db: AsyncSession, *, snapshot_id: int, status: str) -> None:
+    """Меняет статус снимка ('interrupted' - сбор можно продолжить) и коммитит."""
+    await db.execute(update(MembershipSnapshot).filter(MembershipSnapshot.id == snapshot_id).values(status=status))
+    await db.commit()
+
+
+async def discard_membership_snapshot(db: AsyncSession, *, snapshot_id: int) -> None:
+    """
+    Отмечает снимок неполным (status='incomplete') и удаляет его участников: по неполному
+    сбору нельзя определить вышедших, сравнение со следующим сбором идет с прежним снимком.
+    """
+    await db.execute(delete(MembershipSnapshotMember).filter(MembershipSnapshotMember.snapshot_id == snapshot_id))
+    await db.execute(
+        update(MembershipSnapshot).filter(MembershipSnapshot.id == snapshot_id)
+        .values(status='incomplete', completed_at=func.now())
+    )
+    await db.commit()
+
+
+def _anti_join_events(chat_id: int, snapshot_id: int, source_id: int, other_id: int, event: str):
+    """INSERT событий для участников снимка source_id, которых нет в снимке other_id."""
+    source = MembershipSnapshotMember.__table__.alias("source")
+    other = MembershipSnapshotMember.__table__.alias("other")
+    missing = ~exists().where(and_(other.c.snapshot_id == other_id, other.c.user_id == source.c.user_id))
+    rows = select(
+        literal(chat_id, BigInteger), literal(snapshot_id), source.c.user_id, literal(event, Text)
+    ).where(source.c.snapshot_id == source_id, missing)
+    return sql_insert(MembershipEvent.__table__).from_select(["chat_id", "snapshot_id", "user_id", "event"], rows)
+
+
+async def complete_membership_snapshot(db: AsyncSession, *, snapshot_id: int) -> MembershipSnapshot:
+    """
+    Завершает снимок полного сбора: в одной транзакции сравнивает его с предыдущим завершенным
+    снимком чата, добавляет события 'joined'/'left', отмечает вышедших в chat_participants.left_at
+    и удаляет участников предыдущего снимка.
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        snapshot_id: ID снимка.
+
+    Returns:
+        Завершенный MembershipSnapshot (member_count, joined_count, left_count).
+    """
+    snapshot = await db.get(MembershipSnapshot, snapshot_id, with_for_update=True)
+    chat_id = snapshot.chat_id
+    previous_id = (await db.execute(
+        select(func.max(MembershipSnapshot.id))
+        .filter(MembershipSnapshot.chat_id == chat_id, MembershipSnapshot.status == 'completed', MembershipSnapshot.id != snapshot_id)
+    )).scalar_one_or_none()
+    member_count = (await db.execute(
+        select(func.count()).select_from(MembershipSnapshotMember).filter(MembershipSnapshotMember.snapshot_id == snapshot_id)
+    )).scalar_one()
+
+    joined = left = 0
+    if previous_id is not None:
+        # Вошедшие - есть в новом снимке и нет в предыдущем, вышедшие - наоборот
+        joined = (await db.execute(_anti_join_events(chat_id, snapshot_id, snapshot_id, previous_id, 'joined'))).rowcount
+        left = (await db.execute(_anti_join_events(chat_id, snapshot_id, previous_id, snapshot_id, 'left'))).rowcount
+
+    # Состояние участия в chat_participants по составу нового снимка (у первого снимка - без событий)
+    in_snapshot = exists().where(
+        MembershipSnapshotMember.snapshot_id == snapshot_id, MembershipSnapshotMember.user_id == ChatParticipant.user_id
+    )
+    await db.execute(
+        update(ChatParticipant)
+        .filter(ChatParticipant.chat_id == chat_id, ChatParticipant.left_at.is_(None), ~in_snapshot)
+        .values(left_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(ChatParticipant)
+        .filter(ChatParticipant.chat_id == chat_id, ChatParticipant.left_at.is_not(None), in_snapshot)
+        .values(left_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    if previous_id is not None:
+        await db.execute(delete(MembershipSnapshotMember).filter(MembershipSnapshotMember.snapshot_id == previous_id))
+
+    snapshot.status = 'completed'
+    snapshot.previous_snapshot_id = previous_id
+    snapshot.is_baseline = previous_id is None
+    snapshot.member_count = member_count
+    snapshot.joined_count = joined
+    snapshot.left_count = left
+    snapshot.completed_at = func.now()
+    await db.commit()
+    await db.refresh(snapshot)
+    return snapshot
+
+
+async def get_membership_snapshot(db: AsyncSession, *, chat_id: int, snapshot_id: int) -> Optional[MembershipSnapshot]:
+    """Получает снимок состава чата по ID."""
+    result = await db.execute(
+        select(MembershipSnapshot).filter(MembershipSnapshot.chat_id == chat_id, MembershipSnapshot.id == snapshot_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_membership_snapshots(db: AsyncSession, *, chat_id: int, limit: int = 50) -> List[MembershipSnapshot]:
+    """Последние завершенные снимки состава чата (новые первыми)."""
+    result = await db.execute(
+        select(MembershipSnapshot)
+        .filter(MembershipSnapshot.chat_id == chat_id, MembershipSnapshot.status == 'completed')
+        .order_by(MembershipSnapshot.id.desc())
+        .limit(limit)
+    )
+    return list(result.scalars())
+
+
+async def get_membership_diff(db: AsyncSession, *, chat_id: int, from_snapshot_id: int, to_snapshot_id: int) -> MembershipDiff:
+    """
+    Вошедшие и вышедшие между двумя завершенными снимками чата (from_snapshot_id < to_snapshot_id).
+
+    Считается по событиям снимков (from_snapshot_id, to_snapshot_id]: события пользователя чередуются,
+    поэтому при нечетном их количестве состав изменился, а направление задает первое событие
+    (вошел и вышел между снимками - изменения нет).
+
+    Returns:
+        MembershipDiff со списками ID (по возрастанию).
+    """
+    first_event = array_agg(aggregate_order_by(MembershipEvent.event, MembershipEvent.id))[1]
+    result = await db.execute(
+        select(MembershipEvent.user_id, first_event)
+        .filter(
+            MembershipEvent.chat_id == chat_id,
+            MembershipEvent.snapshot_id > from_snapshot_id,
+            MembershipEvent.snapshot_id <= to_snapshot_id,
+        )
+        .group_by(MembershipEvent.user_id)
+        .having(func.count() % 2 == 1)
+        .order_by(MembershipEvent.user_id)
+    )
+    diff = MembershipDiff()
+    for user_id, event in result:
+        (diff.joined if event == 'joined' else diff.left).append(user_id)
+    return diff
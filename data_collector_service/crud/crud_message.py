@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+from typing import Sequence, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared.models import Message, MessageEntity, MessageFile
+from data_collector_service.telegram.messages import MESSAGE_COLUMNS, MESSAGE_ENTITY_COLUMNS, MESSAGE_FILE_COLUMNS
+from .bulk_copy import bulk_copy_upsert, bulk_copy_insert, RETURN_IDS
+
+
+@dataclass
+class MessageInsertResult:
+    """Итог массовой вставки сообщений."""
+    messages: int = 0 # Вставлено новых сообщений
+    duplicates: int = 0 # Сообщения уже были в БД - пропущены вместе с их сущностями и файлами
+    entities: int = 0
+    files: int = 0
+
+
+async def bulk_insert_message_rows(
+    db: AsyncSession,
+    *,
+    chat_id: int,
+    messages: Sequence[Tuple],
+    entities: Sequence[Tuple] = (),
+    files: Sequence[Tuple] = (),
+    commit: bool = True,
+) -> MessageInsertResult:
+    """
+    Массовая вставка сообщений чата с сущностями текста и метаданными файлов из готовых строк
+    (см. telegram.messages.MessageBatch). Сообщения пишутся INSERT ... ON CONFLICT (id, chat_id)
+    DO NOTHING: сообщения не обновляются, повторная загрузка диапазона ничего не меняет.
+    Сущности и файлы вставляются только для новых сообщений, поэтому не дублируются.
+    Пользователи, на которых ссылаются сообщения, должны быть записаны раньше.
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        chat_id: ID чата Telegram (запись TargetChat должна уже существовать).
+        messages: Строки сообщений в порядке MESSAGE_COLUMNS.
+        entities: Строки сущностей в порядке MESSAGE_ENTITY_COLUMNS.
+        files: Строки файлов в порядке MESSAGE_FILE_COLUMNS.
+        commit: Закоммитить транзакцию (False - запись войдет в транзакцию вызывающего кода).
+
+    Returns:
+        MessageInsertResult.
+    """
+    result = MessageInsertResult()
+    if not messages:
+        return result
+
+    chat = (chat_id,)
+    inserted = await bulk_copy_upsert(
+        db, table=Message.__table__, columns=[*MESSAGE_COLUMNS, "chat_id"], rows=[row + chat for row in messages],
+        conflict_columns=["id", "chat_id"], update_columns=[], returning=RETURN_IDS, id_column="id",
+    )
+    result.messages = inserted.count
+    result.duplicates = len(messages) - inserted.count
+
+    # Сущности и файлы уже существовавших сообщений были записаны при первой загрузке
+    new_ids = set(inserted.ids) if result.duplicates else None
+    entity_rows = [row + chat for row in entities if new_ids is None or row[0] in new_ids]
+    file_rows = [row + chat for row in files if new_ids is None or row[0] in new_ids]
+    result.entities = await bulk_copy_insert(
+        db, table=MessageEntity.__table__, columns=[*MESSAGE_ENTITY_COLUMNS, "chat_id"], rows=entity_rows
+    )
+    result.files = await bulk_copy_insert(
+        db, table=MessageFile.__table__, columns=[*MESSAGE_FILE_COLUMNS, "chat_id"], rows=file_rows
+    )
+    if commit:
+        await db.commit()
+    print(f"Bulk inserted {result.messages} messages ({result.duplicates} already stored), "
+          f"{result.entities} entities, {result.files} files for chat {chat_id}.")
+    return result
+
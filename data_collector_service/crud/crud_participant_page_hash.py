@@ -0,0 +1,54 @@
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+
+from shared.models import ParticipantPageHash
+from data_collector_service.telegram.participants import PageHash
+
+async def get_participant_page_hashes(db: AsyncSession, *, chat_id: int) -> Dict[Tuple[str, int], PageHash]:
+    """
+    Загружает хеши страниц участников прошлого сбора чата.
+
+    Returns:
+        Словарь (префикс, смещение) -> PageHash.
+    """
+    result = await db.execute(
+        select(
+            ParticipantPageHash.filter_query, ParticipantPageHash.offset,
+            ParticipantPageHash.hash, ParticipantPageHash.total_count, ParticipantPageHash.user_ids,
+        ).filter(ParticipantPageHash.chat_id == chat_id)
+    )
+    return {
+        (row.filter_query, row.offset): PageHash(hash=row.hash, count=row.total_count, user_ids=list(row.user_ids))
+        for row in result
+    }
+
+async def save_participant_page_hash(
+    db: AsyncSession,
+    *,
+    chat_id: int,
+    filter_query: str,
+    offset: int,
+    page_hash: int,
+    total_count: int,
+    user_ids: List[int],
+    commit: bool = True,
+) -> None:
+    """Сохраняет (или обновляет) хеш страницы участников и коммитит его (если commit=True)."""
+    stmt = insert(ParticipantPageHash).values(
+        chat_id=chat_id, filter_query=filter_query, offset=offset,
+        hash=page_hash, total_count=total_count, user_ids=user_ids,
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        constraint='uq_participant_page_hash',
+        set_={
+            "hash": stmt.excluded.hash,
+            "total_count": stmt.excluded.total_count,
+            "user_ids": stmt.excluded.user_ids,
+            "updated_at": func.now(),
+        },
+    ))
+    if commit:
+        await db.commit()
@@ -1,7 +1,8 @@
 import uuid
-from typing import Optional
+from typing import Optional, List, Iterable
 
-from sqlalchemy import select, update
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload # Если нужно подгружать связи
 
@@ -16,22 +17,61 @@ async def get_target_chat_by_chat_id(db: AsyncSession, chat_id: int) -> Optional
     result = await db.execute(select(TargetChat).filter(TargetChat.chat_id == chat_id))
     return result.scalar_one_or_none()
 
+async def get_target_chat_by_username(db: AsyncSession, username: str) -> Optional[TargetChat]:
+    """
+    Получает целевой чат из БД по username (без учета регистра, без '@').
+    Username мог перейти к другому чату - берется последний обновленный.
+    """
+    result = await db.execute(
+        select(TargetChat)
+        .filter(func.lower(TargetChat.username) == username.lower())
+        .order_by(TargetChat.updated_at.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+async def get_target_chats_by_chat_ids(db: AsyncSession, chat_ids: Iterable[int]) -> List[TargetChat]:
+    """Получает целевые чаты из БД по списку Telegram ID (одним запросом)."""
+    chat_ids = list(set(chat_ids))
+    if not chat_ids:
+        return []
+    result = await db.execute(select(TargetChat).filter(TargetChat.chat_id.in_(chat_ids)))
+    return list(result.scalars().all())
+
+async def get_target_chats_by_usernames(db: AsyncSession, usernames: Iterable[str]) -> List[TargetChat]:
+    """
+    Получает целевые чаты из БД по списку username (без учета регистра, одним запросом).
+    Если username встречается у нескольких чатов, первым идет последний обновленный.
+    """
+    usernames = list({username.lower() for username in usernames})
+    if not usernames:
+        return []
+    result = await db.execute(
+        select(TargetChat)
+        .filter(func.lower(TargetChat.username).in_(usernames))
+        .order_by(TargetChat.updated_at.desc())
+    )
+    return list(result.scalars().all())
+
 async def create_or_update_target_chat(
     db: AsyncSession,
     *,
     chat_data: dict, # Словарь с данными, полученными из get_chat_info
     added_by_user: AppUser, # Пользователь приложения, инициировавший сбор
-    initial_status: str = "collecting" # Статус при создании/начале сбора
+    initial_status: str = "collecting", # Статус при создании/начале сбора
+    commit: bool = True,
 ) -> TargetChat:
     """
     Создает новую запись TargetChat или обновляет существующую на основе данных из Telegram.
-    Использует chat_id для поиска существующей записи.
+    Выполняется одним запросом INSERT ... ON CONFLICT (chat_id) DO UPDATE ... RETURNING,
+    без предварительного SELECT и refresh после коммита.
 
     Args:
         db: Асинхронная сессия SQLAlchemy.
         chat_data: Словарь с данными чата (из telegram.collector.get_chat_info).
         added_by_user: Пользователь AppUser, который добавляет/обновляет чат.
         initial_status: Статус, который будет установлен при создании или обновлении.
+        commit: Закоммитить транзакцию (False - запись войдет в транзакцию вызывающего кода).
 
     Returns:
         Созданный или обновленный объект TargetChat.
@@ -41,9 +81,6 @@ async def create_or_update_target_chat(
         # Это не должно происходить, если chat_data валиден
         raise ValueError("Chat data must contain an 'id'")
 
-    # Ищем существующий чат
-    target_chat = await get_target_chat_by_chat_id(db, chat_id=chat_id)
-
     # Готовим данные для создания/обновления
     # Используем схему TargetChatUpdate для удобства, хотя вход - словарь
     chat_update_data = TargetChatUpdate(
@@ -55,52 +92,46 @@ async def create_or_update_target_chat(
     ).model_dump(exclude_unset=True) # Pydantic V2
     # ).dict(exclude_unset=True) # Pydantic V1
 
+    stmt = insert(TargetChat).values(chat_id=chat_id, added_by=added_by_user.id, **chat_update_data)
+    # При конфликте обновляем только переданные поля; added_by оставляем первого добавившего
+    update_dict = {field: getattr(stmt.excluded, field) for field in chat_update_data}
+    update_dict["updated_at"] = func.now()
+    upsert_stmt = stmt.on_conflict_do_update(index_elements=['chat_id'], set_=update_dict).returning(TargetChat)
 
-    if target_chat:
-        # --- Обновление существующего чата ---
-        print(f"Updating existing target chat (ID: {chat_id}, Internal ID: {target_chat.internal_id})")
-        # Обновляем только переданные поля
-        for field, value in chat_update_data.items():
-            setattr(target_chat, field, value)
-        # Обновляем added_by только если он изменился? Или всегда оставляем первого?
-        # target_chat.added_by = added_by_user.id # Пока не обновляем
-        db.add(target_chat) # Добавляем в сессию для отслеживания изменений
-    else:
-        # --- Создание нового чата ---
-        print(f"Creating new target chat (ID: {chat_id})")
-        target_chat = TargetChat(
-            chat_id=chat_id,
-            added_by=added_by_user.id,
-            **chat_update_data # Передаем остальные поля
-        )
-        db.add(target_chat) # Добавляем в сессию
-
-    # Коммитим изменения (создание или обновление)
-    await db.commit()
-    # Обновляем объект из БД, чтобы получить актуальные данные (internal_id, updated_at)
-    await db.refresh(target_chat)
+    # populate_existing: если объект чата уже есть в сессии, он обновится значениями из RETURNING
+    result = await db.execute(upsert_stmt, execution_options={"populate_existing": True})
+    target_chat = result.scalar_one()
+    if commit:
+        await db.commit()
+    print(f"Upserted target chat (ID: {chat_id}, Internal ID: {target_chat.internal_id})")
 
     return target_chat
 
-async def update_target_chat_status(db: AsyncSession, chat_id: int, status: str) -> Optional[TargetChat]:
+async def update_target_chat_status(db: AsyncSession, chat_id: int, status: str, *, commit: bool = True) -> Optional[TargetChat]:
     """
-    Обновляет статус целевого чата.
+    Обновляет статус целевого чата одним запросом UPDATE ... RETURNING.
 
     Args:
         db: Асинхронная сессия SQLAlchemy.
         chat_id: ID чата Telegram.
         status: Новый статус ('new', 'collected', 'monitoring', 'error').
+        commit: Закоммитить транзакцию.
 
     Returns:
         Обновленный объект TargetChat или None, если чат не найден.
     """
-    target_chat = await get_target_chat_by_chat_id(db, chat_id=chat_id)
-    if target_chat:
-        target_chat.status = status
-        db.add(target_chat)
+    result = await db.execute(
+        update(TargetChat)
+        .where(TargetChat.chat_id == chat_id)
+        .values(status=status, updated_at=func.now())
+        .returning(TargetChat),
+        execution_options={"populate_existing": True},
+    )
+    target_chat = result.scalar_one_or_none()
+    if commit:
         await db.commit()
-        await db.refresh(target_chat)
+    if target_chat:
         print(f"Updated status for target chat {chat_id} to '{status}'")
     else:
         print(f"Warning: Tried to update status for non-existent target chat {chat_id}")
-    return target_chat
\ No newline at end of file
+    return target_chat
@@ -1,5 +1,5 @@
 import uuid
-from typing import List, Optional
+from typing import List, Optional, Sequence, Tuple
 
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,6 +8,12 @@ from sqlalchemy.dialects.postgresql import insert # Для ON CONFLICT DO UPDATE
 # Импортируем модели SQLAlchemy и схемы Pydantic
 from shared.models import User, AppUser
 from data_collector_service.schemas.collection import CollectedUserSchema # Схема с данными от Telethon
+from .bulk_copy import bulk_copy_upsert, UpsertResult, RETURN_COUNT
+
+# Поля CollectedUserSchema, которые не пишутся в users (данные участника и поля, управляемые иначе)
+USER_EXCLUDED_FIELDS = {"participant_type", "inviter_user_id", "joined_date", "is_contact", "status", "last_seen_at"}
+# Колонки users, которые пишет сбор, в порядке значений строки для bulk_upsert_user_rows
+USER_COLUMNS = tuple(name for name in CollectedUserSchema.model_fields if name not in USER_EXCLUDED_FIELDS)
 
 async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
     """Получает пользователя Telegram по его ID."""
@@ -30,9 +36,7 @@ async def upsert_user(db: AsyncSession, *, user_data: CollectedUserSchema, colle
     # Преобразуем Pydantic схему в словарь, совместимый с моделью User
     # Исключаем поля, специфичные для участника чата (participant_type и т.д.)
     # и поля, которых нет в модели User или которые управляются иначе (is_contact)
-    user_values = user_data.model_dump(
-        exclude={"participant_type", "inviter_user_id", "joined_date", "is_contact", "status", "last_seen_at"}
-    ) # Pydantic V2
+    user_values = user_data.model_dump(exclude=USER_EXCLUDED_FIELDS) # Pydantic V2
     # user_values = user_data.dict(
     #     exclude={"participant_type", "inviter_user_id", "joined_date", "is_contact", "status", "last_seen_at"}
     # ) # Pydantic V1
@@ -67,48 +71,72 @@ async def upsert_user(db: AsyncSession, *, user_data: CollectedUserSchema, colle
     # print(f"Upserted user: ID={upserted_user.id}, Username={upserted_user.username}")
     return upserted_user
 
-async def bulk_upsert_users(db: AsyncSession, *, users_data: List[CollectedUserSchema], collected_by: AppUser) -> List[User]:
+async def bulk_upsert_users(
+    db: AsyncSession,
+    *,
+    users_data: List[CollectedUserSchema],
+    collected_by: AppUser,
+    returning: str = RETURN_COUNT,
+    commit: bool = True,
+) -> UpsertResult:
     """
     Выполняет массовый Upsert пользователей Telegram.
+    Большие пачки загружаются через COPY (см. bulk_copy), поэтому размер пачки не ограничен
+    лимитом параметров одного INSERT.
 
     Args:
         db: Асинхронная сессия SQLAlchemy.
         users_data: Список данных пользователей (CollectedUserSchema).
         collected_by: Пользователь AppUser, который их нашел.
+        returning: 'count', 'split' (вставлено/обновлено) или 'ids' (ID пользователей).
+        commit: Закоммитить транзакцию (False - запись войдет в транзакцию вызывающего кода).
 
     Returns:
-        Список созданных/обновленных объектов User.
+        UpsertResult (количество созданных/обновленных и неизменившихся пользователей).
+        ORM-объекты User не создаются.
     """
-    if not users_data:
-        return []
-
-    users_values = []
-    for user_data in users_data:
-        user_values = user_data.model_dump(
-            exclude={"participant_type", "inviter_user_id", "joined_date", "is_contact", "status", "last_seen_at"}
-        )
-        user_values["added_by_user_id"] = collected_by.id
-        users_values.append(user_values)
-
-    # Создаем оператор insert
-    stmt = insert(User).values(users_values)
-
-    # Определяем поля для обновления при конфликте
-    update_dict = {
-        col.name: getattr(stmt.excluded, col.name)
-        for col in stmt.excluded if col.name not in ["id", "added_by_user_id", "created_at"]
-    }
-
-    # Создаем ON CONFLICT DO UPDATE
-    upsert_stmt = stmt.on_conflict_do_update(
-        index_elements=['id'],
-        set_=update_dict
-    ).returning(User)
+    rows = [tuple(getattr(user_data, name) for name in USER_COLUMNS) for user_data in users_data]
+    return await bulk_upsert_user_rows(db, rows=rows, collected_by=collected_by, returning=returning, commit=commit)
+
+async def bulk_upsert_user_rows(
+    db: AsyncSession,
+    *,
+    rows: Sequence[Tuple],
+    collected_by: AppUser,
+    returning: str = RETURN_COUNT,
+    commit: bool = True,
+) -> UpsertResult:
+    """
+    Массовый Upsert пользователей из готовых строк (кортежи значений в порядке USER_COLUMNS),
+    без промежуточных объектов CollectedUserSchema (см. pipeline.rows).
 
-    # Выполняем
-    result = await db.execute(upsert_stmt)
-    await db.commit()
-    upserted_users = result.scalars().all()
-    print(f"Bulk upserted {len(upserted_users)} users.")
+    Args:
+        db: Асинхронная сессия SQLAlchemy.
+        rows: Строки пользователей в порядке USER_COLUMNS.
+        collected_by: Пользователь AppUser, который их нашел.
+        returning: 'count', 'split' (вставлено/обновлено) или 'ids' (ID пользователей).
+        commit: Закоммитить транзакцию.
 
-    return upserted_users
\ No newline at end of file
+    Returns:
+        UpsertResult (количество созданных/обновленных и неизменившихся пользователей).
+    """
+    if not rows:
+        return UpsertResult(count=0)
+
+    columns = [*USER_COLUMNS, "added_by_user_id"]
+    added_by = (collected_by.id,)
+    rows = [row + added_by for row in rows]
+
+    # Обновляем собранные поля, кроме ID и added_by_user_id (кто первый нашел, тот и добавил).
+    # Строка перезаписывается, только если хотя бы одно из них изменилось; updated_at -> now()
+    update_columns = [name for name in USER_COLUMNS if name != "id"]
+
+    result = await bulk_copy_upsert(
+        db, table=User.__table__, columns=columns, rows=rows,
+        conflict_columns=["id"], update_columns=update_columns, returning=returning,
+    )
+    if commit:
+        await db.commit()
+    print(f"Bulk upserted {result.count} users ({result.skipped} unchanged).")
+
+    return result
@@ -0,0 +1,89 @@
+# telegram-intel/data_collector_service/crud/unit_of_work.py
+
+from contextlib import asynccontextmanager
+from typing import Any, List, AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# --- Пакетная запись страниц в одной транзакции ---
+# Раньше каждая страница участников давала три коммита (users, chat_participants, хеш страницы),
+# т.е. три fsync и возможность частично записанной страницы при падении между ними.
+# Unit of work записывает каждую страницу в своей точке сохранения (SAVEPOINT) и коммитит
+# несколько страниц разом: ошибка страницы откатывает только ее, а страница считается записанной
+# только после коммита пакета. Вызывающий код получает результаты закоммиченных страниц
+# (например, чтобы отметить их в чекпоинте).
+
+
+class CollectionCommitError(Exception):
+    """Коммит пакета не удался; results - результаты страниц, которые не были записаны."""
+
+    def __init__(self, results: List[Any], error: Exception):
+        super().__init__(str(error))
+        self.results = results
+
+
+class CollectionUnitOfWork:
+    """
+    Транзакция записи нескольких страниц сбора: страница - SAVEPOINT, коммит - раз в pages_per_commit страниц.
+
+    Args:
+        db: Асинхронная сессия SQLAlchemy (используется только этим unit of work).
+        pages_per_commit: Сколько страниц копить в транзакции перед коммитом.
+    """
+
+    def __init__(self, db: AsyncSession, *, pages_per_commit: int):
+        self.db = db
+        self.pages_per_commit = max(1, pages_per_commit)
+        self._staged: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._staged)
+
+    @property
+    def due(self) -> bool:
+        """Набралось достаточно страниц для коммита."""
+        return len(self._staged) >= self.pages_per_commit
+
+    @asynccontextmanager
+    async def page(self, result: Any) -> AsyncIterator[None]:
+        """
+        Записи одной страницы в SAVEPOINT. При исключении откатывается только эта страница
+        (исключение пробрасывается), иначе result будет возвращен из commit().
+
+        Args:
+            result: Значение, которое вернет commit() после успешного коммита страницы.
+        """
+        async with self.db.begin_nested():
+            yield
+        self._staged.append(result)
+
+    async def commit(self) -> List[Any]:
+        """
+        Коммитит накопленные страницы.
+
+        Returns:
+            Результаты закоммиченных страниц (в порядке записи).
+
+        Raises:
+            CollectionCommitError: Коммит не удался (транзакция откачена, страницы пакета не записаны).
+        """
+        if not self._staged:
+            return []
+        staged, self._staged = self._staged, []
+        try:
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            raise CollectionCommitError(staged, e) from e
+        return staged
+
+    async def rollback(self) -> List[Any]:
+        """
+        Откатывает транзакцию.
+
+        Returns:
+            Результаты страниц, которые были потеряны.
+        """
+        staged, self._staged = self._staged, []
+        await self.db.rollback()
+        return staged
@@ -0,0 +1,19 @@
+# telegram-intel/data_collector_service/jobs/__init__.py
+
+from .runner import CollectionJobRunner, job_runner, parse_chat_target
+from .coalescing import chat_target_key, resolve_target_key, resolve_target_keys, SingleFlight, collection_flight
+from .scheduling import job_priority, effective_quota, queue_slots_left
+
+__all__ = [
+    "CollectionJobRunner",
+    "job_runner",
+    "parse_chat_target",
+    "chat_target_key",
+    "resolve_target_key",
+    "resolve_target_keys",
+    "SingleFlight",
+    "collection_flight",
+    "job_priority",
+    "effective_quota",
+    "queue_slots_left",
+]
@@ -0,0 +1,106 @@
+# telegram-intel/data_collector_service/jobs/coalescing.py
+
+import asyncio
+from typing import Optional, Dict, Any, List, Tuple, Union, Sequence, Callable, Awaitable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from telethon import utils
+
+from data_collector_service import crud
+
+# --- Объединение одновременных сборов одного чата ---
+# Один чат можно указать по-разному: -1001234567890, 1234567890, @Name, t.me/name, https://telegram.me/name/.
+# Все формы приводятся к каноническому ключу цели; повторный /collect того же чата не запускает
+# второй полный сбор (двойная flood-нагрузка на ту же сессию и гонка одних и тех же upsert'ов),
+# а присоединяется к активной задаче: между процессами - через задачу в collection_jobs под
+# advisory-блокировкой ключа (crud.enqueue_collection_job), внутри процесса без очереди - через
+# SingleFlight.
+
+
+def chat_target_key(chat_target: Union[int, str]) -> str:
+    """
+    Канонический ключ цели сбора: 'id:<ID без префикса -100>', 'username:<в нижнем регистре>',
+    'invite:<хеш приглашения>', 'phone:<цифры>' или 'raw:<строка>' (формат не распознан).
+    """
+    if isinstance(chat_target, int):
+        return f"id:{utils.resolve_id(chat_target)[0]}"
+    text = chat_target.strip()
+    if text.lstrip("-").isdigit():
+        return f"id:{utils.resolve_id(int(text))[0]}"
+    phone = utils.parse_phone(text) if text.startswith("+") else None
+    if phone:
+        return f"phone:{phone}"
+    username, is_invite = utils.parse_username(text)
+    if username is None:
+        return f"raw:{text}"
+    return f"invite:{username}" if is_invite else f"username:{username}"
+
+
+async def resolve_target_key(db: AsyncSession, chat_target: Union[int, str]) -> Tuple[str, Optional[int]]:
+    """
+    Ключ цели и ID чата, если он известен без Telegram. Username уже собранного чата
+    приводится к 'id:...', чтобы @name и ID этого чата попадали в одну задачу.
+
+    Returns:
+        (ключ цели, ID чата или None).
+    """
+    key = chat_target_key(chat_target)
+    if key.startswith("id:"):
+        return key, int(key[3:])
+    if key.startswith("username:"):
+        target_chat = await crud.get_target_chat_by_username(db, key[9:])
+        if target_chat is not None:
+            return f"id:{target_chat.chat_id}", target_chat.chat_id
+    return key, None
+
+
+async def resolve_target_keys(db: AsyncSession, chat_targets: Sequence[Union[int, str]]) -> List[Tuple[str, Optional[int]]]:
+    """То же, что resolve_target_key, для списка целей: username ищутся в БД одним запросом."""
+    keys = [chat_target_key(chat_target) for chat_target in chat_targets]
+    known: Dict[str, int] = {}
+    for target_chat in await crud.get_target_chats_by_usernames(db, [key[9:] for key in keys if key.startswith("username:")]):
+        known.setdefault(target_chat.username.lower(), target_chat.chat_id) # Первым идет последний обновленный
+    resolved: List[Tuple[str, Optional[int]]] = []
+    for key in keys:
+        if key.startswith("id:"):
+            resolved.append((key, int(key[3:])))
+        elif key.startswith("username:") and key[9:] in known:
+            resolved.append((f"id:{known[key[9:]]}", known[key[9:]]))
+        else:
+            resolved.append((key, None))
+    return resolved
+
+
+class SingleFlight:
+    """
+    Внутрипроцессное объединение вызовов: пока выполняется вызов с ключом, повторные вызовы
+    с тем же ключом ждут его результат, а не запускают свой. Отмена ожидающего (клиент
+    отключился) не отменяет общий вызов - его результата ждут остальные.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    def _forget(self, key: str, call: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Returns:
+            (результат, True - результат общего вызова, начатого другим запросом).
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            return await asyncio.shield(call), True
+        call = asyncio.ensure_future(factory())
+        self._calls[key] = call
+        call.add_done_callback(lambda _: self._forget(key, call))
+        return await asyncio.shield(call), False
+
+
+# Сборы без очереди задач (JOB_QUEUE_ENABLED=false), объединяемые в этом процессе
+collection_flight = SingleFlight()
@@ -0,0 +1,372 @@
+# telegram-intel/data_collector_service/jobs/runner.py
+
+import asyncio
+import os
+import re
+import socket
+import uuid
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Set, Tuple, Union, Callable, Awaitable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from data_collector_service import crud
+from data_collector_service.core.config import settings
+from data_collector_service.db.session import AsyncSessionFactory
+from data_collector_service.pipeline.progress import JobProgress, JobPreempted, current_progress
+from shared.models import AppUser, CollectionJob
+
+# --- Обработчик очереди задач сбора ---
+# /collect только записывает задачу в collection_jobs и сразу отвечает task_id; сбор выполняют
+# обработчики: JOB_WORKER_CONCURRENCY asyncio-задач в процессе API (JOB_WORKER_ENABLED) и/или
+# отдельные процессы (python -m data_collector_service.jobs.runner). Задача забирается из
+# очереди через FOR UPDATE SKIP LOCKED, пока выполняется - обновляет heartbeat и этап сбора.
+# Упавший обработчик не теряет задачу: она возвращается в очередь и продолжается с чекпоинтов.
+# Обработчик, чью задачу вернули в очередь (heartbeat задержался), узнает об этом по следующему
+# heartbeat, останавливает сбор и не сохраняет результат - задачу уже выполняет другой обработчик.
+# Живой прогресс задачи (страницы, записи, flood wait) публикуется в progress_hub этого процесса.
+# Порядок задач и вытеснение - справедливые между пользователями (см. jobs.scheduling).
+
+# Функция сбора: (db, app_user, chat_target, *, progress, **options) -> CollectChatResponse.
+# Передается в start(), чтобы модуль не зависел от слоя API.
+CollectionHandler = Callable[..., Awaitable[Any]]
+
+# Колбэк этапа сбора: (stage, chat_id)
+ProgressCallback = Callable[[str, Optional[int]], Awaitable[None]]
+
+_NUMERIC_TARGET = re.compile(r"-?\d+")
+
+
+def parse_chat_target(chat_target: str) -> Union[int, str]:
+    """Восстанавливает chat_target задачи: числовой ID хранится в тексте, как и username/ссылка."""
+    return int(chat_target) if _NUMERIC_TARGET.fullmatch(chat_target) else chat_target
+
+
+class CollectionJobRunner:
+    """Выполняет задачи сбора из очереди collection_jobs."""
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = settings.JOB_WORKER_CONCURRENCY,
+        poll_interval: float = settings.JOB_POLL_INTERVAL,
+        heartbeat_interval: float = settings.JOB_HEARTBEAT_INTERVAL,
+        stale_after: float = settings.JOB_STALE_AFTER,
+        max_attempts: int = settings.JOB_MAX_ATTEMPTS,
+        global_limit: int = settings.JOB_GLOBAL_CONCURRENCY,
+        per_session_limit: int = settings.JOB_MAX_PER_SESSION,
+        per_dc_limit: int = settings.JOB_MAX_PER_DC,
+        default_weight: int = settings.JOB_DEFAULT_WEIGHT,
+        preemption_enabled: bool = settings.JOB_PREEMPTION_ENABLED,
+        preempt_after: float = settings.JOB_PREEMPT_AFTER,
+        preemption_interval: float = settings.JOB_PREEMPTION_CHECK_INTERVAL,
+        max_preemptions: int = settings.JOB_MAX_PREEMPTIONS,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionFactory,
+    ):
+        self.concurrency = max(concurrency, 1)
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        # Лимиты выполняемых задач во всех процессах (см. crud.claim_collection_job)
+        self.global_limit = global_limit
+        self.per_session_limit = per_session_limit
+        self.per_dc_limit = per_dc_limit
+        self.default_weight = default_weight
+        self.preemption_enabled = preemption_enabled
+        self.preempt_after = preempt_after
+        self.preemption_interval = preemption_interval
+        self.max_preemptions = max_preemptions
+        self.session_factory = session_factory
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._handler: Optional[CollectionHandler] = None
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[uuid.UUID, CollectionJob] = {} # Выполняемые этим процессом задачи
+        self._progress: Dict[uuid.UUID, JobProgress] = {} # Их прогресс (через него задача вытесняется)
+        # Сбор задач по (ID задачи, обработчик): задачу, вернувшуюся в очередь, может забрать другой обработчик процесса
+        self._work: Dict[Tuple[uuid.UUID, str], asyncio.Task] = {} # Отменяется при потере задачи
+        self._lost: Set[Tuple[uuid.UUID, str]] = set() # Задачи, которые обработчик больше не выполняет
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, handler: CollectionHandler) -> None:
+        """Запускает обработчики очереди и обслуживание зависших задач (вызывается из lifespan)."""
+        if self._tasks:
+            return
+        self._handler = handler
+        self._tasks = [asyncio.create_task(self._worker_loop(f"{self.name}/{i}")) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._maintenance_loop()))
+        if self.preemption_enabled:
+            self._tasks.append(asyncio.create_task(self._preemption_loop()))
+        print(f"Collection job runner {self.name} started ({self.concurrency} workers)")
+
+    def notify(self) -> None:
+        """Будит свободный обработчик (в очередь добавлена задача), не дожидаясь опроса."""
+        self._wakeup.set()
+
+    async def close(self) -> None:
+        """Останавливает обработчики; прерванные задачи возвращаются в очередь без учета попытки."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        jobs, self._running = list(self._running.values()), {}
+        job_ids = [job.id for job in jobs]
+        if job_ids:
+            try:
+                async with self.session_factory() as db:
+                    await crud.release_collection_jobs(db, job_ids=job_ids, workers=[job.worker for job in jobs])
+                print(f"Returned {len(job_ids)} interrupted collection job(s) to the queue")
+            except Exception as e: # Задачи вернутся в очередь по отсутствию heartbeat
+                print(f"Warning: Failed to release collection jobs {job_ids}: {e}")
+
+    # --- Обработка задач ---
+
+    async def _worker_loop(self, worker: str) -> None:
+        """Цикл одного обработчика; worker - его имя в задачах (у каждого обработчика процесса свое)."""
+        while True:
+            try:
+                async with self.session_factory() as db:
+                    job = await crud.claim_collection_job(
+                        db, worker=worker, global_limit=self.global_limit,
+                        per_session_limit=self.per_session_limit, per_dc_limit=self.per_dc_limit,
+                        default_weight=self.default_weight,
+                    )
+            except Exception as e:
+                print(f"Error: Failed to claim a collection job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(job)
+
+    async def run_job(self, job: CollectionJob) -> None:
+        """Выполняет задачу (уже переведенную в 'running' обработчиком job.worker) и сохраняет ее результат."""
+        print(f"Running collection job {job.id} for '{job.chat_target}' (attempt {job.attempts})")
+        self._running[job.id] = job
+        job_progress = JobProgress(str(job.id))
+        job_progress.chat_id = job.chat_id
+        self._progress[job.id] = job_progress
+        # Сбор - отдельная задача: ее отменяет heartbeat, если задачу вернули в очередь
+        run_key = (job.id, job.worker)
+        work = asyncio.create_task(self._execute(job, job_progress))
+        self._work[run_key] = work
+        heartbeat = asyncio.create_task(self._heartbeat_loop(job, job_progress))
+        status, result, error, chat_id = 'failed', None, None, job.chat_id
+        try:
+            status, result, error, chat_id = await work
+        except asyncio.CancelledError:
+            if run_key not in self._lost or asyncio.current_task().cancelling():
+                # Остановка процесса: задача вернется в очередь (close / heartbeat)
+                job_progress.finish('queued', "Обработчик остановлен, задача возвращена в очередь.")
+                raise
+        finally:
+            self._work.pop(run_key, None)
+            # Задачу мог уже забрать другой обработчик этого процесса - его записи не трогаем
+            if self._progress.get(job.id) is job_progress:
+                self._progress.pop(job.id)
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+        if run_key in self._lost:
+            self._lost.discard(run_key)
+            self._forget(job)
+            job_progress.finish('queued', "Задача возвращена в очередь и выполняется другим обработчиком.")
+            print(f"Collection job {job.id} stopped: it is no longer owned by {job.worker}")
+            return
+        if job_progress.preempted:
+            # Конвейер остановлен на границе страницы: результат неполный, сбор продолжится с чекпоинтов
+            await self._requeue_preempted(job, job_progress)
+            return
+        try:
+            async with self.session_factory() as db:
+                finished = await crud.finish_collection_job(
+                    db, job_id=job.id, worker=job.worker, status=status, result=result, error=error, chat_id=chat_id,
+                )
+            if not finished: # Задачу вернули в очередь после последнего heartbeat - ее результат сохранит другой обработчик
+                print(f"Warning: Collection job {job.id} is no longer owned by {job.worker}, result discarded")
+                status = 'queued'
+        except Exception as e: # Задача вернется в очередь по отсутствию heartbeat и будет повторена
+            print(f"Error: Failed to save the result of collection job {job.id}: {e}")
+        self._forget(job)
+        job_progress.chat_id = chat_id
+        job_progress.finish(status, error)
+        self.notify() # Освободился слот лимитов: задачи, ждавшие его, можно забирать
+        print(f"Collection job {job.id} {status}")
+
+    async def _execute(
+        self, job: CollectionJob, job_progress: JobProgress,
+    ) -> Tuple[str, Optional[Dict[str, Any]], Optional[str], Optional[int]]:
+        """Выполняет сбор задачи. Returns: (статус, результат, ошибка, ID чата)."""
+        status, result, error, chat_id = 'failed', None, None, job.chat_id
+        # Конвейеры сбора (и их asyncio-задачи) отмечают прогресс в job_progress
+        current_progress.set(job_progress) # Контекст задачи сбора - сбрасывать не нужно
+        options = dict(job.options or {})
+        # Задача возобновлена (вытеснение, сбой обработчика): этапы, завершенные прошлым запуском, пропускаются
+        job_progress.completed_stages = list((job.progress or {}).get("completed_stages") or [])
+        if "participants" in job_progress.completed_stages and options.get("participants", True):
+            print(f"Collection job {job.id}: participants were collected by a previous attempt, skipping them")
+            options["participants"] = False
+        try:
+            async with self.session_factory() as db:
+                app_user = await db.get(AppUser, job.app_user_id)
+                if app_user is None:
+                    error = "Пользователь задачи не найден."
+                else:
+                    response = await self._handler(
+                        db, app_user, parse_chat_target(job.chat_target),
+                        progress=self._progress_callback(job, job_progress), **options,
+                    )
+                    result = response.model_dump()
+                    chat_id = response.chat_id or chat_id
+                    # Чат не получен ни из Telegram, ни из БД - сбор не состоялся
+                    if response.status is None or response.status == "error":
+                        error = response.message
+                    else:
+                        status = 'completed'
+        except JobPreempted:
+            pass # Остановлена на границе этапа - вернется в очередь в run_job
+        except Exception as e:
+            print(f"Error: Collection job {job.id} failed: {e}")
+            error = f"{type(e).__name__}: {e}"
+        return status, result, error, chat_id
+
+    def _forget(self, job: CollectionJob) -> None:
+        """Убирает задачу из выполняемых, если ее еще не забрал заново другой обработчик процесса."""
+        if self._running.get(job.id) is job:
+            self._running.pop(job.id)
+
+    def _lose(self, job: CollectionJob) -> None:
+        """Задачу вернули в очередь или завершили без этого обработчика: сбор останавливается."""
+        run_key = (job.id, job.worker)
+        work = self._work.get(run_key)
+        if work is None or run_key in self._lost:
+            return
+        print(f"Warning: Collection job {job.id} was requeued while running on {job.worker}, stopping it")
+        self._lost.add(run_key)
+        work.cancel()
+
+    async def _requeue_preempted(self, job: CollectionJob, job_progress: JobProgress) -> None:
+        progress = {
+            "stage": "preempted", "preempted_stage": job_progress.stage,
+            "stage_started_at": datetime.now(timezone.utc).isoformat(),
+            "completed_stages": job_progress.completed_stages,
+        }
+        try:
+            async with self.session_factory() as db:
+                await crud.preempt_collection_job(db, job_id=job.id, worker=job.worker, progress=progress)
+        except Exception as e: # Задача вернется в очередь по отсутствию heartbeat
+            print(f"Error: Failed to requeue preempted collection job {job.id}: {e}")
+        self._forget(job)
+        job_progress.finish('queued', "Задача вытеснена планировщиком очереди и возвращена в очередь.")
+        self.notify()
+        print(f"Collection job {job.id} preempted and returned to the queue")
+
+    def _progress_callback(self, job: CollectionJob, job_progress: JobProgress) -> ProgressCallback:
+        async def report(stage: str, chat_id: Optional[int] = None) -> None:
+            job_progress.set_stage(stage, chat_id=chat_id) # Граница этапа: здесь может быть поднято JobPreempted
+            progress = {
+                "stage": stage, "stage_started_at": datetime.now(timezone.utc).isoformat(),
+                "completed_stages": job_progress.completed_stages,
+            }
+            try:
+                async with self.session_factory() as db:
+                    preempt_requested = await crud.update_collection_job(
+                        db, job_id=job.id, worker=job.worker, progress=progress, chat_id=chat_id,
+                    )
+            except Exception as e: # Прогресс не критичен для сбора
+                print(f"Warning: Failed to save progress of collection job {job.id}: {e}")
+                return
+            if preempt_requested is None:
+                self._lose(job) # Отменяет и этот сбор
+            elif preempt_requested:
+                job_progress.request_preemption()
+        return report
+
+    async def _heartbeat_loop(self, job: CollectionJob, job_progress: JobProgress) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                async with self.session_factory() as db:
+                    preempt_requested = await crud.update_collection_job(db, job_id=job.id, worker=job.worker)
+            except Exception as e:
+                print(f"Warning: Failed to update heartbeat of collection job {job.id}: {e}")
+                continue
+            if preempt_requested is None:
+                self._lose(job)
+                return
+            if preempt_requested:
+                job_progress.request_preemption() # Вытеснение запрошено (возможно, другим процессом)
+
+    async def _preemption_loop(self) -> None:
+        """Помечает задачи для вытеснения ради ждущих в очереди (см. crud.request_collection_job_preemptions)."""
+        while True:
+            await asyncio.sleep(self.preemption_interval)
+            try:
+                async with self.session_factory() as db:
+                    job_ids = await crud.request_collection_job_preemptions(
+                        db, preempt_after=self.preempt_after, per_session_limit=self.per_session_limit,
+                        default_weight=self.default_weight, max_preemptions=self.max_preemptions,
+                    )
+            except Exception as e:
+                print(f"Error: Failed to check collection jobs for preemption: {e}")
+                continue
+            for job_id in job_ids:
+                print(f"Requested preemption of collection job {job_id}")
+                job_progress = self._progress.get(job_id)
+                if job_progress is not None: # Задача этого процесса - не ждем heartbeat
+                    job_progress.request_preemption()
+
+    async def _maintenance_loop(self) -> None:
+        """Возвращает в очередь задачи обработчиков, переставших обновлять heartbeat."""
+        while True:
+            try:
+                async with self.session_factory() as db:
+                    job_ids = await crud.requeue_stale_collection_jobs(
+                        db, stale_after=self.stale_after, max_attempts=self.max_attempts,
+                    )
+                if job_ids:
+                    print(f"Requeued or failed {len(job_ids)} stale collection job(s): {job_ids}")
+                    self.notify()
+            except Exception as e:
+                print(f"Error: Failed to requeue stale collection jobs: {e}")
+            await asyncio.sleep(max(self.stale_after / 2, self.poll_interval))
+
+
+# Глобальный обработчик очереди сервиса
+job_runner = CollectionJobRunner()
+
+
+# --- Отдельный процесс-обработчик ---
+# Запуск: python -m data_collector_service.jobs.runner
+# Выполняет задачи очереди без HTTP API (в API можно выключить JOB_WORKER_ENABLED).
+if __name__ == '__main__':
+    from data_collector_service.db.session import startup_db_client, shutdown_db_client
+    from data_collector_service.telegram.client_pool import client_pool
+    from data_collector_service.pipeline import fingerprint_cache
+    from data_collector_service.api.v1.endpoints.collector import process_and_save_collection
+
+    async def main() -> None:
+        await startup_db_client()
+        if settings.TELEGRAM_CLIENT_POOL_ENABLED:
+            client_pool.start()
+        job_runner.start(process_and_save_collection)
+        try:
+            await asyncio.Event().wait() # До остановки процесса
+        finally:
+            await job_runner.close()
+            await client_pool.close()
+            await fingerprint_cache.close()
+            await shutdown_db_client()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Collection job runner stopped")
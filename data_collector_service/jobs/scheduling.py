@@ -0,0 +1,56 @@
+# telegram-intel/data_collector_service/jobs/scheduling.py
+
+from typing import Optional, Dict, Any, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from data_collector_service import crud
+from data_collector_service.core.config import settings
+from shared.models import AppUser, CollectionQuota
+
+# --- Справедливое распределение очереди между пользователями ---
+# Все сборы делят одни лимиты (JOB_GLOBAL_CONCURRENCY, пул соединений БД, event loop), поэтому
+# очередь распределяется между пользователями, а не по порядку поступления:
+# - класс приоритета: интерактивные запросы (только информация о чате, без участников и истории)
+#   забираются раньше массовых сборов;
+# - внутри класса - пользователь с наименьшей долей выполняемых задач относительно своего веса
+#   (crud.claim_collection_job);
+# - квоты пользователя (collection_quotas): вес, сколько задач выполняется и сколько ждет в очереди;
+# - вытеснение: задача, прождавшая JOB_PREEMPT_AFTER, вытесняет массовый сбор или задачу
+#   пользователя, занявшего больше своей доли (crud.request_collection_job_preemptions); вытесненная
+#   задача останавливается на границе страницы и продолжается с чекпоинтов (pipeline.progress).
+
+
+def job_priority(options: Optional[Dict[str, Any]]) -> int:
+    """Класс приоритета задачи по параметрам сбора."""
+    options = options or {}
+    history = options.get("history")
+    if history is None:
+        history = settings.HISTORY_COLLECTION_ENABLED
+    if options.get("participants", True) or history:
+        return crud.PRIORITY_BULK
+    return crud.PRIORITY_INTERACTIVE
+
+
+def effective_quota(quota: Optional[CollectionQuota]) -> Tuple[int, int, int]:
+    """
+    Действующая квота пользователя с учетом настроек по умолчанию.
+
+    Returns:
+        (вес, лимит выполняемых задач, лимит задач в очереди); 0 - без ограничения.
+    """
+    if quota is None:
+        return settings.JOB_DEFAULT_WEIGHT, settings.JOB_MAX_PER_SESSION, settings.JOB_MAX_QUEUED_PER_USER
+    return (
+        quota.weight,
+        settings.JOB_MAX_PER_SESSION if quota.max_running is None else quota.max_running,
+        settings.JOB_MAX_QUEUED_PER_USER if quota.max_queued is None else quota.max_queued,
+    )
+
+
+async def queue_slots_left(db: AsyncSession, app_user: AppUser) -> Optional[int]:
+    """Сколько еще задач пользователь может поставить в очередь (None - без ограничения)."""
+    _, _, max_queued = effective_quota(await crud.get_collection_quota(db, app_user_id=app_user.id))
+    if max_queued <= 0:
+        return None
+    return max(max_queued - await crud.count_queued_collection_jobs(db, app_user_id=app_user.id), 0)
@@ -7,9 +7,15 @@ from dotenv import load_dotenv
 
 # Импортируем настройки и функции управления БД ИЗ ЭТОГО СЕРВИСА
 from data_collector_service.core.config import settings
-from data_collector_service.db.session import startup_db_client, shutdown_db_client
+from data_collector_service.db.session import startup_db_client, shutdown_db_client, AsyncSessionFactory
+from data_collector_service import crud
+from data_collector_service.telegram.client import prewarm_telegram_clients
+from data_collector_service.telegram.client_pool import client_pool
+from data_collector_service.pipeline import fingerprint_cache
+from data_collector_service.jobs import job_runner
 # Импортируем роутеры API (пока закомментировано, добавим позже)
 from data_collector_service.api.v1.api import api_router as api_v1_router
+from data_collector_service.api.v1.endpoints.collector import process_and_save_collection
 
 # --- Lifespan Management ---
 @asynccontextmanager
@@ -17,11 +23,27 @@ async def lifespan(app: FastAPI):
     """
     Handles application startup and shutdown events for Data Collector Service.
     Connects to the database on startup and disconnects on shutdown.
+    Pre-warms the Telegram client pool and disconnects pooled clients on shutdown.
+    Runs the collection job queue workers (see jobs.runner).
     """
     print(f"--- Starting up {settings.PROJECT_NAME} ---")
     await startup_db_client() # Подключаемся к БД этого сервиса
+    if settings.TELEGRAM_CLIENT_POOL_ENABLED:
+        client_pool.start() # Фоновое отключение простаивающих клиентов
+        if settings.TELEGRAM_CLIENT_POOL_PREWARM > 0:
+            try:
+                async with AsyncSessionFactory() as db:
+                    users = await crud.get_app_users_with_sessions(db, limit=settings.TELEGRAM_CLIENT_POOL_PREWARM)
+                await prewarm_telegram_clients(users)
+            except Exception as e:
+                print(f"Warning: Failed to prewarm Telegram client pool: {e}")
+    if settings.JOB_QUEUE_ENABLED and settings.JOB_WORKER_ENABLED:
+        job_runner.start(process_and_save_collection) # Обработчики очереди задач сбора
     yield # Приложение работает здесь
     print(f"--- Shutting down {settings.PROJECT_NAME} ---")
+    await job_runner.close() # Останавливаем сборы, незавершенные задачи возвращаются в очередь
+    await client_pool.close() # Отключаем клиентов Telegram
+    await fingerprint_cache.close() # Закрываем соединение с Redis кеша отпечатков (если используется)
     await shutdown_db_client() # Отключаемся от БД этого сервиса
 
 # --- Создание экземпляра FastAPI ---
@@ -0,0 +1,30 @@
+# telegram-intel/data_collector_service/pipeline/__init__.py
+
+from .participants import ParticipantPipelineStats, run_participant_pipeline
+from .fingerprints import ProfileFingerprintCache, fingerprint_cache
+from .membership import MembershipRecorder
+from .admin_log import AdminLogRefreshStats, refresh_from_admin_log, save_admin_log_watermark
+from .history import HistoryPipelineStats, run_history_pipeline
+from .backfill import HistoryBackfillStats, run_history_backfill
+from .progress import ProgressEvent, ProgressHub, progress_hub, JobProgress, JobPreempted, current_progress
+
+__all__ = [
+    "ParticipantPipelineStats",
+    "run_participant_pipeline",
+    "ProfileFingerprintCache",
+    "fingerprint_cache",
+    "MembershipRecorder",
+    "AdminLogRefreshStats",
+    "refresh_from_admin_log",
+    "save_admin_log_watermark",
+    "HistoryPipelineStats",
+    "run_history_pipeline",
+    "HistoryBackfillStats",
+    "run_history_backfill",
+    "ProgressEvent",
+    "ProgressHub",
+    "progress_hub",
+    "JobProgress",
+    "JobPreempted",
+    "current_progress",
+]
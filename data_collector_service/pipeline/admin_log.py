@@ -0,0 +1,129 @@
+# telegram-intel/data_collector_service/pipeline/admin_log.py
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Union, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from telethon import TelegramClient
+from telethon.errors import RPCError
+
+from data_collector_service import crud
+from data_collector_service.core.config import settings
+from data_collector_service.db.session import AsyncSessionFactory
+from data_collector_service.telegram.collector import (
+    get_admin_log_head, get_admin_log_membership, AdminLogTooLongError, ParticipantCollectionError,
+)
+from shared.models import AppUser
+
+# --- Инкрементальное обновление состава по журналу администратора ---
+# Для каналов, где аккаунт - администратор, состав обновляется по событиям журнала
+# (входы, выходы, приглашения, блокировки) после водяного знака - ID последнего обработанного
+# события, который хранится в collection_checkpoints (mode='admin_log', position).
+# Стоимость обновления зависит от количества изменений, а не от размера чата. Если водяного
+# знака нет, он устарел (журнал хранится 48 часов) или событий слишком много, нужен полный
+# перебор участников; водяной знак для следующего обновления запоминается перед ним.
+
+# Вид сбора в collection_checkpoints.mode
+MODE_ADMIN_LOG = 'admin_log'
+
+
+@dataclass
+class AdminLogRefreshStats:
+    """Итоги обновления состава по журналу администратора."""
+    applied: bool = False # Изменения журнала записаны, полный перебор не нужен
+    fallback_reason: Optional[str] = None # Почему нужен полный перебор
+    watermark: Optional[int] = None # Водяной знак после обновления (или для сохранения после полного перебора)
+    events: int = 0 # Событий о составе
+    members_present: int = 0 # Участники, записанные Upsert (вошли, приглашены, разблокированы)
+    members_left: int = 0 # Участники, отмеченные вышедшими
+
+
+async def refresh_from_admin_log(
+    client: TelegramClient,
+    chat_target: Union[int, str],
+    *,
+    chat_id: int,
+    app_user: AppUser,
+    session_factory: Callable[[], AsyncSession] = AsyncSessionFactory,
+) -> AdminLogRefreshStats:
+    """
+    Обновляет состав чата по журналу администратора с сохраненного водяного знака.
+
+    Если журналом воспользоваться нельзя, возвращает fallback_reason (и, по возможности, текущий
+    водяной знак журнала в watermark): вызывающий код выполняет полный перебор участников и после
+    его успешного завершения сохраняет водяной знак (save_admin_log_watermark).
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient (аккаунт - администратор канала).
+        chat_target: ID или username канала/супергруппы.
+        chat_id: ID чата Telegram (запись TargetChat должна уже существовать).
+        app_user: Пользователь приложения, инициировавший сбор.
+        session_factory: Фабрика сессий БД.
+
+    Returns:
+        AdminLogRefreshStats.
+    """
+    stats = AdminLogRefreshStats()
+    async with session_factory() as db:
+        checkpoint = await crud.get_checkpoint(db, chat_id=chat_id, mode=MODE_ADMIN_LOG)
+
+    if checkpoint is None or checkpoint.status != 'completed' or checkpoint.position is None:
+        stats.fallback_reason = "no watermark"
+    elif (datetime.now(timezone.utc) - checkpoint.updated_at).total_seconds() > settings.ADMIN_LOG_MAX_WATERMARK_AGE:
+        stats.fallback_reason = "watermark expired"
+    else:
+        try:
+            changes = await get_admin_log_membership(client, chat_target, min_id=checkpoint.position)
+        except AdminLogTooLongError as e:
+            stats.fallback_reason = str(e)
+        except (ParticipantCollectionError, RPCError) as e:
+            stats.fallback_reason = f"admin log unavailable: {e}"
+            return stats
+        else:
+            stats.events = changes.events
+            stats.watermark = changes.max_event_id
+            stats.members_present = len(changes.batch)
+            async with session_factory() as db:
+                # Изменения и новый водяной знак - в одной транзакции (save_checkpoint коммитит)
+                user_rows = changes.batch.rows(crud.USER_COLUMNS)
+                if user_rows:
+                    await crud.bulk_upsert_user_rows(db, rows=user_rows, collected_by=app_user, commit=False)
+                    await crud.bulk_upsert_participant_rows(
+                        db, chat_id=chat_id, rows=changes.batch.rows(crud.PARTICIPANT_COLUMNS), commit=False
+                    )
+                stats.members_left = await crud.apply_participant_membership(
+                    db, chat_id=chat_id, present_user_ids=changes.batch.ids.tolist(), left=changes.left, commit=False,
+                )
+                await crud.save_checkpoint(
+                    db, chat_id=chat_id, mode=MODE_ADMIN_LOG, status='completed', position=stats.watermark,
+                    session_file=app_user.session_file,
+                )
+            stats.applied = True
+            print(f"Admin log refresh for chat {chat_id}: {stats.events} events, {stats.members_present} present, "
+                  f"{stats.members_left} left, watermark {stats.watermark}.")
+            return stats
+
+    # Полный перебор: водяной знак берется до него, события во время перебора будут прочитаны повторно
+    try:
+        stats.watermark = await get_admin_log_head(client, chat_target)
+    except (ParticipantCollectionError, RPCError) as e:
+        print(f"Warning: Could not read admin log head for chat {chat_id}: {e}")
+    print(f"Admin log refresh for chat {chat_id} needs a full participant crawl: {stats.fallback_reason}.")
+    return stats
+
+
+async def save_admin_log_watermark(
+    chat_id: int,
+    watermark: int,
+    session_file: Optional[str],
+    session_factory: Callable[[], AsyncSession] = AsyncSessionFactory,
+) -> None:
+    """Сохраняет водяной знак журнала после полного перебора участников (ошибка не прерывает сбор)."""
+    try:
+        async with session_factory() as db:
+            await crud.save_checkpoint(
+                db, chat_id=chat_id, mode=MODE_ADMIN_LOG, status='completed', position=watermark, session_file=session_file,
+            )
+    except Exception as e:
+        print(f"Error: Failed to save admin log watermark for chat {chat_id}: {e}")
@@ -0,0 +1,272 @@
+# telegram-intel/data_collector_service/pipeline/backfill.py
+
+import asyncio
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import Optional, Union, Callable, List, Dict, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from telethon import TelegramClient
+
+from data_collector_service import crud
+from data_collector_service.core.config import settings
+from data_collector_service.db.session import AsyncSessionFactory
+from data_collector_service.telegram.collector import get_history_head, iter_history_backfill
+from data_collector_service.telegram.backfill import (
+    BackfillPage, BackfillReport, HistoryRange, split_history_ranges, ranges_state, ranges_from_state,
+)
+from data_collector_service.telegram.messages import MessageBatch
+from shared.models import AppUser
+from .fingerprints import ProfileFingerprintCache, fingerprint_cache
+from .history import MODE_HISTORY, insert_message_batch
+from .progress import current_progress, JobPreempted
+
+# --- Первая загрузка истории по диапазонам ID ---
+# Вся история чата (0, ID последнего сообщения] делится на диапазоны, которые параллельно
+# читают все аккаунты задачи (telegram/backfill.py). Страницы разных диапазонов приходят
+# вперемешку; писатель складывает их в пачки по HISTORY_WRITE_BATCH_SIZE сообщений и пишет
+# пачку одной транзакцией вместе с чекпоинтом (mode='history_backfill'): в state хранятся
+# незаписанные части всех диапазонов, в position - верхняя граница загрузки. Сообщения
+# пишутся ON CONFLICT DO NOTHING, поэтому повторно прочитанные после прерывания страницы
+# ничего не портят. После завершения position становится водяным знаком обычной загрузки
+# (mode='history'): дальше run_history_pipeline читает только новые сообщения.
+
+# Вид сбора в collection_checkpoints.mode
+MODE_HISTORY_BACKFILL = 'history_backfill'
+
+# Маркер завершения очереди для писателя
+_STOP = None
+
+
+@dataclass
+class HistoryBackfillStats:
+    """Итоги первой загрузки истории по диапазонам."""
+    skipped: bool = False # Загрузка не нужна: история уже загружена или читается по водяному знаку
+    resumed: bool = False # Продолжена с чекпоинта прерванной загрузки
+    head: int = 0 # Верхняя граница загрузки (ID последнего сообщения на момент начала)
+    sessions: int = 0 # Аккаунтов, читавших историю
+    ranges_initial: int = 0
+    ranges_stolen: int = 0
+    ranges_left: int = 0 # Незаписанных диапазонов в чекпоинте (0 - история загружена полностью)
+    pages_fetched: int = 0
+    messages_fetched: int = 0
+    messages_written: int = 0 # Новые сообщения
+    messages_duplicate: int = 0 # Уже были в БД (ON CONFLICT DO NOTHING)
+    entities_written: int = 0
+    files_written: int = 0
+    users_written: int = 0
+    batches_written: int = 0
+    write_errors: int = 0
+    pages_per_session: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+    checkpoint_status: Optional[str] = None # 'completed' / 'interrupted'
+    elapsed: float = 0.0
+
+    @property
+    def messages_per_second(self) -> Optional[float]:
+        """Скорость загрузки (прочитанных сообщений в секунду)."""
+        return self.messages_fetched / self.elapsed if self.elapsed else None
+
+
+async def _write_pages(
+    db: AsyncSession,
+    pages: Sequence[BackfillPage],
+    ranges: List[HistoryRange],
+    stats: HistoryBackfillStats,
+    chat_id: int,
+    app_user: AppUser,
+    fingerprints: Optional[ProfileFingerprintCache],
+) -> None:
+    """Записывает пачку страниц и чекпоинт диапазонов одной транзакцией (save_checkpoint коммитит)."""
+    batch = MessageBatch()
+    done_to: Dict[int, int] = {}
+    for page in pages:
+        batch.merge(page.batch)
+        # Страницы диапазона приходят сверху вниз, поэтому граница записанного только уменьшается
+        done_to[id(page.range)] = min(done_to.get(id(page.range), page.done_to), page.done_to)
+    user_rows, result = await insert_message_batch(db, batch, chat_id, app_user, fingerprints)
+    # Чекпоинт - снимок всех диапазонов (включая украденные части), как если бы пачка уже записана
+    committed = {id(r): min(r.committed, done_to.get(id(r), r.committed)) for r in ranges}
+    await crud.save_checkpoint(
+        db, chat_id=chat_id, mode=MODE_HISTORY_BACKFILL, status='running', position=stats.head,
+        state={"ranges": [[r.low, committed[id(r)]] for r in ranges if committed[id(r)] > r.low]},
+        pages_done=stats.batches_written + 1, rows_done=stats.messages_written + result.messages,
+        session_file=app_user.session_file,
+    )
+    for r in ranges: # Части, украденные во время записи, в снимок не попали и не изменились
+        r.committed = committed.get(id(r), r.committed)
+    stats.batches_written += 1
+    stats.messages_written += result.messages
+    stats.messages_duplicate += result.duplicates
+    stats.entities_written += result.entities
+    stats.files_written += result.files
+    stats.users_written += len(user_rows)
+    job_progress = current_progress.get()
+    if job_progress is not None:
+        job_progress.messages_saved(result.messages)
+    if fingerprints is not None and user_rows:
+        await fingerprints.store(user_rows) # Только после коммита пачки
+
+
+async def _write_batches(
+    queue: asyncio.Queue,
+    ranges: List[HistoryRange],
+    stats: HistoryBackfillStats,
+    chat_id: int,
+    app_user: AppUser,
+    session_factory: Callable[[], AsyncSession],
+    fingerprints: Optional[ProfileFingerprintCache],
+    started: float,
+) -> None:
+    """Писатель: записывает пачки страниц; после ошибки только разгружает очередь."""
+    async with session_factory() as db:
+        while True:
+            pages = await queue.get()
+            if pages is _STOP:
+                break
+            if stats.write_errors:
+                continue
+            try:
+                await _write_pages(db, pages, ranges, stats, chat_id, app_user, fingerprints)
+            except Exception as e:
+                await db.rollback()
+                stats.write_errors += 1
+                stats.error = stats.error or f"write failed: {e}"
+                print(f"Error: Failed to write {len(pages)} history pages for chat {chat_id}: {e}")
+                continue
+            stats.elapsed = time.perf_counter() - started
+
+
+async def run_history_backfill(
+    client: TelegramClient,
+    chat_target: Union[int, str],
+    *,
+    chat_id: int,
+    app_user: AppUser,
+    extra_clients: Sequence[TelegramClient] = (),
+    batch_size: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    session_factory: Callable[[], AsyncSession] = AsyncSessionFactory,
+    fingerprints: Optional[ProfileFingerprintCache] = None,
+) -> HistoryBackfillStats:
+    """
+    Первая загрузка всей истории чата параллельно по диапазонам ID (или продолжение прерванной).
+    Если история уже загружается по водяному знаку (run_history_pipeline), ничего не делает.
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient (основной).
+        chat_target: ID или username целевого чата.
+        chat_id: ID чата Telegram (запись TargetChat должна уже существовать).
+        app_user: Пользователь приложения, инициировавший сбор.
+        extra_clients: Дополнительные клиенты (аккаунты из session_pool) для каналов и супергрупп.
+        batch_size: Сообщений в пачке записи (по умолчанию settings.HISTORY_WRITE_BATCH_SIZE).
+        queue_size: Пачек в очереди (по умолчанию settings.HISTORY_QUEUE_MAXSIZE).
+        session_factory: Фабрика сессий БД.
+        fingerprints: Кеш отпечатков профилей отправителей (по умолчанию общий fingerprint_cache,
+            если включен settings.PROFILE_FINGERPRINT_CACHE_ENABLED).
+
+    Returns:
+        Статистика загрузки (HistoryBackfillStats).
+    """
+    batch_size = batch_size or settings.HISTORY_WRITE_BATCH_SIZE
+    queue_size = queue_size or settings.HISTORY_QUEUE_MAXSIZE
+    if fingerprints is None and settings.PROFILE_FINGERPRINT_CACHE_ENABLED:
+        fingerprints = fingerprint_cache
+    stats = HistoryBackfillStats()
+    async with session_factory() as db:
+        checkpoint = await crud.get_checkpoint(db, chat_id=chat_id, mode=MODE_HISTORY_BACKFILL)
+        history_checkpoint = await crud.get_checkpoint(db, chat_id=chat_id, mode=MODE_HISTORY)
+
+    if checkpoint is not None and checkpoint.status != 'completed' and (checkpoint.state or {}).get("ranges"):
+        ranges = ranges_from_state(checkpoint.state["ranges"])
+        stats.head = checkpoint.position or 0
+        stats.resumed = True
+    elif checkpoint is not None or (history_checkpoint is not None and history_checkpoint.position):
+        stats.skipped = True
+        return stats
+    else:
+        stats.head = await get_history_head(client, chat_target)
+        parts = (1 + len(extra_clients)) * settings.HISTORY_BACKFILL_RANGES_PER_SESSION
+        ranges = split_history_ranges(0, stats.head, parts)
+        async with session_factory() as db:
+            await crud.save_checkpoint(
+                db, chat_id=chat_id, mode=MODE_HISTORY_BACKFILL, status='running', position=stats.head,
+                state={"ranges": ranges_state(ranges)}, session_file=app_user.session_file, restart=True,
+            )
+
+    print(f"Starting history backfill for chat {chat_id} up to message {stats.head}: {len(ranges)} range(s), "
+          f"{1 + len(extra_clients)} session(s){' (resumed)' if stats.resumed else ''}")
+    report = BackfillReport()
+    started = time.perf_counter()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    writer_task = asyncio.create_task(
+        _write_batches(queue, ranges, stats, chat_id, app_user, session_factory, fingerprints, started)
+    )
+    job_progress = current_progress.get()
+    preempted: Optional[JobPreempted] = None
+    try:
+        pending: List[BackfillPage] = []
+        pending_messages = 0
+        if ranges:
+            # aclosing: при выходе из цикла клиенты останавливаются сразу, а не при сборке мусора
+            async with aclosing(iter_history_backfill(client, chat_target, ranges, extra_clients=extra_clients, report=report)) as pages:
+                async for page in pages:
+                    if stats.write_errors:
+                        break # Писатель остановился: чекпоинт дальше не сдвинется, читать незачем
+                    if job_progress is not None:
+                        job_progress.history_page_fetched(len(page.batch))
+                    pending.append(page)
+                    pending_messages += len(page.batch)
+                    if pending_messages >= batch_size:
+                        await queue.put(pending) # Backpressure: клиенты ждут, пока писатель разгрузит очередь
+                        pending, pending_messages = [], 0
+        if pending:
+            await queue.put(pending)
+    except JobPreempted as e:
+        stats.error = str(e)
+        preempted = e # Пробрасывается после сохранения чекпоинта
+    except Exception as e:
+        stats.error = str(e)
+        print(f"Error: History backfill for {chat_target} stopped: {e}")
+    finally:
+        await queue.put(_STOP)
+        await writer_task
+
+    stats.sessions = len(report.pages_per_lane) or 1
+    stats.ranges_initial = report.ranges_initial
+    stats.ranges_stolen = report.ranges_stolen
+    stats.pages_fetched = report.pages_fetched
+    stats.messages_fetched = report.messages_fetched
+    stats.pages_per_session = report.pages_per_lane
+    left = ranges_state(ranges)
+    stats.ranges_left = len(left)
+    stats.checkpoint_status = 'interrupted' if stats.error or left else 'completed'
+    try:
+        async with session_factory() as db:
+            await crud.save_checkpoint(
+                db, chat_id=chat_id, mode=MODE_HISTORY_BACKFILL, status=stats.checkpoint_status, position=stats.head,
+                state={"ranges": left} if left else None, pages_done=stats.batches_written,
+                rows_done=stats.messages_written, session_file=app_user.session_file,
+            )
+            if stats.checkpoint_status == 'completed':
+                # Дальше история догружается по водяному знаку с верхней границы этой загрузки
+                position = max(stats.head, history_checkpoint.position or 0) if history_checkpoint else stats.head
+                await crud.save_checkpoint(
+                    db, chat_id=chat_id, mode=MODE_HISTORY, status='completed', position=position,
+                    pages_done=stats.batches_written, rows_done=stats.messages_written, session_file=app_user.session_file,
+                )
+    except Exception as e:
+        print(f"Error: Failed to save history backfill checkpoint for chat {chat_id}: {e}")
+
+    rate = stats.messages_per_second
+    print(
+        f"History backfill for chat {chat_id} finished: fetched {stats.messages_fetched} messages in {stats.pages_fetched} pages "
+        f"by {stats.sessions} session(s), written {stats.messages_written} (duplicates {stats.messages_duplicate}), "
+        f"entities {stats.entities_written}, files {stats.files_written}, users {stats.users_written}, "
+        f"ranges {stats.ranges_initial} (+{stats.ranges_stolen} stolen, {stats.ranges_left} left), "
+        f"write errors {stats.write_errors}, {f'{rate:,.0f} messages/s' if rate else 'n/a'}, checkpoint {stats.checkpoint_status}."
+    )
+    if preempted is not None:
+        raise preempted
+    return stats
@@ -0,0 +1,111 @@
+# telegram-intel/data_collector_service/pipeline/checkpoints.py
+
+import asyncio
+from typing import Optional, Callable, Dict, Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from data_collector_service import crud
+from data_collector_service.core.config import settings
+from data_collector_service.telegram.participants import ParticipantPage, CrawlProgress
+
+# Вид сбора в collection_checkpoints.mode
+MODE_PARTICIPANTS = 'participants'
+
+
+class ParticipantCheckpointer:
+    """
+    Чекпоинт сбора участников: хранит незавершенные страницы перебора в collection_checkpoints,
+    чтобы прерванный сбор (падение процесса, RPCError, flood wait) продолжился с места остановки.
+
+    Страница отмечается завершенной только после записи ее участников в БД, поэтому чекпоинт
+    никогда не опережает данные: после падения часть страниц может быть собрана повторно,
+    но ни одна не теряется.
+
+    Args:
+        chat_id: ID чата Telegram.
+        session_file: Сессия, которой идет сбор (сохраняется в чекпоинте).
+        session_factory: Фабрика сессий БД.
+        flush_every: Сохранять чекпоинт после каждых flush_every записанных страниц.
+    """
+
+    def __init__(
+        self,
+        chat_id: int,
+        session_file: Optional[str],
+        session_factory: Callable[[], AsyncSession],
+        flush_every: Optional[int] = None,
+    ):
+        self.chat_id = chat_id
+        self.session_file = session_file
+        self.session_factory = session_factory
+        self.flush_every = flush_every or settings.CHECKPOINT_EVERY_PAGES
+        self.progress = CrawlProgress()
+        self.pages_done = 0
+        self.rows_done = 0
+        self._since_flush = 0
+        self._lock = asyncio.Lock()
+
+    def _state(self) -> Dict[str, Any]:
+        return {
+            "sharded": self.progress.sharded,
+            "pending": [[query, offset] for query, offset in self.progress.pending()],
+        }
+
+    async def start(self, resume: bool = True) -> CrawlProgress:
+        """
+        Загружает незавершенный чекпоинт (если есть) и отмечает сбор как запущенный.
+
+        Returns:
+            CrawlProgress для перебора (с незавершенными страницами, если сбор возобновлен).
+        """
+        async with self.session_factory() as db:
+            checkpoint = await crud.get_checkpoint(db, chat_id=self.chat_id, mode=MODE_PARTICIPANTS)
+            if resume and checkpoint is not None and checkpoint.status != 'completed' and (checkpoint.state or {}).get('pending'):
+                self.progress = CrawlProgress(
+                    pending=checkpoint.state['pending'], sharded=checkpoint.state.get('sharded', False)
+                )
+                self.pages_done, self.rows_done = checkpoint.pages_done, checkpoint.rows_done
+                print(f"Resuming participant collection for chat {self.chat_id} from checkpoint: "
+                      f"{self.pages_done} pages / {self.rows_done} rows already saved, "
+                      f"{len(self.progress.outstanding)} unfinished page(s) (previous session: {checkpoint.session_file})")
+            await crud.save_checkpoint(
+                db, chat_id=self.chat_id, mode=MODE_PARTICIPANTS, status='running', state=self._state(),
+                position=self.progress.resume_offset(), pages_done=self.pages_done, rows_done=self.rows_done,
+                session_file=self.session_file, restart=not self.progress.resumed,
+            )
+        return self.progress
+
+    async def page_written(self, page: ParticipantPage, rows: int) -> None:
+        """Страница записана в БД: отмечаем ее завершенной и периодически сохраняем чекпоинт."""
+        self.progress.complete((page.query, page.offset))
+        self.pages_done += 1
+        self.rows_done += rows
+        self._since_flush += 1
+        if self._since_flush >= self.flush_every:
+            await self.flush('running')
+
+    async def flush(self, status: str) -> None:
+        """Сохраняет чекпоинт (ошибка сохранения не прерывает сбор)."""
+        async with self._lock:
+            self._since_flush = 0
+            try:
+                async with self.session_factory() as db:
+                    await crud.save_checkpoint(
+                        db, chat_id=self.chat_id, mode=MODE_PARTICIPANTS, status=status, state=self._state(),
+                        position=self.progress.resume_offset(), pages_done=self.pages_done, rows_done=self.rows_done,
+                        session_file=self.session_file,
+                    )
+            except Exception as e:
+                print(f"Error: Failed to save participant checkpoint for chat {self.chat_id}: {e}")
+
+    async def finish(self, failed: bool) -> str:
+        """
+        Сохраняет итоговый чекпоинт.
+
+        Returns:
+            'completed', если все страницы записаны, иначе 'interrupted' (следующий запуск продолжит сбор).
+        """
+        status = 'completed' if self.progress.done and not failed else 'interrupted'
+        await self.flush(status)
+        return status
@@ -0,0 +1,183 @@
+# telegram-intel/data_collector_service/pipeline/fingerprints.py
+
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Iterable, Sequence, Tuple
+
+from data_collector_service.core.config import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError: # Redis-бэкенд необязателен
+    aioredis = None
+
+# --- Кеш отпечатков профилей пользователей ---
+# Популярные пользователи состоят в десятках собираемых чатов, и каждый сбор заново отправлял
+# их профиль в bulk_upsert_users. Кеш хранит отпечаток (хеш строки users в порядке crud.USER_COLUMNS)
+# по ID пользователя Telegram: если отпечаток не изменился, пользователь не отправляется в БД.
+# Участие в чате (chat_participants) пишется всегда - оно свое для каждого чата.
+#
+# Отпечаток сохраняется только после успешной записи страницы, поэтому попадание в кеш означает,
+# что строка users уже есть в БД. Уровни: LRU в памяти процесса и (опционально) Redis, общий
+# для всех процессов сервиса; записи Redis живут PROFILE_FINGERPRINT_TTL секунд.
+
+
+def profile_fingerprint(row: Tuple) -> int:
+    """Отпечаток профиля: 64-битный blake2b от строки users (значения в порядке crud.USER_COLUMNS, ID первым)."""
+    return int.from_bytes(hashlib.blake2b(repr(row).encode(), digest_size=8).digest(), "big")
+
+
+@dataclass
+class FingerprintCacheStats:
+    """Счетчики кеша отпечатков (для отчетов и эндпоинта статистики)."""
+    lookups: int = 0
+    hits: int = 0 # Отпечаток совпал - пользователь не отправлялся в БД
+    local_hits: int = 0 # Из них найдено в памяти процесса
+    redis_hits: int = 0 # Из них найдено в Redis
+    changed: int = 0 # Отпечаток был, но профиль изменился
+    misses: int = 0 # Отпечатка не было
+    stored: int = 0
+    redis_errors: int = 0
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        return self.hits / self.lookups if self.lookups else None
+
+
+class ProfileFingerprintCache:
+    """
+    Кеш отпечатков профилей: LRU в памяти процесса с опциональным Redis-бэкендом.
+
+    Args:
+        max_size: Максимальное количество отпечатков в памяти процесса.
+        redis_url: URL Redis (None - только память процесса).
+        ttl: Время жизни отпечатка в Redis (сек).
+        key_prefix: Префикс ключей в Redis.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int = settings.PROFILE_FINGERPRINT_CACHE_SIZE,
+        redis_url: Optional[str] = None,
+        ttl: int = settings.PROFILE_FINGERPRINT_TTL,
+        key_prefix: str = "tg:user_fp:",
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.stats = FingerprintCacheStats()
+        self._local: "OrderedDict[int, int]" = OrderedDict()
+        self._redis = None
+        if redis_url:
+            if aioredis is None:
+                print("Warning: redis package is not installed, profile fingerprint cache uses process memory only.")
+            else:
+                self._redis = aioredis.from_url(redis_url)
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    def _remember(self, user_id: int, fingerprint: int) -> None:
+        self._local[user_id] = fingerprint
+        self._local.move_to_end(user_id)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    async def _redis_get(self, user_ids: Sequence[int]) -> List[Optional[int]]:
+        if self._redis is None or not user_ids:
+            return [None] * len(user_ids)
+        try:
+            values = await self._redis.mget([f"{self.key_prefix}{user_id}" for user_id in user_ids])
+        except Exception as e:
+            self.stats.redis_errors += 1
+            print(f"Warning: Profile fingerprint cache Redis lookup failed: {e}")
+            return [None] * len(user_ids)
+        return [int(value) if value is not None else None for value in values]
+
+    async def filter_changed(self, rows: Iterable[Tuple]) -> List[Tuple]:
+        """
+        Отбрасывает пользователей, чей профиль не изменился с последней записи.
+
+        Args:
+            rows: Строки users (в порядке crud.USER_COLUMNS).
+
+        Returns:
+            Строки, которые нужно отправить в БД (новые или с измененным профилем).
+        """
+        rows = list(rows)
+        self.stats.lookups += len(rows)
+        fingerprints = [profile_fingerprint(row) for row in rows]
+        cached: List[Optional[int]] = []
+        remote_ids = []
+        for row in rows:
+            value = self._local.get(row[0])
+            if value is not None:
+                self._local.move_to_end(row[0])
+            else:
+                remote_ids.append(row[0])
+            cached.append(value)
+        remote = dict(zip(remote_ids, await self._redis_get(remote_ids)))
+
+        changed_rows = []
+        for row, fingerprint, local_value in zip(rows, fingerprints, cached):
+            value = local_value if local_value is not None else remote.get(row[0])
+            if value == fingerprint:
+                self.stats.hits += 1
+                if local_value is not None:
+                    self.stats.local_hits += 1
+                else:
+                    self.stats.redis_hits += 1
+                    self._remember(row[0], fingerprint)
+                continue
+            if value is None:
+                self.stats.misses += 1
+            else:
+                self.stats.changed += 1
+            changed_rows.append(row)
+        return changed_rows
+
+    async def store(self, rows: Iterable[Tuple]) -> None:
+        """Запоминает отпечатки пользователей (строки users), записанных в БД."""
+        fingerprints: Dict[int, int] = {row[0]: profile_fingerprint(row) for row in rows}
+        if not fingerprints:
+            return
+        for user_id, fingerprint in fingerprints.items():
+            self._remember(user_id, fingerprint)
+        self.stats.stored += len(fingerprints)
+        if self._redis is None:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for user_id, fingerprint in fingerprints.items():
+                    pipe.set(f"{self.key_prefix}{user_id}", fingerprint, ex=self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            self.stats.redis_errors += 1
+            print(f"Warning: Profile fingerprint cache Redis store failed: {e}")
+
+    def clear(self) -> None:
+        """Очищает кеш в памяти процесса (Redis не затрагивается)."""
+        self._local.clear()
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            close = getattr(self._redis, "aclose", None) or self._redis.close # aclose() - redis>=5
+            await close()
+
+    def metrics(self) -> Dict[str, object]:
+        """Счетчики кеша и доля попаданий."""
+        return {
+            **self.stats.__dict__,
+            "hit_rate": self.stats.hit_rate,
+            "size": len(self),
+            "max_size": self.max_size,
+            "redis": self._redis is not None,
+        }
+
+
+# Общий кеш отпечатков сервиса
+fingerprint_cache = ProfileFingerprintCache(
+    redis_url=settings.REDIS_URL if settings.PROFILE_FINGERPRINT_REDIS_ENABLED else None,
+)
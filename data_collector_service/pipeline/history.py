@@ -0,0 +1,251 @@
+# telegram-intel/data_collector_service/pipeline/history.py
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Optional, Union, Callable, List, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from telethon import TelegramClient
+
+from data_collector_service import crud
+from data_collector_service.core.config import settings
+from data_collector_service.db.session import AsyncSessionFactory
+from data_collector_service.telegram.collector import iter_chat_history
+from data_collector_service.telegram.messages import MessageBatch
+from shared.models import AppUser
+from .fingerprints import ProfileFingerprintCache, fingerprint_cache
+from .progress import current_progress, JobPreempted
+
+# --- Потоковая загрузка истории сообщений ---
+# Сборщик читает историю от старых сообщений к новым страницами по 100 и складывает строки
+# в пачки по HISTORY_WRITE_BATCH_SIZE сообщений; писатель записывает пачку (пользователи,
+# сообщения, сущности, файлы) одной транзакцией через COPY и в той же транзакции сдвигает
+# водяной знак - ID последнего записанного сообщения (collection_checkpoints, mode='history',
+# position). Повторный запуск запрашивает только сообщения новее водяного знака. Пачки пишет
+# один писатель строго по порядку: иначе водяной знак мог бы перескочить незаписанную пачку.
+
+# Вид сбора в collection_checkpoints.mode
+MODE_HISTORY = 'history'
+
+# Маркер завершения очереди для писателя
+_STOP = None
+
+
+@dataclass
+class HistoryPipelineStats:
+    """Итоги загрузки истории сообщений."""
+    pages_fetched: int = 0
+    messages_fetched: int = 0
+    messages_written: int = 0 # Новые сообщения
+    messages_duplicate: int = 0 # Уже были в БД (ON CONFLICT DO NOTHING)
+    entities_written: int = 0
+    files_written: int = 0
+    users_written: int = 0 # Строки users, отправленные в БД (после кеша отпечатков)
+    batches_written: int = 0
+    write_errors: int = 0
+    start_watermark: int = 0 # Водяной знак до загрузки
+    watermark: int = 0 # ID последнего записанного сообщения (сохраняется не меньше start_watermark)
+    error: Optional[str] = None # Ошибка сборщика или писателя, прервавшая загрузку
+    checkpoint_status: Optional[str] = None # 'completed' / 'interrupted'
+    elapsed: float = 0.0 # Секунд от начала загрузки до записи последней пачки
+
+    @property
+    def messages_per_second(self) -> Optional[float]:
+        """Скорость загрузки (прочитанных сообщений в секунду)."""
+        return self.messages_fetched / self.elapsed if self.elapsed else None
+
+
+async def _produce_batches(
+    client: TelegramClient,
+    chat_target: Union[int, str],
+    queue: asyncio.Queue,
+    stats: HistoryPipelineStats,
+    min_id: int,
+    limit: int,
+    batch_size: int,
+) -> None:
+    """Читает страницы истории после min_id и кладет в очередь пачки по batch_size сообщений."""
+    pending = MessageBatch()
+    job_progress = current_progress.get()
+    async for page in iter_chat_history(client, chat_target, min_id=min_id, limit=limit):
+        if stats.write_errors:
+            break # Писатель остановился: дальше водяной знак не сдвинется, читать незачем
+        stats.pages_fetched += 1
+        stats.messages_fetched += len(page)
+        if job_progress is not None:
+            job_progress.history_page_fetched(len(page))
+        pending.merge(page)
+        if len(pending) >= batch_size:
+            await queue.put(pending) # Backpressure: сборщик ждет, пока писатель разгрузит очередь
+            pending = MessageBatch()
+    if len(pending):
+        await queue.put(pending)
+
+
+async def insert_message_batch(
+    db: AsyncSession,
+    batch: MessageBatch,
+    chat_id: int,
+    app_user: AppUser,
+    fingerprints: Optional[ProfileFingerprintCache],
+) -> Tuple[List[Tuple], crud.MessageInsertResult]:
+    """Записывает отправителей и сообщения пачки без коммита. Возвращает строки users и итог вставки сообщений."""
+    user_rows = batch.user_batch().rows(crud.USER_COLUMNS)
+    if fingerprints is not None and user_rows:
+        user_rows = await fingerprints.filter_changed(user_rows)
+    # Пользователи пишутся раньше сообщений (внешние ключи messages.user_id/forwarded_from_id)
+    if user_rows:
+        await crud.bulk_upsert_user_rows(db, rows=user_rows, collected_by=app_user, commit=False)
+    result = await crud.bulk_insert_message_rows(
+        db, chat_id=chat_id, messages=batch.messages, entities=batch.entities, files=batch.files, commit=False,
+    )
+    return user_rows, result
+
+
+async def _write_batch(
+    db: AsyncSession,
+    batch: MessageBatch,
+    stats: HistoryPipelineStats,
+    chat_id: int,
+    app_user: AppUser,
+    fingerprints: Optional[ProfileFingerprintCache],
+) -> List[Tuple]:
+    """Записывает пачку и водяной знак одной транзакцией (save_checkpoint коммитит). Возвращает строки users."""
+    user_rows, result = await insert_message_batch(db, batch, chat_id, app_user, fingerprints)
+    watermark = max(stats.watermark, batch.max_id)
+    await crud.save_checkpoint(
+        db, chat_id=chat_id, mode=MODE_HISTORY, status='running', position=max(watermark, stats.start_watermark),
+        pages_done=stats.batches_written + 1, rows_done=stats.messages_written + result.messages,
+        session_file=app_user.session_file,
+    )
+    stats.watermark = watermark
+    stats.batches_written += 1
+    stats.messages_written += result.messages
+    stats.messages_duplicate += result.duplicates
+    stats.entities_written += result.entities
+    stats.files_written += result.files
+    stats.users_written += len(user_rows)
+    job_progress = current_progress.get()
+    if job_progress is not None:
+        job_progress.messages_saved(result.messages)
+    return user_rows
+
+
+async def _write_batches(
+    queue: asyncio.Queue,
+    stats: HistoryPipelineStats,
+    chat_id: int,
+    app_user: AppUser,
+    session_factory: Callable[[], AsyncSession],
+    fingerprints: Optional[ProfileFingerprintCache],
+    started: float,
+) -> None:
+    """Писатель: записывает пачки по порядку; после ошибки только разгружает очередь."""
+    async with session_factory() as db:
+        while True:
+            batch = await queue.get()
+            if batch is _STOP:
+                break
+            if stats.write_errors:
+                continue
+            try:
+                user_rows = await _write_batch(db, batch, stats, chat_id, app_user, fingerprints)
+            except Exception as e:
+                await db.rollback()
+                stats.write_errors += 1
+                stats.error = stats.error or f"write failed: {e}"
+                print(f"Error: Failed to write {len(batch)} messages ({batch.min_id}..{batch.max_id}) for chat {chat_id}: {e}")
+                continue
+            if fingerprints is not None and user_rows:
+                await fingerprints.store(user_rows) # Только после коммита пачки
+            stats.elapsed = time.perf_counter() - started
+
+
+async def run_history_pipeline(
+    client: TelegramClient,
+    chat_target: Union[int, str],
+    *,
+    chat_id: int,
+    app_user: AppUser,
+    limit: int = 0,
+    from_start: bool = False,
+    batch_size: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    session_factory: Callable[[], AsyncSession] = AsyncSessionFactory,
+    fingerprints: Optional[ProfileFingerprintCache] = None,
+) -> HistoryPipelineStats:
+    """
+    Загружает историю сообщений чата в messages, message_entities и message_files.
+    Чтение следующих страниц идет одновременно с записью предыдущих пачек; в памяти
+    одновременно находится не более queue_size + 2 пачек.
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient.
+        chat_target: ID или username целевого чата.
+        chat_id: ID чата Telegram (запись TargetChat должна уже существовать).
+        app_user: Пользователь приложения, инициировавший сбор.
+        limit: Максимальное количество сообщений за запуск (0 = все новые).
+        from_start: Загрузить историю с первого сообщения, не используя водяной знак
+            (уже сохраненные сообщения пропускаются ON CONFLICT DO NOTHING).
+        batch_size: Сообщений в пачке записи (по умолчанию settings.HISTORY_WRITE_BATCH_SIZE).
+        queue_size: Пачек в очереди (по умолчанию settings.HISTORY_QUEUE_MAXSIZE).
+        session_factory: Фабрика сессий БД для писателя.
+        fingerprints: Кеш отпечатков профилей отправителей (по умолчанию общий fingerprint_cache,
+            если включен settings.PROFILE_FINGERPRINT_CACHE_ENABLED).
+
+    Returns:
+        Статистика загрузки (HistoryPipelineStats).
+    """
+    batch_size = batch_size or settings.HISTORY_WRITE_BATCH_SIZE
+    queue_size = queue_size or settings.HISTORY_QUEUE_MAXSIZE
+    if fingerprints is None and settings.PROFILE_FINGERPRINT_CACHE_ENABLED:
+        fingerprints = fingerprint_cache
+    stats = HistoryPipelineStats()
+    async with session_factory() as db:
+        checkpoint = await crud.get_checkpoint(db, chat_id=chat_id, mode=MODE_HISTORY)
+    if checkpoint is not None and checkpoint.position is not None:
+        stats.start_watermark = checkpoint.position
+    # При from_start водяной знак не используется для чтения, но и не уменьшается
+    stats.watermark = 0 if from_start else stats.start_watermark
+
+    print(f"Starting history pipeline for chat {chat_id} after message {stats.watermark} (batch={batch_size}, queue={queue_size})")
+    started = time.perf_counter()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    writer_task = asyncio.create_task(_write_batches(queue, stats, chat_id, app_user, session_factory, fingerprints, started))
+    preempted: Optional[JobPreempted] = None
+    try:
+        await _produce_batches(client, chat_target, queue, stats, stats.watermark, limit, batch_size)
+    except JobPreempted as e:
+        stats.error = str(e)
+        preempted = e # Пробрасывается после сохранения чекпоинта
+    except Exception as e:
+        stats.error = str(e)
+        print(f"Error: History collection for {chat_target} stopped: {e}")
+    finally:
+        await queue.put(_STOP)
+        await writer_task
+
+    stats.checkpoint_status = 'interrupted' if stats.error else 'completed'
+    position = max(stats.watermark, stats.start_watermark)
+    try:
+        async with session_factory() as db:
+            await crud.save_checkpoint(
+                db, chat_id=chat_id, mode=MODE_HISTORY, status=stats.checkpoint_status, position=position,
+                pages_done=stats.batches_written, rows_done=stats.messages_written, session_file=app_user.session_file,
+            )
+    except Exception as e:
+        print(f"Error: Failed to save history checkpoint for chat {chat_id}: {e}")
+
+    rate = stats.messages_per_second
+    print(
+        f"History pipeline for chat {chat_id} finished: fetched {stats.messages_fetched} messages in {stats.pages_fetched} pages, "
+        f"written {stats.messages_written} (duplicates {stats.messages_duplicate}), entities {stats.entities_written}, "
+        f"files {stats.files_written}, users {stats.users_written}, write errors {stats.write_errors}, "
+        f"watermark {stats.start_watermark} -> {position}, {f'{rate:,.0f} messages/s' if rate else 'n/a'}, "
+        f"checkpoint {stats.checkpoint_status}."
+    )
+    if preempted is not None:
+        raise preempted
+    return stats
+
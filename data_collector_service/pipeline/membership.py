@@ -0,0 +1,75 @@
+# telegram-intel/data_collector_service/pipeline/membership.py
+
+from typing import Optional, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from data_collector_service import crud
+from data_collector_service.telegram.participants import ParticipantPage
+from shared.models import MembershipSnapshot
+
+
+class MembershipRecorder:
+    """
+    Снимок состава чата для одного сбора участников (см. crud.crud_membership).
+
+    ID участников каждой страницы добавляются в снимок в транзакции записи страницы, включая
+    страницы без изменений (ID берутся из сохраненного хеша страницы). Входы и выходы считаются
+    при завершении полного сбора; прерванный сбор продолжает тот же снимок.
+
+    Args:
+        chat_id: ID чата Telegram.
+        session_factory: Фабрика сессий БД.
+    """
+
+    def __init__(self, chat_id: int, session_factory: Callable[[], AsyncSession]):
+        self.chat_id = chat_id
+        self.session_factory = session_factory
+        self.snapshot_id: Optional[int] = None
+
+    async def start(self, resume: bool) -> Optional[int]:
+        """
+        Начинает (или продолжает) снимок. Ошибка не прерывает сбор - снимок просто не ведется.
+
+        Returns:
+            ID снимка или None.
+        """
+        try:
+            async with self.session_factory() as db:
+                snapshot = await crud.start_membership_snapshot(db, chat_id=self.chat_id, resume=resume)
+            self.snapshot_id = snapshot.id
+        except Exception as e:
+            print(f"Error: Failed to start membership snapshot for chat {self.chat_id}: {e}")
+        return self.snapshot_id
+
+    async def stage(self, db: AsyncSession, page: ParticipantPage) -> None:
+        """Добавляет участников страницы в снимок (без коммита - в транзакции писателя)."""
+        if self.snapshot_id is not None:
+            await crud.stage_membership_members(
+                db, snapshot_id=self.snapshot_id, user_ids=page.member_ids(), commit=False
+            )
+
+    async def finish(self, *, complete: bool, resumable: bool) -> Optional[MembershipSnapshot]:
+        """
+        Завершает снимок.
+
+        Args:
+            complete: Сбор полный - сравнить снимок с предыдущим и записать входы/выходы.
+            resumable: Сбор прерван и будет продолжен с чекпоинта - оставить снимок открытым.
+
+        Returns:
+            Завершенный снимок (только если complete) или None.
+        """
+        if self.snapshot_id is None:
+            return None
+        try:
+            async with self.session_factory() as db:
+                if complete:
+                    return await crud.complete_membership_snapshot(db, snapshot_id=self.snapshot_id)
+                if resumable:
+                    await crud.set_membership_snapshot_status(db, snapshot_id=self.snapshot_id, status='interrupted')
+                else:
+                    await crud.discard_membership_snapshot(db, snapshot_id=self.snapshot_id)
+        except Exception as e:
+            print(f"Error: Failed to finish membership snapshot {self.snapshot_id} for chat {self.chat_id}: {e}")
+        return None
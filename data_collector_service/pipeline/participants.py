@@ -0,0 +1,382 @@
+# telegram-intel/data_collector_service/pipeline/participants.py
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional, Union, Callable, Sequence, Dict, List, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from telethon import TelegramClient
+
+from data_collector_service import crud
+from data_collector_service.crud import UpsertResult
+from data_collector_service.core.config import settings
+from data_collector_service.db.session import AsyncSessionFactory
+from data_collector_service.telegram.collector import iter_chat_participants
+from data_collector_service.telegram.participants import ParticipantPage, PageHash, CrawlProgress, WorkKey
+from data_collector_service.telegram.sharding import ShardingReport
+from shared.models import AppUser
+from .checkpoints import ParticipantCheckpointer
+from .fingerprints import ProfileFingerprintCache, fingerprint_cache
+from .membership import MembershipRecorder
+from .progress import current_progress, JobPreempted
+from .rows import ParticipantRows, ValidationSummary, batch_rows
+
+# Маркер завершения очереди для писателей
+_STOP = None
+
+
+@dataclass
+class ParticipantPipelineStats:
+    """Итоги потокового сбора участников."""
+    pages_fetched: int = 0
+    pages_written: int = 0
+    rows_fetched: int = 0
+    rows_written: int = 0
+    rows_invalid: int = 0
+    validation: ValidationSummary = field(default_factory=ValidationSummary) # Ошибки валидации строк по полям
+    write_errors: int = 0
+    pages_not_modified: int = 0 # Страницы без изменений с прошлого сбора (по хешу), запись пропущена
+    rows_not_modified: int = 0 # Участники неизменившихся страниц, не встречавшиеся раньше в переборе
+    users_changed: int = 0 # Пользователи, вставленные или измененные в users
+    users_unchanged: int = 0 # Пользователи без изменений (строка в БД не перезаписывалась)
+    users_cached: int = 0 # Пользователи, не отправленные в БД: отпечаток профиля совпал с кешем
+    participations_changed: int = 0 # То же для chat_participants
+    participations_unchanged: int = 0
+    participants_count: Optional[int] = None # Количество участников по данным get_chat_info
+    sharding: Optional[ShardingReport] = None # Статистика шардированного перебора (если использовался)
+    error: Optional[str] = None # Ошибка сборщика, прервавшая сбор (если была)
+    resumed: bool = False # Сбор продолжен с чекпоинта
+    checkpoint_status: Optional[str] = None # 'completed' / 'interrupted' (см. ParticipantCheckpointer)
+    snapshot_id: Optional[int] = None # Снимок состава чата (см. MembershipRecorder)
+    snapshot_status: Optional[str] = None # 'completed' / 'interrupted' / 'incomplete'
+    snapshot_baseline: bool = False # Первый снимок чата - входы/выходы не считались
+    members_joined: Optional[int] = None # Вошли с прошлого снимка
+    members_left: Optional[int] = None # Вышли с прошлого снимка
+
+    @property
+    def coverage(self) -> Optional[float]:
+        """Доля собранных участников от participants_count (None, если количество неизвестно)."""
+        if not self.participants_count:
+            return None
+        return min((self.rows_fetched + self.rows_not_modified) / self.participants_count, 1.0)
+
+
+async def _produce_pages(
+    client: TelegramClient,
+    chat_target: Union[int, str],
+    queue: asyncio.Queue,
+    stats: ParticipantPipelineStats,
+    limit: int,
+    extra_clients: Sequence[TelegramClient] = (),
+    progress: Optional[CrawlProgress] = None,
+    page_hashes: Optional[Dict[WorkKey, PageHash]] = None,
+) -> None:
+    """Читает страницы из Telegram и кладет их в очередь (ждет, если очередь заполнена)."""
+    pages = iter_chat_participants(
+        client, chat_target, limit=limit,
+        participants_count=stats.participants_count, sharding_report=stats.sharding,
+        extra_clients=extra_clients, progress=progress, page_hashes=page_hashes,
+    )
+    job_progress = current_progress.get()
+    async for page in pages:
+        stats.pages_fetched += 1
+        stats.rows_fetched += len(page.batch)
+        if job_progress is not None:
+            job_progress.participants_page_fetched(len(page.batch))
+        await queue.put(page) # Backpressure: сборщик ждет, пока писатели разгрузят очередь
+
+
+@dataclass
+class _WrittenPage:
+    """Страница, записанная в SAVEPOINT и ожидающая коммита пакета."""
+    page: ParticipantPage
+    user_rows: List[Tuple] # Строки users, отправленные в БД (после кеша отпечатков)
+    rows: int
+    users_result: Optional[UpsertResult] = None
+    participations_result: Optional[UpsertResult] = None
+
+
+async def _write_page(
+    uow: crud.CollectionUnitOfWork,
+    page: ParticipantPage,
+    rows: ParticipantRows,
+    user_rows: List[Tuple],
+    chat_id: int,
+    app_user: AppUser,
+    membership: Optional[MembershipRecorder] = None,
+) -> None:
+    """Записывает страницу (и ее участников в снимок состава) в SAVEPOINT транзакции писателя (без коммита)."""
+    written = _WrittenPage(page=page, user_rows=user_rows, rows=len(rows))
+    async with uow.page(written):
+        # Пользователи пишутся раньше участников (внешний ключ chat_participants.user_id)
+        if user_rows:
+            written.users_result = await crud.bulk_upsert_user_rows(
+                db=uow.db, rows=user_rows, collected_by=app_user, commit=False
+            )
+        if rows.participants:
+            written.participations_result = await crud.bulk_upsert_participant_rows(
+                db=uow.db, chat_id=chat_id, rows=rows.participants, commit=False
+            )
+        if membership is not None:
+            await membership.stage(uow.db, page)
+        # Хеш пишется в той же транзакции, что и данные: при ошибке записи страница будет загружена заново
+        if page.hash is not None and page.count is not None and not page.not_modified:
+            await crud.save_participant_page_hash(
+                db=uow.db, chat_id=chat_id, filter_query=page.query, offset=page.offset,
+                page_hash=page.hash, total_count=page.count, user_ids=page.user_ids, commit=False,
+            )
+
+
+async def _commit_pages(
+    writer_no: int,
+    uow: crud.CollectionUnitOfWork,
+    stats: ParticipantPipelineStats,
+    chat_id: int,
+    checkpointer: ParticipantCheckpointer,
+    fingerprints: Optional[ProfileFingerprintCache],
+) -> None:
+    """Коммитит пакет страниц писателя и учитывает записанные страницы в статистике, кеше и чекпоинте."""
+    try:
+        committed: List[_WrittenPage] = await uow.commit()
+    except crud.CollectionCommitError as e:
+        stats.write_errors += len(e.results)
+        print(f"Error: Writer {writer_no} failed to commit {len(e.results)} page(s) for chat {chat_id}: {e}")
+        return
+    rows_before, users_before = stats.rows_written, stats.users_changed
+    for written in committed:
+        if not written.page.not_modified: # Неизменившаяся страница пишется только в снимок состава
+            stats.pages_written += 1
+            stats.rows_written += written.rows
+        if written.users_result is not None:
+            stats.users_changed += written.users_result.count
+            stats.users_unchanged += written.users_result.skipped
+        if written.participations_result is not None:
+            stats.participations_changed += written.participations_result.count
+            stats.participations_unchanged += written.participations_result.skipped
+        if fingerprints is not None:
+            await fingerprints.store(written.user_rows) # Только после коммита страницы
+        # Только закоммиченная страница считается завершенной в чекпоинте
+        await checkpointer.page_written(written.page, written.rows)
+    job_progress = current_progress.get()
+    if job_progress is not None:
+        job_progress.participants_saved(rows=stats.rows_written - rows_before, users=stats.users_changed - users_before)
+
+
+async def _write_pages(
+    writer_no: int,
+    queue: asyncio.Queue,
+    stats: ParticipantPipelineStats,
+    chat_id: int,
+    app_user: AppUser,
+    session_factory: Callable[[], AsyncSession],
+    checkpointer: ParticipantCheckpointer,
+    fingerprints: Optional[ProfileFingerprintCache] = None,
+    pages_per_commit: int = 1,
+    membership: Optional[MembershipRecorder] = None,
+) -> None:
+    """
+    Писатель: забирает страницы из очереди и сохраняет пользователей и участников своей сессией БД.
+    Каждая страница пишется в SAVEPOINT, коммит - раз в pages_per_commit страниц или когда очередь опустела.
+    """
+    async with session_factory() as db:
+        uow = crud.CollectionUnitOfWork(db, pages_per_commit=pages_per_commit)
+        try:
+            while True:
+                page: Optional[ParticipantPage] = await queue.get()
+                try:
+                    if page is _STOP:
+                        return
+
+                    if page.not_modified:
+                        # Страница не изменилась с прошлого сбора - данные в БД актуальны, запись пропускаем
+                        stats.pages_not_modified += 1
+                        # Только участники, не встречавшиеся раньше в переборе (иначе покрытие завышается)
+                        stats.rows_not_modified += page.new_users if page.new_users is not None else len(page.user_ids)
+                        if membership is None:
+                            await checkpointer.page_written(page, 0)
+                            continue
+                        # Участники страницы (из сохраненного хеша) все равно входят в снимок состава
+                        rows, user_rows = ParticipantRows(), []
+                    else:
+                        # Строки в порядке колонок БД прямо из колонок пакета; отброшенные сборщиком - в сводку
+                        invalid_before = stats.validation.invalid_rows
+                        rows = batch_rows(page.batch, stats.validation)
+                        stats.rows_invalid += stats.validation.invalid_rows - invalid_before
+                        rows.sort_by_user_id()
+
+                        user_rows = rows.users
+                        if fingerprints is not None and user_rows:
+                            # Пользователи с неизменившимся профилем уже есть в users - в БД их не отправляем
+                            user_rows = await fingerprints.filter_changed(user_rows)
+                            stats.users_cached += len(rows.users) - len(user_rows)
+
+                    try:
+                        await _write_page(uow, page, rows, user_rows, chat_id, app_user, membership)
+                    except Exception as e:
+                        # Страница могла ждать блокировки строк, которые держит другой писатель (или упасть
+                        # на взаимной блокировке): коммитим свой пакет, освобождая блокировки, и пробуем еще раз
+                        print(f"Warning: Writer {writer_no} failed to save page at offset {page.offset} for chat {chat_id}, retrying: {e}")
+                        await _commit_pages(writer_no, uow, stats, chat_id, checkpointer, fingerprints)
+                        try:
+                            await _write_page(uow, page, rows, user_rows, chat_id, app_user, membership)
+                        except Exception as e:
+                            stats.write_errors += 1
+                            print(f"Error: Writer {writer_no} failed to save page at offset {page.offset} for chat {chat_id}: {e}")
+
+                    # Пока очередь пуста (сборщик ждет Telegram), транзакцию не держим открытой
+                    if uow.due or queue.empty():
+                        await _commit_pages(writer_no, uow, stats, chat_id, checkpointer, fingerprints)
+                finally:
+                    queue.task_done()
+        finally:
+            await _commit_pages(writer_no, uow, stats, chat_id, checkpointer, fingerprints)
+
+
+async def _finish_snapshot(membership: MembershipRecorder, stats: ParticipantPipelineStats) -> None:
+    """Завершает снимок состава: сравнивает его с предыдущим только по полному сбору."""
+    stats.snapshot_id = membership.snapshot_id
+    complete = (
+        stats.checkpoint_status == 'completed' and stats.error is None and not stats.write_errors
+        and (stats.coverage is None or stats.coverage >= settings.MEMBERSHIP_SNAPSHOT_MIN_COVERAGE)
+    )
+    snapshot = await membership.finish(complete=complete, resumable=stats.checkpoint_status == 'interrupted')
+    if snapshot is not None:
+        stats.snapshot_status = snapshot.status
+        stats.snapshot_baseline = snapshot.is_baseline
+        stats.members_joined, stats.members_left = snapshot.joined_count, snapshot.left_count
+    else:
+        stats.snapshot_status = 'interrupted' if stats.checkpoint_status == 'interrupted' else 'incomplete'
+
+
+async def run_participant_pipeline(
+    client: TelegramClient,
+    chat_target: Union[int, str],
+    *,
+    chat_id: int,
+    app_user: AppUser,
+    limit: int = 0,
+    participants_count: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    writers: Optional[int] = None,
+    session_factory: Callable[[], AsyncSession] = AsyncSessionFactory,
+    extra_clients: Sequence[TelegramClient] = (),
+    resume: bool = True,
+    use_page_hashes: Optional[bool] = None,
+    fingerprints: Optional[ProfileFingerprintCache] = None,
+    membership_snapshot: Optional[bool] = None,
+) -> ParticipantPipelineStats:
+    """
+    Потоковый сбор участников: страницы из Telegram сразу уходят в ограниченную
+    очередь, которую параллельно разбирают писатели bulk_upsert_users/bulk_upsert_participants.
+    Получение следующей страницы идет одновременно с записью предыдущих,
+    а в памяти одновременно находится не более queue_size + writers страниц.
+    Прогресс сохраняется в чекпоинт (collection_checkpoints): прерванный сбор
+    следующий запуск продолжает с незаписанных страниц.
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient.
+        chat_target: ID или username целевого чата.
+        chat_id: ID чата Telegram (запись TargetChat должна уже существовать).
+        app_user: Пользователь приложения, инициировавший сбор.
+        limit: Максимальное количество участников (0 = все).
+        participants_count: Количество участников из get_chat_info: включает шардированный
+            перебор для больших каналов и используется для расчета покрытия.
+        queue_size: Размер очереди страниц (по умолчанию settings.PIPELINE_QUEUE_MAXSIZE).
+        writers: Количество писателей (по умолчанию settings.PIPELINE_WRITERS).
+        session_factory: Фабрика сессий БД для писателей.
+        extra_clients: Клиенты дополнительных аккаунтов из session_pool, между которыми
+            распределяется получение страниц.
+        resume: Продолжить незавершенный сбор из чекпоинта (False - начать с начала).
+        use_page_hashes: Отправлять хеши страниц прошлого сбора и пропускать запись неизменившихся
+            страниц (по умолчанию settings.PARTICIPANTS_PAGE_HASHES_ENABLED).
+        fingerprints: Кеш отпечатков профилей (по умолчанию общий fingerprint_cache, если
+            включен settings.PROFILE_FINGERPRINT_CACHE_ENABLED).
+        membership_snapshot: Вести снимок состава чата и по полному сбору записать входы/выходы
+            участников (по умолчанию settings.MEMBERSHIP_SNAPSHOTS_ENABLED; при limit > 0 не ведется).
+
+    Returns:
+        Статистика сбора (ParticipantPipelineStats).
+    """
+    queue_size = queue_size or settings.PIPELINE_QUEUE_MAXSIZE
+    writers = writers or settings.PIPELINE_WRITERS
+    stats = ParticipantPipelineStats(participants_count=participants_count, sharding=ShardingReport())
+    job_progress = current_progress.get()
+    if job_progress is not None and participants_count:
+        job_progress.participants_count = participants_count # Для оценки оставшегося времени
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    checkpointer = ParticipantCheckpointer(chat_id, app_user.session_file, session_factory)
+    progress = await checkpointer.start(resume=resume)
+    stats.resumed = progress.resumed
+    if fingerprints is None and settings.PROFILE_FINGERPRINT_CACHE_ENABLED:
+        fingerprints = fingerprint_cache
+    membership = None
+    if (settings.MEMBERSHIP_SNAPSHOTS_ENABLED if membership_snapshot is None else membership_snapshot) and limit == 0:
+        membership = MembershipRecorder(chat_id, session_factory)
+        if await membership.start(resume=progress.resumed) is None:
+            membership = None
+    page_hashes = {}
+    if settings.PARTICIPANTS_PAGE_HASHES_ENABLED if use_page_hashes is None else use_page_hashes:
+        async with session_factory() as db:
+            page_hashes = await crud.get_participant_page_hashes(db, chat_id=chat_id)
+
+    print(f"Starting participant pipeline for chat {chat_id} (queue={queue_size}, writers={writers})")
+    writer_tasks = [
+        asyncio.create_task(_write_pages(
+            n, queue, stats, chat_id, app_user, session_factory, checkpointer, fingerprints,
+            settings.PIPELINE_PAGES_PER_COMMIT, membership,
+        ))
+        for n in range(writers)
+    ]
+    producer = asyncio.create_task(
+        _produce_pages(client, chat_target, queue, stats, limit, extra_clients, progress, page_hashes)
+    )
+    preempted: Optional[JobPreempted] = None
+    try:
+        # Писатель завершается только по _STOP: если он завершился раньше сборщика, значит упал,
+        # и сборщик (когда упадут все писатели) повис бы на заполненной очереди
+        await asyncio.wait([producer, *writer_tasks], return_when=asyncio.FIRST_COMPLETED)
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            failed = next(task for task in writer_tasks if task.done())
+            raise RuntimeError(f"participant writer stopped: {failed.exception()!r}")
+        producer.result()
+    except JobPreempted as e:
+        stats.error = str(e)
+        preempted = e # Пробрасывается после чекпоинта и снимка: сбор чата не должен завершиться
+    except Exception as e:
+        stats.error = str(e)
+        print(f"Error: Participant collection for {chat_target} stopped: {e}")
+    finally:
+        if not producer.done(): # Отмена самого сбора
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+        # Оставшиеся писатели дописывают очередь; упавшим _STOP не нужен (его некому забрать)
+        for task in writer_tasks:
+            if not task.done():
+                await queue.put(_STOP)
+        for result in await asyncio.gather(*writer_tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                stats.error = stats.error or f"participant writer stopped: {result!r}"
+                print(f"Error: Participant writer for chat {chat_id} failed: {result!r}")
+        stats.checkpoint_status = await checkpointer.finish(failed=stats.error is not None)
+        if membership is not None:
+            await _finish_snapshot(membership, stats)
+        if job_progress is not None and stats.checkpoint_status == "completed":
+            job_progress.stage_completed("participants")
+
+    print(
+        f"Participant pipeline for chat {chat_id} finished: fetched {stats.rows_fetched} rows in {stats.pages_fetched} pages, "
+        f"written {stats.rows_written}, invalid {stats.rows_invalid}, write errors {stats.write_errors}, "
+        f"not modified {stats.pages_not_modified} pages ({stats.rows_not_modified} rows), "
+        f"users changed {stats.users_changed} / unchanged {stats.users_unchanged} / cached {stats.users_cached}, "
+        f"participations changed {stats.participations_changed} / unchanged {stats.participations_unchanged}, "
+        f"coverage {f'{stats.coverage:.1%}' if stats.coverage is not None else 'n/a'}, checkpoint {stats.checkpoint_status}."
+    )
+    if stats.snapshot_status == 'completed' and not stats.snapshot_baseline:
+        print(f"Membership of chat {chat_id} since previous snapshot: {stats.members_joined} joined, {stats.members_left} left.")
+    if stats.rows_invalid:
+        print(f"Warning: Participant pipeline for chat {chat_id} skipped {stats.validation.report()}")
+    if preempted is not None:
+        raise preempted
+    return stats
@@ -0,0 +1,235 @@
+# telegram-intel/data_collector_service/pipeline/progress.py
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, Set, List, AsyncIterator
+
+from data_collector_service.telegram.rate_limiter import rate_limiter
+
+# --- Живой прогресс сборов (внутрипроцессный pub/sub) ---
+# Задача сбора заводит JobProgress и делает его текущим (current_progress - contextvar, его
+# наследуют все asyncio-задачи конвейеров). Конвейеры отмечают в нем страницы, записанные
+# строки и flood wait'ы (через слушатель rate_limiter), а JobProgress после каждого изменения
+# публикует снимок прогресса в progress_hub. Подписчики (WebSocket/SSE, см. API) получают снимки
+# из памяти процесса, без опроса БД. Каждое событие - полный снимок, поэтому медленному
+# подписчику можно пропустить промежуточные: его очередь хранит только последние события.
+# Через JobProgress же задача вытесняется планировщиком очереди: после request_preemption()
+# следующая отметка страницы (или этапа) поднимает JobPreempted - конвейер останавливается,
+# как при ошибке, с чекпоинтом 'interrupted', и задача продолжится с него при следующем запуске.
+# Завершенные этапы (completed_stages) сохраняются в collection_jobs.progress: завершенный чекпоинт
+# не возобновляется, поэтому при следующем запуске такие этапы пропускаются (см. jobs.runner).
+
+# Сколько событий хранится в очереди подписчика (старые вытесняются новыми)
+SUBSCRIBER_QUEUE_SIZE = 64
+
+
+@dataclass
+class ProgressEvent:
+    """Снимок прогресса задачи сбора."""
+    task_id: str
+    event: str # stage / page / write / flood_wait / preempting / finished
+    stage: Optional[str] = None # chat_info / participants / history / finished
+    chat_id: Optional[int] = None
+    pages_fetched: int = 0
+    rows_fetched: int = 0 # Участники, полученные из Telegram
+    users_upserted: int = 0 # Пользователи, вставленные или измененные в users
+    participants_written: int = 0
+    messages_fetched: int = 0
+    messages_written: int = 0
+    flood_waits: int = 0
+    flood_wait_seconds: float = 0.0
+    participants_count: Optional[int] = None
+    eta_seconds: Optional[float] = None # Оценка по скорости сбора участников и participants_count
+    elapsed_seconds: float = 0.0
+    status: Optional[str] = None # Итог задачи (только в событии finished; 'queued' - задача возвращена в очередь)
+    error: Optional[str] = None
+    ts: float = 0.0
+
+    @property
+    def final(self) -> bool:
+        return self.event == "finished"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ProgressHub:
+    """Раздает события прогресса подписчикам задачи; хранит последний снимок каждой активной задачи."""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._latest: Dict[str, ProgressEvent] = {}
+
+    def latest(self, task_id: str) -> Optional[ProgressEvent]:
+        """Последний снимок задачи, выполняемой этим процессом (None - задачи здесь нет)."""
+        return self._latest.get(task_id)
+
+    def subscribers(self, task_id: str) -> int:
+        return len(self._subscribers.get(task_id, ()))
+
+    def publish(self, event: ProgressEvent) -> None:
+        """Отдает событие всем подписчикам задачи (не блокируется на медленных подписчиках)."""
+        if event.final:
+            self._latest.pop(event.task_id, None)
+        else:
+            self._latest[event.task_id] = event
+        for queue in self._subscribers.get(event.task_id, ()):
+            if queue.full():
+                queue.get_nowait() # Вытесняем самый старый снимок
+            queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: str) -> AsyncIterator[asyncio.Queue]:
+        """
+        Подписка на события задачи. Очередь сразу получает последний снимок (если задача
+        выполняется этим процессом), затем - новые события.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        latest = self._latest.get(task_id)
+        if latest is not None:
+            queue.put_nowait(latest)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[task_id]
+
+
+# Глобальный хаб прогресса сервиса
+progress_hub = ProgressHub()
+
+
+class JobPreempted(Exception):
+    """Задача вытеснена планировщиком очереди: сбор остановлен на границе страницы."""
+
+
+class JobProgress:
+    """Счетчики прогресса одной задачи сбора; каждое изменение публикуется в хаб."""
+
+    def __init__(self, task_id: str, *, hub: ProgressHub = progress_hub, clock=time.monotonic):
+        self.task_id = task_id
+        self.hub = hub
+        self.clock = clock
+        self.started_at = clock()
+        self.stage: Optional[str] = None
+        self.chat_id: Optional[int] = None
+        self.pages_fetched = 0
+        self.rows_fetched = 0
+        self.users_upserted = 0
+        self.participants_written = 0
+        self.messages_fetched = 0
+        self.messages_written = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+        self.participants_count: Optional[int] = None
+        self.preempt_requested = False
+        self.preempted = False # Сбор остановлен из-за вытеснения (результат задачи неполный)
+        self.completed_stages: List[str] = [] # Этапы, завершенные полностью (в том числе прошлыми запусками)
+        self._participants_started_at: Optional[float] = None
+
+    def eta(self) -> Optional[float]:
+        """Секунд до конца сбора участников по текущей скорости (None - не оценить)."""
+        if self.stage != "participants" or not self.participants_count or not self.rows_fetched:
+            return None
+        elapsed = self.clock() - (self._participants_started_at or self.started_at)
+        if elapsed <= 0:
+            return None
+        remaining = max(self.participants_count - self.rows_fetched, 0)
+        return round(remaining / (self.rows_fetched / elapsed), 1)
+
+    def snapshot(self, event: str, *, status: Optional[str] = None, error: Optional[str] = None) -> ProgressEvent:
+        return ProgressEvent(
+            task_id=self.task_id, event=event, stage=self.stage, chat_id=self.chat_id,
+            pages_fetched=self.pages_fetched, rows_fetched=self.rows_fetched, users_upserted=self.users_upserted,
+            participants_written=self.participants_written, messages_fetched=self.messages_fetched,
+            messages_written=self.messages_written,
+            flood_waits=self.flood_waits, flood_wait_seconds=self.flood_wait_seconds,
+            participants_count=self.participants_count, eta_seconds=self.eta(),
+            elapsed_seconds=round(self.clock() - self.started_at, 1), status=status, error=error, ts=time.time(),
+        )
+
+    def _publish(self, event: str, **kwargs) -> None:
+        self.hub.publish(self.snapshot(event, **kwargs))
+
+    # --- Вытеснение ---
+
+    def request_preemption(self) -> None:
+        """Просит остановить сбор на ближайшей границе страницы (вызывает обработчик очереди)."""
+        if not self.preempt_requested:
+            self.preempt_requested = True
+            self._publish("preempting")
+
+    def check_preemption(self) -> None:
+        """Граница страницы: поднимает JobPreempted, если задачу просят вытеснить."""
+        if self.preempt_requested:
+            self.preempted = True
+            raise JobPreempted(f"Задача {self.task_id} вытеснена планировщиком очереди")
+
+    # --- Отметки конвейеров ---
+
+    def set_stage(self, stage: str, *, chat_id: Optional[int] = None, participants_count: Optional[int] = None) -> None:
+        self.check_preemption()
+        self.stage = stage
+        self.chat_id = chat_id if chat_id is not None else self.chat_id
+        if participants_count is not None:
+            self.participants_count = participants_count
+        if stage == "participants":
+            self._participants_started_at = self.clock()
+        self._publish("stage")
+
+    def stage_completed(self, stage: str) -> None:
+        """Этап завершен полностью (чекпоинт 'completed'): при возобновлении задачи он не повторяется."""
+        if stage not in self.completed_stages:
+            self.completed_stages.append(stage)
+
+    def participants_page_fetched(self, rows: int) -> None:
+        self.pages_fetched += 1
+        self.rows_fetched += rows
+        self._publish("page")
+        self.check_preemption()
+
+    def history_page_fetched(self, messages: int) -> None:
+        self.pages_fetched += 1
+        self.messages_fetched += messages
+        self._publish("page")
+        self.check_preemption()
+
+    def participants_saved(self, *, rows: int, users: int) -> None:
+        self.participants_written += rows
+        self.users_upserted += users
+        self._publish("write")
+
+    def messages_saved(self, messages: int) -> None:
+        self.messages_written += messages
+        self._publish("write")
+
+    def flood_wait(self, seconds: float) -> None:
+        self.flood_waits += 1
+        self.flood_wait_seconds += seconds
+        self._publish("flood_wait")
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        self.stage = "finished"
+        self._publish("finished", status=status, error=error)
+
+
+# Прогресс задачи, которую выполняет текущая asyncio-задача (None - сбор без отслеживания)
+current_progress: ContextVar[Optional[JobProgress]] = ContextVar("current_progress", default=None)
+
+
+def _on_flood_wait(session: str, method: str, seconds: float) -> None:
+    # Слушатель вызывается синхронно в задаче, получившей FloodWaitError, - с ее контекстом
+    progress = current_progress.get()
+    if progress is not None:
+        progress.flood_wait(seconds)
+
+
+rate_limiter.add_flood_listener(_on_flood_wait)
@@ -0,0 +1,79 @@
+# telegram-intel/data_collector_service/pipeline/rows.py
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Any, Tuple
+
+from pydantic import ValidationError
+
+from data_collector_service.crud import USER_COLUMNS, PARTICIPANT_COLUMNS
+from data_collector_service.telegram.participants import ParticipantBatch
+
+# --- Пакетное преобразование строк участников для записи в БД ---
+# Раньше писатель создавал CollectedUserSchema для каждой строки (model_validate), печатал весь
+# словарь при каждой ошибке, а CRUD затем разбирал объекты обратно в значения для users и
+# chat_participants. Страницы сборщика приходят как ParticipantBatch (колонки уже нужных типов),
+# и batch_rows строит кортежи в порядке колонок БД прямо из колонок пакета. Пользователи,
+# отброшенные при сборке пакета, не печатаются по одной строке, а накапливаются в ValidationSummary.
+
+
+@dataclass
+class ValidationSummary:
+    """Сводка ошибок валидации строк (вместо печати каждой строки)."""
+    invalid_rows: int = 0
+    errors: Counter = field(default_factory=Counter) # (поле, тип ошибки) -> количество
+    samples: List[str] = field(default_factory=list) # Несколько примеров для отладки
+    max_samples: int = 5
+
+    def add(self, row_id: Any, error: Exception) -> None:
+        """Учитывает неверную строку (ошибку Pydantic - по полям, прочие ошибки - по типу)."""
+        self.invalid_rows += 1
+        if isinstance(error, ValidationError):
+            details = error.errors()
+            for detail in details:
+                self.errors[(".".join(str(part) for part in detail["loc"]), detail["type"])] += 1
+            message = details[0]["msg"]
+        else:
+            self.errors[("row", type(error).__name__)] += 1
+            message = str(error)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(f"id={row_id!r}: {message}")
+
+    def report(self) -> str:
+        """Короткий отчет: количество неверных строк, ошибки по полям и примеры."""
+        if not self.invalid_rows:
+            return "no invalid rows"
+        by_field = ", ".join(f"{loc} {kind} x{count}" for (loc, kind), count in self.errors.most_common())
+        return f"{self.invalid_rows} invalid rows ({by_field}); e.g. {'; '.join(self.samples)}"
+
+
+@dataclass
+class ParticipantRows:
+    """Строки страницы, готовые к записи: users (USER_COLUMNS) и chat_participants (PARTICIPANT_COLUMNS)."""
+    users: List[Tuple] = field(default_factory=list)
+    participants: List[Tuple] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def sort_by_user_id(self) -> None:
+        """Единый порядок строк снижает риск взаимных блокировок между писателями."""
+        self.users.sort(key=lambda row: row[0])
+        self.participants.sort(key=lambda row: row[0])
+
+
+def batch_rows(batch: ParticipantBatch, summary: ValidationSummary) -> ParticipantRows:
+    """
+    Строки для записи в БД из пакета сборщика.
+
+    Args:
+        batch: Участники страницы (ParticipantBatch).
+        summary: Сводка, в которую добавляются пользователи, отброшенные при сборке пакета.
+
+    Returns:
+        ParticipantRows со строками users и chat_participants.
+    """
+    for row_id, error in batch.rejected:
+        summary.add(row_id, error)
+    return ParticipantRows(users=batch.rows(USER_COLUMNS), participants=batch.rows(PARTICIPANT_COLUMNS))
+
@@ -1,9 +1,15 @@
 # telegram-intel/data_collector_service/schemas/__init__.py
 
 from .target import TargetChatBase, TargetChatPublic, TargetChatCreate, TargetChatUpdate
-from .collection import CollectChatRequest, CollectChatResponse, CollectedUserSchema
+from .collection import (
+    CollectChatRequest, CollectChatResponse, CollectedUserSchema, CollectJobCheckpoint, CollectJobStatus,
+    CollectBatchRequest, CollectBatchItem, CollectBatchSummary, CollectTenantQueueStats, CollectQueueStats,
+)
+from .membership import MembershipSnapshotPublic, MembershipDiffResponse
 
 # __all__ = [
 #     "TargetChatBase", "TargetChatPublic", "TargetChatCreate", "TargetChatUpdate",
-#     "CollectChatRequest", "CollectChatResponse", "CollectedUserSchema",
+#     "CollectChatRequest", "CollectChatResponse", "CollectedUserSchema", "CollectJobCheckpoint", "CollectJobStatus",
+#     "CollectBatchRequest", "CollectBatchItem", "CollectBatchSummary", "CollectTenantQueueStats", "CollectQueueStats",
+#     "MembershipSnapshotPublic", "MembershipDiffResponse",
 # ]
\ No newline at end of file
@@ -1,5 +1,6 @@
 from datetime import datetime
-from typing import Union, Optional
+import uuid
+from typing import Union, Optional, Dict, Any, List
 from pydantic import BaseModel, Field, field_validator, model_validator
 
 # --- Схема для запроса на сбор данных ---
@@ -8,6 +9,8 @@ class CollectChatRequest(BaseModel):
     chat_target: Union[int, str] = Field(..., description="ID, username (@username) или ссылка (t.me/...) целевого чата/канала")
     # Опциональные параметры (например, лимит участников)
     # participant_limit: Optional[int] = Field(0, description="Лимит участников для сбора (0 = без лимита)")
+    # Режим экспорта: сбор через takeout-сессию Telegram (None - по настройке TAKEOUT_EXPORT_ENABLED)
+    takeout: Optional[bool] = Field(None, description="Собирать участников и историю через takeout-сессию (режим экспорта)")
 
     # Валидатор для chat_target (опционально, но полезно)
     @field_validator('chat_target')
@@ -18,13 +21,102 @@ class CollectChatRequest(BaseModel):
         return v
 
 # --- Схема для ответа после запуска сбора ---
-# Пока просто сообщаем об успехе/ошибке
-# В будущем может содержать ID задачи Celery
+# При очереди задач (JOB_QUEUE_ENABLED) - ID поставленной задачи, иначе - результат сбора
 class CollectChatResponse(BaseModel):
     message: str = Field(..., description="Сообщение о результате запуска сбора")
     chat_id: Optional[int] = Field(None, description="ID чата, для которого запущен сбор (если удалось определить)")
     status: Optional[str] = Field(None, description="Текущий статус целевого чата в БД (если он там есть)")
-    task_id: Optional[str] = Field(None, description="ID задачи Celery (если используется)") # Для асинхронного варианта
+    task_id: Optional[str] = Field(None, description="ID задачи сбора (статус: GET /collect/{task_id})")
+    attached: bool = Field(False, description="Запрос присоединен к уже выполняемому сбору того же чата")
+
+# --- Схемы статуса задачи сбора ---
+class CollectJobCheckpoint(BaseModel):
+    mode: str = Field(..., description="Вид сбора: participants, history, ...")
+    status: str = Field(..., description="running / interrupted / completed")
+    pages_done: int = Field(..., description="Обработано страниц")
+    rows_done: int = Field(..., description="Обработано строк")
+    updated_at: Optional[datetime] = Field(None, description="Последнее сохранение чекпоинта")
+
+    class Config:
+        from_attributes = True # Для создания из ORM-объекта
+
+class CollectJobStatus(BaseModel):
+    task_id: uuid.UUID = Field(..., description="ID задачи сбора")
+    status: str = Field(..., description="queued / running / completed / failed")
+    chat_target: str = Field(..., description="Цель сбора из запроса")
+    chat_id: Optional[int] = Field(None, description="ID чата (известен после получения информации о чате)")
+    attempts: int = Field(..., description="Сколько раз задача начиналась")
+    attached_requests: int = Field(0, description="Сколько повторных запросов присоединено к задаче")
+    priority: str = Field("bulk", description="Класс приоритета: interactive / bulk")
+    preemptions: int = Field(0, description="Сколько раз задача была вытеснена планировщиком очереди")
+    progress: Optional[Dict[str, Any]] = Field(None, description="Текущий этап сбора")
+    checkpoints: List[CollectJobCheckpoint] = Field(default_factory=list, description="Прогресс по видам сбора чата")
+    result: Optional[CollectChatResponse] = Field(None, description="Результат завершенного сбора")
+    error: Optional[str] = Field(None, description="Ошибка, если задача завершилась неудачно")
+    created_at: datetime = Field(..., description="Постановка в очередь")
+    started_at: Optional[datetime] = Field(None, description="Начало (последней попытки) выполнения")
+    finished_at: Optional[datetime] = Field(None, description="Завершение")
+
+# --- Схемы пакетного сбора (/collect/batch) ---
+class CollectBatchRequest(BaseModel):
+    targets: List[Union[int, str]] = Field(..., min_length=1, description="ID, username или ссылки целевых чатов (повторы объединяются)")
+    # Параметры сбора, общие для всех целей пакета
+    takeout: Optional[bool] = Field(None, description="Собирать участников и историю через takeout-сессию (режим экспорта)")
+    participants: bool = Field(True, description="Собирать участников")
+    history: Optional[bool] = Field(None, description="Загружать историю сообщений (None - по настройке HISTORY_COLLECTION_ENABLED)")
+
+    @field_validator('targets')
+    def targets_must_be_valid(cls, v):
+        if any(isinstance(target, str) and not target.strip() for target in v):
+            raise ValueError("targets не может содержать пустые строки")
+        return v
+
+# Строка потока ответа /collect/batch (NDJSON): сначала по строке на каждую цель запроса
+# (поставлена в очередь / присоединена / повтор / ошибка), затем - по мере завершения задач
+class CollectBatchItem(BaseModel):
+    index: int = Field(..., description="Позиция цели в запросе")
+    target: Union[int, str] = Field(..., description="Цель, как в запросе")
+    target_key: str = Field(..., description="Канонический ключ цели")
+    status: str = Field(..., description="queued / running / duplicate / completed / failed")
+    task_id: Optional[str] = Field(None, description="ID задачи сбора")
+    chat_id: Optional[int] = Field(None, description="ID чата (если известен)")
+    title: Optional[str] = Field(None, description="Название чата (если получено пакетным запросом)")
+    attached: bool = Field(False, description="Цель присоединена к уже выполняемому сбору")
+    duplicate_of: Optional[int] = Field(None, description="Позиция первой цели с тем же ключом")
+    error: Optional[str] = Field(None, description="Ошибка")
+    result: Optional[CollectChatResponse] = Field(None, description="Результат завершенного сбора")
+
+class CollectBatchSummary(BaseModel):
+    targets: int = Field(..., description="Целей в запросе")
+    unique: int = Field(..., description="Целей после объединения повторов")
+    duplicates: int = Field(..., description="Повторов")
+    attached: int = Field(..., description="Присоединено к уже выполняемым сборам")
+    resolved_in_bulk: int = Field(..., description="Каналов, полученных пакетными channels.getChannels")
+    completed: int = Field(..., description="Завершено успешно")
+    failed: int = Field(..., description="Завершено с ошибкой")
+    pending: int = Field(0, description="Не завершено к концу потока (статус - по task_id в /collect/{task_id})")
+
+# --- Схемы метрик очереди задач (/collect/queue) ---
+class CollectTenantQueueStats(BaseModel):
+    app_user_id: uuid.UUID = Field(..., description="Пользователь (арендатор очереди)")
+    weight: int = Field(..., description="Вес в справедливом распределении слотов")
+    max_running: int = Field(..., description="Лимит выполняемых задач (0 - без ограничения)")
+    max_queued: int = Field(..., description="Лимит задач в очереди (0 - без ограничения)")
+    queued: int = Field(..., description="Задач в очереди")
+    queued_interactive: int = Field(..., description="Из них интерактивных")
+    running: int = Field(..., description="Выполняемых задач")
+    oldest_wait_seconds: Optional[float] = Field(None, description="Сколько ждет самая старая задача в очереди")
+    started: int = Field(..., description="Запусков задач за окно метрик")
+    avg_wait_seconds: Optional[float] = Field(None, description="Среднее ожидание в очереди до запуска (за окно)")
+    p95_wait_seconds: Optional[float] = Field(None, description="95-й перцентиль ожидания до запуска (за окно)")
+    preemptions: int = Field(..., description="Вытеснений задач (активных и завершенных за окно)")
+
+class CollectQueueStats(BaseModel):
+    window_seconds: float = Field(..., description="Окно метрик ожидания")
+    global_limit: int = Field(..., description="Лимит выполняемых задач всего (0 - без ограничения)")
+    queued: int = Field(..., description="Задач в очереди (всех пользователей)")
+    running: int = Field(..., description="Выполняемых задач (всех пользователей)")
+    tenant: Optional[CollectTenantQueueStats] = Field(None, description="Метрики текущего пользователя (нет активных и недавних задач - null)")
 
 # --- Схема для данных пользователя (внутренняя, для валидации перед CRUD) ---
 # Основана на данных, получаемых из get_chat_participants
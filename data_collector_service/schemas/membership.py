@@ -0,0 +1,32 @@
+# telegram-intel/data_collector_service/schemas/membership.py
+
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+# --- Схема снимка состава чата ---
+class MembershipSnapshotPublic(BaseModel):
+    id: int = Field(..., description="ID снимка")
+    chat_id: int = Field(..., description="ID чата Telegram")
+    previous_snapshot_id: Optional[int] = Field(None, description="Снимок, с которым сравнивался этот")
+    is_baseline: bool = Field(..., description="Первый снимок чата (входы/выходы не считались)")
+    member_count: Optional[int] = Field(None, description="Участников в снимке")
+    joined_count: Optional[int] = Field(None, description="Вошли с предыдущего снимка")
+    left_count: Optional[int] = Field(None, description="Вышли с предыдущего снимка")
+    started_at: datetime = Field(..., description="Начало сбора")
+    completed_at: Optional[datetime] = Field(None, description="Завершение снимка")
+
+    class Config:
+        from_attributes = True # Для создания из ORM-объекта
+
+# --- Схема ответа с изменением состава между двумя снимками ---
+class MembershipDiffResponse(BaseModel):
+    chat_id: int = Field(..., description="ID чата Telegram")
+    from_snapshot_id: int = Field(..., description="Более ранний снимок")
+    to_snapshot_id: int = Field(..., description="Более поздний снимок")
+    joined_count: int = Field(..., description="Сколько участников вошло")
+    left_count: int = Field(..., description="Сколько участников вышло")
+    joined: List[int] = Field(default_factory=list, description="ID вошедших (не более limit)")
+    left: List[int] = Field(default_factory=list, description="ID вышедших (не более limit)")
+    truncated: bool = Field(False, description="Списки обрезаны до limit")
@@ -0,0 +1,277 @@
+# telegram-intel/data_collector_service/telegram/backfill.py
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Sequence, AsyncIterator, Iterable
+
+from telethon.tl.functions.messages import GetHistoryRequest
+from telethon.errors import FloodWaitError, ChannelPrivateError, ChatAdminRequiredError, UserNotParticipantError, RPCError
+
+from data_collector_service.core.config import settings
+from .messages import MessageBatch
+from .rate_limiter import rate_limiter
+from .sharding import CrawlLane
+
+# --- Параллельная загрузка истории по диапазонам ID ---
+# Последовательный перебор истории большого канала упирается в лимит запросов одной сессии.
+# Здесь пространство ID сообщений (low, high] делится на диапазоны, и каждый клиент (аккаунт
+# из session_pool) читает свой диапазон от новых сообщений к старым: offset_id = high + 1,
+# min_id = low. Освободившийся клиент забирает нижнюю половину самого большого из
+# читаемых диапазонов (work stealing): быстрые клиенты и разреженные диапазоны (удаленные
+# сообщения) не простаивают, пока медленный клиент дочитывает свой. Для чекпоинта у каждого
+# диапазона отдельно хранится граница записанного в БД (committed).
+
+
+@dataclass
+class HistoryRange:
+    """
+    Диапазон ID сообщений (low, high], который еще нужно прочитать.
+
+    Attributes:
+        low: Нижняя граница (не включается); растет, когда нижнюю часть забирает другой клиент.
+        high: Верхняя граница непрочитанной части; уменьшается после каждой страницы.
+        committed: Верхняя граница части, еще не записанной в БД (для чекпоинта; двигает писатель).
+        lane: Имя клиента, читающего диапазон (None - диапазон свободен).
+    """
+    low: int
+    high: int
+    committed: int
+    lane: Optional[str] = None
+    pages: int = 0
+
+    @property
+    def remaining(self) -> int:
+        """Сколько ID еще не прочитано."""
+        return max(self.high - self.low, 0)
+
+    @property
+    def done(self) -> bool:
+        return self.high <= self.low
+
+
+def split_history_ranges(low: int, high: int, parts: int) -> List[HistoryRange]:
+    """Делит (low, high] на parts примерно равных диапазонов (от новых к старым)."""
+    parts = max(1, min(parts, high - low))
+    step = (high - low) / parts
+    bounds = [high - round(step * i) for i in range(parts)] + [low]
+    return [HistoryRange(low=bounds[i + 1], high=bounds[i], committed=bounds[i]) for i in range(parts) if bounds[i] > bounds[i + 1]]
+
+
+def ranges_state(ranges: Iterable[HistoryRange]) -> List[List[int]]:
+    """Незаписанные части диапазонов для чекпоинта: [[low, committed], ...]."""
+    return [[r.low, r.committed] for r in ranges if r.committed > r.low]
+
+
+def ranges_from_state(state: Sequence[Sequence[int]]) -> List[HistoryRange]:
+    """Восстанавливает диапазоны из чекпоинта (см. ranges_state)."""
+    return [HistoryRange(low=low, high=committed, committed=committed) for low, committed in state if committed > low]
+
+
+@dataclass
+class BackfillPage:
+    """
+    Страница истории одного диапазона.
+
+    Attributes:
+        range: Диапазон, из которого получена страница.
+        batch: Строки сообщений страницы (может быть пустым у последней страницы диапазона).
+        done_to: После записи страницы непрочитанной остается часть (range.low, done_to].
+    """
+    range: HistoryRange
+    batch: MessageBatch
+    done_to: int
+
+
+@dataclass
+class BackfillReport:
+    """Статистика параллельной загрузки истории."""
+    ranges_initial: int = 0
+    ranges_stolen: int = 0 # Сколько раз свободный клиент забрал часть чужого диапазона
+    ranges_done: int = 0
+    pages_fetched: int = 0
+    messages_fetched: int = 0
+    pages_per_lane: Dict[str, int] = field(default_factory=dict)
+
+
+class _HistoryBackfill:
+    """Состояние одной параллельной загрузки (диапазоны, клиенты, очередь готовых страниц)."""
+
+    def __init__(self, lanes: Sequence[CrawlLane], ranges: List[HistoryRange], report: BackfillReport,
+                 page_size: int, min_split: int):
+        self.lanes = list(lanes)
+        self.ranges = ranges # Общий с вызывающим кодом список: украденные части добавляются в него
+        self.report = report
+        self.page_size = page_size
+        self.min_split = min_split
+        # С несколькими клиентами flood wait не пережидается на месте: диапазон уходит другому клиенту
+        self.handoff = len(self.lanes) > 1
+        self.out: asyncio.Queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_MAXSIZE)
+        self.failure: Optional[BaseException] = None
+        self.changed = asyncio.Event() # Диапазон освободился - ожидающие клиенты пробуют снова
+
+    def take(self, lane: CrawlLane) -> Optional[HistoryRange]:
+        """
+        Выдает клиенту диапазон: самый большой свободный, иначе нижнюю половину самого
+        большого из читаемых (если он больше 2 * min_split).
+        """
+        free = [r for r in self.ranges if r.lane is None and not r.done]
+        if free:
+            chosen = max(free, key=lambda r: r.remaining)
+            chosen.lane = lane.name
+            return chosen
+        busy = [r for r in self.ranges if r.lane is not None and r.remaining >= 2 * self.min_split]
+        if not busy:
+            return None
+        victim = max(busy, key=lambda r: r.remaining)
+        # Владелец читает сверху вниз и продолжит с верхней половины; нижняя переходит к клиенту
+        middle = victim.low + victim.remaining // 2
+        stolen = HistoryRange(low=victim.low, high=middle, committed=middle, lane=lane.name)
+        victim.low = middle
+        self.ranges.append(stolen)
+        self.report.ranges_stolen += 1
+        return stolen
+
+    def release(self, history_range: HistoryRange) -> None:
+        """Освобождает диапазон (дочитан или возвращается в пул после flood wait / ошибки клиента)."""
+        history_range.lane = None
+        self.changed.set()
+
+    async def wait_changed(self, timeout: float) -> None:
+        """Ждет, пока какой-нибудь диапазон освободится (не дольше timeout)."""
+        self.changed.clear()
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def fetch(self, lane: CrawlLane, history_range: HistoryRange):
+        """Одна страница диапазона от новых к старым (паузы и повтор после flood wait - в rate_limiter)."""
+        return await rate_limiter.call(lane.client, GetHistoryRequest(
+            peer=lane.entity, offset_id=history_range.high + 1, offset_date=None, add_offset=0,
+            limit=self.page_size, max_id=0, min_id=history_range.low, hash=0,
+        ), max_retries=0 if self.handoff else None)
+
+    async def read_range(self, lane: CrawlLane, history_range: HistoryRange) -> None:
+        """Читает диапазон до конца (или пока его верхнюю границу не догонит нижняя после кражи)."""
+        while not history_range.done and self.failure is None:
+            result = await self.fetch(lane, history_range)
+            lane.pages_fetched += 1
+            history_range.pages += 1
+            self.report.pages_fetched += 1
+            # Пока шел запрос, нижнюю часть диапазона мог забрать другой клиент: ее сообщения отбрасываются
+            messages = [m for m in result.messages if history_range.low < m.id <= history_range.high]
+            if messages and len(result.messages) >= self.page_size:
+                history_range.high = max(min(m.id for m in messages) - 1, history_range.low)
+            else:
+                history_range.high = history_range.low # Дошли до min_id: в диапазоне больше нет сообщений
+            batch = MessageBatch.from_page(messages, result.users)
+            self.report.messages_fetched += len(batch)
+            await self.out.put(BackfillPage(range=history_range, batch=batch, done_to=history_range.high))
+        if history_range.done:
+            self.report.ranges_done += 1
+
+    async def worker(self, lane: CrawlLane) -> None:
+        loop = asyncio.get_running_loop()
+        while not lane.disabled and self.failure is None:
+            if lane.paused_until > loop.time(): # Клиент на flood wait - диапазоны пока читают другие
+                if all(r.done for r in self.ranges):
+                    return # Ждать окончания паузы незачем: работы не осталось
+                await self.wait_changed(lane.paused_until - loop.time())
+                continue
+            history_range = self.take(lane)
+            if history_range is None:
+                if not any(r.lane for r in self.ranges):
+                    return # Работы не осталось
+                # Делить больше нечего, но другой клиент может вернуть диапазон после flood wait
+                await self.wait_changed(1.0)
+                continue
+            try:
+                await self.read_range(lane, history_range)
+                self.release(history_range)
+            except (UserNotParticipantError, ChannelPrivateError, ChatAdminRequiredError) as e:
+                self.release(history_range)
+                if lane.primary:
+                    self.failure = e # Доступа нет - останавливаем всю загрузку
+                else:
+                    print(f"Warning: Lane {lane.name} has no access to chat history, leaving backfill: {e}")
+                    lane.disabled = True
+            except FloodWaitError as e: # Ограничитель исчерпал повторы (или не повторял - handoff)
+                lane.paused_until = loop.time() + e.seconds
+                self.release(history_range)
+            except RPCError as e:
+                self.release(history_range)
+                if lane.primary and not self.handoff:
+                    self.failure = e
+                else:
+                    print(f"Warning: Lane {lane.name} failed on history range ({history_range.low}, {history_range.high}], leaving backfill: {e}")
+                    lane.disabled = True
+            except Exception as e: # Обрыв соединения и т.п.
+                self.release(history_range)
+                if lane.primary:
+                    self.failure = e
+                else:
+                    print(f"Warning: Lane {lane.name} failed, leaving backfill: {e}")
+                    lane.disabled = True
+        if all(l.disabled for l in self.lanes) and self.failure is None:
+            self.failure = RuntimeError("All sessions left the history backfill")
+
+
+async def iter_history_ranges(
+    lanes: Sequence[CrawlLane],
+    ranges: List[HistoryRange],
+    *,
+    report: Optional[BackfillReport] = None,
+    page_size: int = settings.HISTORY_PAGE_SIZE,
+    min_split: int = settings.HISTORY_BACKFILL_MIN_SPLIT,
+) -> AsyncIterator[BackfillPage]:
+    """
+    Читает диапазоны истории параллельно всеми клиентами (один запрос одновременно на клиента)
+    с перераспределением работы между ними.
+
+    Args:
+        lanes: Клиенты с сущностью чата, разрешенной каждым из них (первый - основной).
+        ranges: Непрочитанные диапазоны (split_history_ranges или ranges_from_state); список
+            изменяется по ходу чтения - части, забранные другим клиентом, добавляются в него.
+        report: Объект BackfillReport, который будет заполняться по ходу загрузки.
+        page_size: Сообщений на запрос (Telegram отдает не более 100).
+        min_split: Диапазон делится для кражи, только если в нем не меньше 2 * min_split ID.
+
+    Yields:
+        BackfillPage в порядке получения (страницы разных диапазонов перемешаны).
+
+    Raises:
+        Ошибку доступа основного клиента, если загрузку пришлось остановить.
+    """
+    report = report if report is not None else BackfillReport()
+    report.ranges_initial = len(ranges)
+    backfill = _HistoryBackfill(lanes, ranges, report, page_size, min_split)
+    print(f"Starting history backfill of {len(ranges)} range(s) with {len(lanes)} client(s)")
+
+    done = object() # Маркер окончания загрузки в очереди страниц
+    workers = [asyncio.create_task(backfill.worker(lane)) for lane in backfill.lanes]
+
+    async def supervise():
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            await backfill.out.put(done)
+
+    supervisor = asyncio.create_task(supervise())
+    try:
+        while True:
+            page = await backfill.out.get()
+            if page is done:
+                break
+            yield page
+    finally:
+        for task in (*workers, supervisor):
+            task.cancel()
+        await asyncio.gather(*workers, supervisor, return_exceptions=True)
+        report.pages_per_lane = {lane.name: lane.pages_fetched for lane in backfill.lanes}
+
+    print(f"History backfill finished: {report.messages_fetched} messages in {report.pages_fetched} pages, "
+          f"{report.ranges_done} range(s) done, {report.ranges_stolen} stolen; "
+          f"pages per client: {', '.join(f'{name}={pages}' for name, pages in report.pages_per_lane.items())}")
+    if backfill.failure is not None:
+        raise backfill.failure
+
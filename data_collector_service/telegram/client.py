@@ -1,8 +1,10 @@
 # telegram-intel/data_collector_service/telegram/client.py
 
 import os
+import sqlite3
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Optional, AsyncIterator, Iterable
 
 from telethon import TelegramClient
 # ----- ИСПРАВЛЕННЫЙ ИМПОРТ -----
@@ -14,25 +16,42 @@ from telethon.errors import SessionPasswordNeededError, FloodWaitError, RPCError
 from data_collector_service.core.config import settings
 # Импортируем модель AppUser для получения пути к файлу сессии
 from shared.models import AppUser # Модель SQLAlchemy
+from .client_pool import client_pool
 
 # --- Управление клиентом Telethon ---
 
-async def get_telegram_client(user: AppUser) -> Optional[TelegramClient]:
+async def get_telegram_client(user: AppUser, *, receive_updates: bool = True) -> Optional[TelegramClient]:
     """
     Инициализирует и возвращает аутентифицированный клиент Telethon
     для указанного пользователя приложения.
+
+    Args:
+        user: Пользователь приложения.
+        receive_updates: Получать ли обновления (клиентам только для сбора они не нужны).
     """
     if not user.session_file:
         print(f"Error: No session file path configured for user {user.email} (ID: {user.id})")
         return None
 
     session_path = settings.SESSION_FILES_DIR / user.session_file
-    session_name = session_path.stem # Имя файла без расширения
+    return await connect_session_file(session_path, owner=f"user {user.email}", receive_updates=receive_updates)
+
+async def connect_session_file(session_path: Path, *, owner: str, receive_updates: bool = True) -> Optional[TelegramClient]:
+    """
+    Создает, подключает и проверяет авторизацию клиента Telethon для файла сессии.
 
-    print(f"Attempting to initialize TelegramClient for user {user.email} using session: {session_path}")
+    Args:
+        session_path: Путь к файлу .session.
+        owner: Описание владельца сессии для логов (пользователь или аккаунт пула сессий).
+        receive_updates: Получать ли обновления.
+
+    Returns:
+        Подключенный и авторизованный клиент или None.
+    """
+    print(f"Attempting to initialize TelegramClient for {owner} using session: {session_path}")
 
     if not session_path.exists():
-        print(f"Error: Session file not found at {session_path} for user {user.email}")
+        print(f"Error: Session file not found at {session_path} for {owner}")
         return None
 
     # Создаем клиент Telethon, передавая путь к файлу сессии как строку.
@@ -43,34 +62,37 @@ async def get_telegram_client(user: AppUser) -> Optional[TelegramClient]:
         api_hash=settings.API_HASH,
         connection_retries=5,
         retry_delay=5,
+        # Все FloodWaitError отдаются наверх, чтобы их учитывал адаптивный rate_limiter
+        flood_sleep_threshold=0,
+        receive_updates=receive_updates,
     )
 
     try:
-        print(f"Connecting Telegram client for user {user.email}...")
+        print(f"Connecting Telegram client for {owner}...")
         await client.connect()
 
         if not await client.is_user_authorized():
-            print(f"Error: User {user.email} session ({session_path}) is not authorized or expired.")
+            print(f"Error: Session of {owner} ({session_path}) is not authorized or expired.")
             await client.disconnect()
             return None
 
-        print(f"Telegram client for user {user.email} connected and authorized.")
+        print(f"Telegram client for {owner} connected and authorized.")
         return client
 
     except SessionPasswordNeededError:
-        print(f"Error: Session for user {user.email} requires 2FA password.")
+        print(f"Error: Session of {owner} requires 2FA password.")
         await client.disconnect()
         return None
     except FloodWaitError as e:
-        print(f"Error: Flood wait encountered for user {user.email}. Wait {e.seconds} seconds.")
+        print(f"Error: Flood wait encountered for {owner}. Wait {e.seconds} seconds.")
         await client.disconnect()
         return None
     except RPCError as e:
-        print(f"Error: Telegram RPC error for user {user.email}: {e}")
+        print(f"Error: Telegram RPC error for {owner}: {e}")
         await client.disconnect()
         return None
     except Exception as e:
-        print(f"Error: Unexpected error initializing Telegram client for user {user.email}: {e}")
+        print(f"Error: Unexpected error initializing Telegram client for {owner}: {e}")
         if client and client.is_connected():
             await client.disconnect()
         return None
@@ -80,4 +102,70 @@ async def disconnect_client(client: Optional[TelegramClient]):
     if client and client.is_connected():
         print("Disconnecting Telegram client...")
         await client.disconnect()
-        print("Telegram client disconnected.")
\ No newline at end of file
+        print("Telegram client disconnected.")
+
+def session_dc_id(session_file: str) -> Optional[int]:
+    """
+    Домашний DC аккаунта из SQLite-файла сессии Telethon (без подключения к Telegram).
+    Файл открывается только на чтение - его может использовать подключенный клиент.
+
+    Returns:
+        Номер DC или None, если файла нет или он не читается.
+    """
+    session_path = settings.SESSION_FILES_DIR / session_file
+    if not session_path.exists():
+        return None
+    try:
+        conn = sqlite3.connect(f"{session_path.as_uri()}?mode=ro", uri=True)
+        try:
+            row = conn.execute("select dc_id from sessions").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Warning: Could not read DC of session {session_file}: {e}")
+        return None
+    return row[0] if row else None
+
+def client_pool_key(session_file: str) -> str:
+    """
+    Ключ клиента в пуле. Клиенты ключуются файлом сессии (а не AppUser.id), чтобы сбор от имени
+    пользователя и пул сессий (session_pool) не открывали один SQLite-файл сессии двумя клиентами.
+    """
+    return f"session:{session_file}"
+
+def _pooled_connect(user: AppUser):
+    """Функция подключения клиента для пула: клиенты пула только собирают данные, без обновлений."""
+    return lambda: get_telegram_client(user, receive_updates=False)
+
+@asynccontextmanager
+async def telegram_client_session(user: AppUser) -> AsyncIterator[Optional[TelegramClient]]:
+    """
+    Контекстный менеджер: отдает клиент пользователя (или None, если подключиться не удалось).
+    Клиент берется из пула подключенных клиентов и возвращается в него по выходу;
+    при TELEGRAM_CLIENT_POOL_ENABLED=false клиент создается заново и отключается по выходу.
+    """
+    if settings.TELEGRAM_CLIENT_POOL_ENABLED:
+        key = client_pool_key(user.session_file) if user.session_file else user.id
+        async with client_pool.lease(key, _pooled_connect(user)) as client:
+            yield client
+        return
+
+    client = await get_telegram_client(user, receive_updates=False)
+    try:
+        yield client
+    finally:
+        await disconnect_client(client)
+
+async def prewarm_telegram_clients(users: Iterable[AppUser]) -> int:
+    """
+    Заранее подключает клиентов пула для указанных пользователей (вызывается при старте сервиса).
+
+    Returns:
+        Количество подключенных клиентов.
+    """
+    if not settings.TELEGRAM_CLIENT_POOL_ENABLED:
+        return 0
+    connectors = {client_pool_key(user.session_file): _pooled_connect(user) for user in users if user.session_file}
+    warmed = await client_pool.prewarm(connectors)
+    print(f"Telegram client pool prewarmed: {warmed}/{len(connectors)} client(s) connected.")
+    return warmed
@@ -0,0 +1,270 @@
+# telegram-intel/data_collector_service/telegram/client_pool.py
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional, Dict, Callable, Awaitable, AsyncIterator, Hashable, List
+
+from telethon import TelegramClient
+from telethon.tl.functions import PingRequest
+
+from data_collector_service.core.config import settings
+
+# --- Пул долгоживущих клиентов Telethon ---
+# Раньше на каждый сбор создавался новый TelegramClient: открытие файла сессии, MTProto-рукопожатие,
+# проверка авторизации и отключение в finally. Пул держит подключенные клиенты между сборами
+# (ключ - файл сессии, см. client.client_pool_key), проверяет их состояние перед выдачей, отключает простаивающие
+# и ограничивает общее число подключений.
+
+ConnectFunc = Callable[[], Awaitable[Optional[TelegramClient]]]
+
+
+@dataclass
+class _PooledClient:
+    key: Hashable
+    client: TelegramClient
+    leases: int = 0 # Сколько сборов сейчас используют клиент (клиент Telethon можно использовать параллельно)
+    last_used: float = 0.0
+    last_checked: float = 0.0
+
+
+@dataclass
+class ClientPoolStats:
+    """Счетчики пула (для отладки и отчетов)."""
+    connects: int = 0
+    reuses: int = 0
+    connect_failures: int = 0
+    health_check_failures: int = 0
+    evicted_idle: int = 0
+
+
+class TelegramClientPool:
+    """
+    Пул подключенных клиентов Telethon с вытеснением простаивающих и проверкой состояния.
+
+    Args:
+        max_clients: Максимальное количество одновременно подключенных клиентов.
+        idle_timeout: Через сколько секунд простоя клиент отключается.
+        health_check_interval: Как часто (сек) проверять клиента пингом перед выдачей.
+        clock: Функция текущего времени (монотонные секунды).
+    """
+
+    def __init__(
+        self,
+        *,
+        max_clients: int = settings.TELEGRAM_CLIENT_POOL_MAX_CLIENTS,
+        idle_timeout: float = settings.TELEGRAM_CLIENT_POOL_IDLE_TIMEOUT,
+        health_check_interval: float = settings.TELEGRAM_CLIENT_POOL_HEALTH_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.clock = clock
+        self.stats = ClientPoolStats()
+        self._entries: Dict[Hashable, _PooledClient] = {}
+        self._key_locks: Dict[Hashable, asyncio.Lock] = {}
+        self._slots = asyncio.Condition() # Ожидание свободного места в пуле
+        self._pending = 0 # Клиенты, которые сейчас подключаются (место уже занято)
+        self._retired: List[_PooledClient] = [] # Убраны из пула, но еще используются сборами (место занято)
+        self._janitor: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --- Выдача и возврат клиентов ---
+
+    async def acquire(self, key: Hashable, connect: ConnectFunc) -> Optional[TelegramClient]:
+        """
+        Выдает подключенный клиент по ключу; если его нет или он неисправен - подключает новый.
+        Каждый успешный acquire должен завершаться release (удобнее через lease).
+
+        Args:
+            key: Ключ клиента в пуле (см. client.client_pool_key).
+            connect: Функция, создающая и подключающая клиента (None при ошибке).
+
+        Returns:
+            Клиент Telethon или None, если подключиться не удалось.
+        """
+        lock = self._key_locks.setdefault(key, asyncio.Lock())
+        async with lock: # Один ключ подключается не более одного раза одновременно
+            entry = self._entries.get(key)
+            if entry is not None and not await self._is_healthy(entry):
+                await self._discard(entry)
+                entry = None
+
+            if entry is None:
+                await self._reserve_slot()
+                client = None
+                try:
+                    client = await connect()
+                except Exception as e:
+                    print(f"Error: Client pool failed to connect client '{key}': {e}")
+                finally:
+                    # Место освобождается и при отмене подключения (CancelledError)
+                    self._pending -= 1
+                    if client is not None:
+                        now = self.clock()
+                        entry = _PooledClient(key=key, client=client, last_used=now, last_checked=now)
+                        self._entries[key] = entry
+                    else:
+                        async with self._slots:
+                            self._slots.notify()
+                if client is None:
+                    self.stats.connect_failures += 1
+                    return None
+                self.stats.connects += 1
+            else:
+                self.stats.reuses += 1
+
+            entry.leases += 1
+            entry.last_used = self.clock()
+            return entry.client
+
+    async def release(self, key: Hashable, client: TelegramClient) -> None:
+        """Возвращает клиента в пул (клиент остается подключенным)."""
+        entry = self._entries.get(key)
+        if entry is None or entry.client is not client:
+            # Клиент убран из пула как неисправный, пока его использовали: отключается последним release
+            retired = next((e for e in self._retired if e.client is client), None)
+            if retired is not None:
+                retired.leases = max(retired.leases - 1, 0)
+                if retired.leases == 0:
+                    self._retired.remove(retired)
+                    await self._disconnect(retired)
+                    async with self._slots:
+                        self._slots.notify()
+            return
+        entry.leases = max(entry.leases - 1, 0)
+        entry.last_used = self.clock()
+        if entry.leases == 0:
+            async with self._slots:
+                self._slots.notify()
+
+    @asynccontextmanager
+    async def lease(self, key: Hashable, connect: ConnectFunc) -> AsyncIterator[Optional[TelegramClient]]:
+        """Контекстный менеджер: acquire на входе, release на выходе (None, если подключиться не удалось)."""
+        client = await self.acquire(key, connect)
+        try:
+            yield client
+        finally:
+            if client is not None:
+                await self.release(key, client)
+
+    async def prewarm(self, connectors: Dict[Hashable, ConnectFunc]) -> int:
+        """
+        Заранее подключает клиентов (параллельно), чтобы первый сбор не ждал рукопожатия.
+
+        Returns:
+            Количество клиентов, подключенных и оставленных в пуле.
+        """
+        items = list(connectors.items())[:self.max_clients]
+
+        async def warm(key, connect) -> bool:
+            client = await self.acquire(key, connect)
+            if client is None:
+                return False
+            await self.release(key, client)
+            return True
+
+        results = await asyncio.gather(*(warm(key, connect) for key, connect in items))
+        return sum(results)
+
+    # --- Обслуживание пула ---
+
+    async def _reserve_slot(self) -> None:
+        """Занимает место в пуле; если пул полон - вытесняет самый давно простаивающий клиент или ждет."""
+        victim = None
+        async with self._slots:
+            while len(self._entries) + len(self._retired) + self._pending >= self.max_clients:
+                idle = [e for e in self._entries.values() if e.leases == 0]
+                if idle:
+                    victim = min(idle, key=lambda e: e.last_used)
+                    self._entries.pop(victim.key, None)
+                    break
+                await self._slots.wait() # Все клиенты заняты - ждем, пока какой-нибудь освободится
+            self._pending += 1
+        if victim is not None:
+            print(f"Client pool is full ({self.max_clients}), evicting least recently used client '{victim.key}'")
+            await self._disconnect(victim)
+
+    async def _is_healthy(self, entry: _PooledClient) -> bool:
+        """Проверяет клиента: подключение, а для простаивающего - пинг не чаще health_check_interval."""
+        if not entry.client.is_connected():
+            self.stats.health_check_failures += 1
+            return False
+        now = self.clock()
+        if entry.leases > 0 or now - entry.last_checked < self.health_check_interval:
+            return True # Клиент недавно проверялся или прямо сейчас работает
+        try:
+            await asyncio.wait_for(entry.client(PingRequest(ping_id=random.getrandbits(63))), timeout=10)
+        except Exception as e:
+            self.stats.health_check_failures += 1
+            print(f"Warning: Health check failed for pooled client '{entry.key}': {e}")
+            return False
+        entry.last_checked = now
+        return True
+
+    async def _discard(self, entry: _PooledClient) -> None:
+        async with self._slots:
+            if self._entries.get(entry.key) is entry:
+                self._entries.pop(entry.key)
+            if entry.leases > 0:
+                # Клиент еще используют другие сборы: новые получат новый клиент, этот отключит release
+                self._retired.append(entry)
+                return
+            self._slots.notify()
+        await self._disconnect(entry)
+
+    @staticmethod
+    async def _disconnect(entry: _PooledClient) -> None:
+        try:
+            if entry.client.is_connected():
+                await entry.client.disconnect()
+        except Exception as e:
+            print(f"Warning: Error disconnecting pooled client '{entry.key}': {e}")
+
+    async def evict_idle(self) -> int:
+        """Отключает клиентов, простаивающих дольше idle_timeout. Возвращает их количество."""
+        now = self.clock()
+        expired: List[_PooledClient] = [
+            e for e in self._entries.values() if e.leases == 0 and now - e.last_used >= self.idle_timeout
+        ]
+        for entry in expired:
+            await self._discard(entry)
+        self.stats.evicted_idle += len(expired)
+        if expired:
+            print(f"Client pool: disconnected {len(expired)} idle client(s), {len(self._entries)} left")
+        return len(expired)
+
+    async def _janitor_loop(self) -> None:
+        interval = max(min(self.idle_timeout, self.health_check_interval) / 2, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                print(f"Error: Client pool janitor failed: {e}")
+
+    def start(self) -> None:
+        """Запускает фоновое отключение простаивающих клиентов (вызывается из lifespan)."""
+        if self._janitor is None or self._janitor.done():
+            self._janitor = asyncio.create_task(self._janitor_loop())
+
+    async def close(self) -> None:
+        """Останавливает обслуживание и отключает все клиенты пула (вызывается при остановке сервиса)."""
+        if self._janitor is not None:
+            self._janitor.cancel()
+            await asyncio.gather(self._janitor, return_exceptions=True)
+            self._janitor = None
+        entries, self._entries = list(self._entries.values()) + self._retired, {}
+        self._retired = []
+        self._key_locks.clear()
+        await asyncio.gather(*(self._disconnect(e) for e in entries))
+        print(f"Client pool closed, {len(entries)} client(s) disconnected.")
+
+
+# Общий пул клиентов сервиса
+client_pool = TelegramClientPool()
@@ -1,16 +1,31 @@
 import asyncio
-from typing import Optional, List, Dict, Any, Tuple, Union # Добавил Union
+from contextlib import aclosing
+from typing import Optional, List, Dict, Any, Tuple, Union, AsyncIterator, Sequence # Добавил Union
 
 from telethon import TelegramClient
-from telethon.tl.types import Channel, Chat, User as TLUser, ChannelParticipantsSearch, ChannelParticipantAdmin, ChannelParticipantCreator, ChannelParticipant, InputPeerChannel, InputPeerChat, InputPeerUser
+from telethon.tl.types import (
+    Channel, ChannelForbidden, Chat, User as TLUser, ChannelParticipantsSearch, InputPeerChannel, InputPeerChat, InputPeerUser,
+    InputChannel, ChannelAdminLogEventsFilter,
+)
 # ----- ИСПРАВЛЕННЫЕ ИМПОРТЫ ЗАПРОСОВ -----
-from telethon.tl.functions.channels import GetFullChannelRequest, GetParticipantsRequest
-from telethon.tl.functions.messages import GetFullChatRequest
+from telethon.tl.functions.channels import GetFullChannelRequest, GetParticipantsRequest, GetAdminLogRequest, GetChannelsRequest
+from telethon.tl.types.channels import ChannelParticipantsNotModified
+from telethon.tl.functions.messages import GetFullChatRequest, GetHistoryRequest
 # -----------------------------------------
 from telethon.errors import FloodWaitError, UserNotParticipantError, ChannelPrivateError, ChatAdminRequiredError, RPCError, ChatIdInvalidError
 
+from data_collector_service.core.config import settings
 # Импортируем функцию получения клиента
-from .client import get_telegram_client, disconnect_client
+from .client import telegram_client_session
+from .participants import (
+    ParticipantPage, PageHash, CrawlProgress, WorkKey,
+    ParticipantBatch, participant_user_id, participants_page_hash,
+    MembershipChanges, membership_changes,
+)
+from .messages import MessageBatch
+from .sharding import ShardingReport, CrawlLane, iter_sharded_participants
+from .backfill import HistoryRange, BackfillPage, BackfillReport, iter_history_ranges
+from .rate_limiter import rate_limiter, session_key
 # Импортируем модели SQLAlchemy для типизации и сохранения
 from shared.models import AppUser, TargetChat, User, ChatParticipant
 
@@ -18,6 +33,81 @@ from shared.models import AppUser, TargetChat, User, ChatParticipant
 ChatDataType = Optional[Dict[str, Any]]
 ParticipantsDataType = Optional[List[Dict[str, Any]]]
 
+
+async def resolve_entity(client: TelegramClient, chat_entity_or_id: Union[int, str]) -> Any:
+    """client.get_entity через ограничитель запросов (ResolveUsername и т.п. тоже расходуют лимиты)."""
+    return await rate_limiter.run((session_key(client), "get_entity"), lambda: client.get_entity(chat_entity_or_id))
+
+
+def _entity_chat_info(entity: Any) -> Dict[str, Any]:
+    """Информация о чате, известная из самой сущности (без GetFullChannel/GetFullChat)."""
+    chat_info = {
+        "id": entity.id,
+        "title": getattr(entity, 'title', None),
+        "username": getattr(entity, 'username', None),
+        "access_hash": getattr(entity, 'access_hash', None),
+        "type": None,
+        "participants_count": getattr(entity, 'participants_count', None),
+        "about": None,
+        "is_supergroup": False,
+        "is_channel": False,
+        "is_group": False,
+        "is_gigagroup": False,
+        "is_admin": False, # Аккаунт - создатель или администратор (доступен журнал администратора)
+    }
+    if isinstance(entity, Channel):
+        chat_info["type"] = "channel" if entity.broadcast else ("supergroup" if entity.megagroup else "group") # Уточняем тип
+        chat_info["is_channel"] = entity.broadcast
+        chat_info["is_supergroup"] = entity.megagroup
+        chat_info["is_gigagroup"] = getattr(entity, 'gigagroup', False)
+        chat_info["is_admin"] = bool(entity.creator or entity.admin_rights)
+    return chat_info
+
+
+# Сколько каналов Telegram принимает в одном channels.getChannels
+GET_CHANNELS_CHUNK_SIZE = 100
+
+
+async def get_channels_info(
+    client: TelegramClient, channels: Sequence[Tuple[int, int]], *, chunk_size: int = GET_CHANNELS_CHUNK_SIZE,
+) -> Dict[int, ChatDataType]:
+    """
+    Получает информацию о каналах/супергруппах с известным access_hash пачками по chunk_size
+    (один channels.getChannels вместо разрешения каждого чата по отдельности). Полученные
+    сущности попадают в кеш сессии Telethon, поэтому последующий get_entity по их ID не
+    обращается к Telegram.
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient.
+        channels: Пары (ID канала, access_hash).
+        chunk_size: Каналов в одном запросе (не больше 100).
+
+    Returns:
+        Словарь ID канала -> информация о канале (как get_chat_info, без participants_count/about
+        из полной информации) или None, если доступа к каналу нет. Каналы, которых нет в
+        ответе (или пачка не получена), в словарь не попадают.
+    """
+    channels_info: Dict[int, ChatDataType] = {}
+    channels = list(dict(channels).items()) # Без повторов
+    for start in range(0, len(channels), chunk_size):
+        chunk = channels[start:start + chunk_size]
+        try:
+            result = await rate_limiter.call(client, GetChannelsRequest(
+                id=[InputChannel(channel_id=chat_id, access_hash=access_hash) for chat_id, access_hash in chunk]
+            ))
+        except (FloodWaitError, RPCError) as e:
+            # Пачка не получена: эти чаты разрешаются обычным путем при сборе
+            print(f"Warning: Could not get info for {len(chunk)} channels in bulk: {e}")
+            continue
+        for entity in result.chats:
+            if isinstance(entity, ChannelForbidden):
+                channels_info[entity.id] = None
+            elif isinstance(entity, Channel):
+                channels_info[entity.id] = _entity_chat_info(entity)
+    print(f"Bulk channel info: {len(channels_info)} of {len(channels)} channels in {-(-len(channels) // chunk_size)} requests")
+    return channels_info
+
+
 async def get_chat_info(client: TelegramClient, chat_entity_or_id: Union[int, str]) -> ChatDataType:
     """
     Получает подробную информацию о чате или канале.
@@ -32,31 +122,14 @@ async def get_chat_info(client: TelegramClient, chat_entity_or_id: Union[int, st
     print(f"Attempting to get info for chat/channel: {chat_entity_or_id}")
     try:
         # Получаем сущность чата/канала
-        entity = await client.get_entity(chat_entity_or_id)
-
-        chat_info = {
-            "id": entity.id,
-            "title": getattr(entity, 'title', None),
-            "username": getattr(entity, 'username', None),
-            "access_hash": getattr(entity, 'access_hash', None),
-            "type": None,
-            "participants_count": None,
-            "about": None,
-            "is_supergroup": False,
-            "is_channel": False,
-            "is_group": False,
-            "is_gigagroup": False,
-        }
+        entity = await resolve_entity(client, chat_entity_or_id)
+        chat_info = _entity_chat_info(entity)
 
         # Определяем тип и получаем дополнительную информацию
         if isinstance(entity, Channel):
-            chat_info["type"] = "channel" if entity.broadcast else ("supergroup" if entity.megagroup else "group") # Уточняем тип
-            chat_info["is_channel"] = entity.broadcast
-            chat_info["is_supergroup"] = entity.megagroup
-            chat_info["is_gigagroup"] = getattr(entity, 'gigagroup', False)
             try:
                 # Запрашиваем полную информацию (включая кол-во участников и описание)
-                full_channel = await client(GetFullChannelRequest(channel=entity))
+                full_channel = await rate_limiter.call(client, GetFullChannelRequest(channel=entity))
                 chat_info["participants_count"] = full_channel.full_chat.participants_count
                 chat_info["about"] = full_channel.full_chat.about
                 # Можно добавить больше полей из full_channel.full_chat и full_channel.chats/users
@@ -68,7 +141,7 @@ async def get_chat_info(client: TelegramClient, chat_entity_or_id: Union[int, st
              chat_info["is_group"] = True
              try:
                 # Запрашиваем полную информацию о группе
-                full_chat = await client(GetFullChatRequest(chat_id=entity.id))
+                full_chat = await rate_limiter.call(client, GetFullChatRequest(chat_id=entity.id))
                 chat_info["participants_count"] = len(full_chat.users) # Приблизительно, GetFullChatRequest может не вернуть всех
                 # В full_chat.full_chat нет about для обычных групп
                 # Можно получить список участников из full_chat.users
@@ -92,9 +165,9 @@ async def get_chat_info(client: TelegramClient, chat_entity_or_id: Union[int, st
          print(f"Error: Invalid chat ID: {chat_entity_or_id}")
          return None
     except FloodWaitError as e:
-        print(f"Error: Flood wait ({e.seconds}s) while getting chat info for {chat_entity_or_id}.")
-        await asyncio.sleep(e.seconds + 1) # Ждем и пробуем еще раз (простая обработка)
-        return await get_chat_info(client, chat_entity_or_id) # Рекурсивный вызов (осторожно!)
+        # Ограничитель уже выждал и повторил допустимое число раз
+        print(f"Error: Flood wait ({e.seconds}s) while getting chat info for {chat_entity_or_id}, retries exhausted.")
+        return None
     except RPCError as e:
         print(f"Error: RPC error getting chat info for {chat_entity_or_id}: {e}")
         return None
@@ -103,153 +176,453 @@ async def get_chat_info(client: TelegramClient, chat_entity_or_id: Union[int, st
         return None
 
 
-async def get_chat_participants(client: TelegramClient, chat_entity_or_id: Union[int, str], limit: int = 0) -> ParticipantsDataType:
+class ParticipantCollectionError(Exception):
+    """Фатальная ошибка сбора участников (чат не найден, нет доступа и т.п.)."""
+
+
+async def resolve_extra_lanes(
+    clients: Sequence[TelegramClient], chat_entity_or_id: Union[int, str], entity: Channel
+) -> List[CrawlLane]:
     """
-    Получает список участников чата или канала.
+    Разрешает канал каждым дополнительным клиентом (у каждого аккаунта свой access_hash).
+    Клиенты, которые не смогли найти канал, в перебор не попадают.
+    """
+    target = entity.username or chat_entity_or_id # По username канал найдет любой аккаунт
+
+    async def resolve(extra_client: TelegramClient) -> Optional[CrawlLane]:
+        try:
+            extra_entity = await resolve_entity(extra_client, target)
+        except (ValueError, FloodWaitError, RPCError) as e:
+            print(f"Warning: Extra session {session_key(extra_client)} could not resolve {target}: {e}")
+            return None
+        if not isinstance(extra_entity, Channel):
+            return None
+        return CrawlLane(client=extra_client, entity=extra_entity, name=session_key(extra_client), primary=False)
+
+    lanes = await asyncio.gather(*(resolve(extra_client) for extra_client in clients))
+    return [lane for lane in lanes if lane is not None]
+
+
+async def iter_chat_participants(
+    client: TelegramClient,
+    chat_entity_or_id: Union[int, str],
+    limit: int = 0,
+    batch_size: int = settings.PARTICIPANTS_PAGE_SIZE,
+    participants_count: Optional[int] = None,
+    sharding_report: Optional[ShardingReport] = None,
+    extra_clients: Sequence[TelegramClient] = (),
+    progress: Optional[CrawlProgress] = None,
+    page_hashes: Optional[Dict[WorkKey, PageHash]] = None,
+) -> AsyncIterator[ParticipantPage]:
+    """
+    Асинхронный генератор участников чата/канала: отдает данные постранично,
+    по мере получения из Telegram, не накапливая весь список в памяти.
 
     Args:
         client: Авторизованный экземпляр TelegramClient.
         chat_entity_or_id: ID чата/канала (int) или его username/ссылка (str).
         limit: Максимальное количество участников для получения (0 = все).
-               Внимание: Получение ВСЕХ участников может быть очень долгим и ресурсоемким!
-
-    Returns:
-        Список словарей с информацией об участниках или None в случае ошибки.
+        batch_size: Размер страницы GetParticipantsRequest (максимум 200).
+        participants_count: Количество участников из get_chat_info. Для каналов/супергрупп
+            больше settings.PARTICIPANTS_SHARDING_THRESHOLD включается шардированный перебор
+            (iter_sharded_participants), т.к. один поисковый запрос отдает не более ~10k участников.
+        sharding_report: Объект ShardingReport для статистики шардированного перебора.
+        extra_clients: Клиенты дополнительных аккаунтов (session_pool). Для каналов/супергрупп
+            страницы и префиксные запросы распределяются между client и этими клиентами.
+        progress: Незавершенная работа перебора (чекпоинт). Потребитель отмечает страницы
+            завершенными после записи (progress.complete); восстановленный из чекпоинта
+            перебор продолжается с незавершенных страниц.
+        page_hashes: Хеши страниц прошлого сбора по (префикс, смещение). Они отправляются
+            в GetParticipantsRequest(hash=...), и неизменившиеся страницы отдаются с not_modified=True
+            (без строк), чтобы их не записывать повторно.
+
+    Yields:
+        ParticipantPage для каждой полученной страницы.
+
+    Raises:
+        ParticipantCollectionError: чат не найден или нет доступа к участникам.
+        FloodWaitError: flood wait, который не удалось переждать (см. rate_limiter).
     """
-    print(f"Attempting to get participants for chat/channel: {chat_entity_or_id} (Limit: {limit})")
-    participants_data = []
-    offset = 0
-    batch_size = 200 # Максимальное количество за один запрос GetParticipantsRequest
-
     try:
-        entity = await client.get_entity(chat_entity_or_id)
-        if not isinstance(entity, (Channel, Chat)):
-            print(f"Error: Entity {chat_entity_or_id} is not a Channel or Chat.")
-            return None
-
+        entity = await resolve_entity(client, chat_entity_or_id)
+    except ValueError:
+        raise ParticipantCollectionError(f"Could not find chat/channel: {chat_entity_or_id}. Invalid ID or username?")
+    except (ChannelPrivateError, ChatAdminRequiredError):
+        raise ParticipantCollectionError(f"Access denied to chat/channel: {chat_entity_or_id}.")
+    except ChatIdInvalidError:
+        raise ParticipantCollectionError(f"Invalid chat ID: {chat_entity_or_id}")
+
+    if not isinstance(entity, (Channel, Chat)):
+        raise ParticipantCollectionError(f"Entity {chat_entity_or_id} is not a Channel or Chat.")
+
+    extra_lanes = []
+    if isinstance(entity, Channel) and extra_clients:
+        extra_lanes = await resolve_extra_lanes(extra_clients, chat_entity_or_id, entity)
+    progress = progress if progress is not None else CrawlProgress()
+    sharded = isinstance(entity, Channel) and (
+        (participants_count or 0) > settings.PARTICIPANTS_SHARDING_THRESHOLD or progress.sharded
+    )
+    progress.sharded = sharded
+    if sharded or extra_lanes:
+        try:
+            async for page in iter_sharded_participants(
+                client, entity, participants_count=participants_count, limit=limit, report=sharding_report,
+                # Чат меньше порога с несколькими аккаунтами: без деления на префиксы, только параллельные страницы
+                max_depth=None if sharded else 0,
+                extra_lanes=extra_lanes,
+                progress=progress,
+                page_hashes=page_hashes,
+            ):
+                yield page
+        except (UserNotParticipantError, ChannelPrivateError, ChatAdminRequiredError):
+            raise ParticipantCollectionError(f"Access denied to participants of chat/channel: {chat_entity_or_id}.")
+        return
+
+    offset = progress.resume_offset() if progress.resumed else 0
+    if progress.resumed:
+        print(f"Resuming participant collection for chat {entity.id} from offset {offset}...")
+    else:
         print(f"Starting participant collection for chat {entity.id}...")
-        total_participants_processed = 0
-
-        while True:
-            print(f"Fetching participants batch: Offset={offset}, Limit={batch_size}")
-            try:
-                if isinstance(entity, Channel):
-                    # Для каналов и супергрупп
-                    participants_result = await client(GetParticipantsRequest(
-                        channel=entity,
-                        filter=ChannelParticipantsSearch(''), # Пустой фильтр для получения всех
-                        offset=offset,
-                        limit=batch_size,
-                        hash=0 # hash=0 для получения свежих данных
-                    ))
+    progress.schedule(('', offset))
+    total_participants_processed = 0
+
+    page_hashes = page_hashes or {}
+    while True:
+        print(f"Fetching participants batch: Offset={offset}, Limit={batch_size}")
+        try:
+            not_modified: Optional[PageHash] = None
+            if isinstance(entity, Channel):
+                # Для каналов и супергрупп
+                previous = page_hashes.get(('', offset))
+                participants_result = await rate_limiter.call(client, GetParticipantsRequest(
+                    channel=entity,
+                    filter=ChannelParticipantsSearch(''), # Пустой фильтр для получения всех
+                    offset=offset,
+                    limit=batch_size,
+                    # Хеш прошлого сбора (0 - получить свежие данные): неизменившаяся страница
+                    # придет как ChannelParticipantsNotModified
+                    hash=previous.hash if previous is not None else 0
+                ))
+                if isinstance(participants_result, ChannelParticipantsNotModified):
+                    not_modified = previous
+                else:
                     current_batch_participants = participants_result.users
                     current_batch_participant_details = participants_result.participants
-                elif isinstance(entity, Chat):
-                     # Для обычных групп (может работать нестабильно или требовать других методов)
-                     # GetFullChatRequest может быть предпочтительнее, но вернет не всех сразу
-                     print("Warning: Fetching participants for basic groups might be limited.")
-                     full_chat = await client(GetFullChatRequest(chat_id=entity.id))
-                     current_batch_participants = full_chat.users
-                     current_batch_participant_details = getattr(full_chat.full_chat, 'participants', None) # Пытаемся получить детали, если есть
-                     if offset > 0: # Для обычных групп получаем всех за один раз (предположительно)
-                         break
-                else:
-                    break # Неожиданный тип
-
+            else:
+                # Для обычных групп GetFullChatRequest возвращает всех участников за один раз
+                if offset > 0:
+                    break
+                print("Warning: Fetching participants for basic groups might be limited.")
+                full_chat = await rate_limiter.call(client, GetFullChatRequest(chat_id=entity.id))
+                current_batch_participants = full_chat.users
+                current_batch_participant_details = getattr(full_chat.full_chat, 'participants', None) # ChatParticipants (или Forbidden, если нет доступа)
+
+            if not_modified is not None:
+                # Страница не изменилась с прошлого сбора: записывать нечего, размер страницы берем из хеша
+                page = ParticipantPage(
+                    offset=offset, count=not_modified.count, user_ids=not_modified.user_ids,
+                    hash=not_modified.hash, not_modified=True,
+                )
+                page_length = len(not_modified.user_ids)
+            else:
                 if not current_batch_participants:
                     print("No more participants found in this batch or chat.")
+                    progress.complete(('', offset))
                     break # Больше нет участников
 
-                # Обрабатываем полученных пользователей
-                for user_obj in current_batch_participants:
-                    if isinstance(user_obj, TLUser): # Убедимся, что это пользователь
-                        participant_details = next((p for p in current_batch_participant_details if getattr(p, 'user_id', None) == user_obj.id), None) if current_batch_participant_details else None
-                        participant_type = 'member' # По умолчанию
-                        inviter_id = None
-                        joined_date = None
-
-                        if participant_details:
-                            joined_date = getattr(participant_details, 'date', None) # Дата присоединения
-                            if isinstance(participant_details, ChannelParticipantCreator):
-                                participant_type = 'creator'
-                            elif isinstance(participant_details, ChannelParticipantAdmin):
-                                participant_type = 'admin'
-                            # Можно добавить обработку ChannelParticipantBanned, ChannelParticipantLeft
-                            # inviter_id доступен в ChannelParticipant через inviter_id, если есть права
-                            inviter_id = getattr(participant_details, 'inviter_id', None)
-
-
-                        user_data = {
-                            "id": user_obj.id,
-                            "access_hash": getattr(user_obj, 'access_hash', None),
-                            "username": getattr(user_obj, 'username', None),
-                            "first_name": getattr(user_obj, 'first_name', None),
-                            "last_name": getattr(user_obj, 'last_name', None),
-                            "phone": getattr(user_obj, 'phone', None),
-                            "is_bot": getattr(user_obj, 'bot', False),
-                            "is_deleted": getattr(user_obj, 'deleted', False),
-                            "is_verified": getattr(user_obj, 'verified', False),
-                            "is_restricted": getattr(user_obj, 'restricted', False),
-                            "is_scam": getattr(user_obj, 'scam', False),
-                            "is_fake": getattr(user_obj, 'fake', False),
-                            "lang_code": getattr(user_obj, 'lang_code', None),
-                            # Telethon не предоставляет статус (online/offline) в этом запросе
-                            # "status": None,
-                            # "last_seen_at": None, # Нужно использовать GetUsersRequest или обновления статуса
-
-                            # Данные из participant_details
-                            "participant_type": participant_type,
-                            "inviter_user_id": inviter_id,
-                            "joined_date": joined_date,
-                        }
-                        participants_data.append(user_data)
-                        total_participants_processed += 1
-
-                offset += len(current_batch_participants)
-                print(f"Processed batch. Total participants so far: {total_participants_processed}. Current offset: {offset}")
-
-                # Проверяем лимит, если он установлен
-                if limit > 0 and total_participants_processed >= limit:
-                    print(f"Reached participant limit ({limit}). Stopping collection.")
-                    # Обрезаем список до точного лимита
-                    participants_data = participants_data[:limit]
-                    break
+                # Нормализуем страницу: участники индексируются по user_id один раз на страницу
+                page = ParticipantPage(
+                    offset=offset,
+                    batch=ParticipantBatch.from_page(current_batch_participants, current_batch_participant_details),
+                )
+                if isinstance(entity, Channel):
+                    page.count = participants_result.count
+                    page.user_ids = [uid for uid in map(participant_user_id, current_batch_participant_details) if uid is not None]
+                    page.hash = participants_page_hash(page.count, page.user_ids)
+                elif not page.batch:
+                    progress.complete(('', offset)) # Пользователей на странице нет - записывать нечего
+                page_length = len(current_batch_participants)
+
+            if not page_length:
+                progress.complete(('', offset))
+                break
+            offset += page_length
+
+            # Проверяем лимит, если он установлен
+            if limit > 0 and total_participants_processed + len(page.batch) >= limit:
+                # Обрезаем страницу до точного лимита
+                if len(page.batch) > limit - total_participants_processed:
+                    page.batch.truncate(limit - total_participants_processed)
+                    page.hash = None # Страница записана не полностью - ее хеш не сохраняем
+                total_participants_processed += len(page.batch)
+                print(f"Reached participant limit ({limit}). Stopping collection.")
+                yield page
+                break
+
+            if isinstance(entity, Channel):
+                progress.schedule(('', offset)) # Следующая страница (у обычных групп она одна)
+
+            total_participants_processed += len(page.batch)
+            print(f"Processed batch. Total participants so far: {total_participants_processed}. Current offset: {offset}"
+                  + (" (page not modified)" if page.not_modified else ""))
+            yield page
+            # Паузы между страницами выдерживает rate_limiter (адаптивно, по FloodWaitError)
+
+        except (UserNotParticipantError, ChannelPrivateError, ChatAdminRequiredError):
+            raise ParticipantCollectionError(f"Access denied to participants of chat/channel: {chat_entity_or_id}.")
+        except RPCError as e:
+            print(f"Error: RPC error fetching participants for {chat_entity_or_id}: {e}")
+            break # Прерываем цикл при RPC ошибке
+
+    print(f"Finished collecting participants for chat {entity.id}. Total found: {total_participants_processed}")
+
+
+# События журнала администратора, меняющие состав участников
+ADMIN_LOG_MEMBERSHIP_FILTER = ChannelAdminLogEventsFilter(
+    join=True, leave=True, invite=True, ban=True, unban=True, kick=True, unkick=True,
+)
+
+
+class AdminLogTooLongError(Exception):
+    """Событий после водяного знака больше лимита - полный перебор участников дешевле."""
+
+
+async def get_admin_log_head(client: TelegramClient, chat_entity_or_id: Union[int, str]) -> int:
+    """
+    ID самого нового события журнала администратора о составе (0 - журнал пуст).
+    Запоминается перед полным перебором участников: следующее обновление читает журнал с него.
+
+    Raises:
+        ParticipantCollectionError: чат не канал/супергруппа или нет прав администратора.
+    """
+    entity = await _resolve_admin_log_channel(client, chat_entity_or_id)
+    try:
+        result = await rate_limiter.call(client, GetAdminLogRequest(
+            channel=entity, q='', max_id=0, min_id=0, limit=1, events_filter=ADMIN_LOG_MEMBERSHIP_FILTER,
+        ))
+    except (ChannelPrivateError, ChatAdminRequiredError):
+        raise ParticipantCollectionError(f"Admin log of {chat_entity_or_id} requires admin rights.")
+    return max((event.id for event in result.events), default=0)
+
+
+async def get_admin_log_membership(
+    client: TelegramClient,
+    chat_entity_or_id: Union[int, str],
+    min_id: int,
+    page_size: int = settings.ADMIN_LOG_PAGE_SIZE,
+    max_events: int = settings.ADMIN_LOG_MAX_EVENTS,
+) -> MembershipChanges:
+    """
+    Читает события журнала администратора о составе участников новее водяного знака min_id
+    и сводит их в итоговое изменение состава (см. membership_changes).
+
+    Журнал отдается от новых событий к старым; страницы запрашиваются с max_id самого старого
+    события предыдущей страницы, пока не будет достигнут min_id.
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient.
+        chat_entity_or_id: ID канала/супергруппы (int) или его username/ссылка (str).
+        min_id: ID последнего обработанного события (водяной знак).
+        page_size: Событий на запрос (максимум 100).
+        max_events: Максимум событий за обновление.
+
+    Returns:
+        MembershipChanges (max_event_id = min_id, если новых событий нет).
+
+    Raises:
+        ParticipantCollectionError: чат не канал/супергруппа или нет прав администратора.
+        AdminLogTooLongError: событий больше max_events.
+    """
+    entity = await _resolve_admin_log_channel(client, chat_entity_or_id)
+    events, users = [], {}
+    max_id = 0
+    while True:
+        try:
+            result = await rate_limiter.call(client, GetAdminLogRequest(
+                channel=entity, q='', max_id=max_id, min_id=min_id, limit=page_size,
+                events_filter=ADMIN_LOG_MEMBERSHIP_FILTER,
+            ))
+        except (ChannelPrivateError, ChatAdminRequiredError):
+            raise ParticipantCollectionError(f"Admin log of {chat_entity_or_id} requires admin rights.")
+        page = [event for event in result.events if event.id > min_id]
+        events.extend(page)
+        users.update((user_obj.id, user_obj) for user_obj in result.users)
+        if len(events) > max_events:
+            raise AdminLogTooLongError(f"More than {max_events} admin log events since event {min_id}.")
+        if len(result.events) < page_size or len(page) < len(result.events):
+            break # Дошли до водяного знака или до начала журнала
+        max_id = min(event.id for event in page)
+
+    changes = membership_changes(events, users.values())
+    changes.max_event_id = max(changes.max_event_id, min_id)
+    print(f"Read {len(events)} admin log events for chat {entity.id} since event {min_id}: "
+          f"{len(changes.batch)} present, {len(changes.left)} left.")
+    return changes
+
+
+async def _resolve_admin_log_channel(client: TelegramClient, chat_entity_or_id: Union[int, str]) -> Channel:
+    """Разрешает канал/супергруппу для GetAdminLogRequest (у обычных групп журнала нет)."""
+    try:
+        entity = await resolve_entity(client, chat_entity_or_id)
+    except ValueError:
+        raise ParticipantCollectionError(f"Could not find chat/channel: {chat_entity_or_id}. Invalid ID or username?")
+    except (ChannelPrivateError, ChatAdminRequiredError):
+        raise ParticipantCollectionError(f"Access denied to chat/channel: {chat_entity_or_id}.")
+    if not isinstance(entity, Channel):
+        raise ParticipantCollectionError(f"Entity {chat_entity_or_id} has no admin log (not a channel or supergroup).")
+    return entity
+
+
+class HistoryCollectionError(Exception):
+    """Историю чата получить нельзя (чат не найден или нет доступа)."""
+
+
+async def iter_chat_history(
+    client: TelegramClient,
+    chat_entity_or_id: Union[int, str],
+    min_id: int = 0,
+    page_size: int = settings.HISTORY_PAGE_SIZE,
+    limit: int = 0,
+) -> AsyncIterator[MessageBatch]:
+    """
+    Асинхронный генератор страниц истории чата от старых сообщений к новым, начиная после min_id.
+
+    Страницы идут по возрастанию ID (как iter_messages(reverse=True) в Telethon: offset_id
+    следующего сообщения и add_offset=-limit), поэтому после каждой записанной страницы ее
+    max_id можно сохранить как водяной знак: прерванный или повторный сбор продолжится с него.
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient.
+        chat_entity_or_id: ID чата/канала (int) или его username/ссылка (str).
+        min_id: Водяной знак - сообщения с ID <= min_id не запрашиваются.
+        page_size: Сообщений на запрос (Telegram отдает не более 100).
+        limit: Максимальное количество сообщений (0 = все).
+
+    Yields:
+        MessageBatch одной страницы (строки сообщений, сущностей и файлов, пользователи ответа).
+
+    Raises:
+        HistoryCollectionError: чат не найден или нет доступа.
+    """
+    entity = await _resolve_history_entity(client, chat_entity_or_id)
+
+    cursor, collected = min_id, 0
+    while True:
+        request_size = min(page_size, limit - collected) if limit else page_size
+        try:
+            result = await rate_limiter.call(client, GetHistoryRequest(
+                peer=entity, offset_id=cursor + 1, offset_date=None, add_offset=-request_size,
+                limit=request_size, max_id=0, min_id=0, hash=0,
+            ))
+        except ChannelPrivateError:
+            raise HistoryCollectionError(f"Access denied to history of {chat_entity_or_id}.")
+        # offset_id включителен при отрицательном add_offset; старые ID отбрасываются на всякий случай
+        messages = [message for message in result.messages if message.id > cursor]
+        if not messages:
+            break
+        batch = MessageBatch.from_page(messages, result.users)
+        collected += len(messages)
+        cursor = max(message.id for message in messages) # Включая пропущенные пустые сообщения
+        yield batch
+        if len(result.messages) < request_size or (limit and collected >= limit):
+            break # Дошли до последнего сообщения чата или до лимита
+
+    print(f"Finished collecting history for chat {entity.id} after message {min_id}: {collected} messages, last {cursor}.")
+
+
+async def get_history_head(client: TelegramClient, chat_entity_or_id: Union[int, str]) -> int:
+    """
+    ID самого нового сообщения чата (0 - история пуста). Верхняя граница первой загрузки истории.
+
+    Raises:
+        HistoryCollectionError: чат не найден или нет доступа.
+    """
+    entity = await _resolve_history_entity(client, chat_entity_or_id)
+    try:
+        result = await rate_limiter.call(client, GetHistoryRequest(
+            peer=entity, offset_id=0, offset_date=None, add_offset=0, limit=1, max_id=0, min_id=0, hash=0,
+        ))
+    except ChannelPrivateError:
+        raise HistoryCollectionError(f"Access denied to history of {chat_entity_or_id}.")
+    return max((message.id for message in result.messages), default=0)
+
+
+async def iter_history_backfill(
+    client: TelegramClient,
+    chat_entity_or_id: Union[int, str],
+    ranges: List[HistoryRange],
+    extra_clients: Sequence[TelegramClient] = (),
+    report: Optional[BackfillReport] = None,
+) -> AsyncIterator[BackfillPage]:
+    """
+    Асинхронный генератор страниц истории по диапазонам ID (см. telegram/backfill.py): диапазоны
+    читаются одновременно основным и дополнительными клиентами, освободившийся клиент забирает
+    часть чужого диапазона. Дополнительные клиенты используются только для каналов и супергрупп.
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient (основной).
+        chat_entity_or_id: ID чата/канала (int) или его username/ссылка (str).
+        ranges: Непрочитанные диапазоны ID (список изменяется по ходу чтения, см. iter_history_ranges).
+        extra_clients: Дополнительные клиенты (аккаунты из session_pool).
+        report: Объект BackfillReport, который будет заполняться по ходу загрузки.
+
+    Yields:
+        BackfillPage в порядке получения.
+
+    Raises:
+        HistoryCollectionError: чат не найден или у основного клиента нет доступа.
+    """
+    entity = await _resolve_history_entity(client, chat_entity_or_id)
+    lanes = [CrawlLane(client=client, entity=entity, name=session_key(client), primary=True)]
+    if extra_clients and isinstance(entity, Channel):
+        lanes.extend(await resolve_extra_lanes(extra_clients, chat_entity_or_id, entity))
+    try:
+        async with aclosing(iter_history_ranges(lanes, ranges, report=report)) as pages:
+            async for page in pages:
+                yield page
+    except (ChannelPrivateError, ChatAdminRequiredError, UserNotParticipantError):
+        raise HistoryCollectionError(f"Access denied to history of {chat_entity_or_id}.")
 
-                # Небольшая задержка между запросами, чтобы избежать флуда
-                await asyncio.sleep(1)
-
-            except FloodWaitError as e:
-                print(f"Error: Flood wait ({e.seconds}s) during participant fetch. Waiting...")
-                await asyncio.sleep(e.seconds + 1)
-                # Продолжаем с того же места
-                continue
-            except (UserNotParticipantError, ChannelPrivateError, ChatAdminRequiredError):
-                 print(f"Error: Access denied to participants of chat/channel: {chat_entity_or_id}.")
-                 return None # Нет смысла продолжать
-            except RPCError as e:
-                 print(f"Error: RPC error fetching participants for {chat_entity_or_id}: {e}")
-                 # Можно попробовать продолжить или прервать
-                 break # Прерываем цикл при RPC ошибке
-            except Exception as e:
-                 print(f"Error: Unexpected error fetching participants for {chat_entity_or_id}: {e}")
-                 break # Прерываем цикл
-
-        print(f"Finished collecting participants for chat {entity.id}. Total found: {len(participants_data)}")
-        return participants_data
 
+async def _resolve_history_entity(client: TelegramClient, chat_entity_or_id: Union[int, str]) -> Any:
+    """Разрешает чат для GetHistoryRequest."""
+    try:
+        return await resolve_entity(client, chat_entity_or_id)
     except ValueError:
-        print(f"Error: Could not find chat/channel: {chat_entity_or_id}. Invalid ID or username?")
-        return None
+        raise HistoryCollectionError(f"Could not find chat/channel: {chat_entity_or_id}. Invalid ID or username?")
     except (ChannelPrivateError, ChatAdminRequiredError):
-        print(f"Error: Access denied to chat/channel: {chat_entity_or_id}.")
+        raise HistoryCollectionError(f"Access denied to chat/channel: {chat_entity_or_id}.")
+
+
+async def get_chat_participants(client: TelegramClient, chat_entity_or_id: Union[int, str], limit: int = 0) -> ParticipantsDataType:
+    """
+    Получает список участников чата или канала.
+    Накопительный режим поверх iter_chat_participants; для больших чатов
+    используйте iter_chat_participants и потоковую запись (pipeline.participants).
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient.
+        chat_entity_or_id: ID чата/канала (int) или его username/ссылка (str).
+        limit: Максимальное количество участников для получения (0 = все).
+               Внимание: Получение ВСЕХ участников может быть очень долгим и ресурсоемким!
+
+    Returns:
+        Список словарей с информацией об участниках или None в случае ошибки.
+    """
+    print(f"Attempting to get participants for chat/channel: {chat_entity_or_id} (Limit: {limit})")
+    participants_data = []
+    try:
+        async for page in iter_chat_participants(client, chat_entity_or_id, limit=limit):
+            participants_data.extend(page.batch.to_dicts())
+        return participants_data
+
+    except ParticipantCollectionError as e:
+        print(f"Error: {e}")
         return None
-    except ChatIdInvalidError:
-         print(f"Error: Invalid chat ID: {chat_entity_or_id}")
-         return None
     except FloodWaitError as e:
-        print(f"Error: Flood wait ({e.seconds}s) getting entity for participants: {chat_entity_or_id}.")
-        await asyncio.sleep(e.seconds + 1)
-        return await get_chat_participants(client, chat_entity_or_id, limit) # Рекурсия
+        # Ограничитель уже выждал и повторил допустимое число раз
+        print(f"Error: Flood wait ({e.seconds}s) collecting participants for {chat_entity_or_id}, retries exhausted.")
+        return participants_data or None
     except RPCError as e:
         print(f"Error: RPC error getting entity for participants: {chat_entity_or_id}: {e}")
         return None
@@ -270,12 +643,10 @@ async def collect_chat_data(app_user: AppUser, chat_target: Union[int, str]) ->
         Кортеж из двух элементов: (информация_о_чате, список_участников).
         Каждый элемент может быть None в случае ошибки.
     """
-    client = None
     chat_data = None
     participants_list = None
-    try:
-        # 1. Получить клиента Telethon
-        client = await get_telegram_client(app_user)
+    # 1. Получить клиента Telethon (из пула подключенных клиентов)
+    async with telegram_client_session(app_user) as client:
         if not client:
             print(f"Failed to get Telegram client for user {app_user.email}")
             return None, None # Возвращаем None, None при ошибке клиента
@@ -294,8 +665,4 @@ async def collect_chat_data(app_user: AppUser, chat_target: Union[int, str]) ->
             print(f"Failed to get participants for target: {chat_target}")
             # Ошибки получения участников могут быть ожидаемы (например, нет прав)
 
-        return chat_data, participants_list
-
-    finally:
-        # 4. Гарантированно отключить клиент
-        await disconnect_client(client)
\ No newline at end of file
+    return chat_data, participants_list
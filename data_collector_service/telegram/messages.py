@@ -0,0 +1,253 @@
+# telegram-intel/data_collector_service/telegram/messages.py
+
+import re
+from typing import Optional, List, Dict, Any, Iterable, Tuple
+
+from telethon import helpers
+from telethon.tl.types import (
+    User as TLUser, Message as TLMessage, MessageService, PeerUser, MessageReplyHeader,
+    MessageMediaPhoto, MessageMediaDocument, MessageMediaWebPage, MessageMediaGeo, MessageMediaGeoLive,
+    MessageMediaVenue, MessageMediaContact, MessageMediaPoll, MessageMediaDice, MessageMediaGame, MessageMediaInvoice,
+    MessageMediaStory, Photo, Document,
+    DocumentAttributeSticker, DocumentAttributeAudio, DocumentAttributeVideo, DocumentAttributeAnimated,
+    MessageEntityTextUrl, MessageEntityMentionName, MessageEntityCustomEmoji, MessageEntityPre,
+    ReactionEmoji, ReactionCustomEmoji,
+)
+
+from .participants import ParticipantBatch
+
+# --- Строки сообщений для записи в БД ---
+# История чата приходит страницами по 100 сообщений (GetHistoryRequest). Каждое сообщение сразу
+# раскладывается в кортежи в порядке колонок messages, message_entities и message_files -
+# без ORM-объектов и промежуточных словарей. Писатель накапливает страницы в MessageBatch и
+# отправляет их в БД одной пачкой (COPY). chat_id в строках нет - его добавляет CRUD.
+
+# Колонки строки сообщения (messages без chat_id)
+MESSAGE_COLUMNS = (
+    "id", "user_id", "message_text", "message_type", "media_type", "reply_to_msg_id",
+    "forwarded_from_id", "views", "forwards", "reactions", "date",
+)
+# Колонки строки сущности текста (message_entities без chat_id)
+MESSAGE_ENTITY_COLUMNS = ("message_id", "type", "offset", "length", "value")
+# Колонки строки файла (message_files без chat_id)
+MESSAGE_FILE_COLUMNS = ("message_id", "file_type", "file_path", "file_size", "mime_type")
+
+# Тип вложения (messages.media_type) по классу Telethon; документы уточняются по атрибутам
+MEDIA_TYPES: Dict[type, str] = {
+    MessageMediaPhoto: 'photo',
+    MessageMediaDocument: 'document',
+    MessageMediaWebPage: 'webpage',
+    MessageMediaGeo: 'geo',
+    MessageMediaGeoLive: 'geo',
+    MessageMediaVenue: 'venue',
+    MessageMediaContact: 'contact',
+    MessageMediaPoll: 'poll',
+    MessageMediaDice: 'dice',
+    MessageMediaGame: 'game',
+    MessageMediaInvoice: 'invoice',
+    MessageMediaStory: 'story',
+}
+# Вложения-файлы: для них пишется строка message_files
+FILE_MEDIA_TYPES = {'photo', 'document', 'video', 'round_video', 'audio', 'voice', 'sticker', 'gif'}
+
+# Имя типа сущности по классу Telethon: MessageEntityTextUrl -> 'text_url'
+_ENTITY_TYPES: Dict[type, str] = {}
+
+
+def entity_type_name(entity: Any) -> str:
+    """Тип сущности текста для message_entities.type (имя класса Telethon в snake_case, с кешем по классу)."""
+    kind = type(entity)
+    name = _ENTITY_TYPES.get(kind)
+    if name is None:
+        name = re.sub(r'(?<!^)(?=[A-Z])', '_', kind.__name__.replace('MessageEntity', '', 1)).lower()
+        _ENTITY_TYPES[kind] = name
+    return name
+
+
+def document_media_type(document: Document) -> str:
+    """Уточняет тип документа по атрибутам: стикер, голосовое, аудио, видео, GIF или документ."""
+    media_type = 'document'
+    for attribute in document.attributes:
+        if isinstance(attribute, DocumentAttributeSticker):
+            return 'sticker'
+        if isinstance(attribute, DocumentAttributeAnimated):
+            media_type = 'gif'
+        elif isinstance(attribute, DocumentAttributeAudio):
+            return 'voice' if attribute.voice else 'audio'
+        elif isinstance(attribute, DocumentAttributeVideo) and media_type != 'gif':
+            media_type = 'round_video' if attribute.round_message else 'video'
+    return media_type
+
+
+def _photo_size(photo: Photo) -> Optional[int]:
+    """Размер самой большой версии фотографии (байт)."""
+    sizes = []
+    for size in photo.sizes:
+        if getattr(size, 'size', None):
+            sizes.append(size.size)
+        elif getattr(size, 'sizes', None): # PhotoSizeProgressive
+            sizes.append(max(size.sizes))
+    return max(sizes, default=None)
+
+
+def _reactions(message: TLMessage) -> Optional[Dict[str, int]]:
+    """Реакции сообщения: {эмодзи или 'custom:<document_id>': количество}."""
+    if message.reactions is None or not message.reactions.results:
+        return None
+    result = {}
+    for reaction_count in message.reactions.results:
+        reaction = reaction_count.reaction
+        if isinstance(reaction, ReactionEmoji):
+            key = reaction.emoticon
+        elif isinstance(reaction, ReactionCustomEmoji):
+            key = f"custom:{reaction.document_id}"
+        else:
+            key = type(reaction).__name__
+        result[key] = reaction_count.count
+    return result
+
+
+def _entity_value(entity: Any, text: str) -> Optional[str]:
+    """Значение сущности: ссылка, ID пользователя/эмодзи, язык блока кода или фрагмент текста."""
+    if isinstance(entity, MessageEntityTextUrl):
+        return entity.url
+    if isinstance(entity, MessageEntityMentionName):
+        return str(entity.user_id)
+    if isinstance(entity, MessageEntityCustomEmoji):
+        return str(entity.document_id)
+    if isinstance(entity, MessageEntityPre) and entity.language:
+        return entity.language
+    return text[entity.offset:entity.offset + entity.length]
+
+
+class MessageBatch:
+    """
+    Сообщения одной или нескольких страниц истории в виде строк для записи в БД.
+
+    Attributes:
+        messages: Строки messages (MESSAGE_COLUMNS).
+        entities: Строки message_entities (MESSAGE_ENTITY_COLUMNS).
+        files: Строки message_files (MESSAGE_FILE_COLUMNS).
+        users: Пользователи Telethon из ответов (по ID) - для строк users: без них не выполнится
+            внешний ключ messages.user_id/forwarded_from_id.
+        min_id, max_id: Наименьший и наибольший ID сообщения в пакете.
+        skipped: Пропущенные пустые/удаленные сообщения.
+    """
+
+    __slots__ = ('messages', 'entities', 'files', 'users', 'min_id', 'max_id', 'skipped')
+
+    def __init__(self):
+        self.messages: List[Tuple] = []
+        self.entities: List[Tuple] = []
+        self.files: List[Tuple] = []
+        self.users: Dict[int, TLUser] = {}
+        self.min_id: Optional[int] = None
+        self.max_id: int = 0
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    @classmethod
+    def from_page(cls, messages: Iterable[Any], users: Iterable[Any]) -> 'MessageBatch':
+        """Пакет одной страницы GetHistoryRequest (result.messages, result.users)."""
+        batch = cls()
+        batch.extend_page(messages, users)
+        return batch
+
+    def extend_page(self, messages: Iterable[Any], users: Iterable[Any]) -> None:
+        """Добавляет страницу: сначала пользователей (для проверки ссылок на них), затем сообщения."""
+        for user_obj in users:
+            if isinstance(user_obj, TLUser):
+                self.users[user_obj.id] = user_obj
+        for message in messages:
+            self.append(message)
+
+    def merge(self, other: 'MessageBatch') -> None:
+        """Добавляет строки другого пакета (следующей страницы)."""
+        self.messages.extend(other.messages)
+        self.entities.extend(other.entities)
+        self.files.extend(other.files)
+        self.users.update(other.users)
+        if other.min_id is not None:
+            self.min_id = other.min_id if self.min_id is None else min(self.min_id, other.min_id)
+        self.max_id = max(self.max_id, other.max_id)
+        self.skipped += other.skipped
+
+    def append(self, message: Any) -> bool:
+        """
+        Добавляет сообщение Telethon (Message или MessageService).
+
+        Returns:
+            False для пустых сообщений (MessageEmpty) - они пропускаются.
+        """
+        if isinstance(message, TLMessage):
+            message_type, text = 'text', message.message or None
+        elif isinstance(message, MessageService):
+            message_type, text = 'service', None
+        else:
+            self.skipped += 1
+            return False
+        message_id = message.id
+        from_id = message.from_id
+        # Отправитель пишется, только если он есть среди пользователей ответа (внешний ключ на users)
+        user_id = from_id.user_id if isinstance(from_id, PeerUser) and from_id.user_id in self.users else None
+        reply_to = message.reply_to
+        reply_to_msg_id = reply_to.reply_to_msg_id if isinstance(reply_to, MessageReplyHeader) else None
+
+        media_type = forwarded_from_id = views = forwards = reactions = None
+        if message_type == 'text':
+            media = message.media
+            if media is not None:
+                media_type = MEDIA_TYPES.get(type(media))
+                if media_type is None:
+                    media_type = type(media).__name__.replace('MessageMedia', '', 1).lower() or None
+                elif media_type == 'document' and isinstance(media.document, Document):
+                    media_type = document_media_type(media.document)
+                if media_type in FILE_MEDIA_TYPES:
+                    self._append_file(message_id, media, media_type)
+                message_type = media_type or message_type
+            fwd_from = message.fwd_from
+            if fwd_from is not None and isinstance(fwd_from.from_id, PeerUser) and fwd_from.from_id.user_id in self.users:
+                forwarded_from_id = fwd_from.from_id.user_id
+            views, forwards = message.views, message.forwards
+            reactions = _reactions(message)
+            if message.entities and text:
+                self._append_entities(message_id, message.entities, text)
+
+        self.messages.append((
+            message_id, user_id, text, message_type, media_type, reply_to_msg_id,
+            forwarded_from_id, views, forwards, reactions, message.date,
+        ))
+        if self.min_id is None or message_id < self.min_id:
+            self.min_id = message_id
+        if message_id > self.max_id:
+            self.max_id = message_id
+        return True
+
+    def _append_entities(self, message_id: int, entities: List[Any], text: str) -> None:
+        # Смещения сущностей в Telegram - в UTF-16; для текста только из BMP они совпадают с индексами str
+        surrogates = not text.isascii() and max(text) > '\uffff'
+        if surrogates:
+            text = helpers.add_surrogate(text)
+        for entity in entities:
+            value = _entity_value(entity, text)
+            if surrogates and value is not None:
+                value = helpers.del_surrogate(value)
+            self.entities.append((message_id, entity_type_name(entity), entity.offset, entity.length, value))
+
+    def _append_file(self, message_id: int, media: Any, media_type: str) -> None:
+        # Файл не скачивается: file_path - ссылка на файл Telegram (photo/document ID) до загрузки
+        if isinstance(media, MessageMediaPhoto) and isinstance(media.photo, Photo):
+            self.files.append((message_id, media_type, f"telegram:photo:{media.photo.id}", _photo_size(media.photo), "image/jpeg"))
+        elif isinstance(media, MessageMediaDocument) and isinstance(media.document, Document):
+            document = media.document
+            self.files.append((message_id, media_type, f"telegram:document:{document.id}", document.size, document.mime_type))
+
+    def user_batch(self) -> ParticipantBatch:
+        """Пользователи пакета в виде ParticipantBatch (для строк users)."""
+        batch = ParticipantBatch()
+        for user_obj in self.users.values():
+            batch.append(user_obj, None)
+        return batch
+
@@ -0,0 +1,471 @@
+# telegram-intel/data_collector_service/telegram/participants.py
+
+import sys
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Iterable, Tuple, Set, Sequence
+
+from telethon.tl.types import (
+    User as TLUser, PeerUser, ChatParticipants,
+    ChannelParticipant, ChannelParticipantSelf, ChannelParticipantCreator, ChannelParticipantAdmin,
+    ChannelParticipantBanned, ChannelParticipantLeft,
+    ChatParticipant, ChatParticipantCreator, ChatParticipantAdmin,
+    ChannelAdminLogEventActionParticipantJoin, ChannelAdminLogEventActionParticipantJoinByInvite,
+    ChannelAdminLogEventActionParticipantJoinByRequest, ChannelAdminLogEventActionParticipantLeave,
+    ChannelAdminLogEventActionParticipantInvite, ChannelAdminLogEventActionParticipantToggleBan,
+)
+
+# --- Нормализация участников ---
+# Telethon возвращает участников отдельно от пользователей (participants_result.participants
+# и participants_result.users). Здесь участники один раз индексируются по user_id,
+# после чего каждая строка собирается за O(1), без линейного поиска по странице.
+
+# Тип участника (значение participant_type в chat_participants) по классу Telethon
+PARTICIPANT_TYPES: Dict[type, str] = {
+    ChannelParticipant: 'member',
+    ChannelParticipantSelf: 'self',
+    ChannelParticipantCreator: 'creator',
+    ChannelParticipantAdmin: 'admin',
+    ChannelParticipantBanned: 'banned',
+    ChannelParticipantLeft: 'left',
+    # Участники обычных групп (GetFullChatRequest)
+    ChatParticipant: 'member',
+    ChatParticipantCreator: 'creator',
+    ChatParticipantAdmin: 'admin',
+}
+
+# --- Компактный пакет участников ---
+# Раньше каждый участник страницы был словарем из 16 ключей (плюс отдельные объекты int и datetime
+# для значений), и такие словари лежали в очереди между сборщиком и писателями. ParticipantBatch
+# хранит страницу по колонкам: числа - в array('q'), булевы поля и признаки "значение есть" -
+# битами одного int в array('H'), тип участника - кодом в array('B'), строки - в списках.
+# Писатели получают из пакета строки в порядке колонок БД (rows), не создавая словарей.
+
+# Поля участника в порядке колонок пакета (ключи словарей to_dicts)
+ROW_COLUMNS = (
+    "id", "access_hash", "username", "first_name", "last_name", "phone",
+    "is_bot", "is_deleted", "is_verified", "is_restricted", "is_scam", "is_fake", "lang_code",
+    "participant_type", "inviter_user_id", "joined_date",
+)
+
+# Биты flags: булевы поля пользователя (колонка users -> атрибут Telethon) ...
+_USER_FLAGS = (
+    ("is_bot", "bot"), ("is_deleted", "deleted"), ("is_verified", "verified"),
+    ("is_restricted", "restricted"), ("is_scam", "scam"), ("is_fake", "fake"),
+)
+FLAG_BITS: Dict[str, int] = {column: 1 << bit for bit, (column, _) in enumerate(_USER_FLAGS)}
+_FLAG_ATTRS = [(1 << bit, attr) for bit, (_, attr) in enumerate(_USER_FLAGS)]
+# ... и признаки заполненности числовых колонок (0 в array не отличить от None)
+_HAS_ACCESS_HASH = 1 << 6
+_HAS_INVITER = 1 << 7
+_HAS_JOINED = 1 << 8
+
+# Коды participant_type в колонке types
+PARTICIPANT_TYPE_NAMES = ('member', 'self', 'creator', 'admin', 'banned', 'left')
+_PARTICIPANT_TYPE_CODES = {name: code for code, name in enumerate(PARTICIPANT_TYPE_NAMES)}
+
+# Строковые колонки: поле -> атрибут пакета (и атрибут пользователя Telethon)
+_STRING_COLUMNS = {
+    "username": "usernames", "first_name": "first_names", "last_name": "last_names",
+    "phone": "phones", "lang_code": "lang_codes",
+}
+
+
+class ParticipantBatch:
+    """
+    Участники страницы в колоночном виде (для передачи от сборщика писателям).
+
+    Attributes:
+        ids, access_hashes, inviter_ids: ID пользователей, access_hash и ID пригласивших (array('q')).
+        joined_at: Дата входа в чат, секунды Unix (array('q')).
+        flags: Булевы поля пользователя и признаки заполненности числовых колонок (array('H')).
+        types: Коды participant_type (array('B'), см. PARTICIPANT_TYPE_NAMES).
+        usernames, first_names, last_names, phones, lang_codes: Строковые колонки.
+        rejected: Пропущенные пользователи с неверными данными: (id, ошибка).
+    """
+
+    __slots__ = (
+        'ids', 'access_hashes', 'inviter_ids', 'joined_at', 'flags', 'types',
+        'usernames', 'first_names', 'last_names', 'phones', 'lang_codes', 'rejected',
+    )
+
+    def __init__(self):
+        self.ids = array('q')
+        self.access_hashes = array('q')
+        self.inviter_ids = array('q')
+        self.joined_at = array('q')
+        self.flags = array('H')
+        self.types = array('B')
+        self.usernames: List[Optional[str]] = []
+        self.first_names: List[Optional[str]] = []
+        self.last_names: List[Optional[str]] = []
+        self.phones: List[Optional[str]] = []
+        self.lang_codes: List[Optional[str]] = []
+        self.rejected: List[Tuple[Any, Exception]] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_page(cls, users: Iterable[Any], participant_details: Any) -> 'ParticipantBatch':
+        """Пакет одной страницы: пользователи с их данными участника (см. extend_page)."""
+        batch = cls()
+        batch.extend_page(users, participant_details)
+        return batch
+
+    def extend_page(self, users: Iterable[Any], participant_details: Any, seen: Optional[Set[int]] = None) -> int:
+        """
+        Добавляет пользователей страницы, сопоставляя их с данными участника через индекс
+        по user_id (O(n) на страницу вместо O(n^2)).
+
+        Args:
+            users: Пользователи страницы (participants_result.users / full_chat.users).
+            participant_details: Участники страницы (список или ChatParticipants).
+            seen: ID уже отданных пользователей: они пропускаются, новые добавляются в множество.
+
+        Returns:
+            Количество пропущенных повторов (пользователей из seen).
+        """
+        index = index_participants(participant_details)
+        duplicates = 0
+        for user_obj in users:
+            if not isinstance(user_obj, TLUser): # Только пользователи
+                continue
+            if seen is not None:
+                if user_obj.id in seen:
+                    duplicates += 1
+                    continue
+                seen.add(user_obj.id)
+            self.append(user_obj, index.get(user_obj.id))
+        return duplicates
+
+    def append(self, user_obj: TLUser, participant: Any) -> bool:
+        """
+        Добавляет пользователя Telethon и его данные участника.
+
+        Returns:
+            False, если данные не помещаются в колонки (пользователь попадает в rejected).
+        """
+        participant_type, inviter_id, joined_date = classify_participant(participant)
+        access_hash = getattr(user_obj, 'access_hash', None)
+        flags = 0
+        for bit, attr in _FLAG_ATTRS:
+            if getattr(user_obj, attr, False):
+                flags |= bit
+        if access_hash is not None:
+            flags |= _HAS_ACCESS_HASH
+        if inviter_id is not None:
+            flags |= _HAS_INVITER
+        if joined_date is not None:
+            flags |= _HAS_JOINED
+
+        size = len(self.ids)
+        try:
+            self.ids.append(user_obj.id)
+            self.access_hashes.append(access_hash or 0)
+            self.inviter_ids.append(inviter_id or 0)
+            self.joined_at.append(int(joined_date.timestamp()) if joined_date is not None else 0)
+        except (TypeError, ValueError, OverflowError, AttributeError) as e:
+            del self.ids[size:], self.access_hashes[size:], self.inviter_ids[size:], self.joined_at[size:]
+            self.rejected.append((getattr(user_obj, 'id', None), e))
+            return False
+        self.flags.append(flags)
+        self.types.append(_PARTICIPANT_TYPE_CODES.get(participant_type, 0))
+        self.usernames.append(getattr(user_obj, 'username', None))
+        self.first_names.append(getattr(user_obj, 'first_name', None))
+        self.last_names.append(getattr(user_obj, 'last_name', None))
+        self.phones.append(getattr(user_obj, 'phone', None))
+        lang_code = getattr(user_obj, 'lang_code', None)
+        self.lang_codes.append(sys.intern(lang_code) if isinstance(lang_code, str) else lang_code) # Несколько десятков значений на всех
+        return True
+
+    def truncate(self, size: int) -> None:
+        """Оставляет в пакете первых size участников."""
+        for name in self.__slots__[:-1]:
+            del getattr(self, name)[size:]
+
+    def column(self, name: str) -> List[Any]:
+        """
+        Значения одного поля (имя из ROW_COLUMNS; 'user_id' - синоним 'id') в виде списка.
+
+        Raises:
+            KeyError: Неизвестное поле.
+        """
+        if name in ("id", "user_id"):
+            return self.ids.tolist()
+        if name in _STRING_COLUMNS:
+            return list(getattr(self, _STRING_COLUMNS[name]))
+        if name in FLAG_BITS:
+            bit = FLAG_BITS[name]
+            return [bool(flags & bit) for flags in self.flags]
+        if name == "access_hash":
+            return [value if flags & _HAS_ACCESS_HASH else None for value, flags in zip(self.access_hashes, self.flags)]
+        if name == "inviter_user_id":
+            return [value if flags & _HAS_INVITER else None for value, flags in zip(self.inviter_ids, self.flags)]
+        if name == "joined_date":
+            return [
+                datetime.fromtimestamp(value, timezone.utc) if flags & _HAS_JOINED else None
+                for value, flags in zip(self.joined_at, self.flags)
+            ]
+        if name == "participant_type":
+            return [PARTICIPANT_TYPE_NAMES[code] for code in self.types]
+        raise KeyError(name)
+
+    def rows(self, columns: Sequence[str]) -> List[Tuple]:
+        """Строки пакета (кортежи значений в порядке columns) - например, для записи в БД."""
+        if not self.ids:
+            return []
+        return list(zip(*(self.column(name) for name in columns)))
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Участники в виде словарей (формат get_chat_participants)."""
+        return [dict(zip(ROW_COLUMNS, row)) for row in self.rows(ROW_COLUMNS)]
+
+
+@dataclass
+class ParticipantPage:
+    """
+    Одна страница участников, полученная одним запросом к Telegram.
+
+    Attributes:
+        offset: Смещение, с которого была запрошена страница.
+        batch: Участники страницы (ParticipantBatch).
+        query: Поисковый префикс ChannelParticipantsSearch ('' - без фильтра).
+        count: Общее количество участников по запросу (channels.channelParticipants.count).
+        user_ids: ID всех участников страницы в порядке ответа (включая уже отданных ранее).
+        hash: Хеш страницы для следующего сбора (None - хеш не сохраняется).
+        not_modified: Telegram ответил ChannelParticipantsNotModified - страница не изменилась
+            с прошлого сбора, batch пуст, user_ids и count взяты из сохраненного хеша.
+        new_users: Для неизменившейся страницы - сколько ее участников не встречалось раньше в этом
+            переборе (шардированный перебор видит одних и тех же участников под разными префиксами);
+            None - страницы перебора не пересекаются, новые - все user_ids.
+    """
+    offset: int
+    batch: ParticipantBatch = field(default_factory=ParticipantBatch)
+    query: str = ''
+    count: Optional[int] = None
+    user_ids: List[int] = field(default_factory=list)
+    hash: Optional[int] = None
+    not_modified: bool = False
+    new_users: Optional[int] = None
+
+    def member_ids(self) -> List[int]:
+        """ID всех участников страницы (для снимка состава): user_ids ответа или, если их нет, ID пакета."""
+        return self.user_ids or self.batch.ids.tolist()
+
+
+@dataclass
+class PageHash:
+    """Сохраненный хеш страницы участников (participant_page_hashes) с данными для пропуска страницы."""
+    hash: int
+    count: int
+    user_ids: List[int]
+
+
+def telegram_hash(ids: Iterable[int]) -> int:
+    """
+    Хеш Telegram для кеширования (https://core.telegram.org/api/offsets#hash-generation):
+    64-битная свертка списка ID, результат - знаковый int64.
+    """
+    acc = 0
+    for value in ids:
+        acc ^= acc >> 21
+        acc ^= (acc << 35) & 0xFFFFFFFFFFFFFFFF
+        acc ^= acc >> 4
+        acc = (acc + (value & 0xFFFFFFFFFFFFFFFF)) & 0xFFFFFFFFFFFFFFFF
+    return acc - (1 << 64) if acc >= (1 << 63) else acc
+
+
+def participants_page_hash(count: int, user_ids: Iterable[int]) -> int:
+    """
+    Хеш страницы для GetParticipantsRequest(hash=...): по документации channels.getParticipants
+    в свертку передается сначала count из прошлого ответа, затем ID участников страницы.
+    """
+    return telegram_hash([count, *user_ids])
+
+
+# Единица работы перебора участников: (поисковый префикс, смещение страницы)
+WorkKey = Tuple[str, int]
+
+
+class CrawlProgress:
+    """
+    Незавершенная работа перебора участников (для чекпоинтов и возобновления).
+
+    Страница считается завершенной, когда ее участники записаны в БД (или в ней не оказалось
+    новых участников). Запланированные, но не завершенные страницы сохраняются в чекпоинт;
+    возобновленный перебор начинает с них, а не с нулевого смещения.
+
+    Args:
+        pending: Незавершенные страницы из чекпоинта (пусто - перебор с начала).
+        sharded: Перебор из чекпоинта был шардированным (префиксные запросы).
+    """
+
+    def __init__(self, pending: Iterable[WorkKey] = (), sharded: bool = False):
+        self.outstanding: Dict[WorkKey, None] = dict.fromkeys((q, int(o)) for q, o in pending) # Упорядоченное множество
+        self.resumed = bool(self.outstanding)
+        self.sharded = sharded
+
+    def schedule(self, key: WorkKey) -> bool:
+        """Отмечает страницу как запланированную. False, если она уже ожидает обработки."""
+        if key in self.outstanding:
+            return False
+        self.outstanding[key] = None
+        return True
+
+    def complete(self, key: WorkKey) -> None:
+        """Отмечает страницу как завершенную (записанную или пустую)."""
+        self.outstanding.pop(key, None)
+
+    def pending(self) -> List[WorkKey]:
+        return list(self.outstanding)
+
+    def resume_offset(self) -> int:
+        """Смещение, с которого возобновляется последовательный перебор (минимальная незавершенная страница)."""
+        return min((offset for query, offset in self.outstanding if query == ''), default=0)
+
+    @property
+    def done(self) -> bool:
+        return not self.outstanding
+
+
+def participant_user_id(participant: Any) -> Optional[int]:
+    """
+    Возвращает ID пользователя-участника.
+    У ChannelParticipantBanned/ChannelParticipantLeft вместо user_id есть peer.
+    """
+    user_id = getattr(participant, 'user_id', None)
+    if user_id is not None:
+        return user_id
+    peer = getattr(participant, 'peer', None)
+    if isinstance(peer, PeerUser):
+        return peer.user_id
+    return None # Peer канала/чата (например, забаненный канал) - не пользователь
+
+
+def classify_participant(participant: Any) -> Tuple[str, Optional[int], Optional[datetime]]:
+    """
+    Определяет тип участника, пригласившего и дату входа.
+
+    Returns:
+        Кортеж (participant_type, inviter_user_id, joined_date).
+        Для отсутствующих данных возвращается ('member', None, None).
+    """
+    if participant is None:
+        return 'member', None, None
+    participant_type = PARTICIPANT_TYPES.get(type(participant), 'member')
+    # inviter_id есть у ChannelParticipantSelf/Admin и ChatParticipant/Admin (если есть права)
+    return participant_type, getattr(participant, 'inviter_id', None), getattr(participant, 'date', None)
+
+
+def index_participants(participant_details: Any) -> Dict[int, Any]:
+    """
+    Строит словарь user_id -> участник для одной страницы.
+    Принимает список участников или ChatParticipants (full_chat.participants обычной группы).
+    """
+    if participant_details is None:
+        return {}
+    if isinstance(participant_details, ChatParticipants):
+        participant_details = participant_details.participants
+    elif not isinstance(participant_details, (list, tuple)):
+        return {} # ChatParticipantsForbidden и т.п. - деталей нет
+    index = {}
+    for participant in participant_details:
+        user_id = participant_user_id(participant)
+        if user_id is not None:
+            index[user_id] = participant
+    return index
+
+
+# --- События журнала администратора ---
+# Журнал администратора канала (channels.getAdminLog) содержит входы, выходы, приглашения
+# и блокировки участников за последние 48 часов. Для каналов, где аккаунт - администратор,
+# состав можно обновлять по этим событиям, а не перебирать всех участников заново.
+
+# Действия журнала, которые добавляют участника (без объекта участника в событии)
+_JOIN_ACTIONS = (
+    ChannelAdminLogEventActionParticipantJoin,
+    ChannelAdminLogEventActionParticipantJoinByInvite,
+    ChannelAdminLogEventActionParticipantJoinByRequest,
+)
+
+
+@dataclass
+class MembershipChanges:
+    """
+    Итоговое изменение состава по событиям журнала администратора (последнее событие пользователя побеждает).
+
+    Attributes:
+        batch: Участники, которые состоят в чате после событий (для upsert users/chat_participants).
+        left: Вышедшие, исключенные и удаленные участники: user_id -> дата события.
+        events: Сколько событий о составе прочитано.
+        max_event_id: ID самого нового прочитанного события (новый водяной знак журнала).
+    """
+    batch: ParticipantBatch = field(default_factory=ParticipantBatch)
+    left: Dict[int, datetime] = field(default_factory=dict)
+    events: int = 0
+    max_event_id: int = 0
+
+
+def admin_log_membership(event: Any) -> Optional[Tuple[int, Optional[Any]]]:
+    """
+    Определяет изменение состава по событию журнала администратора.
+
+    Returns:
+        (user_id, участник) - пользователь состоит в чате (участник Telethon для типа и даты входа),
+        (user_id, None) - пользователь вышел или исключен, None - событие не меняет состав.
+    """
+    action = event.action
+    if isinstance(action, _JOIN_ACTIONS):
+        return event.user_id, ChannelParticipant(user_id=event.user_id, date=event.date)
+    if isinstance(action, ChannelAdminLogEventActionParticipantLeave):
+        return event.user_id, None
+    if isinstance(action, ChannelAdminLogEventActionParticipantInvite):
+        participant = action.participant
+    elif isinstance(action, ChannelAdminLogEventActionParticipantToggleBan):
+        participant = action.new_participant
+    else:
+        return None
+    user_id = participant_user_id(participant)
+    if user_id is None:
+        return None
+    # Исключенный (kick) - ChannelParticipantBanned с left; снятие исключения - ChannelParticipantLeft
+    if isinstance(participant, ChannelParticipantLeft) or (isinstance(participant, ChannelParticipantBanned) and participant.left):
+        return user_id, None
+    return user_id, participant
+
+
+def membership_changes(events: Iterable[Any], users: Iterable[Any]) -> MembershipChanges:
+    """
+    Сводит события журнала администратора (в любом порядке) в итоговое изменение состава.
+
+    Args:
+        events: События ChannelAdminLogEvent.
+        users: Пользователи ответов GetAdminLogRequest (для строк users).
+
+    Returns:
+        MembershipChanges.
+    """
+    users_by_id = {user_obj.id: user_obj for user_obj in users if isinstance(user_obj, TLUser)}
+    changes = MembershipChanges()
+    present: Dict[int, Any] = {}
+    for event in sorted(events, key=lambda e: e.id): # От старых к новым
+        changes.max_event_id = max(changes.max_event_id, event.id)
+        change = admin_log_membership(event)
+        if change is None:
+            continue
+        changes.events += 1
+        user_id, participant = change
+        if participant is None:
+            present.pop(user_id, None)
+            changes.left[user_id] = event.date
+        else:
+            changes.left.pop(user_id, None)
+            present[user_id] = participant
+    for user_id, participant in present.items():
+        user_obj = users_by_id.get(user_id)
+        if user_obj is not None:
+            changes.batch.append(user_obj, participant)
+    return changes
+
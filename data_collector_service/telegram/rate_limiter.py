@@ -0,0 +1,206 @@
+# telegram-intel/data_collector_service/telegram/rate_limiter.py
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Tuple, List, Any, Callable, Awaitable
+
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+from data_collector_service.core.config import settings
+
+# --- Адаптивный ограничитель запросов к Telegram ---
+# Для каждой пары (сессия, RPC-метод) ведется token bucket. Скорость bucket'а
+# уменьшается мультипликативно при каждом FloodWaitError и растет аддитивно (пробно),
+# когда flood wait долго не приходил (AIMD). Все вызовы Telethon в сборщике идут через
+# RateLimiter.call/RateLimiter.run, повтор после flood wait выполняется циклом, без рекурсии.
+# Часы и sleep передаются снаружи, поэтому поведение проверяется с поддельным временем.
+
+BucketKey = Tuple[str, str] # (ключ сессии, имя RPC-метода)
+# Суффикс ключа сессии для запросов внутри takeout-сессии: у Telegram для них отдельные, более мягкие лимиты
+TAKEOUT_KEY_SUFFIX = "#takeout"
+FloodListener = Callable[[str, str, float], None] # (ключ сессии, метод, секунды ожидания)
+
+
+@dataclass
+class _Bucket:
+    rate: float # Запросов в секунду
+    max_rate: float
+    tokens: float
+    updated_at: float
+    blocked_until: float = 0.0 # До этого момента запросы не отправляются (flood wait)
+    last_flood_at: Optional[float] = None
+    success_streak: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+@dataclass
+class RateLimiterStats:
+    """Счетчики ограничителя (для отчетов о сборе)."""
+    calls: int = 0
+    flood_waits: int = 0
+    flood_wait_seconds: float = 0.0
+    throttled_seconds: float = 0.0 # Сколько всего ждали токенов
+
+
+def session_key(client: Any) -> str:
+    """
+    Ключ сессии клиента для ограничителя: путь к файлу сессии или id объекта клиента.
+    Клиенту takeout-сессии (telegram/takeout.py) соответствует отдельный ключ с TAKEOUT_KEY_SUFFIX.
+    """
+    session = getattr(client, 'session', None)
+    key = str(getattr(session, 'filename', None) or f"client-{id(client)}")
+    return key + TAKEOUT_KEY_SUFFIX if getattr(client, 'takeout_id', None) is not None else key
+
+
+class RateLimiter:
+    """
+    Token bucket на пару (сессия, метод) с адаптацией по FloodWaitError.
+
+    Args:
+        initial_rate: Начальная скорость, запросов/сек.
+        min_rate: Нижняя граница скорости.
+        max_rate: Верхняя граница скорости.
+        burst: Емкость bucket'а (сколько запросов можно отправить подряд).
+        decrease_factor: Множитель скорости при flood wait (0 < f < 1).
+        increase_step: Прибавка скорости при пробном повышении.
+        probe_after: Сколько успешных вызовов подряд нужно для пробного повышения.
+        max_retries: Сколько раз повторять вызов после flood wait, прежде чем пробросить ошибку.
+        max_flood_wait: Flood wait дольше этого значения (сек) не ожидается, а пробрасывается сразу.
+        takeout_initial_rate: Начальная скорость bucket'ов takeout-сессий.
+        takeout_max_rate: Верхняя граница скорости bucket'ов takeout-сессий.
+        clock: Функция текущего времени (монотонные секунды).
+        sleep: Асинхронная функция ожидания.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial_rate: float = settings.RATE_LIMIT_INITIAL_RPS,
+        min_rate: float = settings.RATE_LIMIT_MIN_RPS,
+        max_rate: float = settings.RATE_LIMIT_MAX_RPS,
+        burst: float = settings.RATE_LIMIT_BURST,
+        decrease_factor: float = 0.5,
+        increase_step: float = 0.1,
+        probe_after: int = 20,
+        max_retries: int = settings.RATE_LIMIT_MAX_RETRIES,
+        max_flood_wait: float = settings.RATE_LIMIT_MAX_FLOOD_WAIT,
+        takeout_initial_rate: float = settings.TAKEOUT_RATE_LIMIT_INITIAL_RPS,
+        takeout_max_rate: float = settings.TAKEOUT_RATE_LIMIT_MAX_RPS,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.probe_after = probe_after
+        self.max_retries = max_retries
+        self.max_flood_wait = max_flood_wait
+        self.takeout_initial_rate = takeout_initial_rate
+        self.takeout_max_rate = takeout_max_rate
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = RateLimiterStats()
+        self._buckets: Dict[BucketKey, _Bucket] = {}
+        self._flood_listeners: List[FloodListener] = []
+
+    def _bucket(self, key: BucketKey) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if key[0].endswith(TAKEOUT_KEY_SUFFIX):
+                bucket = _Bucket(rate=self.takeout_initial_rate, max_rate=self.takeout_max_rate, tokens=self.burst, updated_at=self.clock())
+            else:
+                bucket = _Bucket(rate=self.initial_rate, max_rate=self.max_rate, tokens=self.burst, updated_at=self.clock())
+            self._buckets[key] = bucket
+        return bucket
+
+    def add_flood_listener(self, listener: FloodListener) -> None:
+        """Подписывает обработчик на каждый FloodWaitError (например, учет охлаждения аккаунтов в session_pool)."""
+        self._flood_listeners.append(listener)
+
+    def rate(self, key: BucketKey) -> float:
+        """Текущая скорость bucket'а (запросов/сек)."""
+        return self._bucket(key).rate
+
+    async def acquire(self, key: BucketKey) -> None:
+        """Ждет, пока в bucket'е появится токен (и закончится flood wait), и забирает его."""
+        bucket = self._bucket(key)
+        async with bucket.lock: # Ожидающие вызовы одного bucket'а обслуживаются по очереди
+            while True:
+                now = self.clock()
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * bucket.rate)
+                bucket.updated_at = now
+                if now < bucket.blocked_until:
+                    delay = bucket.blocked_until - now
+                elif bucket.tokens >= 1 - 1e-9: # Допуск на погрешность float после ожидания
+                    bucket.tokens = max(bucket.tokens - 1, 0.0)
+                    return
+                else:
+                    delay = (1 - bucket.tokens) / bucket.rate
+                self.stats.throttled_seconds += delay
+                await self.sleep(delay)
+
+    def on_success(self, key: BucketKey) -> None:
+        """Успешный вызов: после серии успехов пробно повышаем скорость."""
+        bucket = self._bucket(key)
+        bucket.success_streak += 1
+        if bucket.success_streak >= self.probe_after and bucket.rate < bucket.max_rate:
+            bucket.rate = min(bucket.max_rate, bucket.rate + self.increase_step)
+            bucket.success_streak = 0
+
+    def on_flood_wait(self, key: BucketKey, seconds: float) -> None:
+        """Flood wait: снижаем скорость и блокируем bucket на указанное время."""
+        bucket = self._bucket(key)
+        now = self.clock()
+        bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+        bucket.tokens = 0
+        bucket.blocked_until = max(bucket.blocked_until, now + seconds)
+        bucket.last_flood_at = now
+        bucket.success_streak = 0
+        self.stats.flood_waits += 1
+        self.stats.flood_wait_seconds += seconds
+        print(f"Rate limiter: flood wait {seconds}s on {key[1]} ({key[0]}), rate lowered to {bucket.rate:.2f} req/s")
+        for listener in self._flood_listeners:
+            listener(key[0], key[1], seconds)
+
+    async def run(self, key: BucketKey, call: Callable[[], Awaitable[Any]], *, max_retries: Optional[int] = None) -> Any:
+        """
+        Выполняет вызов под ограничителем с повтором после flood wait.
+
+        Args:
+            key: Ключ bucket'а (сессия, метод).
+            call: Функция без аргументов, возвращающая корутину вызова Telethon.
+            max_retries: Переопределяет self.max_retries (0 - не ждать, а сразу пробросить flood wait,
+                например, чтобы отдать работу другому аккаунту).
+
+        Raises:
+            FloodWaitError: если число повторов исчерпано или ожидание слишком длинное.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            await self.acquire(key)
+            self.stats.calls += 1
+            try:
+                result = await call()
+            except FloodWaitError as e:
+                self.on_flood_wait(key, e.seconds)
+                if attempt >= max_retries or e.seconds > self.max_flood_wait:
+                    raise
+                continue # Повторяем после ожидания в acquire()
+            self.on_success(key)
+            return result
+
+    async def call(self, client: TelegramClient, request: Any, *, max_retries: Optional[int] = None) -> Any:
+        """Отправляет TL-запрос client(request) под ограничителем (ключ - сессия и тип запроса)."""
+        return await self.run(
+            (session_key(client), type(request).__name__), lambda: client(request), max_retries=max_retries
+        )
+
+
+# Общий ограничитель сервиса (bucket'ы разделены по сессиям, поэтому один на процесс)
+rate_limiter = RateLimiter()
+
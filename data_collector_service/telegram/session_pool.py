@@ -0,0 +1,169 @@
+# telegram-intel/data_collector_service/telegram/session_pool.py
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Dict, List, Callable, AsyncIterator
+
+from telethon import TelegramClient
+
+from data_collector_service.core.config import settings
+from .client import connect_session_file, client_pool_key
+from .client_pool import client_pool
+from .rate_limiter import rate_limiter
+
+# --- Пул аккаунтов (файлов сессий) для распределенного сбора ---
+# Один сбор больше не ограничен flood-бюджетом одного аккаунта: планировщик выдает задаче
+# несколько сессий из settings.SESSION_FILES_DIR, и страницы/префиксные запросы перебора
+# распределяются между их клиентами. Для каждого аккаунта ведется охлаждение: после долгого
+# flood wait (или ошибки подключения) аккаунт какое-то время не выдается новым задачам.
+
+
+@dataclass
+class SessionAccount:
+    """Аккаунт пула: файл сессии и его состояние."""
+    name: str # Имя файла сессии в SESSION_FILES_DIR
+    path: Path
+    leases: int = 0 # Сколько задач сейчас используют аккаунт
+    cooldown_until: float = 0.0 # До этого момента аккаунт не выдается
+    flood_waits: int = 0
+    connect_failures: int = 0
+
+    def cooling_down(self, now: float) -> bool:
+        return now < self.cooldown_until
+
+
+@dataclass
+class SessionLease:
+    """Аккаунты и подключенные клиенты, выданные одной задаче."""
+    accounts: List[SessionAccount] = field(default_factory=list)
+    clients: List[TelegramClient] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+
+class SessionPool:
+    """
+    Планировщик аккаунтов: выдает задачам сессии из каталога с файлами сессий.
+
+    Args:
+        sessions_dir: Каталог с файлами *.session.
+        max_jobs_per_session: Сколько задач одновременно могут использовать один аккаунт.
+        cooldown_threshold: Flood wait не короче этого значения (сек) отправляет аккаунт на охлаждение.
+        failure_cooldown: Охлаждение аккаунта после неудачного подключения (сек).
+        clock: Функция текущего времени (монотонные секунды).
+    """
+
+    def __init__(
+        self,
+        *,
+        sessions_dir: Path = settings.SESSION_FILES_DIR,
+        max_jobs_per_session: int = settings.SESSION_POOL_MAX_JOBS_PER_SESSION,
+        cooldown_threshold: float = settings.SESSION_POOL_COOLDOWN_THRESHOLD,
+        failure_cooldown: float = settings.SESSION_POOL_FAILURE_COOLDOWN,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.sessions_dir = sessions_dir
+        self.max_jobs_per_session = max_jobs_per_session
+        self.cooldown_threshold = cooldown_threshold
+        self.failure_cooldown = failure_cooldown
+        self.clock = clock
+        self._accounts: Dict[str, SessionAccount] = {}
+        self._by_session_key: Dict[str, SessionAccount] = {} # session_key(client) -> аккаунт
+        self._lock = asyncio.Lock()
+        rate_limiter.add_flood_listener(self._on_flood_wait)
+
+    def scan(self) -> List[SessionAccount]:
+        """Обновляет список аккаунтов по файлам *.session в каталоге (новые добавляются, удаленные убираются)."""
+        found = {path.name: path for path in sorted(self.sessions_dir.glob("*.session"))}
+        for name in list(self._accounts):
+            if name not in found and self._accounts[name].leases == 0:
+                account = self._accounts.pop(name)
+                self._by_session_key.pop(str(account.path), None)
+        for name, path in found.items():
+            if name not in self._accounts:
+                account = SessionAccount(name=name, path=path)
+                self._accounts[name] = account
+                self._by_session_key[str(path)] = account
+        return list(self._accounts.values())
+
+    def accounts(self) -> List[SessionAccount]:
+        return list(self._accounts.values())
+
+    def cool_down(self, account: SessionAccount, seconds: float) -> None:
+        """Не выдавать аккаунт новым задачам в течение seconds секунд."""
+        account.cooldown_until = max(account.cooldown_until, self.clock() + seconds)
+
+    def _on_flood_wait(self, session: str, method: str, seconds: float) -> None:
+        """Подписчик rate_limiter: долгий flood wait отправляет аккаунт на охлаждение."""
+        account = self._by_session_key.get(session)
+        if account is None:
+            return
+        account.flood_waits += 1
+        if seconds >= self.cooldown_threshold:
+            self.cool_down(account, seconds)
+            print(f"Session pool: account {account.name} cooling down for {seconds}s after flood wait on {method}")
+
+    def _pick(self, count: int, exclude: set) -> List[SessionAccount]:
+        """Выбирает до count доступных аккаунтов: сначала наименее загруженные, затем реже получавшие flood wait."""
+        now = self.clock()
+        candidates = [
+            a for a in self._accounts.values()
+            if a.name not in exclude and not a.cooling_down(now) and a.leases < self.max_jobs_per_session
+        ]
+        candidates.sort(key=lambda a: (a.leases, a.flood_waits, a.name))
+        return candidates[:count]
+
+    async def _connect(self, account: SessionAccount) -> Optional[TelegramClient]:
+        client = await client_pool.acquire(
+            client_pool_key(account.name),
+            lambda: connect_session_file(account.path, owner=f"pool account {account.name}", receive_updates=False),
+        )
+        if client is None:
+            account.connect_failures += 1
+            self.cool_down(account, self.failure_cooldown)
+        return client
+
+    @asynccontextmanager
+    async def lease(self, count: int, *, exclude: Optional[List[str]] = None) -> AsyncIterator[SessionLease]:
+        """
+        Выдает задаче до count подключенных аккаунтов (может выдать меньше или ни одного).
+
+        Args:
+            count: Сколько аккаунтов нужно задаче.
+            exclude: Имена файлов сессий, которые не выдавать (например, сессия самого пользователя,
+                которая уже используется задачей).
+
+        Yields:
+            SessionLease с аккаунтами и их клиентами; по выходу клиенты возвращаются в client_pool.
+        """
+        lease = SessionLease()
+        excluded = set(exclude or ())
+        if count > 0:
+            async with self._lock: # Выбор аккаунтов атомарен, чтобы параллельные задачи не делили их сверх лимита
+                self.scan()
+                picked = self._pick(count, excluded)
+                for account in picked:
+                    account.leases += 1
+            clients = await asyncio.gather(*(self._connect(account) for account in picked))
+            for account, client in zip(picked, clients):
+                if client is None:
+                    account.leases -= 1
+                    continue
+                lease.accounts.append(account)
+                lease.clients.append(client)
+            if picked:
+                print(f"Session pool: leased {len(lease)}/{count} account(s): {', '.join(a.name for a in lease.accounts)}")
+        try:
+            yield lease
+        finally:
+            for account, client in zip(lease.accounts, lease.clients):
+                account.leases -= 1
+                await client_pool.release(client_pool_key(account.name), client)
+
+
+# Общий пул аккаунтов сервиса
+session_pool = SessionPool()
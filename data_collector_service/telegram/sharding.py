@@ -0,0 +1,341 @@
+# telegram-intel/data_collector_service/telegram/sharding.py
+
+import asyncio
+import string
+from dataclasses import dataclass
+from typing import Optional, Set, Dict, Sequence, Tuple, AsyncIterator
+
+from telethon import TelegramClient
+from telethon.tl.types import Channel, ChannelParticipantsSearch
+from telethon.tl.functions.channels import GetParticipantsRequest
+from telethon.tl.types.channels import ChannelParticipantsNotModified
+from telethon.errors import FloodWaitError, UserNotParticipantError, ChannelPrivateError, ChatAdminRequiredError, RPCError
+
+from data_collector_service.core.config import settings
+from .participants import (
+    ParticipantPage, PageHash, CrawlProgress, WorkKey,
+    ParticipantBatch, participant_user_id, participants_page_hash,
+)
+from .rate_limiter import rate_limiter, session_key
+
+# --- Шардированный перебор участников ---
+# Telegram отдает по одному поисковому запросу ChannelParticipantsSearch не более ~10k участников.
+# Чтобы получить участников сверх этого лимита, перебираем префиксные запросы ('a', 'b', ..., 'аб', ...):
+# если запрос "насыщен" (count упирается в лимит), он рекурсивно делится на запросы длиннее на один символ.
+# Страницы запросов выполняются пулом воркеров под общим ограничением параллелизма (воркеры
+# могут принадлежать разным аккаунтам, см. session_pool), пользователи дедуплицируются по ID.
+
+# Больше этого количества участников один поисковый запрос не отдает (страницы дальше пустые)
+SEARCH_RESULTS_CAP = 10000
+
+# Алфавиты для префиксных запросов (по письменностям)
+SHARD_SCRIPTS = {
+    "latin": string.ascii_lowercase,
+    "digits": string.digits,
+    "cyrillic": "абвгдеёжзийклмнопрстуфхцчшщъыьэюя",
+    "ukrainian": "іїєґ",
+    "greek": "αβγδεζηθικλμνξοπρστυφχψω",
+    "arabic": "ابتثجحخدذرزسشصضطظعغفقكلمنهوي",
+    "hebrew": "אבגדהוזחטיכלמנסעפצקרשת",
+}
+
+
+def shard_alphabet(scripts: Optional[str] = None) -> str:
+    """Собирает алфавит префиксов из списка письменностей через запятую (по умолчанию из настроек)."""
+    names = (scripts or settings.PARTICIPANTS_SHARD_SCRIPTS).split(",")
+    return "".join(SHARD_SCRIPTS.get(name.strip(), "") for name in names)
+
+
+@dataclass
+class ShardingReport:
+    """Статистика шардированного перебора и покрытие относительно participants_count."""
+    participants_count: Optional[int] = None
+    queries_done: int = 0
+    queries_split: int = 0
+    queries_failed: int = 0
+    pages_fetched: int = 0
+    pages_not_modified: int = 0 # Страницы, не изменившиеся с прошлого сбора (по хешу)
+    duplicates: int = 0
+    unique_users: int = 0
+
+    @property
+    def coverage(self) -> Optional[float]:
+        """Доля собранных уникальных участников от participants_count (None, если количество неизвестно)."""
+        if not self.participants_count:
+            return None
+        return min(self.unique_users / self.participants_count, 1.0)
+
+
+@dataclass
+class CrawlLane:
+    """
+    Клиент, участвующий в переборе, и сущность канала, разрешенная этим клиентом
+    (access_hash канала у каждого аккаунта свой).
+    """
+    client: TelegramClient
+    entity: Channel
+    name: str = ''
+    primary: bool = True # Ошибка доступа у основного клиента останавливает весь перебор
+    pages_fetched: int = 0
+    paused_until: float = 0.0 # Время цикла событий, до которого клиент не берет работу (flood wait)
+    disabled: bool = False
+
+
+# Элемент очереди работы: (префикс, смещение, номер попытки)
+WorkItem = Tuple[str, int, int]
+
+
+class _ShardCrawl:
+    """Состояние одного шардированного перебора (очередь запросов, дедупликация, результаты)."""
+
+    def __init__(self, lanes: Sequence[CrawlLane], report: ShardingReport, alphabet: str,
+                 max_depth: int, page_size: int, saturation: int, limit: int, progress: CrawlProgress,
+                 page_hashes: Dict[WorkKey, PageHash]):
+        self.lanes = list(lanes)
+        self.progress = progress
+        self.page_hashes = page_hashes
+        self.report = report
+        self.alphabet = alphabet
+        self.max_depth = max_depth
+        self.page_size = page_size
+        self.saturation = saturation
+        self.limit = limit
+        # С несколькими клиентами flood wait не пережидается на месте: работа уходит другому клиенту
+        self.handoff = len(self.lanes) > 1
+        self.max_attempts = settings.RATE_LIMIT_MAX_RETRIES * len(self.lanes) + 1
+        self.seen: Set[int] = set() # ID уже отданных пользователей
+        self.work: asyncio.Queue = asyncio.Queue() # Страницы префиксных запросов к обработке
+        self.out: asyncio.Queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_MAXSIZE) # Готовые страницы
+        self.failure: Optional[BaseException] = None
+        self.stopped = False # Перебор остановлен ошибкой: новые страницы не ставятся и не запрашиваются
+
+    def enqueue(self, query: str, offset: int) -> None:
+        """Ставит страницу в очередь, если она еще не запланирована (важно при возобновлении из чекпоинта)."""
+        if not self.stopped and self.progress.schedule((query, offset)):
+            self.work.put_nowait((query, offset, 0))
+
+    def requeue(self, query: str, offset: int, attempt: int) -> None:
+        """Возвращает страницу в очередь (другому клиенту или после flood wait), если перебор не остановлен."""
+        if not self.stopped:
+            self.work.put_nowait((query, offset, attempt))
+
+    def stop(self, failure: BaseException) -> None:
+        """Останавливает перебор: страницы в работе дозавершаются, но новых запросов не будет."""
+        self.failure = failure
+        self.stopped = True
+        self.drain_work()
+
+    async def fetch(self, lane: CrawlLane, query: str, offset: int):
+        """Один запрос страницы (паузы и повтор после flood wait - в rate_limiter)."""
+        previous = self.page_hashes.get((query, offset))
+        return await rate_limiter.call(lane.client, GetParticipantsRequest(
+            channel=lane.entity,
+            filter=ChannelParticipantsSearch(query),
+            offset=offset,
+            limit=self.page_size,
+            # Хеш прошлого сбора: неизменившаяся страница придет как ChannelParticipantsNotModified
+            hash=previous.hash if previous is not None else 0
+        ), max_retries=0 if self.handoff else None)
+
+    async def crawl_page(self, lane: CrawlLane, query: str, offset: int) -> None:
+        """
+        Получает одну страницу префиксного запроса. Первая страница запроса решает, делить ли
+        его на более длинные префиксы, или ставит в очередь остальные страницы (их могут
+        параллельно забрать другие клиенты).
+        """
+        result = await self.fetch(lane, query, offset)
+        self.report.pages_fetched += 1
+        lane.pages_fetched += 1
+
+        if isinstance(result, ChannelParticipantsNotModified):
+            # Страница не изменилась: данные в БД актуальны, берем count и ID участников из сохраненного хеша
+            previous = self.page_hashes[(query, offset)]
+            count = previous.count
+            new_ids = [user_id for user_id in previous.user_ids if user_id not in self.seen]
+            self.seen.update(new_ids)
+            self.report.pages_not_modified += 1
+            self.report.unique_users += len(new_ids)
+            await self.out.put(ParticipantPage(
+                offset=offset, query=query, count=count, user_ids=previous.user_ids, hash=previous.hash, not_modified=True,
+                new_users=len(new_ids),
+            ))
+        else:
+            count = result.count
+            if not result.users:
+                if offset == 0 or offset + self.page_size >= min(count, SEARCH_RESULTS_CAP):
+                    self.report.queries_done += 1
+                self.progress.complete((query, offset))
+                return
+
+            batch = ParticipantBatch()
+            self.report.duplicates += batch.extend_page(result.users, result.participants, seen=self.seen)
+            truncated = False
+            if self.limit > 0 and len(batch) > self.limit - self.report.unique_users:
+                batch.truncate(max(self.limit - self.report.unique_users, 0))
+                truncated = True
+            self.report.unique_users += len(batch)
+            # Страница отдается, даже если новых участников нет: писатель сохранит ее хеш и отметит завершенной
+            user_ids = [uid for uid in map(participant_user_id, result.participants) if uid is not None]
+            await self.out.put(ParticipantPage(
+                offset=offset, batch=batch, query=query, count=count, user_ids=user_ids,
+                hash=None if truncated else participants_page_hash(count, user_ids),
+            ))
+
+        if self.limit > 0 and self.report.unique_users >= self.limit:
+            self.drain_work(abandon=True)
+            return
+
+        reachable = min(count, SEARCH_RESULTS_CAP) # Сколько участников запроса вообще можно получить
+        if offset == 0:
+            # Насыщенный запрос (упирается в лимит поиска) делим на более длинные префиксы
+            if count >= self.saturation and len(query) < self.max_depth:
+                self.report.queries_split += 1
+                self.report.queries_done += 1
+                for char in self.alphabet:
+                    self.enqueue(query + char, 0)
+                return
+            for next_offset in range(self.page_size, reachable, self.page_size):
+                self.enqueue(query, next_offset)
+        if offset + self.page_size >= reachable:
+            self.report.queries_done += 1 # Последняя страница запроса
+
+    def drain_work(self, abandon: bool = False) -> None:
+        """
+        Снимает с очереди все необработанные запросы (при остановке перебора).
+        abandon=True - страницы больше не нужны (достигнут лимит) и не попадут в чекпоинт.
+        """
+        while not self.work.empty():
+            query, offset, _ = self.work.get_nowait()
+            if abandon:
+                self.progress.complete((query, offset))
+            self.work.task_done()
+
+    async def worker(self, lane: CrawlLane) -> None:
+        loop = asyncio.get_running_loop()
+        while not lane.disabled and not self.stopped:
+            if lane.paused_until > loop.time(): # Клиент на flood wait - работу пока берут другие
+                await asyncio.sleep(lane.paused_until - loop.time())
+            query, offset, attempt = await self.work.get()
+            try:
+                if self.stopped:
+                    continue # Перебор остановлен, пока ждали страницу
+                await self.crawl_page(lane, query, offset)
+            except (UserNotParticipantError, ChannelPrivateError, ChatAdminRequiredError) as e:
+                if lane.primary:
+                    self.stop(e) # Доступа нет - останавливаем весь перебор
+                else:
+                    # У дополнительного аккаунта нет доступа - он выходит из перебора, работу берут остальные
+                    print(f"Warning: Lane {lane.name} has no access to channel participants, leaving crawl: {e}")
+                    lane.disabled = True
+                    self.requeue(query, offset, attempt)
+            except FloodWaitError as e: # Ограничитель исчерпал повторы (или не повторял - handoff)
+                lane.paused_until = loop.time() + e.seconds
+                if attempt + 1 < self.max_attempts:
+                    self.requeue(query, offset, attempt + 1)
+                else:
+                    self.report.queries_failed += 1
+                    print(f"Error: Flood wait on participant shard '{query}' offset {offset}, giving up: {e}")
+            except RPCError as e:
+                self.report.queries_failed += 1
+                print(f"Error: RPC error on participant shard '{query}' offset {offset}: {e}")
+            except Exception as e: # Обрыв соединения и т.п.: иначе воркер умрет, а work.join() не дождется очереди
+                if lane.primary:
+                    self.stop(e)
+                else:
+                    print(f"Warning: Lane {lane.name} failed, leaving crawl: {e}")
+                    lane.disabled = True
+                    self.requeue(query, offset, attempt)
+            finally:
+                self.work.task_done()
+
+
+async def iter_sharded_participants(
+    client: TelegramClient,
+    entity: Channel,
+    *,
+    participants_count: Optional[int] = None,
+    limit: int = 0,
+    report: Optional[ShardingReport] = None,
+    concurrency: Optional[int] = None,
+    max_depth: Optional[int] = None,
+    alphabet: Optional[str] = None,
+    extra_lanes: Sequence[CrawlLane] = (),
+    progress: Optional[CrawlProgress] = None,
+    page_hashes: Optional[Dict[WorkKey, PageHash]] = None,
+) -> AsyncIterator[ParticipantPage]:
+    """
+    Перебирает участников канала/супергруппы префиксными поисковыми запросами
+    параллельно (не более concurrency запросов одновременно на каждый клиент).
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient.
+        entity: Канал/супергруппа.
+        participants_count: Количество участников из get_chat_info (для отчета о покрытии).
+        limit: Максимальное количество уникальных участников (0 = все).
+        report: Объект ShardingReport, который будет заполняться по ходу перебора.
+        concurrency: Количество одновременных запросов на клиент (по умолчанию settings.PARTICIPANTS_SHARD_CONCURRENCY).
+        max_depth: Максимальная длина префикса (по умолчанию settings.PARTICIPANTS_SHARD_MAX_DEPTH;
+            0 - без деления, только параллельная загрузка страниц).
+        alphabet: Алфавит префиксов (по умолчанию из settings.PARTICIPANTS_SHARD_SCRIPTS).
+        extra_lanes: Дополнительные клиенты (аккаунты из session_pool), между которыми
+            распределяются страницы и префиксные запросы.
+        progress: Незавершенная работа перебора. Если она восстановлена из чекпоинта,
+            перебор начинается с незавершенных страниц, а не с корневого запроса.
+        page_hashes: Хеши страниц прошлого сбора по (префикс, смещение): неизменившиеся
+            страницы приходят как ChannelParticipantsNotModified и отдаются с not_modified=True.
+
+    Yields:
+        ParticipantPage со строками только новых (еще не отданных) пользователей.
+    """
+    report = report if report is not None else ShardingReport()
+    progress = progress if progress is not None else CrawlProgress()
+    report.participants_count = participants_count
+    concurrency = concurrency or settings.PARTICIPANTS_SHARD_CONCURRENCY
+    lanes = [CrawlLane(client=client, entity=entity, name=session_key(client)), *extra_lanes]
+    crawl = _ShardCrawl(
+        lanes, report,
+        alphabet=alphabet or shard_alphabet(),
+        max_depth=settings.PARTICIPANTS_SHARD_MAX_DEPTH if max_depth is None else max_depth,
+        page_size=settings.PARTICIPANTS_PAGE_SIZE,
+        saturation=settings.PARTICIPANTS_SHARD_SATURATION,
+        limit=limit,
+        progress=progress,
+        page_hashes=page_hashes or {},
+    )
+    print(f"Starting sharded participant collection for channel {entity.id} "
+          f"(clients={len(lanes)}, concurrency={concurrency} per client)")
+
+    done = object() # Маркер окончания перебора в очереди страниц
+    if progress.resumed:
+        print(f"Resuming sharded collection for channel {entity.id} from {len(progress.outstanding)} unfinished page(s)")
+        for query, offset in progress.pending():
+            crawl.work.put_nowait((query, offset, 0))
+    else:
+        crawl.enqueue("", 0) # Корневой запрос: при насыщении делится на алфавит
+    workers = [asyncio.create_task(crawl.worker(lane)) for lane in lanes for _ in range(concurrency)]
+
+    async def supervise():
+        try:
+            await crawl.work.join()
+        finally:
+            await crawl.out.put(done)
+
+    supervisor = asyncio.create_task(supervise())
+    try:
+        while True:
+            page = await crawl.out.get()
+            if page is done:
+                break
+            yield page
+    finally:
+        for task in (*workers, supervisor):
+            task.cancel()
+        await asyncio.gather(*workers, supervisor, return_exceptions=True)
+
+    coverage = f"{report.coverage:.1%}" if report.coverage is not None else "n/a"
+    print(f"Sharded collection for channel {entity.id} finished: {report.unique_users} unique users, "
+          f"{report.queries_done} queries ({report.queries_split} split, {report.queries_failed} failed), "
+          f"{report.pages_not_modified} pages not modified, {report.duplicates} duplicates, coverage {coverage}; "
+          f"pages per client: {', '.join(f'{lane.name}={lane.pages_fetched}' for lane in lanes)}")
+    if crawl.failure is not None:
+        raise crawl.failure
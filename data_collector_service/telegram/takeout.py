@@ -0,0 +1,162 @@
+# telegram-intel/data_collector_service/telegram/takeout.py
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, Any, AsyncIterator, Dict, Tuple
+
+from telethon import TelegramClient, utils
+from telethon.tl.functions import InvokeWithTakeoutRequest
+from telethon.tl.functions.account import InitTakeoutSessionRequest, FinishTakeoutSessionRequest
+from telethon.errors import TakeoutInitDelayError, RPCError
+
+from .rate_limiter import rate_limiter, session_key
+
+# --- Режим экспорта (takeout-сессия) ---
+# Telegram выдает аккаунту takeout-сессию (account.initTakeoutSession) для экспорта данных:
+# запросы, обернутые в InvokeWithTakeoutRequest, ограничиваются отдельными и более мягкими
+# лимитами. Полная выгрузка истории и участников - как раз такой экспорт. takeout_session
+# открывает сессию на клиенте и всегда завершает ее (account.finishTakeoutSession), в том числе
+# при ошибке сбора. ID открытой сессии хранится в файле сессии Telethon: если процесс упал,
+# незавершенная сессия будет закрыта при следующем открытии (иначе Telegram не выдаст новую).
+# Клиент из пула могут одновременно использовать несколько сборов, поэтому открытые takeout-сессии
+# учитываются по ключу сессии (_active_takeouts): второй сбор на той же сессии присоединяется к уже
+# открытой, а завершает ее последний вышедший. ID в файле сессии считается оставшимся после сбоя,
+# только если в процессе нет открытой сессии с этим ключом.
+
+
+class TakeoutUnavailableError(Exception):
+    """Takeout-сессию открыть нельзя (Telegram просит подождать или экспорт не подтвержден)."""
+
+    def __init__(self, message: str, seconds: Optional[int] = None):
+        super().__init__(message)
+        self.seconds = seconds # Через сколько секунд можно повторить (TakeoutInitDelayError)
+
+
+class TakeoutClient:
+    """
+    Клиент внутри takeout-сессии: TL-запросы отправляются через InvokeWithTakeoutRequest,
+    остальное (get_entity, session, ...) берется у исходного клиента. Ограничитель запросов
+    ведет для него отдельные bucket'ы (см. rate_limiter.session_key).
+    """
+
+    def __init__(self, client: TelegramClient, takeout_id: int):
+        self.client = client
+        self.takeout_id = takeout_id
+        # Итог экспорта для finishTakeoutSession (None - по тому, завершился ли блок с исключением)
+        self.success: Optional[bool] = None
+
+    async def __call__(self, request: Any, ordered: bool = False) -> Any:
+        # Сущности во вложенном запросе разрешаются до обертки (как в TelegramClient.takeout())
+        await request.resolve(self.client, utils)
+        return await self.client(InvokeWithTakeoutRequest(takeout_id=self.takeout_id, query=request), ordered=ordered)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
+
+
+class _ActiveTakeout:
+    """Открытая в процессе takeout-сессия, которую делят сборы на одной сессии Telethon."""
+
+    def __init__(self, takeout_id: int, scope: Tuple[bool, bool, bool, bool]):
+        self.takeout_id = takeout_id
+        self.scope = scope # (users, chats, megagroups, channels), с которыми сессия открыта
+        self.leases = 0 # Сколько сборов сейчас используют сессию
+        self.success = True # Экспорт успешен, только если успешны все сборы
+
+
+_active_takeouts: Dict[str, _ActiveTakeout] = {}
+_takeout_locks: Dict[str, asyncio.Lock] = {} # Открытие и завершение сессии по одному ключу - по очереди
+
+
+async def _finish_takeout(client: TelegramClient, takeout_id: int, success: bool) -> None:
+    """Завершает takeout-сессию и убирает ее ID из файла сессии."""
+    await rate_limiter.call(TakeoutClient(client, takeout_id), FinishTakeoutSessionRequest(success=success))
+    session = getattr(client, 'session', None)
+    if session is not None:
+        session.takeout_id = None
+
+
+@asynccontextmanager
+async def takeout_session(
+    client: TelegramClient,
+    *,
+    users: bool = True,
+    chats: bool = True,
+    megagroups: bool = True,
+    channels: bool = True,
+) -> AsyncIterator[TakeoutClient]:
+    """
+    Открывает takeout-сессию на клиенте (или присоединяется к уже открытой в процессе на той же
+    сессии) и отдает TakeoutClient для сбора через нее. Сессия завершается при выходе последнего
+    сбора: успешно, если все блоки завершились без исключения (или как задано в TakeoutClient.success).
+    Ошибка завершения не пробрасывается.
+
+    Args:
+        client: Авторизованный экземпляр TelegramClient.
+        users, chats, megagroups, channels: Какие сообщения будут выгружаться
+            (личные переписки, обычные группы, супергруппы, каналы).
+
+    Yields:
+        TakeoutClient.
+
+    Raises:
+        TakeoutUnavailableError: Telegram не выдал takeout-сессию или на этой сессии уже открыт экспорт
+            с другим набором чатов (вызывающий код собирает обычным путем).
+    """
+    key = session_key(client)
+    scope = (users, chats, megagroups, channels)
+    lock = _takeout_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        active = _active_takeouts.get(key)
+        if active is not None:
+            if active.scope != scope:
+                raise TakeoutUnavailableError(f"Takeout session {active.takeout_id} of {key} is already open with another scope")
+            print(f"Joined takeout session {active.takeout_id} of {key} ({active.leases} collection(s) already use it)")
+        else:
+            session = getattr(client, 'session', None)
+            stale_id = getattr(session, 'takeout_id', None)
+            if stale_id is not None:
+                # Прошлый экспорт не был завершен (процесс упал): пока он открыт, новую сессию не выдадут
+                try:
+                    await _finish_takeout(client, stale_id, success=False)
+                    print(f"Finished stale takeout session {stale_id} of {key}")
+                except RPCError as e:
+                    print(f"Warning: Could not finish stale takeout session {stale_id} of {key}: {e}")
+                    session.takeout_id = None
+
+            try:
+                takeout = await rate_limiter.call(client, InitTakeoutSessionRequest(
+                    message_users=users, message_chats=chats, message_megagroups=megagroups, message_channels=channels,
+                ))
+            except TakeoutInitDelayError as e:
+                raise TakeoutUnavailableError(f"Telegram asks to wait {e.seconds}s before a takeout session of {key}", e.seconds)
+            except RPCError as e:
+                raise TakeoutUnavailableError(f"Could not start a takeout session of {key}: {e}")
+
+            active = _active_takeouts[key] = _ActiveTakeout(takeout.id, scope)
+            if session is not None:
+                session.takeout_id = takeout.id # Сохраняется в файле сессии - для закрытия после сбоя
+            print(f"Started takeout session {takeout.id} of {key}")
+        active.leases += 1
+
+    # Свой TakeoutClient на каждый сбор: итог (success) каждый сбор задает независимо
+    takeout_client = TakeoutClient(client, active.takeout_id)
+    failed = True
+    try:
+        yield takeout_client
+        failed = False
+    finally:
+        success = takeout_client.success if takeout_client.success is not None else not failed
+        active.success = active.success and success
+        active.leases -= 1
+        if active.leases == 0:
+            async with lock:
+                # Пока ждали блокировку, к сессии мог присоединиться новый сбор - тогда завершит он
+                if active.leases == 0 and _active_takeouts.get(key) is active:
+                    _active_takeouts.pop(key)
+                    try:
+                        await _finish_takeout(client, active.takeout_id, success=active.success)
+                        print(f"Finished takeout session {active.takeout_id} of {key} (success={active.success})")
+                    except Exception as e: # ID остается в файле сессии - сессия будет закрыта при следующем открытии
+                        print(f"Error: Failed to finish takeout session {active.takeout_id} of {key}: {e}")
+
@@ -8,7 +8,7 @@ from sqlalchemy import (
     create_engine, MetaData, Table, Column, ForeignKey, CheckConstraint, UniqueConstraint, Index, ForeignKeyConstraint,
     Integer, String, BigInteger, Text, DateTime, Boolean, LargeBinary, JSON, Float, Enum as PgEnum
 )
-from sqlalchemy.dialects.postgresql import UUID as PgUUID, JSONB
+from sqlalchemy.dialects.postgresql import UUID as PgUUID, JSONB, ARRAY
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.sql import func, and_ # Добавляем 'and_' для primaryjoin
 
@@ -16,7 +16,8 @@ from sqlalchemy.sql import func, and_ # Добавляем 'and_' для primary
 if TYPE_CHECKING:
     from .models import ( # Предполагаем, что все модели в этом файле
         AppUser, TargetChat, User, ChatParticipant, Message,
-        PrivateMessage, UserContact, MessageEntity, MessageFile
+        PrivateMessage, UserContact, MessageEntity, MessageFile, CollectionCheckpoint, ParticipantPageHash,
+        MembershipSnapshot, MembershipSnapshotMember, MembershipEvent, CollectionJob, CollectionQuota
     )
 
 # Определяем базовый класс для декларативных моделей
@@ -145,6 +146,7 @@ class ChatParticipant(Base):
     inviter_user_id: Mapped[Optional[int]] = mapped_column(BigInteger, ForeignKey('users.id'), nullable=True) # Пригласивший
     joined_date: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
     added_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    left_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True) # Нет в последнем снимке состава; NULL - участник
 
     # Связи
     chat: Mapped["TargetChat"] = relationship(back_populates="participants", foreign_keys=[chat_id])
@@ -171,7 +173,8 @@ class Message(Base):
     __tablename__ = 'messages'
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
-    chat_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('target_chats.chat_id'), nullable=False)
+    # ID сообщения уникален только внутри чата, поэтому первичный ключ - (id, chat_id)
+    chat_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('target_chats.chat_id'), primary_key=True)
     user_id: Mapped[Optional[int]] = mapped_column(BigInteger, ForeignKey('users.id'), nullable=True)
     message_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     message_type: Mapped[str] = mapped_column(Text, nullable=False, default='text', index=True)
@@ -195,7 +198,6 @@ class Message(Base):
     files: Mapped[List["MessageFile"]] = relationship(back_populates="message")
 
     __table_args__ = (
-        UniqueConstraint('id', 'chat_id', name='uq_message_id_chat_id'),
         Index('ix_messages_chat_id_date', 'chat_id', 'date'),
         Index('ix_messages_user_id', 'user_id'),
     )
@@ -305,6 +307,166 @@ class MessageFile(Base):
     def __repr__(self) -> str:
         return f"<MessageFile(id={self.id}, msg_id={self.message_id}, chat_id={self.chat_id}, type='{self.file_type}', path='{self.file_path}')>"
 
+# 10. collection_checkpoints - Чекпоинты сбора (для возобновления прерванных сборов)
+class CollectionCheckpoint(Base):
+    __tablename__ = 'collection_checkpoints'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('target_chats.chat_id'), nullable=False)
+    mode: Mapped[str] = mapped_column(Text, nullable=False) # Вид сбора: 'participants', ...
+    status: Mapped[str] = mapped_column(Text, nullable=False, default='running', index=True) # running / interrupted / completed
+    position: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True) # Смещение/ID, до которого все собрано
+    state: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True) # Незавершенная работа (страницы, префиксы)
+    pages_done: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rows_done: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    session_file: Mapped[Optional[str]] = mapped_column(Text, nullable=True) # Сессия, которой шел сбор
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Связи
+    chat: Mapped["TargetChat"] = relationship(foreign_keys=[chat_id])
+
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'mode', name='uq_collection_checkpoint_chat_mode'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<CollectionCheckpoint(chat_id={self.chat_id}, mode='{self.mode}', status='{self.status}', pages_done={self.pages_done})>"
+
+# 11. participant_page_hashes - Хеши страниц участников прошлого сбора (для GetParticipantsRequest hash)
+class ParticipantPageHash(Base):
+    __tablename__ = 'participant_page_hashes'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('target_chats.chat_id'), nullable=False)
+    filter_query: Mapped[str] = mapped_column(Text, nullable=False, default='') # Префикс ChannelParticipantsSearch
+    offset: Mapped[int] = mapped_column(Integer, nullable=False)
+    hash: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    total_count: Mapped[int] = mapped_column(Integer, nullable=False) # count ответа (участников по запросу)
+    user_ids: Mapped[List[int]] = mapped_column(ARRAY(BigInteger), nullable=False) # Участники страницы по порядку
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'filter_query', 'offset', name='uq_participant_page_hash'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<ParticipantPageHash(chat_id={self.chat_id}, query='{self.filter_query}', offset={self.offset}, hash={self.hash})>"
+
+# 12. membership_snapshots - Снимки состава чата (итог каждого полного сбора участников)
+class MembershipSnapshot(Base):
+    __tablename__ = 'membership_snapshots'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('target_chats.chat_id'), nullable=False)
+    previous_snapshot_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('membership_snapshots.id'), nullable=True) # С каким снимком сравнивался
+    status: Mapped[str] = mapped_column(Text, nullable=False, default='running') # running / interrupted / completed / incomplete / abandoned
+    is_baseline: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False) # Первый снимок чата - сравнивать не с чем
+    member_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    joined_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    left_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('ix_membership_snapshots_chat_id_status', 'chat_id', 'status'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<MembershipSnapshot(id={self.id}, chat_id={self.chat_id}, status='{self.status}', members={self.member_count})>"
+
+# 13. membership_snapshot_members - ID участников снимка (промежуточная таблица для сравнения снимков)
+# Хранятся только у незавершенного и последнего завершенного снимка чата
+class MembershipSnapshotMember(Base):
+    __tablename__ = 'membership_snapshot_members'
+
+    snapshot_id: Mapped[int] = mapped_column(Integer, ForeignKey('membership_snapshots.id', ondelete='CASCADE'), primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+    def __repr__(self) -> str:
+        return f"<MembershipSnapshotMember(snapshot_id={self.snapshot_id}, user_id={self.user_id})>"
+
+# 14. membership_events - Входы и выходы участников между снимками (только добавление)
+class MembershipEvent(Base):
+    __tablename__ = 'membership_events'
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('target_chats.chat_id'), nullable=False)
+    snapshot_id: Mapped[int] = mapped_column(Integer, ForeignKey('membership_snapshots.id'), nullable=False) # Снимок, в котором замечено изменение
+    user_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    event: Mapped[str] = mapped_column(Text, nullable=False) # 'joined' / 'left'
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        CheckConstraint("event IN ('joined', 'left')", name='ck_membership_event_type'),
+        Index('ix_membership_events_chat_id_snapshot_id', 'chat_id', 'snapshot_id'),
+        Index('ix_membership_events_chat_id_user_id', 'chat_id', 'user_id'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<MembershipEvent(chat_id={self.chat_id}, snapshot_id={self.snapshot_id}, user_id={self.user_id}, event='{self.event}')>"
+
+# 15. collection_jobs - Очередь задач сбора (/collect): статус, прогресс и результат задачи
+class CollectionJob(Base):
+    __tablename__ = 'collection_jobs'
+
+    id: Mapped[uuid.UUID] = mapped_column(PgUUID(as_uuid=True), primary_key=True, default=uuid.uuid4) # task_id в API
+    app_user_id: Mapped[uuid.UUID] = mapped_column(PgUUID(as_uuid=True), ForeignKey('app_users.id'), nullable=False)
+    chat_target: Mapped[str] = mapped_column(Text, nullable=False) # ID, username или ссылка, как в запросе
+    target_key: Mapped[Optional[str]] = mapped_column(Text, nullable=True) # Канонический ключ цели ('id:...', 'username:...')
+    options: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True) # Параметры сбора (takeout, ...)
+    status: Mapped[str] = mapped_column(Text, nullable=False, default='queued') # queued / running / completed / failed
+    chat_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True) # Известен после получения информации о чате
+    progress: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True) # Текущий этап сбора
+    result: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True) # CollectChatResponse
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    attached_requests: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0') # Повторные запросы, присоединенные к задаче
+    attached_user_ids: Mapped[Optional[List[uuid.UUID]]] = mapped_column(ARRAY(PgUUID(as_uuid=True)), nullable=True) # Другие пользователи, ждущие задачу
+    worker: Mapped[Optional[str]] = mapped_column(Text, nullable=True) # Обработчик, выполняющий задачу
+    dc_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True) # DC сессии пользователя (лимит задач на DC)
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default='1') # 0 - interactive, 1 - bulk
+    preempt_requested: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default='false') # Остановить на границе страницы и вернуть в очередь
+    preemptions: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0') # Сколько раз задача была вытеснена
+    queued_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now()) # Последняя постановка в очередь (для времени ожидания)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True) # Задача без heartbeat возвращается в очередь
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        CheckConstraint("status IN ('queued', 'running', 'completed', 'failed')", name='ck_collection_job_status'),
+        Index('ix_collection_jobs_status_created_at', 'status', 'created_at'),
+        Index('ix_collection_jobs_status_priority_created_at', 'status', 'priority', 'created_at'),
+        Index('ix_collection_jobs_app_user_id', 'app_user_id'),
+        # Не больше одной активной задачи на цель: повторные запросы присоединяются к ней
+        Index(
+            'uq_collection_jobs_active_target_key', 'target_key', unique=True,
+            postgresql_where="status IN ('queued', 'running')",
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return f"<CollectionJob(id={self.id}, target='{self.chat_target}', status='{self.status}')>"
+
+
+# 16. collection_quotas - Квоты пользователей в очереди сбора (задаются администратором, строки нет - настройки по умолчанию)
+class CollectionQuota(Base):
+    __tablename__ = 'collection_quotas'
+
+    app_user_id: Mapped[uuid.UUID] = mapped_column(PgUUID(as_uuid=True), ForeignKey('app_users.id', ondelete='CASCADE'), primary_key=True)
+    weight: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default='1') # Доля слотов очереди относительно других пользователей
+    max_running: Mapped[Optional[int]] = mapped_column(Integer, nullable=True) # Одновременно выполняемых задач (None - JOB_MAX_PER_SESSION, 0 - без ограничения)
+    max_queued: Mapped[Optional[int]] = mapped_column(Integer, nullable=True) # Задач в очереди (None - JOB_MAX_QUEUED_PER_USER, 0 - без ограничения)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        CheckConstraint("weight > 0", name='ck_collection_quota_weight'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<CollectionQuota(app_user_id={self.app_user_id}, weight={self.weight})>"
+
 
 # Пример использования (для иллюстрации)
 if __name__ == '__main__':
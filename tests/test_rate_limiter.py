@@ -0,0 +1,209 @@
+# telegram-intel/tests/test_rate_limiter.py
+
+import asyncio
+
+import pytest
+from telethon.errors import FloodWaitError
+
+from data_collector_service.telegram.rate_limiter import RateLimiter, session_key
+
+
+class FakeClock:
+    """Поддельные часы: sleep сдвигает время мгновенно."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += max(seconds, 0.0)
+
+
+class FakeSession:
+    def __init__(self, filename: str):
+        self.filename = filename
+
+
+class FakeClient:
+    """Клиент Telethon: отвечает flood wait'ами из очереди `floods`, затем "ok"."""
+
+    def __init__(self, filename: str = "account.session", floods=()):
+        self.session = FakeSession(filename)
+        self.floods = list(floods)
+        self.requests = []
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        if self.floods:
+            raise FloodWaitError(request=None, capture=self.floods.pop(0))
+        return "ok"
+
+
+class GetParticipantsRequest:
+    pass
+
+
+class GetHistoryRequest:
+    pass
+
+
+def make_limiter(clock: FakeClock, **kwargs) -> RateLimiter:
+    options = dict(
+        initial_rate=4.0, min_rate=0.5, max_rate=5.0, burst=1.0, decrease_factor=0.5, increase_step=0.25,
+        probe_after=3, max_retries=3, max_flood_wait=60.0, clock=clock, sleep=clock.sleep,
+    )
+    options.update(kwargs)
+    return RateLimiter(**options)
+
+
+def key(client: FakeClient, request_type: type) -> tuple:
+    return session_key(client), request_type.__name__
+
+
+def test_flood_wait_decreases_rate_multiplicatively_and_blocks_bucket():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    client = FakeClient(floods=[5, 7])
+
+    assert asyncio.run(limiter.call(client, GetParticipantsRequest())) == "ok"
+
+    assert limiter.rate(key(client, GetParticipantsRequest)) == pytest.approx(1.0) # 4 -> 2 -> 1
+    assert len(client.requests) == 3
+    assert clock.now >= 12 # Повторы ждали оба flood wait
+    assert limiter.stats.flood_waits == 2
+    assert limiter.stats.flood_wait_seconds == 12
+
+
+def test_flood_wait_does_not_go_below_min_rate():
+    clock = FakeClock()
+    limiter = make_limiter(clock, max_retries=5)
+    client = FakeClient(floods=[1, 1, 1, 1, 1])
+
+    asyncio.run(limiter.call(client, GetParticipantsRequest()))
+
+    assert limiter.rate(key(client, GetParticipantsRequest)) == pytest.approx(0.5)
+
+
+def test_success_streak_probes_rate_up_additively_up_to_max_rate():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    client = FakeClient()
+    request_key = key(client, GetParticipantsRequest)
+
+    async def calls(count: int):
+        for _ in range(count):
+            await limiter.call(client, GetParticipantsRequest())
+
+    asyncio.run(calls(2))
+    assert limiter.rate(request_key) == pytest.approx(4.0) # Серия еще не набрана
+    asyncio.run(calls(1))
+    assert limiter.rate(request_key) == pytest.approx(4.25)
+    asyncio.run(calls(3))
+    assert limiter.rate(request_key) == pytest.approx(4.5)
+    asyncio.run(calls(30))
+    assert limiter.rate(request_key) == pytest.approx(5.0)
+
+
+def test_flood_wait_resets_success_streak():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    client = FakeClient()
+    request_key = key(client, GetParticipantsRequest)
+
+    async def scenario():
+        for _ in range(2):
+            await limiter.call(client, GetParticipantsRequest())
+        client.floods.append(1)
+        await limiter.call(client, GetParticipantsRequest()) # Flood wait и успешный повтор
+        await limiter.call(client, GetParticipantsRequest())
+
+    asyncio.run(scenario())
+    assert limiter.rate(request_key) == pytest.approx(2.0) # Серия после flood wait - 2 из 3
+
+
+def test_buckets_are_isolated_per_session_and_method():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    flooded = FakeClient("first.session", floods=[3])
+    other_session = FakeClient("second.session")
+
+    async def scenario():
+        await limiter.call(flooded, GetParticipantsRequest())
+        started = clock()
+        await limiter.call(flooded, GetHistoryRequest())
+        await limiter.call(other_session, GetParticipantsRequest())
+        return clock() - started
+
+    waited = asyncio.run(scenario())
+
+    assert limiter.rate(key(flooded, GetParticipantsRequest)) == pytest.approx(2.0)
+    assert limiter.rate(key(flooded, GetHistoryRequest)) == pytest.approx(4.0)
+    assert limiter.rate(key(other_session, GetParticipantsRequest)) == pytest.approx(4.0)
+    assert waited == 0 # Другие bucket'ы не ждут flood wait чужого bucket'а
+
+
+def test_max_retries_bounds_the_number_of_calls():
+    clock = FakeClock()
+    limiter = make_limiter(clock, max_retries=2)
+    client = FakeClient(floods=[1, 1, 1, 1])
+
+    with pytest.raises(FloodWaitError):
+        asyncio.run(limiter.call(client, GetParticipantsRequest()))
+
+    assert len(client.requests) == 3 # Первый вызов и два повтора
+    assert limiter.stats.calls == 3
+
+
+def test_max_retries_override_zero_raises_after_first_flood_wait():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    client = FakeClient(floods=[1])
+
+    with pytest.raises(FloodWaitError):
+        asyncio.run(limiter.call(client, GetParticipantsRequest(), max_retries=0))
+
+    assert len(client.requests) == 1
+    assert clock.now == 0 # Ожидание не выполнялось
+
+
+def test_flood_wait_longer_than_max_flood_wait_is_raised_immediately():
+    clock = FakeClock()
+    limiter = make_limiter(clock, max_flood_wait=30.0)
+    client = FakeClient(floods=[300])
+
+    with pytest.raises(FloodWaitError):
+        asyncio.run(limiter.call(client, GetParticipantsRequest()))
+
+    assert len(client.requests) == 1
+    assert clock.now == 0
+
+
+def test_flood_listeners_are_notified_with_session_method_and_seconds():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    client = FakeClient("account.session", floods=[4, 2])
+    events = []
+    limiter.add_flood_listener(lambda session, method, seconds: events.append((session, method, seconds)))
+
+    asyncio.run(limiter.call(client, GetHistoryRequest()))
+
+    assert events == [("account.session", "GetHistoryRequest", 4), ("account.session", "GetHistoryRequest", 2)]
+
+
+def test_token_bucket_throttles_to_current_rate():
+    clock = FakeClock()
+    limiter = make_limiter(clock, initial_rate=2.0, burst=1.0, probe_after=100)
+    client = FakeClient()
+
+    async def calls(count: int):
+        for _ in range(count):
+            await limiter.call(client, GetParticipantsRequest())
+
+    asyncio.run(calls(5))
+
+    assert clock.now == pytest.approx(2.0) # Первый вызов из burst, еще 4 по 0.5 с
+    assert limiter.stats.throttled_seconds == pytest.approx(2.0)